@@ -0,0 +1,151 @@
+# benchmarks/admission_overload.py
+#
+# interface_stream under overload, with and without admission control. Clients
+# arrive at random (Poisson) at --overload times what the upstream can serve,
+# for --duration seconds. The upstream is a FakeGenerativeModel that slows down
+# once more than --capacity turns stream at once, as a shared worker pool or API
+# quota would: each chunk takes as long as in-flight turns / capacity chunks.
+# Half of the clients (--hot-share) share one API key; the rest each have their own.
+#
+# Per mode, it reports how turns ended and the latency of the ones that finished,
+# measured from when the client connected:
+#   no admission       every turn starts at once and all of them slow down together
+#   admission          MAX_ACTIVE = --capacity, a queue of 2 x capacity turns waiting
+#                      at most --queue-timeout, and KEY_RATE/KEY_BURST on each key
+#
+#   python -m benchmarks.admission_overload --overload 2 --duration 10
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from .common import FakeGenerativeModel, setup_django, summarize
+
+
+class SaturatingModel(FakeGenerativeModel):
+    """Streams slow down in proportion to how far in-flight turns exceed `capacity`."""
+
+    def __init__(self, capacity, **kwargs):
+        super().__init__(**kwargs)
+        self.capacity = capacity
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _slowdown(self):
+        return max(1.0, self.in_flight / self.capacity)
+
+    def _stream(self, contents, kwargs):
+        with self._lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            time.sleep(self.first_latency * self._slowdown())
+            for index, chunk in enumerate(self._chunks(contents, kwargs)):
+                if index:
+                    time.sleep(self.chunk_interval * self._slowdown())
+                yield chunk
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def one_turn(views, factory, key, arrived):
+    """(outcome, seconds from arrival to the first delta, to the end of the response)."""
+    body = json.dumps({
+        "geminiApiKey": key, "tavilyApiKey": "bench", "conversation_name": "overload",
+        "history": [{"role": "user", "content": "What happened today?"}],
+    })
+    response = views.interface_stream(factory.post("/interface_stream/", body, content_type="application/json"))
+    if response.status_code == 429:
+        return json.loads(response.content)["reason"], None, time.perf_counter() - arrived
+    first_delta, outcome = None, "completed"
+    for part in response.streaming_content:
+        if first_delta is None and b'"type": "delta"' in part:
+            first_delta = time.perf_counter() - arrived
+        if b'"reason": "queue_timeout"' in part:
+            outcome = "queue_timeout"
+    response.close()
+    return outcome, first_delta, time.perf_counter() - arrived
+
+
+def run(views, rate, duration, hot_share, seed):
+    from django.test import RequestFactory
+
+    factory = RequestFactory()
+    rng = random.Random(seed)
+    results = []
+    with ThreadPoolExecutor(max_workers=2000) as pool:
+        futures = []
+        started = time.perf_counter()
+        arrival = 0.0
+        while arrival < duration:
+            delay = started + arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            key = "hot" if rng.random() < hot_share else f"key-{rng.randrange(10 ** 6)}"
+            futures.append(pool.submit(one_turn, views, factory, key, time.perf_counter()))
+            arrival += rng.expovariate(rate)
+        results = [future.result() for future in futures]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--capacity", type=int, default=8, help="turns the upstream serves at full speed")
+    parser.add_argument("--overload", type=float, default=2.0, help="offered load as a multiple of capacity")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--first-latency", type=float, default=0.3)
+    parser.add_argument("--chunk-interval", type=float, default=0.05)
+    parser.add_argument("--chunks", type=int, default=10)
+    parser.add_argument("--queue-timeout", type=float, default=3.0)
+    parser.add_argument("--hot-share", type=float, default=0.5)
+    parser.add_argument("--key-rate", type=float, default=1.0)
+    parser.add_argument("--key-burst", type=int, default=5)
+    args = parser.parse_args()
+
+    # Slowed-down turns would checkpoint from dozens of threads at once, which the
+    # benchmark's SQLite file can't take; checkpoints aren't what's measured here.
+    os.environ.setdefault("PERSISTENCE_CHECKPOINT_INTERVAL", "3600")
+    setup_django()
+    from django.conf import settings
+
+    from chat import views
+
+    service = args.first_latency + args.chunk_interval * (args.chunks - 1)
+    rate = args.overload * args.capacity / service
+    model = SaturatingModel(args.capacity, first_latency=args.first_latency, chunk_interval=args.chunk_interval,
+                            chunk_count=args.chunks)
+    print(f"upstream: {args.capacity} turns at once, {service:.2f} s a turn ({args.capacity / service:.1f} turns/s); "
+          f"offered {rate:.1f} turns/s for {args.duration:g} s, {args.hot_share:.0%} on one key")
+    print(f"{'':>13} | {'turns':>5} | {'done':>5} | {'rate 429':>8} | {'full 429':>8} | {'timeout':>7} | "
+          f"{'ttfd p50':>8} | {'ttfd p99':>8} | {'total p99':>9} | {'429 p99 ms':>10} | peak in flight")
+    with mock.patch.object(views, "gemini_model", return_value=model):
+        for label, admission in (
+            ("no admission", {"ENABLED": False}),
+            ("admission", {
+                "ENABLED": True, "MAX_ACTIVE": args.capacity, "QUEUE_SIZE": 2 * args.capacity,
+                "QUEUE_TIMEOUT": args.queue_timeout, "KEY_RATE": args.key_rate, "KEY_BURST": args.key_burst,
+            }),
+        ):
+            settings.ADMISSION = admission
+            model.peak = 0
+            results = run(views, rate, args.duration, args.hot_share, seed=22)
+            outcomes = Counter(outcome for outcome, _, _ in results)
+            done = [(first, total) for outcome, first, total in results if outcome == "completed"]
+            ttfd = summarize([first for first, _ in done])
+            total = summarize([total for _, total in done])
+            rejected = summarize([total for outcome, _, total in results if outcome in ("rate_limited", "queue_full")])
+            print(f"{label:>13} | {len(results):>5} | {outcomes['completed']:>5} | {outcomes['rate_limited']:>8} | "
+                  f"{outcomes['queue_full']:>8} | {outcomes['queue_timeout']:>7} | {ttfd['p50']:>8.2f} | "
+                  f"{ttfd['p99']:>8.2f} | {total['p99']:>9.2f} | {rejected['p99'] * 1000:>10.1f} | {model.peak}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# benchmarks/bulk_transfer.py
+#
+# Throughput of export_chats / import_chats (chat/transfer.py) on --rows seeded
+# turns with answers of about --result-bytes of mixed words, against Django's own
+# dumpdata / loaddata of the chat table. For each compression it reports:
+#   export   rows/s and uncompressed MB/s written to a file, and the file size
+#   import   rows/s into an empty chat table (FTS triggers and all), then again
+#            over the same rows, which are all skipped
+# and what 10 million rows would take at that rate. A last pass repeats the gzip
+# export and dumpdata under tracemalloc for the peak Python heap of each.
+#
+#   python -m benchmarks.bulk_transfer --rows 200000
+#   python -m benchmarks.bulk_transfer --rows 1000000 --no-baseline
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+from .common import setup_django
+
+WORDS = ("the of and to in is that for it as with was on be by this are from or have an which not but what "
+         "all were when we there can more one has their if will would about so out up into them do than some "
+         "time could these two may first then other its new only people also any like after very just").split()
+
+
+def seed(rows, result_bytes, conversations=1000):
+    from django.utils import timezone
+
+    from chat.models import Chat
+
+    rng = random.Random(24)
+    start = timezone.now() - timedelta(days=365)
+    vocabulary = WORDS + [f"term{index}" for index in range(2000)]
+    for offset in range(0, rows, 5000):
+        Chat.objects.bulk_create([
+            Chat(
+                prompt=" ".join(rng.choices(vocabulary, k=12)),
+                result=" ".join(rng.choices(vocabulary, k=result_bytes // 6)),
+                conversation_name=f"conv-{index % conversations}",
+                date_time=start + timedelta(seconds=index, microseconds=index % 1000),
+            )
+            for index in range(offset, min(rows, offset + 5000))
+        ])
+
+
+def peak_heap_mb(run):
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def line(label, rows, seconds, extra=""):
+    projected = 10_000_000 / (rows / seconds) / 60
+    print(f"{label:>22} | {rows / seconds:>9,.0f} | {seconds:>7.1f} | {projected:>10.1f} | {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--result-bytes", type=int, default=600)
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--no-baseline", action="store_true", help="skip dumpdata / loaddata")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+
+    from chat import transfer
+    from chat.models import Chat
+
+    seed(args.rows, args.result_bytes)
+    directory = tempfile.mkdtemp(prefix="juno-transfer-")
+    compressions = ["none", "gzip"] + (["zstd"] if transfer.zstandard is not None else [])
+    print(f"{args.rows} rows, ~{args.result_bytes} B answers; zstd "
+          f"{'available' if transfer.zstandard is not None else 'skipped (zstandard is not installed)'}")
+    print(f"{'':>22} | {'rows/s':>9} | {'seconds':>7} | {'10M rows min':>10} |")
+
+    files = {}
+    plain_size = None
+    for compression in compressions:
+        path = os.path.join(directory, "chats" + transfer.SUFFIXES[compression])
+        started = time.perf_counter()
+        with open(path, "wb") as out:
+            rows, size = transfer.write_export(out, compression=compression)
+        seconds = time.perf_counter() - started
+        plain_size = plain_size or size
+        files[compression] = path
+        line(f"export {compression}", rows, seconds,
+             f"{plain_size / 2 ** 20 / seconds:.0f} MB/s, file {size / 2 ** 20:.1f} MB "
+             f"({size / plain_size:.0%})")
+
+    for compression in compressions:
+        Chat.objects.all().delete()
+        with open(files[compression], "rb") as source:
+            stats = transfer.import_rows(source.read, args.batch_size)
+        assert stats.created == args.rows, stats.as_dict()
+        line(f"import {compression}", stats.read, stats.seconds)
+    started = time.perf_counter()
+    transfer.rebuild_conversations(stats.conversations)
+    print(f"{'':>22}   then rebuild_conversations: {time.perf_counter() - started:.1f} s")
+    with open(files["gzip"], "rb") as source:
+        stats = transfer.import_rows(source.read, args.batch_size)
+    assert stats.skipped == args.rows, stats.as_dict()
+    line("re-import gzip (skips)", stats.read, stats.seconds)
+
+    if not args.no_baseline:
+        path = os.path.join(directory, "dumpdata.json")
+        started = time.perf_counter()
+        call_command("dumpdata", "chat.chat", output=path, verbosity=0)
+        line("dumpdata", args.rows, time.perf_counter() - started, f"file {os.path.getsize(path) / 2 ** 20:.1f} MB")
+        Chat.objects.all().delete()
+        started = time.perf_counter()
+        call_command("loaddata", path, verbosity=0)
+        line("loaddata", args.rows, time.perf_counter() - started)
+
+    with open(os.devnull, "wb") as sink:
+        heap = peak_heap_mb(lambda: transfer.write_export(sink, compression="gzip"))
+    print(f"peak Python heap: export gzip {heap:.1f} MB", end="")
+    if not args.no_baseline:
+        heap = peak_heap_mb(lambda: call_command("dumpdata", "chat.chat", output=os.devnull, verbosity=0))
+        print(f", dumpdata {heap:.1f} MB", end="")
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# benchmarks/client_pool.py
+#
+# Back-to-back Gemini and Tavily calls with a fresh client per request (the old
+# genai.configure + GenerativeModel / TavilyClient per call) vs the pooled clients
+# from chat/clients.py. A local stub HTTP server stands in for both APIs; it sleeps
+# --connect-cost ms on every new connection to play the part of the TCP + TLS
+# handshake a real endpoint costs, and counts how many connections were opened.
+#
+#   python -m benchmarks.client_pool --requests 200 --connect-cost 40
+
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .common import setup_django, summarize
+
+GEMINI_RESPONSE = json.dumps({
+    "candidates": [{"content": {"role": "model", "parts": [{"text": "pong"}]}, "finishReason": "STOP"}],
+}).encode()
+TAVILY_RESPONSE = json.dumps({
+    "query": "ping", "results": [{"title": "ping", "url": "https://example.com/ping", "content": "pong"}],
+}).encode()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, connect_cost, response_latency):
+        self.connect_cost = connect_cost
+        self.response_latency = response_latency
+        self.connections = 0
+        self._lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), StubHandler)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Otherwise Nagle + delayed ACK add ~40 ms to every reply on a kept-alive socket.
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.connections += 1
+        time.sleep(self.server.connect_cost)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        time.sleep(self.server.response_latency)
+        body = TAVILY_RESPONSE if self.path.startswith("/search") else GEMINI_RESPONSE
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(server, requests, call):
+    before = server.connections
+    timings = []
+    for i in range(requests):
+        started = time.perf_counter()
+        call(i)
+        timings.append(time.perf_counter() - started)
+    return summarize(timings), server.connections - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--connect-cost", type=float, default=40, help="ms per new connection")
+    parser.add_argument("--latency", type=float, default=5, help="ms per response")
+    args = parser.parse_args()
+
+    server = StubServer(args.connect_cost / 1000, args.latency / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["GEMINI_TRANSPORT"] = "rest"
+    os.environ["GEMINI_API_ENDPOINT"] = endpoint
+    os.environ["TAVILY_API_BASE_URL"] = endpoint
+
+    setup_django()
+    import google.generativeai as genai
+    from tavily import TavilyClient
+
+    from chat import clients
+
+    def gemini_fresh(i):
+        genai.configure(api_key="bench", transport="rest", client_options={"api_endpoint": endpoint})
+        genai.GenerativeModel("gemini-2.5-flash").generate_content("ping")
+
+    def gemini_pooled(i):
+        clients.gemini_model("bench", "gemini-2.5-flash").generate_content("ping")
+
+    def tavily_fresh(i):
+        TavilyClient(api_key="bench", api_base_url=endpoint).search(query="ping", search_depth="basic")
+
+    def tavily_pooled(i):
+        clients.tavily_client("bench").search(query="ping", search_depth="basic")
+
+    print(f"{'call':>16} | {'p50 ms':>7} | {'p99 ms':>7} | {'mean ms':>7} | {'connections':>11}")
+    for label, call in (
+        ("gemini fresh", gemini_fresh),
+        ("gemini pooled", gemini_pooled),
+        ("tavily fresh", tavily_fresh),
+        ("tavily pooled", tavily_pooled),
+    ):
+        stats, connections = measure(server, args.requests, call)
+        print(f"{label:>16} | {stats['p50'] * 1000:>7.1f} | {stats['p99'] * 1000:>7.1f} | "
+              f"{stats['mean'] * 1000:>7.1f} | {connections:>11}")
+    print(f"pools: {clients.stats()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+# benchmarks/common.py
+#
+# Shared setup for the scripts in this package. Run them from backend/main, e.g.
+#   python -m benchmarks.concurrent_streams
+# Nothing here talks to Gemini or Tavily; the fakes below stand in for both.
+
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+
+def setup_django(db_path=None):
+    """Points Django at a throwaway SQLite file (and blob store), migrates it and returns its path."""
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="juno-bench-"), "bench.sqlite3")
+    os.environ.setdefault("BLOB_STORE_LOCATION", os.path.join(os.path.dirname(db_path), "blobs"))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "main.settings")
+    os.environ.setdefault("SECRET_KEY", "benchmark-only")
+    # Every benchmark client shares one API key; admission.py has a benchmark of its own.
+    os.environ.setdefault("ADMISSION", "0")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command("migrate", verbosity=0)
+    return db_path
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": statistics.fmean(values) if values else 0.0,
+    }
+
+
+# --- Gemini stand-ins -------------------------------------------------------
+# Only the attributes the views actually touch are modelled: candidates[0].content.parts,
+# part.function_call (name/args) and chunk.text.
+
+class FakeFunctionCall:
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+
+class FakePart:
+    def __init__(self, text="", function_call=None):
+        self.text = text
+        self.function_call = function_call
+
+
+class FakeContent:
+    def __init__(self, parts, role="model"):
+        self.parts = parts
+        self.role = role
+
+
+class FakeCandidate:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeResponse:
+    def __init__(self, parts):
+        self.candidates = [FakeCandidate(FakeContent(parts))]
+        self.parts = parts
+        self.text = "".join(part.text for part in parts)
+
+
+class FakeGenerativeModel:
+    """
+    Sleeps like the real model would. `first_latency` is time to the first chunk
+    (or to the whole answer when stream=False), `chunk_interval` the gap between chunks.
+    When `tool_call` is set, the first `tool_rounds` generations ask for internet_search,
+    `parallel_calls` times each, before the model answers in text.
+    """
+
+    def __init__(self, first_latency=0.3, chunk_interval=0.05, chunk_count=10,
+                 chunk_text="lorem ipsum ", tool_call=False, tool_rounds=1, parallel_calls=1):
+        self.first_latency = first_latency
+        self.chunk_interval = chunk_interval
+        self.chunk_count = chunk_count
+        self.chunk_text = chunk_text
+        self.tool_call = tool_call
+        self.tool_rounds = tool_rounds
+        self.parallel_calls = parallel_calls
+        self.calls = 0
+        self.requests = []
+
+    def _wants_tool(self, contents, kwargs):
+        if not self.tool_call or kwargs.get("tool_config"):
+            return False
+        rounds_done = sum(
+            1 for content in contents
+            if (content.get("role") if isinstance(content, dict) else getattr(content, "role", None)) == "tool"
+        )
+        return rounds_done < self.tool_rounds
+
+    def _chunks(self, contents, kwargs):
+        if self._wants_tool(contents, kwargs):
+            parts = [
+                FakePart(function_call=FakeFunctionCall(
+                    "internet_search", {"query": "benchmark query" + (f" {i + 1}" if i else "")}
+                ))
+                for i in range(self.parallel_calls)
+            ]
+            return [FakeResponse(parts)]
+        return [FakeResponse([FakePart(text=self.chunk_text)]) for _ in range(self.chunk_count)]
+
+    def _whole(self, contents, kwargs):
+        chunks = self._chunks(contents, kwargs)
+        return FakeResponse([part for chunk in chunks for part in chunk.parts])
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        self.calls += 1
+        self.requests.append((list(contents), kwargs))
+        if not stream:
+            time.sleep(self.first_latency + self.chunk_interval * (self.chunk_count - 1))
+            return self._whole(contents, kwargs)
+        return self._stream(contents, kwargs)
+
+    def _stream(self, contents, kwargs):
+        time.sleep(self.first_latency)
+        for index, chunk in enumerate(self._chunks(contents, kwargs)):
+            if index:
+                time.sleep(self.chunk_interval)
+            yield chunk
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        self.calls += 1
+        self.requests.append((list(contents), kwargs))
+        if not stream:
+            await asyncio.sleep(self.first_latency + self.chunk_interval * (self.chunk_count - 1))
+            return self._whole(contents, kwargs)
+        return self._astream(contents, kwargs)
+
+    async def _astream(self, contents, kwargs):
+        await asyncio.sleep(self.first_latency)
+        for index, chunk in enumerate(self._chunks(contents, kwargs)):
+            if index:
+                await asyncio.sleep(self.chunk_interval)
+            yield chunk
+
+
+class PassThroughToolCache:
+    """Stands in for chat.tool_cache so every tool call really runs."""
+
+    def call(self, tool_name, tool_args, tool_call):
+        return tool_call()
+
+
+# --- Tavily stand-in --------------------------------------------------------
+
+class FakeTavilyClient:
+    """Drop-in for TavilyClient: every search() sleeps `latency` seconds (or latency(query))."""
+
+    def __init__(self, api_key=None, latency=0.2, results_per_call=3):
+        self.api_key = api_key
+        self.latency = latency
+        self.results_per_call = results_per_call
+        self.calls = 0
+
+    def search(self, query, **kwargs):
+        self.calls += 1
+        delay = self.latency(query) if callable(self.latency) else self.latency
+        time.sleep(delay)
+        slug = "-".join(query.lower().split())
+        return {
+            "query": query,
+            "results": [
+                {"title": f"{query} #{i}", "url": f"https://example.com/{slug}/{i}",
+                 "content": f"Snippet {i} about {query}.", "score": 1.0 / (i + 1)}
+                for i in range(self.results_per_call)
+            ],
+        }
@@ -0,0 +1,93 @@
+# benchmarks/compare.py
+#
+# Compares two result files from benchmarks/e2e.py and flags regressions. For
+# each endpoint and concurrency level the runs share, it checks:
+#   p50/p95/p99 latency and time to first byte/delta   worse when higher
+#   throughput                                           worse when lower
+#   queries per request                                  worse when higher
+#   errors                                               worse when more
+# Timings and throughput only count as regressions past --threshold (relative)
+# and, for timings, --min-delta-ms (absolute), so noise on fast endpoints stays
+# quiet. Any rise in queries per request is flagged. Exits with status 1 when
+# something regressed, so CI can run it.
+#
+#   python -m benchmarks.compare before.json after.json --threshold 0.1
+
+import argparse
+import json
+import sys
+
+TIMINGS = [
+    ("latency_ms", "p50"), ("latency_ms", "p95"), ("latency_ms", "p99"),
+    ("first_byte_ms", "p50"), ("first_delta_ms", "p50"), ("first_delta_ms", "p99"),
+]
+# Queries per request move by fractions when background writes batch differently.
+QUERY_TOLERANCE = 0.5
+
+
+def _key(entry):
+    return entry["endpoint"], entry["concurrency"]
+
+
+def compare(baseline, current, threshold=0.1, min_delta_ms=5.0):
+    """
+    (metric label, endpoint, concurrency, before, after, relative change, regressed)
+    for every metric of every endpoint and level in both reports.
+    """
+    before = {_key(entry): entry for entry in baseline["results"]}
+    rows = []
+    for entry in current["results"]:
+        old = before.get(_key(entry))
+        if old is None:
+            continue
+        endpoint, concurrency = _key(entry)
+
+        def row(label, was, now, regressed):
+            change = (now - was) / was if was else 0.0
+            rows.append((label, endpoint, concurrency, was, now, change, regressed))
+
+        for group, name in TIMINGS:
+            if group in old and group in entry:
+                was, now = old[group][name], entry[group][name]
+                row(f"{group[:-3]} {name} ms", was, now,
+                    now - was > min_delta_ms and now > was * (1 + threshold))
+        was, now = old["throughput"], entry["throughput"]
+        row("throughput", was, now, now < was * (1 - threshold))
+        was, now = old["queries_per_request"], entry["queries_per_request"]
+        row("queries/request", was, now, now - was > QUERY_TOLERANCE)
+        row("errors", old["errors"], entry["errors"], entry["errors"] > old["errors"])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change that counts, e.g. 0.1 = 10%%")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0)
+    parser.add_argument("--all", action="store_true", help="list every metric, not only the ones that moved")
+    args = parser.parse_args()
+
+    with open(args.baseline) as baseline, open(args.current) as current:
+        baseline, current = json.load(baseline), json.load(current)
+    print(f"baseline {baseline['meta'].get('revision')} ({baseline['meta']['created']}) -> "
+          f"current {current['meta'].get('revision')} ({current['meta']['created']})")
+    settings = [{name: value for name, value in report["meta"]["args"].items() if name != "output"}
+                for report in (baseline, current)]
+    if settings[0] != settings[1]:
+        print("warning: the runs used different arguments")
+
+    rows = compare(baseline, current, args.threshold, args.min_delta_ms)
+    print(f"{'endpoint':>16} | {'conc':>4} | {'metric':>18} | {'before':>9} | {'after':>9} | {'change':>7}")
+    for label, endpoint, concurrency, was, now, change, regressed in rows:
+        if args.all or regressed or abs(change) > args.threshold:
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{endpoint:>16} | {concurrency:>4} | {label:>18} | {was:>9.1f} | {now:>9.1f} | "
+                  f"{change:>+7.0%}{flag}")
+    regressions = sum(1 for row in rows if row[-1])
+    print(f"{regressions} regression(s) in {len(rows)} metrics")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# benchmarks/concurrent_streams.py
+#
+# Concurrent-stream capacity of interface_stream (sync generator, one thread per
+# open stream) vs interface_stream_async (async generator on one event loop).
+#
+# The sync path gets a fixed pool of worker threads, like a gthread worker would;
+# the async path gets a single event loop. Both talk to the same stubbed model and
+# search tool, so the only variable is how an open stream is held.
+#
+#   python -m benchmarks.concurrent_streams --threads 32 --levels 25,100,400
+
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from .common import FakeGenerativeModel, PassThroughToolCache, setup_django, summarize
+
+
+def _body():
+    return json.dumps({
+        "geminiApiKey": "bench",
+        "tavilyApiKey": "bench",
+        "conversation_name": "bench",
+        "history": [{"role": "user", "content": "What happened today?"}],
+    })
+
+
+def _patches(views, model_kwargs, tool_latency):
+    def fake_search(query, tavily_api_key):
+        time.sleep(tool_latency)
+        return {"results": [{"url": "https://example.com", "content": query}]}
+
+    return [
+        mock.patch.object(views, "gemini_model", lambda *args, **kwargs: FakeGenerativeModel(**model_kwargs)),
+        mock.patch.dict(views.AVAILABLE_TOOLS, {"internet_search": fake_search}),
+        mock.patch.object(views, "get_tool_cache", PassThroughToolCache),
+    ]
+
+
+def run_sync(views, concurrency, threads):
+    from django.test import RequestFactory
+
+    factory = RequestFactory()
+
+    # Every client connects at once, so latency is measured from the batch start:
+    # time spent waiting for a free worker thread counts against the sync path.
+    def one_stream(started):
+        first_delta = None
+        request = factory.post("/interface_stream/", _body(), content_type="application/json")
+        response = views.interface_stream(request)
+        for part in response.streaming_content:
+            if first_delta is None and b'"delta"' in part:
+                first_delta = time.perf_counter() - started
+        response.close()
+        return first_delta or 0.0, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(one_stream, [started] * concurrency))
+    return results, time.perf_counter() - started
+
+
+def run_async(views, concurrency):
+    from django.test import AsyncRequestFactory
+
+    factory = AsyncRequestFactory()
+
+    async def one_stream(started):
+        first_delta = None
+        request = factory.post("/interface_stream_async/", _body(), content_type="application/json")
+        response = await views.interface_stream_async(request)
+        async for part in response.streaming_content:
+            if first_delta is None and b'"delta"' in part:
+                first_delta = time.perf_counter() - started
+        return first_delta or 0.0, time.perf_counter() - started
+
+    async def main():
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one_stream(started) for _ in range(concurrency)))
+        return results, time.perf_counter() - started
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=32, help="worker threads for the sync path")
+    parser.add_argument("--levels", default="25,50,100,200,400")
+    parser.add_argument("--first-latency", type=float, default=0.3)
+    parser.add_argument("--chunk-interval", type=float, default=0.05)
+    parser.add_argument("--chunks", type=int, default=10)
+    parser.add_argument("--tool-call", action="store_true", help="make every turn go through the search tool")
+    parser.add_argument("--tool-latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    setup_django()
+    from chat import views
+
+    model_kwargs = {
+        "first_latency": args.first_latency,
+        "chunk_interval": args.chunk_interval,
+        "chunk_count": args.chunks,
+        "tool_call": args.tool_call,
+    }
+    patches = _patches(views, model_kwargs, args.tool_latency)
+    for patch in patches:
+        patch.start()
+
+    print(f"sync: {args.threads} threads | async: 1 event loop")
+    print(f"{'streams':>8} | {'path':>5} | {'wall s':>7} | {'streams/s':>9} | "
+          f"{'ttfd p50':>8} | {'ttfd p99':>8} | {'total p99':>9}")
+    try:
+        for level in [int(value) for value in args.levels.split(",")]:
+            for label, runner in (("sync", lambda: run_sync(views, level, args.threads)),
+                                  ("async", lambda: run_async(views, level))):
+                results, wall = runner()
+                ttfd = summarize([first for first, _ in results])
+                total = summarize([end for _, end in results])
+                print(f"{level:>8} | {label:>5} | {wall:>7.2f} | {level / wall:>9.1f} | "
+                      f"{ttfd['p50']:>8.2f} | {ttfd['p99']:>8.2f} | {total['p99']:>9.2f}")
+    finally:
+        for patch in patches:
+            patch.stop()
+
+
+if __name__ == "__main__":
+    main()
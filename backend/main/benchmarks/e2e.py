@@ -0,0 +1,416 @@
+# benchmarks/e2e.py
+#
+# End-to-end load test of the backend over real HTTP. The Django app is served
+# by Django's threaded WSGI server, from a throwaway SQLite database seeded with
+# --rows turns across --conversations conversations of --result-kb answers. Gemini
+# and Tavily are replaced by one local stub server. chat/clients.py talks to it
+# through GEMINI_API_ENDPOINT (REST transport) and TAVILY_API_BASE_URL, so every
+# layer between the client and the upstream APIs is the production code.
+#
+# The stub streams each answer as --chunks chunks of text. The first arrives
+# after --first-latency seconds and the rest follow every --chunk-interval.
+# --search-share of the prompts are asked for an internet_search first, and each
+# search takes --search-latency.
+#
+# Each endpoint runs at every --concurrency level: that many clients send
+# requests back to back until --requests are done. Endpoints:
+#   history            GET /history/
+#   conversation       GET /conversation/conv-0/
+#   interface_fetch    GET /interface_fetch/
+#   interface_stream   POST /interface_stream/, read to the end
+# (interface_stream goes last, since the turns it saves change what interface_fetch returns).
+# Reported per endpoint and level:
+#   - throughput in requests/s
+#   - time to first byte, and for interface_stream also time to the first delta
+#   - p50/p95/p99 latency to the end of the response
+#   - database queries per request, including writes by background threads
+#
+# --output saves the results as JSON; benchmarks/compare.py diffs two such files.
+#
+#   python -m benchmarks.e2e --output before.json
+#   python -m benchmarks.e2e --concurrency 1,8,32 --requests 100 --endpoints history,interface_stream
+#   python -m benchmarks.compare before.json after.json
+
+import argparse
+import datetime
+import http.client
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .common import setup_django, summarize
+
+ENDPOINTS = ["history", "conversation", "interface_fetch", "interface_stream"]
+SEARCH_MARKER = "[search]"
+# socketserver listens with a backlog of 5; past that, connections wait out a
+# one-second SYN retry, which would show up as everyone's p99.
+LISTEN_BACKLOG = 1024
+
+
+# --- Gemini + Tavily stand-in -----------------------------------------------
+
+class UpstreamStub(ThreadingHTTPServer):
+    """
+    Answers the Gemini REST API's generateContent and streamGenerateContent calls,
+    and Tavily's /search, after the configured delays.
+    """
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+    def __init__(self, first_latency=0.2, chunk_interval=0.03, chunk_count=10, chunk_text="lorem ipsum ",
+                 search_latency=0.2):
+        self.first_latency = first_latency
+        self.chunk_interval = chunk_interval
+        self.chunk_count = chunk_count
+        self.chunk_text = chunk_text
+        self.search_latency = search_latency
+        self.calls = {"generate": 0, "stream": 0, "search": 0}
+        self._lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), UpstreamHandler)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def answers(self, request):
+        """The GenerateContentResponse chunks for a request: a search call, or the answer in text."""
+        parts = [part for content in request.get("contents", []) for part in content.get("parts", [])]
+        asked = [part["text"] for part in parts if SEARCH_MARKER in (part.get("text") or "")]
+        if asked and request.get("tools") and not any("functionResponse" in part for part in parts):
+            # A query per prompt, so the tool cache doesn't answer for the stub.
+            query = asked[-1].replace(SEARCH_MARKER, "").strip()
+            call = {"functionCall": {"name": "internet_search", "args": {"query": query}}}
+            return [_candidate([call], finished=True)]
+        return [
+            _candidate([{"text": self.chunk_text}], finished=index == self.chunk_count - 1)
+            for index in range(self.chunk_count)
+        ]
+
+
+def _candidate(parts, finished):
+    candidate = {"content": {"role": "model", "parts": parts}, "index": 0}
+    if finished:
+        candidate["finishReason"] = "STOP"
+    return {"candidates": [candidate]}
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Otherwise Nagle + delayed ACK add ~40 ms to every reply on a kept-alive socket.
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        stub = self.server
+        if self.path.startswith("/search"):
+            stub.count("search")
+            time.sleep(stub.search_latency)
+            self._send_json({"query": body.get("query"), "results": [
+                {"title": f"Result {index}", "url": f"https://example.com/{index}",
+                 "content": f"Snippet {index} about {body.get('query')}.", "score": 1.0 / (index + 1)}
+                for index in range(3)
+            ]})
+        elif ":streamGenerateContent" in self.path:
+            stub.count("stream")
+            self._stream(stub.answers(body))
+        elif ":generateContent" in self.path:
+            stub.count("generate")
+            chunks = stub.answers(body)
+            time.sleep(stub.first_latency + stub.chunk_interval * (len(chunks) - 1))
+            parts = [part for chunk in chunks for part in chunk["candidates"][0]["content"]["parts"]]
+            self._send_json(_candidate(parts, finished=True))
+        else:
+            self.send_error(404)
+
+    def _send_json(self, value):
+        data = json.dumps(value).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, chunks):
+        # The REST transport reads streamed answers as one JSON array, element by element.
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(self.server.first_latency)
+        for index, chunk in enumerate(chunks):
+            if index:
+                time.sleep(self.server.chunk_interval)
+            self._write_chunk((b"[" if index == 0 else b",") + json.dumps(chunk).encode())
+        self._write_chunk(b"]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+# --- The app under test ------------------------------------------------------
+
+class QueryCounter:
+    """Counts every query on every database connection, whichever thread runs it."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self):
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+
+        connection_created.connect(self._attach, weak=False)
+        for connection in connections.all():
+            self._attach(None, connection)
+
+    def _attach(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+def start_app():
+    """Serves the Django app on a free port in a background thread; returns (server, port)."""
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+    from django.core.wsgi import get_wsgi_application
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadedWSGIServer):
+        request_queue_size = LISTEN_BACKLOG
+
+    server = Server(("127.0.0.1", 0), QuietHandler, allow_reuse_address=True)
+    server.set_app(get_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+# --- Load ---------------------------------------------------------------------
+
+def endpoint_request(endpoint, index, search_share=0.0):
+    """(method, path, body) of the index-th request to `endpoint`."""
+    if endpoint == "history":
+        return "GET", "/history/", None
+    if endpoint == "conversation":
+        return "GET", "/conversation/conv-0/", None
+    if endpoint == "interface_fetch":
+        return "GET", "/interface_fetch/", None
+    if endpoint == "interface_stream":
+        return "POST", "/interface_stream/", stream_body(index, search_share)
+    raise ValueError(f"Unknown endpoint {endpoint!r}")
+
+
+def stream_body(index, search_share):
+    # The first of every 1/search_share prompts asks for a search, the same ones on every run.
+    search = int((index + 1) * search_share) > int(index * search_share)
+    prompt = f"Question {index}: what happened today?" + (f" {SEARCH_MARKER}" if search else "")
+    return json.dumps({
+        "geminiApiKey": "bench", "tavilyApiKey": "bench", "conversation_name": f"e2e-{index % 20}",
+        "history": [{"role": "user", "content": prompt}],
+    }).encode()
+
+
+def one_request(port, method, path, body):
+    """Timings of one request read to the end, in seconds from when it was sent."""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    started = time.perf_counter()
+    first_byte = first_delta = None
+    size = 0
+    failed = False
+    try:
+        connection.request(method, path, body=body,
+                           headers={"Content-Type": "application/json"} if body is not None else {})
+        response = connection.getresponse()
+        failed = response.status != 200
+        while True:
+            piece = response.read1(65536)
+            if not piece:
+                break
+            now = time.perf_counter()
+            if first_byte is None:
+                first_byte = now - started
+            if first_delta is None and b'"type": "delta"' in piece:
+                first_delta = now - started
+            if b'"type": "error"' in piece:
+                failed = True
+            size += len(piece)
+    except (OSError, http.client.HTTPException):
+        failed = True
+    finally:
+        connection.close()
+    return {"first_byte": first_byte, "first_delta": first_delta, "total": time.perf_counter() - started,
+            "bytes": size, "failed": failed}
+
+
+def run_level(port, endpoint, concurrency, requests, search_share):
+    """`concurrency` clients sending requests back to back until `requests` are done."""
+    lock = threading.Lock()
+    issued = iter(range(requests))
+    results = []
+
+    def client():
+        while True:
+            with lock:
+                index = next(issued, None)
+            if index is None:
+                return
+            result = one_request(port, *endpoint_request(endpoint, index, search_share))
+            with lock:
+                results.append(result)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    return results, time.perf_counter() - started
+
+
+def percentiles(values):
+    stats = summarize(values)
+    return {name: round(stats[name] * 1000, 2) for name in ("p50", "p95", "p99", "mean")}
+
+
+def level_result(endpoint, concurrency, results, wall, queries):
+    done = [result for result in results if not result["failed"]]
+    entry = {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(results) - len(done),
+        "throughput": round(len(done) / wall, 2),
+        "latency_ms": percentiles([result["total"] for result in done]),
+        "first_byte_ms": percentiles([result["first_byte"] for result in done if result["first_byte"] is not None]),
+        "queries_per_request": round(queries / max(1, len(results)), 2),
+        "bytes_per_request": round(sum(result["bytes"] for result in done) / max(1, len(done))),
+    }
+    if endpoint == "interface_stream":
+        entry["first_delta_ms"] = percentiles(
+            [result["first_delta"] for result in done if result["first_delta"] is not None]
+        )
+    return entry
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(entry):
+    first = entry.get("first_delta_ms", entry["first_byte_ms"])
+    print(f"{entry['endpoint']:>16} | {entry['concurrency']:>4} | {entry['requests']:>5} | {entry['errors']:>4} | "
+          f"{entry['throughput']:>8.1f} | {first['p50']:>9.1f} | {entry['latency_ms']['p50']:>8.1f} | "
+          f"{entry['latency_ms']['p95']:>8.1f} | {entry['latency_ms']['p99']:>8.1f} | "
+          f"{entry['queries_per_request']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated client counts")
+    parser.add_argument("--requests", type=int, default=60, help="per endpoint and concurrency level")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--result-kb", type=int, default=2)
+    parser.add_argument("--first-latency", type=float, default=0.2)
+    parser.add_argument("--chunk-interval", type=float, default=0.03)
+    parser.add_argument("--chunks", type=int, default=10)
+    parser.add_argument("--search-share", type=float, default=0.25)
+    parser.add_argument("--search-latency", type=float, default=0.2)
+    parser.add_argument("--output", help="write the results here as JSON")
+    args = parser.parse_args()
+
+    endpoints = [name for name in ENDPOINTS if name in args.endpoints.split(",")]
+    unknown = set(args.endpoints.split(",")) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    levels = [int(value) for value in args.concurrency.split(",")]
+
+    upstream = UpstreamStub(args.first_latency, args.chunk_interval, args.chunks, search_latency=args.search_latency)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    os.environ["GEMINI_TRANSPORT"] = "rest"
+    os.environ["GEMINI_API_ENDPOINT"] = upstream.url
+    os.environ["TAVILY_API_BASE_URL"] = upstream.url
+    setup_django()
+
+    from django.conf import settings
+
+    from chat.persistence import turn_queue
+
+    from .history_projection import seed
+
+    settings.ALLOWED_HOSTS = ["127.0.0.1"]
+    seed(args.rows, args.conversations, args.result_kb)
+    counter = QueryCounter()
+    counter.install()
+    app, port = start_app()
+
+    # One of each first, so imports, connections and client pools aren't on the clock.
+    for endpoint in endpoints:
+        one_request(port, *endpoint_request(endpoint, 0))
+    turn_queue.drain()
+
+    print(f"{args.rows} rows in {args.conversations} conversations; upstream: first chunk {args.first_latency:g} s, "
+          f"{args.chunks} chunks every {args.chunk_interval:g} s, {args.search_share:.0%} of turns search "
+          f"({args.search_latency:g} s)")
+    print(f"{'endpoint':>16} | {'conc':>4} | {'reqs':>5} | {'errs':>4} | {'req/s':>8} | {'first ms':>9} | "
+          f"{'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | {'queries':>9}")
+    entries = []
+    for endpoint in endpoints:
+        for concurrency in levels:
+            before = counter.count
+            results, wall = run_level(port, endpoint, concurrency, args.requests, args.search_share)
+            # Background saves belong to the requests that caused them.
+            turn_queue.drain()
+            entry = level_result(endpoint, concurrency, results, wall, counter.count - before)
+            entries.append(entry)
+            print_result(entry)
+    print("(first ms is time to the first delta for interface_stream, to the first byte elsewhere)")
+    app.shutdown()
+    upstream.shutdown()
+
+    if args.output:
+        import django
+
+        report = {
+            "meta": {
+                "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "machine": platform.machine(),
+                "args": vars(args),
+                "upstream_calls": dict(upstream.calls),
+            },
+            "results": entries,
+        }
+        with open(args.output, "w") as out:
+            json.dump(report, out, indent=2)
+        print(f"saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# benchmarks/fulltext_search.py
+#
+# /search/ latency over a large chat table: the indexed search (FTS5 with bm25 and
+# snippets on SQLite) against the icontains scan it replaces, for a common word, a
+# mid-frequency word, a rare word, two words together and a phrase. Turns are
+# synthetic text drawn from a Zipf-distributed vocabulary, like real language,
+# and are bulk-inserted into chat so the triggers build the index as they go.
+#
+#   python -m benchmarks.fulltext_search --rows 1000000
+
+import argparse
+import itertools
+import random
+import time
+from datetime import timedelta
+
+from .common import setup_django, summarize
+
+SYLLABLES = ["ka", "to", "ri", "men", "sol", "va", "ne", "lu", "dor", "pi", "ash", "qe", "zu", "bel", "tor"]
+
+
+def vocabulary(size):
+    words = ("".join(parts) for length in (2, 3, 4) for parts in itertools.product(SYLLABLES, repeat=length))
+    return list(itertools.islice(words, size))
+
+
+def seed(rows, vocab, conversations, batch):
+    from django.utils import timezone
+    from chat.models import Chat
+
+    rng = random.Random(16)
+    weights = [1 / rank for rank in range(1, len(vocab) + 1)]
+    start = timezone.now() - timedelta(days=365)
+
+    started = time.perf_counter()
+    for offset in range(0, rows, batch):
+        count = min(batch, rows - offset)
+        words = rng.choices(vocab, weights, k=count * 60)
+        Chat.objects.bulk_create([
+            Chat(
+                prompt=" ".join(words[index * 60:index * 60 + 10]),
+                result=" ".join(words[index * 60 + 10:index * 60 + 60]),
+                conversation_name=f"conv-{(offset + index) % conversations}",
+                date_time=start + timedelta(seconds=offset + index),
+            )
+            for index in range(count)
+        ], batch_size=500)
+    return time.perf_counter() - started
+
+
+def time_queries(search, query, limit, repeats):
+    timings = []
+    rows = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        rows = search(query, limit)
+        timings.append(time.perf_counter() - started)
+    return len(rows), summarize(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--vocabulary", type=int, default=20_000)
+    parser.add_argument("--conversations", type=int, default=5_000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--scan-repeats", type=int, default=3, help="the scan is slow on big tables")
+    args = parser.parse_args()
+
+    setup_django()
+    from chat.search import search_backend, search_turns
+
+    vocab = vocabulary(args.vocabulary)
+    seconds = seed(args.rows, vocab, args.conversations, batch=5000)
+    print(f"{args.rows:,} turns seeded and indexed in {seconds:.1f}s ({search_backend()})")
+
+    common, mid, rare = vocab[0], vocab[len(vocab) // 20], vocab[len(vocab) * 3 // 4]
+    cases = [
+        ("common word", common),
+        ("mid word", mid),
+        ("rare word", rare),
+        ("two words", f"{mid} {vocab[len(vocab) // 20 + 1]}"),
+        ("phrase", f'"{vocab[0]} {vocab[1]}"'),
+    ]
+
+    def scan(query, limit):
+        return search_turns(query.strip('"'), limit, backend="scan")
+
+    def indexed(query, limit):
+        return search_turns(query, limit)
+
+    print(f"{'query':>12} | {'search':>7} | {'hits':>4} | {'p50 ms':>8} | {'p99 ms':>8}")
+    for label, query in cases:
+        for name, search, repeats in (("scan", scan, args.scan_repeats), ("index", indexed, args.repeats)):
+            hits, timing = time_queries(search, query, args.limit, repeats)
+            print(f"{label:>12} | {name:>7} | {hits:>4} | {timing['p50'] * 1000:>8.2f} | {timing['p99'] * 1000:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
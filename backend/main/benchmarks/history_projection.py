@@ -0,0 +1,94 @@
+# benchmarks/history_projection.py
+#
+# Bytes on the wire and query time for the history endpoints with the full
+# result vs the summary projection, on a seeded database with large answers.
+#
+#   python -m benchmarks.history_projection --rows 5000 --result-kb 20
+
+import argparse
+import time
+from datetime import timedelta
+
+from .common import setup_django, summarize
+
+
+def seed(rows, conversations, result_kb):
+    from django.core.management import call_command
+    from django.utils import timezone
+    from chat.models import Chat
+
+    start = timezone.now() - timedelta(days=30)
+    result = ("lorem ipsum dolor sit amet " * (result_kb * 40))[:result_kb * 1024]
+    Chat.objects.bulk_create(
+        [
+            Chat(
+                prompt=f"question {index} about something",
+                result=result,
+                conversation_name=f"conv-{index % conversations}",
+                date_time=start + timedelta(seconds=index),
+            )
+            for index in range(rows)
+        ],
+        batch_size=500,
+    )
+    call_command("backfill_conversations", stdout=open("/dev/null", "w"))
+
+
+def measure(view, path, args, params, queryset, repeats):
+    from django.test import RequestFactory
+
+    factory = RequestFactory()
+    wall, sql = [], []
+    size = 0
+    for _ in range(repeats):
+        started = time.perf_counter()
+        response = view(factory.get(path, params), *args)
+        size = len(b"".join(response.streaming_content) if response.streaming else response.content)
+        wall.append(time.perf_counter() - started)
+
+        # The query on its own: execute and fetch every row, no serialization.
+        started = time.perf_counter()
+        list(queryset.all())
+        sql.append(time.perf_counter() - started)
+    return size, summarize(wall), summarize(sql)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--conversations", type=int, default=10)
+    parser.add_argument("--result-kb", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    from chat import views
+    from chat.models import Chat
+    from chat.projection import VIEWS, project
+
+    seed(args.rows, args.conversations, args.result_kb)
+
+    latest = Chat.objects.order_by('-date_time').values_list('conversation_name', flat=True).first()
+    cases = [
+        ("history (100 rows)", views.paginated_history, "/history/", (), {"cursor": "", "limit": 100},
+         Chat.objects.order_by('-date_time', '-id')[:100]),
+        ("conversation", views.conversation_by_name, "/conversation/conv-0/", ("conv-0",), {},
+         Chat.objects.filter(conversation_name="conv-0").order_by('date_time')),
+        ("interface_fetch", views.interface_fetch, "/interface_fetch/", (), {},
+         Chat.objects.filter(conversation_name=latest).order_by('date_time')),
+    ]
+    print(f"{args.rows} rows, {args.result_kb} KB results")
+    print(f"{'endpoint':>20} | {'view':>7} | {'bytes':>10} | {'p50 ms':>7} | {'query p50 ms':>12}")
+    for label, view, path, view_args, params, queryset in cases:
+        # "before" is view=full on the wire (same JSON as the old endpoints), with the
+        # query the old code ran: whole model instances.
+        for projection, rows in (("before", queryset), ("full", project(queryset, VIEWS["full"])),
+                                 ("summary", project(queryset, VIEWS["summary"]))):
+            view_name = "full" if projection == "before" else projection
+            size, wall, sql = measure(view, path, view_args, {**params, "view": view_name}, rows, args.repeats)
+            print(f"{label:>20} | {projection:>7} | {size:>10,} | {wall['p50'] * 1000:>7.1f} | "
+                  f"{sql['p50'] * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
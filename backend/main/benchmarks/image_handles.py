@@ -0,0 +1,68 @@
+# benchmarks/image_handles.py
+#
+# Per-turn request size and server-side parsing time (json.loads +
+# convert_to_gemini_history) for a conversation whose history carries images,
+# sent the old way (data: URLs resent every turn) vs as /upload/ handles.
+#
+#   python -m benchmarks.image_handles --turns 20 --image-every 4 --image-kb 2048
+
+import argparse
+import base64
+import json
+import os
+import time
+
+from .common import setup_django, summarize
+
+
+def history(turns, image_every, image_part):
+    messages = []
+    for turn in range(turns):
+        content = [{"type": "text", "text": f"question {turn}"}]
+        if turn % image_every == 0:
+            content.append(image_part(turn))
+        messages.append({"role": "user", "content": content})
+        messages.append({"role": "assistant", "content": f"answer {turn} " * 50})
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--image-every", type=int, default=4)
+    parser.add_argument("--image-kb", type=int, default=2048)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from chat import views
+    from chat.blobstore import save_blob
+
+    images = {}
+    for turn in range(0, args.turns, args.image_every):
+        images[turn] = b"\x89PNG\r\n\x1a\n" + os.urandom(args.image_kb * 1024)
+
+    inline_body = json.dumps({"history": history(args.turns, args.image_every, lambda turn: {
+        "type": "image_url",
+        "image_url": {"url": "data:image/png;base64," + base64.b64encode(images[turn]).decode()},
+    })})
+    handles = {turn: save_blob(data, "image/png").digest for turn, data in images.items()}
+    handle_body = json.dumps({"history": history(args.turns, args.image_every, lambda turn: {
+        "type": "image_ref", "handle": handles[turn],
+    })})
+
+    print(f"{args.turns} turns, {len(images)} images of {args.image_kb} KB")
+    print(f"{'history':>8} | {'body bytes':>12} | {'parse p50 ms':>12} | {'parse p99 ms':>12}")
+    for label, body in (("inline", inline_body), ("handles", handle_body)):
+        timings = []
+        for _ in range(args.repeats):
+            started = time.perf_counter()
+            # No API key: handles resolve to inline bytes from the cache, no Files API.
+            views.convert_to_gemini_history(json.loads(body)["history"])
+            timings.append(time.perf_counter() - started)
+        stats = summarize(timings)
+        print(f"{label:>8} | {len(body):>12,} | {stats['p50'] * 1000:>12.2f} | {stats['p99'] * 1000:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# benchmarks/page_fetch.py
+#
+# fetch_pages against the scraper it replaces (requests.get one URL after another,
+# then BeautifulSoup's html.parser over the whole page), served by a local fixture
+# server over real HTTP. The server serves the .html files in --saved (saved
+# Wikipedia articles) or, by default, generated pages shaped like Wikipedia
+# articles: navigation, an infobox, sections of linked paragraphs with footnote
+# markers, references and navboxes. Like Wikipedia, it sends ETag, Last-Modified and
+# "max-age=0, must-revalidate", answers If-None-Match with a 304, and waits
+# --latency seconds before each response to stand in for the network.
+#
+#   python -m benchmarks.page_fetch --pages 80 --latency 0.05
+#   python -m benchmarks.page_fetch --saved ~/wiki-pages
+
+import argparse
+import hashlib
+import itertools
+import os
+import random
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from .common import summarize
+
+WORDS = [
+    "".join(parts) for parts in itertools.product(
+        ["ka", "to", "ri", "men", "sol", "va", "ne", "lu", "dor", "pi"], repeat=3
+    )
+]
+
+
+def sentence(rng):
+    words = rng.choices(WORDS, k=rng.randint(8, 24))
+    for position in rng.sample(range(len(words)), k=min(3, len(words))):
+        words[position] = f'<a href="/wiki/{words[position]}" title="{words[position]}">{words[position]}</a>'
+    marker = f'<sup id="cite_ref-{rng.randint(1, 300)}" class="reference"><a href="#cite_note">[{rng.randint(1, 300)}]</a></sup>'
+    return " ".join(words).capitalize() + "." + (marker if rng.random() < 0.3 else "")
+
+
+def wiki_page(title, rng, sections=14):
+    nav = "".join(f'<li><a href="/wiki/{word}">{word}</a></li>' for word in rng.sample(WORDS, 80))
+    infobox = "".join(
+        f'<tr><th scope="row">{rng.choice(WORDS)}</th><td>{" ".join(rng.choices(WORDS, k=4))}</td></tr>'
+        for _ in range(20)
+    )
+    body = []
+    for number in range(sections):
+        body.append(f'<div class="mw-heading mw-heading2"><h2 id="s{number}">{" ".join(rng.choices(WORDS, k=2)).title()}</h2>'
+                    '<span class="mw-editsection"><a href="#">edit</a></span></div>')
+        for _ in range(rng.randint(3, 7)):
+            body.append("<p>" + " ".join(sentence(rng) for _ in range(rng.randint(3, 8))) + "</p>\n")
+        if rng.random() < 0.3:
+            body.append("<ul>" + "".join(f"<li>{sentence(rng)}</li>" for _ in range(6)) + "</ul>")
+    references = "".join(f'<li id="cite_note-{n}"><span class="reference-text">{sentence(rng)}</span></li>' for n in range(150))
+    navbox = "".join(f'<td><a href="/wiki/{word}">{word}</a></td>' for word in rng.sample(WORDS, 300))
+    return f"""<!DOCTYPE html>
+<html lang="en"><head><meta charset="UTF-8"><title>{title} - Wikipedia</title>
+<style>{'.mw-parser-output .x{color:red}' * 200}</style><script>{'var RLCONF={};' * 300}</script></head>
+<body class="skin-vector"><header class="vector-header"><nav><ul>{nav}</ul></nav></header>
+<div class="mw-page-container"><nav id="mw-panel"><ul>{nav}</ul></nav>
+<main id="content" class="mw-body"><h1 id="firstHeading">{title}</h1>
+<div id="bodyContent"><div class="mw-parser-output">
+<table class="infobox">{infobox}</table>
+{''.join(body)}
+<div class="mw-heading mw-heading2"><h2 id="References">References</h2></div>
+<div class="reflist"><ol class="references">{references}</ol></div>
+<div class="navbox"><table><tr>{navbox}</tr></table></div>
+</div></div></main></div>
+<footer id="footer"><p>This page was last edited on 1 January 2026.</p><ul>{nav}</ul></footer>
+<script>{'(RLQ=window.RLQ||[]).push(function(){});' * 500}</script></body></html>"""
+
+
+def write_fixtures(directory, count):
+    rng = random.Random(18)
+    for number in range(count):
+        title = " ".join(rng.choices(WORDS, k=2)).title()
+        (directory / f"page-{number}.html").write_text(wiki_page(title, rng), encoding="utf-8")
+
+
+class FixtureServer:
+    """Serves a directory's .html files at /wiki/<stem> with Wikipedia's caching headers."""
+
+    def __init__(self, directory, latency):
+        self.pages = {}
+        for path in sorted(Path(directory).glob("*.html")):
+            body = path.read_bytes()
+            self.pages[f"/wiki/{path.stem}"] = (body, '"%s"' % hashlib.sha1(body).hexdigest())
+        self.latency = latency
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                time.sleep(server.latency)
+                page = server.pages.get(self.path)
+                if page is None:
+                    self.send_error(404)
+                    return
+                body, etag = page
+                unchanged = self.headers.get("If-None-Match") == etag
+                with server._lock:
+                    server.requests += 1
+                    server.not_modified += unchanged
+                    server.bytes_sent += 0 if unchanged else len(body)
+                self.send_response(304 if unchanged else 200)
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", formatdate(1767225600, usegmt=True))
+                self.send_header("Cache-Control", "private, s-maxage=0, max-age=0, must-revalidate")
+                if unchanged:
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_header("Content-Type", "text/html; charset=UTF-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the fetcher stopped reading early
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.handle_error = lambda request, address: None  # resets from early-stopping readers
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def reset_counts(self):
+        self.requests = self.not_modified = self.bytes_sent = 0
+
+
+def legacy_get_page_content(url):
+    """chat/internet.get_page_content as it was: requests.get, then BeautifulSoup over the whole page."""
+    import requests
+
+    try:
+        response = requests.get(url, headers={'User-Agent': 'Apple'}, timeout=15)
+        response.raise_for_status()
+    except requests.exceptions.RequestException:
+        return ""
+    return legacy_extract(response.text)
+
+
+def legacy_extract(html):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    main_content_div = soup.find('div', id='content') or soup.find('main') or soup.body
+    compiled_text = []
+    for tag in main_content_div.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p']):
+        text = tag.get_text(strip=True)
+        if text:
+            if tag.name.startswith('h'):
+                compiled_text.append(f"\n\n--- {tag.name.upper()}: {text} ---")
+            else:
+                compiled_text.append(text)
+    return ' '.join(compiled_text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--saved", help="directory of saved .html pages to serve instead of generated ones")
+    parser.add_argument("--pages", type=int, default=80, help="generated pages")
+    parser.add_argument("--urls-per-call", type=int, default=5)
+    parser.add_argument("--calls", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the server waits per response")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="juno-pages-"))
+    os.environ["PAGE_FETCH_LOCATION"] = str(workdir / "cache")
+    os.environ["PAGE_FETCH_ALLOW_PRIVATE_HOSTS"] = "1"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "main.settings")
+    os.environ.setdefault("SECRET_KEY", "benchmark-only")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir / 'bench.sqlite3'}")
+    import django
+
+    django.setup()
+    from django.conf import settings
+
+    from chat import pages
+
+    directory = Path(args.saved) if args.saved else workdir / "fixtures"
+    if not args.saved:
+        directory.mkdir()
+        write_fixtures(directory, args.pages)
+    server = FixtureServer(directory, args.latency)
+    urls = [server.url + path for path in server.pages]
+    sizes = [len(body) for body, _ in server.pages.values()]
+    print(f"{len(urls)} pages, {sum(sizes) / len(sizes) / 1024:.0f} KiB average, "
+          f"{args.latency * 1000:.0f} ms server latency, {args.urls_per_call} URLs per call")
+
+    print("\nparse only, whole page in memory (ms per page)")
+    htmls = [body.decode("utf-8", "replace") for body, _ in server.pages.values()]
+    extractors = [
+        ("BeautifulSoup html.parser", legacy_extract),
+        ("streaming html.parser", lambda html: pages.extract_text(html, parser="html.parser")[1]),
+        ("streaming lxml", lambda html: pages.extract_text(html, parser="lxml")[1]),
+        ("streaming lxml, no cap", lambda html: pages.extract_text(html, max_chars=10**9, parser="lxml")[1]),
+    ]
+    for name, extract in extractors:
+        timings = []
+        chars = 0
+        for html in htmls:
+            started = time.perf_counter()
+            chars += len(extract(html))
+            timings.append(time.perf_counter() - started)
+        stats = summarize(timings)
+        print(f"{name:>28} | p50 {stats['p50'] * 1000:7.1f} | p99 {stats['p99'] * 1000:7.1f} | {chars // len(htmls):>6} chars")
+
+    calls = [
+        [urls[(call * args.urls_per_call + offset) % len(urls)] for offset in range(args.urls_per_call)]
+        for call in range(args.calls)
+    ]
+
+    def run(name, fetch):
+        server.reset_counts()
+        timings = []
+        for call_urls in calls:
+            started = time.perf_counter()
+            fetch(call_urls)
+            timings.append(time.perf_counter() - started)
+        stats = summarize(timings)
+        print(f"{name:>28} | p50 {stats['p50'] * 1000:7.1f} | p99 {stats['p99'] * 1000:7.1f} | "
+              f"{server.requests:>4} requests | {server.not_modified:>4} x 304 | {server.bytes_sent / 2**20:7.1f} MiB")
+
+    def fetch_with(parser_name):
+        def fetch(call_urls):
+            settings.PAGE_FETCH["PARSER"] = parser_name
+            return pages.fetch_pages(call_urls)
+        return fetch
+
+    print("\nper tool call (ms)")
+    run("sequential + BeautifulSoup", lambda call_urls: [legacy_get_page_content(url) for url in call_urls])
+    pages.get_page_cache().clear()
+    run("fetch_pages html.parser", fetch_with("html.parser"))
+    pages.get_page_cache().clear()
+    run("fetch_pages lxml", fetch_with("lxml"))
+    run("fetch_pages lxml, 304s", fetch_with("lxml"))
+    print(f"\n{pages.stats()}")
+
+
+if __name__ == "__main__":
+    main()
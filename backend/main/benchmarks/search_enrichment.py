@@ -0,0 +1,161 @@
+# benchmarks/search_enrichment.py
+#
+# What internet_search hands the model with and without enrichment. A fake Tavily
+# client answers each query variant with snippets from generated Wikipedia-shaped
+# pages (see page_fetch.py), served by the local fixture server. The two pages that
+# really are about the query lead the results, and unrelated pages fill out the rest.
+# The answer to each query is planted mid-article in one of the relevant pages, well
+# past anything a snippet shows.
+#
+# Per query it reports the size of the function_response payload (bytes, and tokens
+# in the cl100k encoding when tiktoken is installed, as a stand-in for Gemini's), how
+# often the planted answer reaches the model, and the tool's latency. The fixture
+# server waits --latency per response, and Tavily takes --search-latency.
+#
+#   python -m benchmarks.search_enrichment --queries 40
+
+import argparse
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from .common import FakeTavilyClient, summarize
+from .page_fetch import WORDS, FixtureServer, wiki_page
+
+TOPICS = [
+    "quorbal", "zephyrine", "maltrask", "virelion", "ostrapane", "gundivex", "selmaric", "tharnock",
+    "brevalis", "cordumin", "faxholt", "jorvendel",
+]
+
+
+def plant(html, sentence, paragraph):
+    """html with `sentence` added to its paragraph-th <p>."""
+    start = -1
+    for _ in range(paragraph + 1):
+        start = html.index("<p>", start + 1)
+    return html[:start + 3] + sentence + " " + html[start + 3:]
+
+
+def build_corpus(directory, queries, unrelated, rng):
+    """Writes the pages; returns [(query, answer, relevant paths)] and the unrelated paths."""
+    cases = []
+    pairs = rng.sample(list(itertools.permutations(TOPICS, 2)), queries)
+    for number, (first, second) in enumerate(pairs):
+        year = rng.randint(1500, 2000)
+        query = f"when was the {first} {second} treaty signed"
+        answer = f"The {first} {second} treaty was signed in {year} by the {rng.choice(WORDS)} council."
+        paths = []
+        for copy in range(2):
+            title = f"{first.title()} {second.title()} treaty" + (" (history)" if copy else "")
+            html = wiki_page(title, rng)
+            if copy == 0:
+                html = plant(html, answer, rng.randint(20, 40))
+            (directory / f"q{number}-{copy}.html").write_text(html, encoding="utf-8")
+            paths.append((f"/wiki/q{number}-{copy}", title))
+        cases.append((query, str(year), paths))
+    others = []
+    for number in range(unrelated):
+        title = " ".join(rng.choices(WORDS, k=2)).title()
+        (directory / f"other-{number}.html").write_text(wiki_page(title, rng), encoding="utf-8")
+        others.append((f"/wiki/other-{number}", title))
+    return cases, others
+
+
+class CorpusTavilyClient(FakeTavilyClient):
+    """Every variant of a query returns its relevant pages first, then unrelated ones."""
+
+    def __init__(self, base_url, cases, others, rng, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+        self.relevant = {query: paths for query, _, paths in cases}
+        self.others = others
+        self.rng = rng
+
+    def search(self, query, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        base = next(name for name in self.relevant if name in query)
+        pages = [(path, title, 0.8 - 0.1 * rank) for rank, (path, title) in enumerate(self.relevant[base])]
+        pages += [(path, title, self.rng.uniform(0.2, 0.6))
+                  for path, title in self.rng.sample(self.others, self.results_per_call - len(pages))]
+        return {
+            "query": query,
+            "results": [
+                {"title": title, "url": self.base_url + path, "score": score, "raw_content": None,
+                 "content": f"{title} is " + " ".join(self.rng.choices(WORDS, k=70)) + "."}
+                for path, title, score in pages
+            ],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=40)
+    parser.add_argument("--unrelated", type=int, default=60)
+    parser.add_argument("--results-per-call", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="fixture server seconds per response")
+    parser.add_argument("--search-latency", type=float, default=0.15, help="fake Tavily seconds per search")
+    parser.add_argument("--budget", type=int, default=6000)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="juno-enrich-"))
+    os.environ["PAGE_FETCH_LOCATION"] = str(workdir / "cache")
+    os.environ["PAGE_FETCH_ALLOW_PRIVATE_HOSTS"] = "1"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "main.settings")
+    os.environ.setdefault("SECRET_KEY", "benchmark-only")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir / 'bench.sqlite3'}")
+    import django
+
+    django.setup()
+    from django.conf import settings
+
+    from chat import pages, tools
+
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+        count_tokens = lambda text: len(encoding.encode(text))
+    except Exception:  # no tiktoken, or no cached encoding offline
+        count_tokens = None
+
+    rng = random.Random(19)
+    fixtures = workdir / "fixtures"
+    fixtures.mkdir()
+    cases, others = build_corpus(fixtures, args.queries, args.unrelated, rng)
+    server = FixtureServer(fixtures, args.latency)
+    client = CorpusTavilyClient(server.url, cases, others, rng, latency=args.search_latency,
+                                results_per_call=args.results_per_call)
+    print(f"{len(cases)} queries, {len(server.pages)} pages, {args.search_latency * 1000:.0f} ms per search, "
+          f"{args.latency * 1000:.0f} ms per page, budget {args.budget} bytes")
+
+    header = f"{'':>24} | {'p50 ms':>7} | {'p99 ms':>7} | {'bytes':>6} | {'tokens':>6} | answer found"
+    print(header)
+    with mock.patch.object(tools, "tavily_client", lambda api_key: client):
+        for label, enabled, clear in (("raw results", False, False), ("enriched, cold", True, True),
+                                      ("enriched, revalidated", True, False)):
+            settings.SEARCH_ENRICHMENT = {**settings.SEARCH_ENRICHMENT, "ENABLED": enabled, "BYTE_BUDGET": args.budget}
+            if clear:
+                pages.get_page_cache().clear()
+            timings, sizes, tokens, found = [], [], [], 0
+            for query, answer, _ in cases:
+                started = time.perf_counter()
+                output = tools.internet_search(query, tavily_api_key="bench")
+                timings.append(time.perf_counter() - started)
+                payload = json.dumps(output)
+                sizes.append(len(payload.encode()))
+                if count_tokens:
+                    tokens.append(count_tokens(payload))
+                found += answer in payload
+            stats = summarize(timings)
+            token_text = f"{sum(tokens) / len(tokens):>6.0f}" if tokens else f"{'n/a':>6}"
+            print(f"{label:>24} | {stats['p50'] * 1000:>7.0f} | {stats['p99'] * 1000:>7.0f} | "
+                  f"{sum(sizes) / len(sizes):>6.0f} | {token_text} | {found}/{len(cases)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/search_fanout.py
+#
+# internet_search latency with the old one-variant-at-a-time loop vs the current
+# parallel fan-out, against a fake Tavily client. Per-call latency is drawn from a
+# log-normal around --latency, with --slow-rate of calls hitting --slow-latency to
+# give the tail something to chew on.
+#
+#   python -m benchmarks.search_fanout --runs 200 --latency 0.15 --slow-rate 0.05
+
+import argparse
+import random
+import time
+from unittest import mock
+
+from .common import FakeTavilyClient, setup_django, summarize
+
+
+def sequential_search(query, tavily_api_key):
+    # The pre-fan-out implementation, kept here as the baseline.
+    from chat import tools
+
+    tavily_client = tools.tavily_client(tavily_api_key)
+    all_results = []
+    for q in [query, f"what is {query}", f"{query} company information", f"{query} overview"]:
+        response = tavily_client.search(query=q, search_depth="basic")
+        if response.get('results'):
+            all_results.extend(response['results'])
+        if len(all_results) > 5:
+            break
+    return {"results": all_results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.15, help="median per-call latency (s)")
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--results-per-call", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    setup_django()
+    from chat import tools
+
+    rng = random.Random(args.seed)
+
+    def latency(query):
+        if rng.random() < args.slow_rate:
+            return args.slow_latency
+        return rng.lognormvariate(0, 0.4) * args.latency
+
+    def client_factory(api_key=None):
+        return FakeTavilyClient(api_key=api_key, latency=latency, results_per_call=args.results_per_call)
+
+    print(f"{'impl':>10} | {'p50 ms':>7} | {'p99 ms':>7} | {'mean ms':>7} | {'results':>7}")
+    with mock.patch.object(tools, "tavily_client", client_factory):
+        for label, search in (("sequential", sequential_search), ("fan-out", tools.internet_search)):
+            timings, counts = [], []
+            for run in range(args.runs):
+                started = time.perf_counter()
+                output = search(f"query {run}", tavily_api_key="bench")
+                timings.append(time.perf_counter() - started)
+                counts.append(len(output["results"]))
+            stats = summarize(timings)
+            print(f"{label:>10} | {stats['p50'] * 1000:>7.0f} | {stats['p99'] * 1000:>7.0f} | "
+                  f"{stats['mean'] * 1000:>7.0f} | {sum(counts) / len(counts):>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# benchmarks/semantic_index.py
+#
+# The semantic index (chat/vector_index.py) over synthetic past prompts: insert
+# throughput, training time, and per-query latency and recall@k of the IVF search at
+# a few NPROBE values against exact search over every row. Prompts are drawn from
+# topics (each with its own small vocabulary, on top of common filler words), and
+# queries are reworded copies of stored prompts, so "found" is how often the prompt a
+# query was reworded from comes back first - the "have we answered this before?" case.
+# The index lives in a temporary directory; its size on disk is reported too.
+#
+#   python -m benchmarks.semantic_index --rows 1000000
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from .common import summarize
+
+
+def make_prompts(rows, topics, seed=17):
+    rng = random.Random(seed)
+    filler = [f"f{n}" for n in range(200)]
+    topic_words = [[f"t{topic}w{n}" for n in range(30)] for topic in range(topics)]
+    prompts = []
+    for _ in range(rows):
+        words = rng.sample(topic_words[rng.randrange(topics)], 6) + rng.choices(filler, k=4)
+        rng.shuffle(words)
+        prompts.append(" ".join(words))
+    return prompts
+
+
+def reword(prompt, rng):
+    words = prompt.split()
+    words.pop(rng.randrange(len(words)))
+    words.insert(rng.randrange(len(words) + 1), "please")
+    return " ".join(words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--topics", type=int, default=2000)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=1000, help="rows per add(), like write-behind batches")
+    args = parser.parse_args()
+
+    import numpy as np
+
+    from chat.embeddings import HashingEmbedder
+    from chat.vector_index import VectorIndex
+
+    embedder = HashingEmbedder(dimensions=args.dimensions)
+    prompts = make_prompts(args.rows, args.topics)
+    started = time.perf_counter()
+    vectors = np.concatenate([embedder.embed(prompts[start:start + 10_000]) for start in range(0, args.rows, 10_000)])
+    print(f"embedded {args.rows:,} prompts in {time.perf_counter() - started:.1f}s")
+
+    location = tempfile.mkdtemp(prefix="juno-semantic-")
+    index = VectorIndex(location, args.dimensions, embedder=embedder.name)
+    add_times = []
+    started = time.perf_counter()
+    for start in range(0, args.rows, args.batch):
+        add_started = time.perf_counter()
+        index.add(range(start, min(args.rows, start + args.batch)), vectors[start:start + args.batch])
+        add_times.append(time.perf_counter() - add_started)
+    elapsed = time.perf_counter() - started
+    adds = summarize(add_times)
+    disk = sum(os.path.getsize(os.path.join(location, name)) for name in os.listdir(location))
+    stats = index.stats()
+    print(f"indexed in {elapsed:.1f}s ({args.rows / elapsed:,.0f} rows/s); add() p50 {adds['p50'] * 1000:.1f} ms, "
+          f"max {max(add_times) * 1000:.0f} ms (retraining); {stats['lists']} lists; {disk / 2**20:.0f} MiB on disk")
+
+    rng = random.Random(5)
+    targets = rng.sample(range(args.rows), args.queries)
+    queries = embedder.embed([reword(prompts[target], rng) for target in targets])
+    exact = [index.search(query, k=args.k, exact=True) for query in queries]
+
+    print(f"\n{'search':>10} | {'p50 ms':>7} | {'p99 ms':>7} | {f'recall@{args.k}':>9} | {'found':>6}")
+    for label, options in [("exact", {"exact": True})] + [(f"nprobe={n}", {"nprobe": n}) for n in (4, 8, 16, 32)]:
+        timings, recall, found = [], 0, 0
+        for query, target, truth in zip(queries, targets, exact):
+            started = time.perf_counter()
+            hits = index.search(query, k=args.k, **options)
+            timings.append(time.perf_counter() - started)
+            recall += len({chat_id for chat_id, _ in hits} & {chat_id for chat_id, _ in truth}) / len(truth)
+            found += bool(hits) and hits[0][0] == target
+        timing = summarize(timings)
+        print(f"{label:>10} | {timing['p50'] * 1000:>7.2f} | {timing['p99'] * 1000:>7.2f} | "
+              f"{recall / len(queries):>9.3f} | {found / len(queries):>6.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# benchmarks/sse_writes.py
+#
+# Writes and bytes per streamed response, before and after delta coalescing and the
+# precomputed delta envelope. "before" frames every chunk with json.dumps and sends
+# it as its own write; "after" uses sse_delta and lets the follower merge the deltas
+# that queued up while the client was busy. Each part handed to the server is one
+# write (one send() under gunicorn/uvicorn), so "writes" is the syscall count for
+# the response body. --client-delay makes the reader sleep after every write, as a
+# slow link or a full socket buffer would.
+#
+# A second table shows heartbeats: a turn whose tool call takes --tool-latency
+# seconds, with keepalives every --keepalive seconds.
+#
+#   python -m benchmarks.sse_writes --chunks 400 --client-delay 2 --window 0.02
+
+import argparse
+import json
+import time
+import timeit
+from unittest import mock
+
+from .common import FakeGenerativeModel, PassThroughToolCache, setup_django
+
+
+def stream_body():
+    return json.dumps({
+        "geminiApiKey": "bench",
+        "tavilyApiKey": "bench",
+        "conversation_name": "",
+        "history": [{"role": "user", "content": "hello"}],
+    })
+
+
+def run_turn(views, model, client_delay, tool_latency=0):
+    from django.test import RequestFactory
+
+    def slow_search(query, tavily_api_key):
+        time.sleep(tool_latency)
+        return {"results": [query]}
+
+    with mock.patch.object(views, "gemini_model", return_value=model), \
+            mock.patch.dict(views.AVAILABLE_TOOLS, {"internet_search": slow_search}), \
+            mock.patch.object(views, "get_tool_cache", PassThroughToolCache):
+        request = RequestFactory().post("/interface_stream/", stream_body(), content_type="application/json")
+        started = last_write = time.perf_counter()
+        writes = total_bytes = comments = 0
+        longest_silence = 0.0
+        for part in views.interface_stream(request).streaming_content:
+            now = time.perf_counter()
+            longest_silence = max(longest_silence, now - last_write)
+            writes += 1
+            total_bytes += len(part)
+            comments += part == b":\n\n"
+            time.sleep(client_delay)
+            last_write = time.perf_counter()
+        return writes, total_bytes, comments, longest_silence, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=400)
+    parser.add_argument("--chunk-text", default="tok ")
+    parser.add_argument("--chunk-interval", type=float, default=1, help="ms between model chunks")
+    parser.add_argument("--client-delay", type=float, default=2, help="ms the client spends per write")
+    parser.add_argument("--window", type=float, default=0.02, help="coalescing window (s) for the last row")
+    parser.add_argument("--tool-latency", type=float, default=3)
+    parser.add_argument("--keepalive", type=float, default=0.5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import override_settings
+
+    from chat import sse, views
+
+    def before_delta(text):
+        return sse.sse_event({"type": "delta", "text": text})
+
+    configs = [
+        ("before", {"COALESCE": False, "KEEPALIVE_INTERVAL": 3600}, before_delta),
+        ("after", {"COALESCE": True, "KEEPALIVE_INTERVAL": 3600}, sse.sse_delta),
+        (f"after+{args.window * 1000:.0f}ms", {"COALESCE": True, "COALESCE_WINDOW": args.window,
+                                               "KEEPALIVE_INTERVAL": 3600}, sse.sse_delta),
+    ]
+
+    print(f"{args.chunks} chunks of {args.chunk_text!r}, client spends {args.client_delay} ms per write")
+    print(f"{'config':>12} | {'writes':>6} | {'bytes':>7} | {'bytes/write':>11} | {'total s':>7}")
+    for label, sse_settings, delta in configs:
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=args.chunk_interval / 1000,
+                                    chunk_count=args.chunks, chunk_text=args.chunk_text)
+        with override_settings(SSE=sse_settings), mock.patch.object(views, "sse_delta", delta):
+            writes, total_bytes, _, _, elapsed = run_turn(views, model, args.client_delay / 1000)
+        print(f"{label:>12} | {writes:>6} | {total_bytes:>7} | {total_bytes / writes:>11.1f} | {elapsed:>7.2f}")
+
+    text = args.chunk_text
+    dumps = timeit.timeit(lambda: before_delta(text), number=100_000) / 100_000
+    envelope = timeit.timeit(lambda: sse.sse_delta(text), number=100_000) / 100_000
+    print(f"\nframing one delta: json.dumps {dumps * 1e6:.2f} us, envelope {envelope * 1e6:.2f} us")
+
+    print(f"\ntool call of {args.tool_latency}s before the answer:")
+    print(f"{'config':>12} | {'comments':>8} | {'longest silence s':>17}")
+    for label, keepalive in (("before", 3600), ("after", args.keepalive)):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=3, tool_call=True)
+        with override_settings(SSE={"KEEPALIVE_INTERVAL": keepalive}):
+            _, _, comments, silence, _ = run_turn(views, model, 0, args.tool_latency)
+        print(f"{label:>12} | {comments:>8} | {silence:>17.2f}")
+
+
+if __name__ == "__main__":
+    main()
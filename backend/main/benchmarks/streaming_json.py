@@ -0,0 +1,114 @@
+# benchmarks/streaming_json.py
+#
+# Peak memory and time to first byte for /conversation/<name>/ on one seeded
+# conversation of --turns turns with --result-kb answers. Each way of serving it
+# runs in a fresh process, so the peak RSS it reports (the growth of ru_maxrss over
+# the request) is its own:
+#   list + JsonResponse   the endpoint as it was: every row in a list, one json.dumps
+#   streamed, json        chat/jsonstream.py with the standard library encoder
+#   streamed, orjson      the same with orjson (when installed)
+#   ndjson, orjson        ?format=ndjson
+#
+#   python -m benchmarks.streaming_json --turns 10000 --result-kb 4
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from .common import setup_django
+from .history_projection import seed
+
+MODES = ["list + JsonResponse", "streamed, json", "streamed, orjson", "ndjson, orjson"]
+
+
+def legacy_conversation(request, conversation_name):
+    """conversation_by_name before streaming."""
+    from django.http import JsonResponse
+
+    from chat.models import Chat
+    from chat.projection import project, requested_fields, serialize
+
+    fields = requested_fields(request)
+    conversation_chats = list(project(Chat.objects.filter(
+        conversation_name=conversation_name
+    ).order_by('date_time'), fields))
+    return JsonResponse({
+        "id": conversation_name,
+        "messages": [serialize(chat, fields) for chat in conversation_chats],
+        "last_message_time": conversation_chats[-1]["date_time"].isoformat()
+    }, status=200)
+
+
+def measure(mode, db_path):
+    """Runs in the child process: serves the conversation once and reports on it."""
+    setup_django(db_path)
+    from django.test import RequestFactory
+
+    from chat import jsonstream, views
+
+    if mode == "streamed, json":
+        jsonstream.orjson = None
+    elif "orjson" in mode and jsonstream.orjson is None:
+        return {"skipped": "orjson is not installed"}
+    view = legacy_conversation if mode == "list + JsonResponse" else views.conversation_by_name
+    params = {"format": "ndjson"} if mode.startswith("ndjson") else {}
+    request = RequestFactory().get("/conversation/conv-0/", params)
+    # Warm up imports, the connection and the query plan on a small conversation.
+    view(RequestFactory().get("/conversation/warm/"), "warm")
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    response = view(request, "conv-0")
+    first_byte = None
+    size = 0
+    for piece in (response.streaming_content if response.streaming else [response.content]):
+        if first_byte is None:
+            first_byte = time.perf_counter() - started
+        size += len(piece)
+    total = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    return {"first_byte": first_byte, "total": total, "bytes": size, "peak_kb": peak}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=10000)
+    parser.add_argument("--result-kb", type=int, default=4)
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(measure(args.mode, args.db)))
+        return
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="juno-json-"), "bench.sqlite3")
+    setup_django(db_path)
+    from django.utils import timezone
+
+    from chat.models import Chat
+
+    seed(args.turns, 1, args.result_kb)
+    Chat.objects.create(prompt="warm", result="up", conversation_name="warm", date_time=timezone.now())
+    print(f"one conversation of {args.turns} turns, {args.result_kb} KB answers")
+    print(f"{'':>20} | {'MB sent':>7} | {'first byte ms':>13} | {'total ms':>8} | {'peak RSS MB':>11}")
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.streaming_json", "--mode", mode, "--db", db_path],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if "skipped" in result:
+            print(f"{mode:>20} | {result['skipped']}")
+            continue
+        print(f"{mode:>20} | {result['bytes'] / 2 ** 20:>7.1f} | {result['first_byte'] * 1000:>13.1f} | "
+              f"{result['total'] * 1000:>8.0f} | {result['peak_kb'] / 1024:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+# benchmarks/stt_latency.py
+#
+# Time from the end of speech to the first token of the answer, for spoken prompts.
+# Each WAV fixture is uploaded to the stt views in --chunk-ms pieces, paced like a
+# client uploading while it records. When the recording ends, the session is ended
+# and the turn's stream is read to its first text delta. By default the fixtures are
+# generated: a few "sentences" of voiced, syllable-shaped sound with pauses between
+# them, over faint background noise, ending in the 0.8 s of silence after which the
+# prototype's listen() stopped recording. --wav reads your own 16-bit mono
+# recordings instead.
+#
+# Two modes, on the same views:
+#   whole recording  as the prototype did it, nothing is recognized until the
+#                    recording ends, then all of it is recognized at once
+#   segmented        chat/speech.py as configured: each utterance is recognized as
+#                    soon as SILENCE_MS of quiet closes it, so ending the session
+#                    waits only for the last one
+#
+# The recognizer is StubRecognizer with a cloud API's latency: --recognizer-delay,
+# plus --real-time-factor times the audio's length. The model is
+# FakeGenerativeModel, answering after --first-latency. The end of speech is the
+# end of the last utterance the segmenter finds in the fixture. --speed plays
+# everything (audio, recognizer and model) faster than real time; latencies are
+# still reported in real-time milliseconds.
+#
+#   python -m benchmarks.stt_latency --fixtures 6
+#   python -m benchmarks.stt_latency --wav ~/recordings
+
+import argparse
+import json
+import tempfile
+import time
+import wave
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+from .common import FakeGenerativeModel, setup_django, summarize
+
+RATE = 16000
+TRAILING_SILENCE = 0.8
+
+
+def speech_like(seconds, rng, rate=RATE):
+    """Float samples in [-1, 1] that a VAD treats like speech: harmonics of a wandering pitch, 4-5 syllables a second."""
+    t = np.arange(int(seconds * rate)) / rate
+    pitch = rng.uniform(100, 220) * (1 + 0.1 * np.sin(2 * np.pi * rng.uniform(0.5, 1.5) * t))
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    voice = sum(np.sin(harmonic * phase) / harmonic for harmonic in range(1, 6))
+    syllables = np.abs(np.sin(np.pi * rng.uniform(4, 5) * t)) ** 0.5
+    return voice * syllables / 2.3
+
+
+def make_recording(rng, sentences=3, rate=RATE):
+    """16-bit mono PCM of `sentences` utterances with pauses, and where the last one ends (seconds)."""
+    pieces = [np.zeros(int(rng.uniform(0.3, 0.6) * rate))]
+    for number in range(sentences):
+        pieces.append(speech_like(rng.uniform(1.2, 3.0), rng, rate) * rng.uniform(0.2, 0.4))
+        pause = TRAILING_SILENCE if number == sentences - 1 else rng.uniform(0.7, 1.2)
+        pieces.append(np.zeros(int(pause * rate)))
+    audio = np.concatenate(pieces)
+    speech_end = (len(audio) - len(pieces[-1])) / rate
+    audio += rng.normal(0, 0.001, len(audio))
+    pcm = (np.clip(audio, -1, 1) * 32767).astype("<i2").tobytes()
+    return pcm, speech_end
+
+
+def write_wav(path, pcm, rate=RATE):
+    with wave.open(str(path), "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        out.writeframes(pcm)
+
+
+def read_wav(path):
+    with wave.open(str(path), "rb") as source:
+        if source.getnchannels() != 1 or source.getsampwidth() != 2:
+            raise SystemExit(f"{path}: only 16-bit mono WAV files are supported")
+        return source.readframes(source.getnframes()), source.getframerate()
+
+
+def speech_end(pcm, rate):
+    """Where the segmenter hears the last utterance end, in seconds."""
+    from chat.speech import Segmenter
+
+    segmenter = Segmenter(rate)
+    segments = segmenter.feed(pcm) + segmenter.flush()
+    return segments[-1].end if segments else None
+
+
+def speak(factory, views, path, chunk_ms, speed, end_of_speech):
+    """Uploads one recording in real time; seconds from the end of speech to the first delta."""
+    from django.urls import reverse
+
+    started = views.stt_start(factory.post("/stt/", json.dumps({
+        "geminiApiKey": "bench", "tavilyApiKey": "bench", "conversation_name": f"stt-{path.stem}",
+    }), content_type="application/json"))
+    session_id = json.loads(started.content)["session_id"]
+    data = path.read_bytes()
+    header = data.index(b"data") + 8
+    rate = read_wav(path)[1]
+    chunk_bytes = rate * chunk_ms // 1000 * 2
+    # The header goes with the first chunk, as a recording client would send it.
+    chunks = [data[:header + chunk_bytes]] + [
+        data[offset:offset + chunk_bytes] for offset in range(header + chunk_bytes, len(data), chunk_bytes)
+    ]
+
+    began = time.perf_counter()
+    recorded = 0.0
+    for chunk in chunks:
+        recorded += (len(chunk) - (header if chunk is chunks[0] else 0)) / 2 / rate
+        # A chunk can only be sent once it has been recorded.
+        delay = began + recorded / speed - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        views.stt_audio(factory.post(reverse("stt_audio", args=[session_id]), chunk,
+                                     content_type="application/octet-stream"), session_id)
+
+    response = views.stt_end(factory.post(reverse("stt_end", args=[session_id]), b"",
+                                          content_type="application/json"), session_id)
+    for part in response.streaming_content:
+        if b'"type": "delta"' in part:
+            first_token = time.perf_counter()
+            break
+    else:
+        raise SystemExit(f"{path.name}: the turn streamed no text")
+    for _ in response.streaming_content:
+        pass
+    # In real-time seconds, whatever the speed.
+    return (first_token - (began + end_of_speech / speed)) * speed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fixtures", type=int, default=6)
+    parser.add_argument("--sentences", type=int, default=3)
+    parser.add_argument("--wav", type=Path, help="directory of 16-bit mono .wav recordings to use instead")
+    parser.add_argument("--chunk-ms", type=int, default=100)
+    parser.add_argument("--recognizer-delay", type=float, default=0.3)
+    parser.add_argument("--real-time-factor", type=float, default=0.25)
+    parser.add_argument("--first-latency", type=float, default=0.4)
+    parser.add_argument("--speed", type=float, default=1.0)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.test import RequestFactory
+
+    from chat import speech, views
+
+    if args.wav:
+        paths = sorted(args.wav.glob("*.wav"))
+    else:
+        workdir = Path(tempfile.mkdtemp(prefix="juno-stt-"))
+        rng = np.random.default_rng(21)
+        paths = []
+        for number in range(args.fixtures):
+            pcm, _ = make_recording(rng, args.sentences)
+            paths.append(workdir / f"recording-{number}.wav")
+            write_wav(paths[-1], pcm)
+    ends = {path: speech_end(*read_wav(path)) for path in paths}
+    paths = [path for path in paths if ends[path] is not None]
+    if not paths:
+        raise SystemExit("No speech found in the fixtures")
+    seconds = sum(len(read_wav(path)[0]) / 2 / read_wav(path)[1] for path in paths)
+    print(f"{len(paths)} recordings, {seconds:.0f} s of audio, recognizer {args.recognizer_delay * 1000:.0f} ms "
+          f"+ {args.real_time_factor:.2f} x audio, model first chunk {args.first_latency * 1000:.0f} ms, "
+          f"{args.speed:g}x speed")
+
+    recognizer = speech.StubRecognizer(
+        ["what is the tallest mountain"], delay=args.recognizer_delay / args.speed,
+        real_time_factor=args.real_time_factor / args.speed,
+    )
+    model = FakeGenerativeModel(first_latency=args.first_latency / args.speed, chunk_interval=0, chunk_count=3)
+    factory = RequestFactory()
+    base = {**settings.STT}
+    print(f"{'':>18} | {'p50 ms':>7} | {'p99 ms':>7} | {'mean ms':>7} | recognizer calls")
+    with mock.patch.object(speech, "_recognizer", recognizer), \
+            mock.patch.object(views, "gemini_model", return_value=model):
+        for label, overrides in (
+            # Nothing closes a segment before the recording ends.
+            ("whole recording", {"SILENCE_MS": 10 ** 7, "MAX_SEGMENT_SECONDS": 10 ** 5}),
+            ("segmented", {}),
+        ):
+            settings.STT = {**base, **overrides}
+            recognizer.calls = 0
+            latencies = [speak(factory, views, path, args.chunk_ms, args.speed, ends[path]) for path in paths]
+            stats = summarize(latencies)
+            print(f"{label:>18} | {stats['p50'] * 1000:>7.0f} | {stats['p99'] * 1000:>7.0f} | "
+                  f"{stats['mean'] * 1000:>7.0f} | {recognizer.calls}")
+    settings.STT = base
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+# admission.py
+#
+# Admission control for turns. Before any model or tool work, each turn asks to be
+# admitted (stream_turn and interface_stream_async):
+#
+#   1. Its Gemini key takes a token from that key's bucket, which holds KEY_BURST
+#      turns and refills at KEY_RATE turns a second. An empty bucket means an
+#      immediate 429, with Retry-After set to when the next token arrives.
+#   2. It takes one of MAX_ACTIVE slots for running turns. With none free it waits
+#      in a FIFO queue of at most QUEUE_SIZE turns. Its stream sends
+#      {"type": "queued", "position": n} each time its place changes (1 is next).
+#      A full queue means an immediate 429. A turn still queued after
+#      QUEUE_TIMEOUT seconds ends with an error event carrying retry_after.
+#
+# Buckets and slots live in a store (STORE). LocalStore keeps them in this
+# process. CacheStore keeps them in a Django cache (CACHES[ALIAS]), so every worker
+# shares one set of limits. The wait queue itself belongs to each worker; its head
+# polls the store every POLL_INTERVAL seconds for slots freed elsewhere.
+#
+# Configure with settings.ADMISSION, e.g.
+# Admission is off unless ENABLED is set.
+#
+#   ADMISSION = {
+#       "ENABLED": True,
+#       "STORE": "chat.admission.CacheStore",   # default LocalStore
+#       "ALIAS": "default",
+#       "MAX_ACTIVE": 32,
+#       "QUEUE_SIZE": 64,
+#       "QUEUE_TIMEOUT": 30,
+#       "KEY_RATE": 1.0,       # turns a second per key, sustained
+#       "KEY_BURST": 10,
+#       "SLOT_LEASE": 600,     # seconds before a shared slot held by a dead worker frees itself
+#       "POLL_INTERVAL": 0.05,
+#   }
+
+import asyncio
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .metrics import ADMISSION_WAIT_SECONDS
+
+DEFAULT_MAX_ACTIVE = 32
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_QUEUE_TIMEOUT = 30
+DEFAULT_KEY_RATE = 1.0
+DEFAULT_KEY_BURST = 10
+DEFAULT_SLOT_LEASE = 600
+DEFAULT_POLL_INTERVAL = 0.05
+# How long CacheStore waits for another worker's bucket update before letting the turn through.
+BUCKET_LOCK_WAIT = 0.05
+# Starting guess at how long a turn holds its slot, for Retry-After.
+DEFAULT_SERVICE_SECONDS = 5.0
+
+UNLIMITED = "unlimited"
+
+
+def admission_setting(name, default=None):
+    value = getattr(settings, 'ADMISSION', {}).get(name)
+    return default if value is None else value
+
+
+def admission_enabled():
+    return bool(admission_setting('ENABLED', False))
+
+
+def key_id(api_key):
+    # Stores never see the key itself.
+    return hashlib.sha256((api_key or "").encode()).hexdigest()[:32]
+
+
+def gcra(arrival, now, rate, burst):
+    """
+    A token-bucket check in GCRA form: one timestamp per bucket instead of a count
+    and a refill time. Returns (seconds to wait, None) when the bucket is empty, or
+    (0.0, the bucket's new timestamp) when a token was taken.
+    """
+    interval = 1.0 / rate
+    arrival = max(arrival, now) + interval
+    over = arrival - now - burst * interval
+    if over > 0:
+        return over, None
+    return 0.0, arrival
+
+
+class Rejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(
+            "Too many turns for this API key." if reason == "rate_limited" else "The server is busy, try again later."
+        )
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class LocalStore:
+    """Buckets and slots for this process only."""
+
+    def __init__(self, **options):
+        self._arrivals = {}
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        with self._lock:
+            now = time.monotonic()
+            wait, arrival = gcra(self._arrivals.get(key, now), now, rate, burst)
+            if arrival is not None:
+                self._arrivals[key] = arrival
+                if len(self._arrivals) > 10000:
+                    # Buckets whose timestamp has passed are full again; forget them.
+                    self._arrivals = {name: value for name, value in self._arrivals.items() if value > now}
+            return wait
+
+    def acquire(self, limit):
+        with self._lock:
+            if self._active >= limit:
+                return None
+            self._active += 1
+            return True
+
+    def release(self, slot):
+        with self._lock:
+            self._active -= 1
+
+    def active(self, limit):
+        return self._active
+
+
+class CacheStore:
+    """
+    Buckets and slots in a Django cache, shared by every worker. Each slot is a key
+    taken with cache.add and given a lease, so a worker that dies mid-turn frees
+    its slots after SLOT_LEASE seconds.
+    """
+
+    def __init__(self, alias="default", lease=DEFAULT_SLOT_LEASE, **options):
+        from django.core.cache import caches
+
+        self.cache = caches[alias]
+        self.lease = lease
+
+    def take(self, key, rate, burst):
+        # cache.add is atomic on the shared backends, so it serves as the bucket's lock.
+        lock = f"admission:lock:{key}"
+        deadline = time.monotonic() + BUCKET_LOCK_WAIT
+        while not self.cache.add(lock, 1, 1):
+            if time.monotonic() >= deadline:
+                return 0.0
+            time.sleep(0.002)
+        try:
+            now = time.time()
+            bucket = f"admission:bucket:{key}"
+            wait, arrival = gcra(self.cache.get(bucket, now), now, rate, burst)
+            if arrival is not None:
+                self.cache.set(bucket, arrival, math.ceil(arrival - now) + 1)
+            return wait
+        finally:
+            self.cache.delete(lock)
+
+    def acquire(self, limit):
+        # A random order spreads the workers over the slot keys.
+        for number in random.sample(range(limit), limit):
+            slot = f"admission:slot:{number}"
+            if self.cache.add(slot, 1, self.lease):
+                return slot
+        return None
+
+    def release(self, slot):
+        self.cache.delete(slot)
+
+    def active(self, limit):
+        return len(self.cache.get_many([f"admission:slot:{number}" for number in range(limit)]))
+
+
+class Ticket:
+    def __init__(self, slot=None):
+        self.slot = slot
+        self.created = time.monotonic()
+        self.admitted_at = self.created if slot is not None else None
+        self.deadline = None
+
+
+class AdmissionController:
+    def __init__(self, store=None, **limits):
+        self._store = store
+        self._limits = limits
+        self._queue = deque()  # waiting Tickets, oldest first
+        self._changed = threading.Condition()
+        self._service_seconds = DEFAULT_SERVICE_SECONDS
+
+        self.admitted = 0
+        self.rate_limited = 0
+        self.queue_full = 0
+        self.timed_out = 0
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = import_string(admission_setting('STORE', 'chat.admission.LocalStore'))(
+                alias=admission_setting('ALIAS', 'default'),
+                lease=admission_setting('SLOT_LEASE', DEFAULT_SLOT_LEASE),
+            )
+        return self._store
+
+    def limit(self, name, default):
+        value = self._limits.get(name.lower())
+        return admission_setting(name, default) if value is None else value
+
+    def retry_after(self):
+        """Seconds until the queue has likely moved on, from how long turns have been holding slots."""
+        waiting = len(self._queue) + 1
+        return max(1, math.ceil(self._service_seconds * waiting / self.limit('MAX_ACTIVE', DEFAULT_MAX_ACTIVE)))
+
+    def admit(self, api_key):
+        """A Ticket that either holds a slot or is queued for one. Raises Rejected for an immediate 429."""
+        if not admission_enabled():
+            return Ticket(UNLIMITED)
+        rate = self.limit('KEY_RATE', DEFAULT_KEY_RATE)
+        if rate:
+            wait = self.store.take(key_id(api_key), rate, self.limit('KEY_BURST', DEFAULT_KEY_BURST))
+            if wait:
+                self.rate_limited += 1
+                ADMISSION_WAIT_SECONDS.observe(0, outcome="rate_limited")
+                raise Rejected("rate_limited", max(1, math.ceil(wait)))
+
+        ticket = Ticket()
+        with self._changed:
+            # Nobody jumps the queue: new turns only go straight in when it's empty.
+            if not self._queue:
+                ticket.slot = self.store.acquire(self.limit('MAX_ACTIVE', DEFAULT_MAX_ACTIVE))
+            if ticket.slot is not None:
+                self._admitted(ticket)
+                return ticket
+            if len(self._queue) >= self.limit('QUEUE_SIZE', DEFAULT_QUEUE_SIZE):
+                self.queue_full += 1
+                ADMISSION_WAIT_SECONDS.observe(0, outcome="queue_full")
+                raise Rejected("queue_full", self.retry_after())
+            ticket.deadline = ticket.created + self.limit('QUEUE_TIMEOUT', DEFAULT_QUEUE_TIMEOUT)
+            self._queue.append(ticket)
+        return ticket
+
+    def _admitted(self, ticket):
+        ticket.admitted_at = time.monotonic()
+        self.admitted += 1
+        ADMISSION_WAIT_SECONDS.observe(ticket.admitted_at - ticket.created, outcome="admitted")
+
+    def _check(self, ticket):
+        """With the lock held: None once `ticket` holds a slot, else its queue position."""
+        if ticket.slot is not None:
+            return None
+        if self._queue[0] is ticket:
+            ticket.slot = self.store.acquire(self.limit('MAX_ACTIVE', DEFAULT_MAX_ACTIVE))
+            if ticket.slot is not None:
+                self._queue.popleft()
+                self._admitted(ticket)
+                self._changed.notify_all()
+                return None
+        if time.monotonic() >= ticket.deadline:
+            self._queue.remove(ticket)
+            self.timed_out += 1
+            ADMISSION_WAIT_SECONDS.observe(time.monotonic() - ticket.created, outcome="queue_timeout")
+            self._changed.notify_all()
+            raise Rejected("queue_timeout", self.retry_after())
+        return self._queue.index(ticket) + 1
+
+    def _pause(self, ticket):
+        return max(0.0, min(self.limit('POLL_INTERVAL', DEFAULT_POLL_INTERVAL), ticket.deadline - time.monotonic()))
+
+    def _locked_check(self, ticket):
+        with self._changed:
+            return self._check(ticket)
+
+    def positions(self, ticket):
+        """Yields the ticket's queue position whenever it changes, until it holds a slot (Rejected at the deadline)."""
+        reported = None
+        while True:
+            with self._changed:
+                position = self._check(ticket)
+                while position is not None and position == reported:
+                    self._changed.wait(self._pause(ticket))
+                    position = self._check(ticket)
+            if position is None:
+                return
+            reported = position
+            yield position
+
+    async def apositions(self, ticket):
+        reported = None
+        while True:
+            position = await sync_to_async(self._locked_check, thread_sensitive=False)(ticket)
+            if position is None:
+                return
+            if position != reported:
+                reported = position
+                yield position
+            await asyncio.sleep(self._pause(ticket))
+
+    def release(self, ticket):
+        """
+        Gives back the ticket's slot, or its place in the queue if it never got one.
+        Releasing a ticket again does nothing.
+        """
+        if ticket.slot == UNLIMITED:
+            return
+        with self._changed:
+            if ticket.slot is not None:
+                self.store.release(ticket.slot)
+                ticket.slot = None
+                held = time.monotonic() - ticket.admitted_at
+                self._service_seconds += 0.1 * (held - self._service_seconds)
+            elif ticket in self._queue:
+                self._queue.remove(ticket)
+            self._changed.notify_all()
+
+    def stats(self):
+        return {
+            "enabled": admission_enabled(),
+            "active": self.store.active(self.limit('MAX_ACTIVE', DEFAULT_MAX_ACTIVE)),
+            "max_active": self.limit('MAX_ACTIVE', DEFAULT_MAX_ACTIVE),
+            "queued": len(self._queue),
+            "queue_size": self.limit('QUEUE_SIZE', DEFAULT_QUEUE_SIZE),
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "queue_full": self.queue_full,
+            "timed_out": self.timed_out,
+            "turn_seconds": round(self._service_seconds, 2),
+        }
+
+
+admission = AdmissionController()
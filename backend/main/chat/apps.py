@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def repair_search_index(sender, using, **kwargs):
+    # SQLite drops chat's triggers whenever a migration rebuilds the table.
+    from django.db import connections
+
+    from .search import repair_index
+
+    repair_index(connections[using])
 
 
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
+
+    def ready(self):
+        post_migrate.connect(repair_search_index, sender=self)
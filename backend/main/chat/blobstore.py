@@ -0,0 +1,148 @@
+# blobstore.py
+#
+# Content-addressed storage for binary payloads (generated images). Blobs are keyed
+# by the SHA-256 of their bytes, so an image is stored once however many chat rows
+# point at it; the chat table only keeps the digest.
+#
+# Configure with settings.BLOB_STORE, e.g.
+#   BLOB_STORE = {
+#       "BACKEND": "chat.blobstore.FileSystemBlobStore",
+#       "LOCATION": MEDIA_ROOT / "blobs",
+#   }
+# Another backend (S3, GCS...) only needs the methods of BlobStore.
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def blob_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# Raster formats the model reads and a browser won't run script from. Uploads must
+# be one of these; stored blobs of any other type are only served as downloads.
+INLINE_IMAGE_TYPES = frozenset({"image/png", "image/jpeg", "image/webp", "image/heic", "image/heif"})
+
+_signatures = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+# ISO base media files: the major brand after "ftyp" says HEIC or plain HEIF.
+_heif_brands = {
+    b"heic": "image/heic", b"heix": "image/heic", b"hevc": "image/heic", b"hevx": "image/heic",
+    b"heim": "image/heic", b"heis": "image/heic",
+    b"mif1": "image/heif", b"msf1": "image/heif",
+}
+
+
+def sniff_content_type(data, default="application/octet-stream"):
+    for signature, content_type in _signatures:
+        if data.startswith(signature):
+            return content_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:8] == b"ftyp" and data[8:12] in _heif_brands:
+        return _heif_brands[data[8:12]]
+    return default
+
+
+class BlobStore:
+    def put(self, data):
+        """Stores `data` if it isn't there yet and returns its digest."""
+        raise NotImplementedError
+
+    def exists(self, digest):
+        raise NotImplementedError
+
+    def size(self, digest):
+        raise NotImplementedError
+
+    def open(self, digest):
+        """A binary file object positioned at the start of the blob."""
+        raise NotImplementedError
+
+    def delete(self, digest):
+        raise NotImplementedError
+
+
+class FileSystemBlobStore(BlobStore):
+    """Stores each blob as LOCATION/ab/cd/abcd... under the local filesystem."""
+
+    def __init__(self, location=None, **options):
+        self.location = str(location or os.path.join(settings.MEDIA_ROOT, "blobs"))
+
+    def path(self, digest):
+        if not DIGEST_PATTERN.match(digest):
+            raise ValueError(f"Not a blob digest: {digest!r}")
+        return os.path.join(self.location, digest[:2], digest[2:4], digest)
+
+    def put(self, data):
+        digest = blob_digest(data)
+        path = self.path(digest)
+        if os.path.exists(path):
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial blob.
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as temp:
+                temp.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return digest
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def size(self, digest):
+        return os.path.getsize(self.path(digest))
+
+    def open(self, digest):
+        return open(self.path(digest), "rb")
+
+    def delete(self, digest):
+        try:
+            os.unlink(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    global _blob_store
+    if _blob_store is None:
+        with _blob_store_lock:
+            if _blob_store is None:
+                config = getattr(settings, "BLOB_STORE", {})
+                backend_class = import_string(config.get("BACKEND", "chat.blobstore.FileSystemBlobStore"))
+                _blob_store = backend_class(location=config.get("LOCATION"), **config.get("OPTIONS", {}))
+    return _blob_store
+
+
+def save_blob(data, content_type):
+    """Stores `data` and returns its Blob row, creating it only the first time these bytes are seen."""
+    from .models import Blob
+
+    digest = get_blob_store().put(data)
+    blob, _ = Blob.objects.get_or_create(
+        digest=digest,
+        defaults={"content_type": content_type, "size": len(data)},
+    )
+    return blob
@@ -0,0 +1,244 @@
+# clients.py
+#
+# Pooled API clients. genai.configure() swaps the process-wide Gemini client, which
+# means a new connection (TLS handshake included) on every request and a race when
+# two requests with different keys run at once. Tavily's client posts through
+# requests.post, which opens a fresh connection per search.
+#
+# Here every API key gets its own Gemini client manager and its own Tavily client
+# with a shared requests.Session, both reused across requests so connections stay
+# alive. GenerativeModel instances are pooled per (key, model name, tools) on top.
+# Async models and their gRPC asyncio channels are pooled per event loop as well,
+# since a channel only works on the loop it was created on.
+#
+# Neither SDK lets a caller pass its own client, so this leans on their internals:
+# google.generativeai's client._ClientManager and GenerativeModel._client /
+# _async_client, and TavilyClient._search (with base_url, headers and proxies).
+# requirements.txt pins both packages; ClientInternalsTests fails if an upgrade
+# moves any of these.
+#
+# Configure with settings.CLIENT_POOL, e.g.
+#   CLIENT_POOL = {
+#       "MAX_SIZE": 256,          # keys (or models) kept per pool
+#       "IDLE_TIMEOUT": 600,      # seconds unused before an entry is dropped
+#       "GEMINI_TRANSPORT": None, # "grpc" (default) or "rest"
+#       "GEMINI_API_ENDPOINT": None,
+#       "TAVILY_API_BASE_URL": None,
+#   }
+
+import asyncio
+import hashlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import google.generativeai as genai
+import requests
+from django.conf import settings
+from google.generativeai import client as genai_client
+from requests.adapters import HTTPAdapter
+from tavily import TavilyClient
+from tavily.errors import (
+    BadRequestError, ForbiddenError, InvalidAPIKeyError, TimeoutError as TavilyTimeoutError, UsageLimitExceededError,
+)
+
+DEFAULT_MAX_SIZE = 256
+DEFAULT_IDLE_TIMEOUT = 600
+# Connections kept per Tavily key; matches the search fan-out pool in tools.py.
+TAVILY_CONNECTIONS = 8
+
+
+def pool_setting(name, default=None):
+    return getattr(settings, 'CLIENT_POOL', {}).get(name) or default
+
+
+def key_fingerprint(api_key):
+    # Pools are keyed by a hash so raw API keys don't sit in memory as dict keys.
+    return hashlib.sha256((api_key or "").encode()).hexdigest()
+
+
+class KeyedPool:
+    """
+    key -> object built on first use and then shared. Entries unused for
+    idle_timeout seconds, or beyond max_size (least recently used first), are
+    dropped. Dropped clients aren't closed, since a request may still be using one;
+    their connections go away once nothing references them.
+    """
+
+    def __init__(self, max_size=None, idle_timeout=None):
+        self.max_size = max_size or pool_setting('MAX_SIZE', DEFAULT_MAX_SIZE)
+        self.idle_timeout = idle_timeout or pool_setting('IDLE_TIMEOUT', DEFAULT_IDLE_TIMEOUT)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data[key] = (entry[0], now)
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        value = build()
+        with self._lock:
+            # Another thread may have built one meanwhile; keep the first.
+            entry = self._data.setdefault(key, (value, now))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return entry[0]
+
+    def _evict_idle(self, now):
+        # Entries are in last-used order, so the idle ones are at the front.
+        while self._data:
+            key, (_, last_used) = next(iter(self._data.items()))
+            if now - last_used < self.idle_timeout:
+                break
+            del self._data[key]
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+gemini_managers = KeyedPool()
+gemini_models = KeyedPool()
+tavily_clients = KeyedPool()
+# event loop -> KeyedPool of async models; a pool goes away with its loop.
+async_gemini_models = weakref.WeakKeyDictionary()
+_manager_lock = threading.Lock()
+_loop_lock = threading.Lock()
+
+
+def _gemini_manager(api_key):
+    manager = genai_client._ClientManager()
+    client_options = {"api_key": api_key}
+    if pool_setting('GEMINI_API_ENDPOINT'):
+        client_options["api_endpoint"] = pool_setting('GEMINI_API_ENDPOINT')
+    manager.configure(transport=pool_setting('GEMINI_TRANSPORT'), client_options=client_options)
+    return manager
+
+
+def _manager(api_key):
+    return gemini_managers.get(key_fingerprint(api_key), lambda: _gemini_manager(api_key))
+
+
+def gemini_client(api_key, name="generative"):
+    """The pooled low-level Gemini client for `api_key`: "generative", "file"..."""
+    manager = _manager(api_key)
+    # _ClientManager builds each client lazily; serialize that so a key gets one of each.
+    with _manager_lock:
+        return manager.get_default_client(name)
+
+
+def _tools_key(tools):
+    return tuple(
+        declaration.name for tool in tools or [] for declaration in tool.function_declarations
+    )
+
+
+def _loop_models():
+    """The async model pool of the running event loop, or None outside one."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    with _loop_lock:
+        pool = async_gemini_models.get(loop)
+        if pool is None:
+            pool = async_gemini_models[loop] = KeyedPool()
+        return pool
+
+
+def gemini_model(api_key, model_name, tools=None, asynchronous=False):
+    """
+    A GenerativeModel bound to `api_key`'s pooled client instead of the global one.
+    The async flavour is pooled per event loop and must be fetched from inside the
+    loop that will use it; outside one it is built fresh every time.
+    """
+    key = (key_fingerprint(api_key), model_name, _tools_key(tools))
+
+    def build():
+        model = genai.GenerativeModel(model_name, tools=tools)
+        if asynchronous:
+            # A client of its own rather than the manager's cached one, which would
+            # be shared with (and bound to) whichever loop asked first.
+            model._async_client = _manager(api_key).make_client("generative_async")
+        else:
+            model._client = gemini_client(api_key, "generative")
+        return model
+
+    if not asynchronous:
+        return gemini_models.get(key, build)
+    pool = _loop_models()
+    return build() if pool is None else pool.get(key, build)
+
+
+class PooledTavilyClient(TavilyClient):
+    """TavilyClient whose searches go through one keep-alive requests.Session."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=TAVILY_CONNECTIONS)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _search(self, query, timeout=60, **kwargs):
+        data = {"query": query, **{name: value for name, value in kwargs.items() if value is not None}}
+        timeout = min(timeout, 120)
+        try:
+            response = self.session.post(
+                self.base_url + "/search", json=data, headers=self.headers, timeout=timeout, proxies=self.proxies
+            )
+        except requests.exceptions.Timeout:
+            raise TavilyTimeoutError(timeout)
+
+        if response.status_code == 200:
+            return response.json()
+
+        # Same errors as TavilyClient._search raises.
+        detail = ""
+        try:
+            detail = response.json().get("detail", {}).get("error", None)
+        except Exception:
+            pass
+        if response.status_code == 429:
+            raise UsageLimitExceededError(detail)
+        if response.status_code in (403, 432, 433):
+            raise ForbiddenError(detail)
+        if response.status_code == 401:
+            raise InvalidAPIKeyError(detail)
+        if response.status_code == 400:
+            raise BadRequestError(detail)
+        response.raise_for_status()
+
+
+def tavily_client(api_key):
+    return tavily_clients.get(
+        key_fingerprint(api_key),
+        lambda: PooledTavilyClient(api_key=api_key, api_base_url=pool_setting('TAVILY_API_BASE_URL')),
+    )
+
+
+def stats():
+    return {
+        "gemini_clients": gemini_managers.stats(),
+        "gemini_models": gemini_models.stats(),
+        "gemini_async_loops": len(async_gemini_models),
+        "tavily_clients": tavily_clients.stats(),
+    }
@@ -0,0 +1,240 @@
+# context.py
+#
+# Server-side conversation context. Instead of resending the whole history every
+# turn, a client can send just conversation_name and the new prompt; the Gemini
+# history is rebuilt here from the saved Chat rows.
+#
+# The converted history is cached per conversation and checked against the
+# conversation summary row (message count, summary position and revision, which
+# every write to the conversation's turns bumps), so a turn saved or finalized by
+# any worker makes every worker's copy stale; save_turn also drops the local copy
+# straight away.
+#
+# Once a conversation's estimated size passes TOKEN_BUDGET, the oldest turns are
+# folded into a running summary stored on the Conversation row, and only the newer
+# turns are sent verbatim. The summary is written by a background thread, so the
+# turn that crosses the budget still goes out with its full history and the next
+# one picks the summary up. Without an API key to summarize with, the older turns
+# are simply dropped.
+#
+# Configure with settings.CONTEXT, e.g.
+#   CONTEXT = {
+#       "TOKEN_BUDGET": 24000,
+#       "SUMMARY_TIMEOUT": 30,   # seconds a summary request may take
+#       "SUMMARY_WORKERS": 2,
+#   }
+
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .clients import gemini_model
+from .models import Chat, Conversation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = 24000
+DEFAULT_SUMMARY_TIMEOUT = 30
+DEFAULT_SUMMARY_WORKERS = 2
+# After compaction, recent turns may use up to this share of the budget.
+CONTEXT_KEEP_RATIO = 0.5
+CONTEXT_CACHE_SIZE = 1024
+SUMMARY_MODEL = 'gemini-2.5-flash'
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below so it can replace it as context for later turns. "
+    "Keep names, numbers, decisions and open questions; drop pleasantries. "
+    "Write plain prose, at most a few paragraphs.\n\n"
+)
+
+
+def context_setting(name, default):
+    value = getattr(settings, 'CONTEXT', {}).get(name)
+    return default if value is None else value
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text; good enough for a budget.
+    return len(text or "") // 4 + 1
+
+
+def turn_contents(prompt, result):
+    return [
+        {'role': 'user', 'parts': [{'text': prompt}]},
+        {'role': 'model', 'parts': [{'text': result or ""}]},
+    ]
+
+
+def summary_contents(summary):
+    return [
+        {'role': 'user', 'parts': [{'text': f"[Summary of the earlier conversation]\n{summary}"}]},
+        {'role': 'model', 'parts': [{'text': "Understood."}]},
+    ]
+
+
+class ContextCache:
+    """LRU of conversation_name -> (version, gemini contents)."""
+
+    def __init__(self, max_entries=CONTEXT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_name, version):
+        with self._lock:
+            entry = self._data.get(conversation_name)
+            if entry is not None and entry[0] == version:
+                self._data.move_to_end(conversation_name)
+                self.hits += 1
+                return list(entry[1])
+        self.misses += 1
+        return None
+
+    def set(self, conversation_name, version, contents):
+        with self._lock:
+            self._data[conversation_name] = (version, list(contents))
+            self._data.move_to_end(conversation_name)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, conversation_name):
+        with self._lock:
+            self._data.pop(conversation_name, None)
+
+
+context_cache = ContextCache()
+
+
+def summarize(previous_summary, turns, gemini_api_key):
+    transcript = []
+    if previous_summary:
+        transcript.append(f"Earlier summary: {previous_summary}")
+    for _, prompt, result in turns:
+        transcript.append(f"User: {prompt}\nAssistant: {result or ''}")
+    response = gemini_model(gemini_api_key, SUMMARY_MODEL).generate_content(
+        SUMMARY_PROMPT + "\n\n".join(transcript),
+        request_options={"timeout": context_setting('SUMMARY_TIMEOUT', DEFAULT_SUMMARY_TIMEOUT)},
+    )
+    return response.text
+
+
+def split_turns(turns, budget):
+    """Splits turns into (older, recent) so recent fits in the kept share of the budget."""
+    keep_budget = budget * CONTEXT_KEEP_RATIO
+    kept_tokens = 0
+    split = len(turns)
+    while split > 0:
+        _, prompt, result = turns[split - 1]
+        cost = estimate_tokens(prompt) + estimate_tokens(result)
+        if kept_tokens + cost > keep_budget and split < len(turns):
+            break
+        kept_tokens += cost
+        split -= 1
+    return turns[:split], turns[split:]
+
+
+def compact(conversation, older, gemini_api_key):
+    """
+    Folds `older` into the conversation's summary. Skipped if another worker moved
+    the summary on since `conversation` was read; returns whether it was saved.
+    """
+    summary = summarize(conversation.summary, older, gemini_api_key)
+    saved = Conversation.objects.filter(
+        pk=conversation.pk, summary_through_id=conversation.summary_through_id
+    ).update(summary=summary, summary_through_id=older[-1][0])
+    if saved:
+        conversation.summary = summary
+        conversation.summary_through_id = older[-1][0]
+    return bool(saved)
+
+
+class Summarizer:
+    """Runs compact() on a few background threads, at most one job per conversation."""
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, conversation, older, gemini_api_key):
+        """Queues a summary of `older`; returns False if one is already under way."""
+        with self._lock:
+            if conversation.name in self._pending:
+                return False
+            self._pending.add(conversation.name)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers or context_setting('SUMMARY_WORKERS', DEFAULT_SUMMARY_WORKERS),
+                    thread_name_prefix="summarizer",
+                )
+        self._executor.submit(self._job, conversation, older, gemini_api_key)
+        return True
+
+    def run(self, conversation, older, gemini_api_key):
+        try:
+            compact(conversation, older, gemini_api_key)
+        except Exception:
+            logger.warning("Summarizing conversation %r failed", conversation.name, exc_info=True)
+        finally:
+            context_cache.invalidate(conversation.name)
+            with self._lock:
+                self._pending.discard(conversation.name)
+
+    def _job(self, conversation, older, gemini_api_key):
+        close_old_connections()
+        try:
+            self.run(conversation, older, gemini_api_key)
+        finally:
+            close_old_connections()
+
+
+summarizer = Summarizer()
+
+
+def history_version(conversation):
+    return (conversation.message_count, conversation.summary_through_id, conversation.revision)
+
+
+def load_history(conversation_name, gemini_api_key=None):
+    """Gemini contents for everything said so far in `conversation_name`, oldest first."""
+    conversation = Conversation.objects.filter(name=conversation_name).first()
+    version = None
+    if conversation is not None:
+        version = history_version(conversation)
+        cached = context_cache.get(conversation_name, version)
+        if cached is not None:
+            return cached
+
+    summary_through_id = conversation.summary_through_id if conversation else None
+    turns = list(
+        Chat.objects.filter(conversation_name=conversation_name, id__gt=summary_through_id or 0)
+        .order_by('date_time', 'id')
+        .values_list('id', 'prompt', 'result')
+    )
+
+    summary = conversation.summary if conversation else ""
+    total = estimate_tokens(summary) + sum(
+        estimate_tokens(prompt) + estimate_tokens(result) for _, prompt, result in turns
+    )
+    budget = context_setting('TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET)
+    if conversation is not None and total > budget:
+        older, recent = split_turns(turns, budget)
+        if older and gemini_api_key:
+            summarizer.schedule(conversation, older, gemini_api_key)
+        elif older:
+            turns = recent
+
+    contents = summary_contents(summary) if summary else []
+    for _, prompt, result in turns:
+        contents.extend(turn_contents(prompt, result))
+
+    if version is not None:
+        context_cache.set(conversation_name, version, contents)
+    return contents
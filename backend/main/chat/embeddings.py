@@ -0,0 +1,89 @@
+# embeddings.py
+#
+# Text embedders for semantic retrieval (see chat/semantic.py). embed(texts) returns
+# an (n, dimensions) float32 array of unit-length rows, so a dot product between two
+# rows is their cosine similarity.
+#
+#   - HashingEmbedder: local and deterministic, no API calls. Words and word pairs
+#     are hashed into `dimensions` signed buckets (the "hashing trick"), so prompts
+#     that share most of their wording land close together. Good enough to catch
+#     repeated and lightly reworded questions, and what the tests and benchmarks use.
+#   - GeminiEmbedder: Gemini's embedding model through the pooled client for the
+#     request's API key; catches paraphrases the hashing embedder can't.
+#
+# Pick one with settings.SEMANTIC["EMBEDDER"]; `name` is stored with the index so
+# vectors from different embedders are never compared.
+
+import hashlib
+import re
+
+import numpy as np
+
+DEFAULT_DIMENSIONS = 256
+GEMINI_EMBEDDING_MODEL = "models/text-embedding-004"
+GEMINI_DIMENSIONS = 768
+
+_words = re.compile(r"\w+")
+
+
+def normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+class HashingEmbedder:
+    def __init__(self, dimensions=DEFAULT_DIMENSIONS, **options):
+        self.dimensions = dimensions
+        self.name = f"hashing-{dimensions}"
+        self._buckets = {}
+
+    def _features(self, text):
+        words = _words.findall(text.casefold())
+        # Pairs carry word order; they count for half as much as single words.
+        return [(word, 1.0) for word in words] + [
+            (f"{first} {second}", 0.5) for first, second in zip(words, words[1:])
+        ]
+
+    def _bucket(self, feature):
+        bucket = self._buckets.get(feature)
+        if bucket is None:
+            value = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+            # The low bit picks the sign so colliding features tend to cancel out.
+            bucket = (value >> 1) % self.dimensions, 1.0 if value & 1 else -1.0
+            if len(self._buckets) < 100_000:
+                self._buckets[feature] = bucket
+        return bucket
+
+    def embed(self, texts, api_key=None):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                index, sign = self._bucket(feature)
+                vectors[row, index] += sign * weight
+        return normalize_rows(vectors)
+
+
+class GeminiEmbedder:
+    needs_api_key = True
+
+    def __init__(self, dimensions=GEMINI_DIMENSIONS, model=GEMINI_EMBEDDING_MODEL, **options):
+        self.dimensions = dimensions
+        self.model = model
+        self.name = f"gemini-{model.rsplit('/', 1)[-1]}-{dimensions}"
+
+    def embed(self, texts, api_key=None):
+        import google.generativeai as genai
+
+        from .clients import gemini_client
+
+        if api_key is None:
+            raise ValueError("GeminiEmbedder needs the request's Gemini API key")
+        response = genai.embed_content(
+            model=self.model,
+            content=list(texts),
+            task_type="semantic_similarity",
+            output_dimensionality=self.dimensions,
+            client=gemini_client(api_key),
+        )
+        return normalize_rows(np.asarray(response["embedding"], dtype=np.float32).reshape(len(texts), -1))
@@ -0,0 +1,192 @@
+# enrichment.py
+#
+# An optional second stage for internet_search (tools.py). Tavily returns a short
+# snippet per result, pooled from four query variants. The model gets a pile of
+# loosely related snippets and rarely the passage that answers the question. With
+# enrichment on:
+#   1. results are ranked by Tavily's score plus the share of query terms their
+#      title and snippet contain. They are trimmed to MAX_RESULTS, and results
+#      without a single query term are dropped while any others have one;
+#   2. the top FETCH_TOP pages are fetched together through chat/pages.py, reading
+#      up to PAGE_CHARS of each page's text. Each fetch gets FETCH_DEADLINE seconds,
+#      and a page that misses it keeps just its snippet;
+#   3. page text is cut into passages of about PASSAGE_CHARS along section and
+#      sentence boundaries, and the passages are scored against the query with BM25;
+#   4. the best passages (at most PASSAGES_PER_PAGE per page) are attached to their
+#      results until the results reach BYTE_BUDGET bytes of JSON.
+#
+# Configure with settings.SEARCH_ENRICHMENT, e.g.
+#   SEARCH_ENRICHMENT = {
+#       "ENABLED": True,
+#       "MAX_RESULTS": 5,
+#       "FETCH_TOP": 3,
+#       "FETCH_DEADLINE": 4.0,
+#       "PAGE_CHARS": 32000,    # at most PAGE_FETCH["EXTRACT_CHARS"]
+#       "PASSAGE_CHARS": 600,
+#       "PASSAGES_PER_PAGE": 3,
+#       "SNIPPET_CHARS": 300,
+#       "BYTE_BUDGET": 6000,
+#   }
+
+import json
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+
+from .pages import fetch_all, truncate
+
+DEFAULT_MAX_RESULTS = 5
+DEFAULT_FETCH_TOP = 3
+DEFAULT_FETCH_DEADLINE = 4.0
+DEFAULT_PAGE_CHARS = 32000
+DEFAULT_PASSAGE_CHARS = 600
+DEFAULT_PASSAGES_PER_PAGE = 3
+DEFAULT_SNIPPET_CHARS = 300
+DEFAULT_BYTE_BUDGET = 6000
+
+# BM25's usual constants.
+K1 = 1.2
+B = 0.75
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can did do does for from how in is it its of on or that the "
+    "this to was were what when where which who why will with".split()
+)
+
+_words = re.compile(r"\w+")
+_heading = re.compile(r"\s*--- H\d: (.*?) ---\s*")
+_sentence_end = re.compile(r"(?<=[.!?])\s+")
+
+
+def enrichment_setting(name, default=None):
+    value = getattr(settings, 'SEARCH_ENRICHMENT', {}).get(name)
+    return default if value is None else value
+
+
+def enrichment_enabled():
+    return bool(enrichment_setting('ENABLED', False))
+
+
+def terms(text):
+    return [word for word in _words.findall(text.casefold()) if word not in STOPWORDS]
+
+
+def json_size(value):
+    return len(json.dumps(value, ensure_ascii=False).encode())
+
+
+def rank_results(query, results, limit):
+    """The `limit` results most worth reading, best first."""
+    wanted = set(terms(query))
+
+    def coverage(result):
+        if not wanted:
+            return 0.0
+        found = set(terms(f"{result.get('title') or ''} {result.get('content') or ''}"))
+        return len(wanted & found) / len(wanted)
+
+    scored = sorted(
+        ((coverage(result) + float(result.get('score') or 0), coverage(result), position, result)
+         for position, result in enumerate(results)),
+        key=lambda item: (-item[0], item[2]),
+    )
+    if any(item[1] for item in scored):
+        scored = [item for item in scored if item[1]]
+    return [item[3] for item in scored[:limit]]
+
+
+def passages(text, size):
+    """Page text (as pages.fetch_page returns it) cut into passages of about `size` chars."""
+    pieces = _heading.split(text)
+    # split() alternates body, heading, body...; each passage is labelled with its section.
+    sections = [("", pieces[0])] + list(zip(pieces[1::2], pieces[2::2]))
+    out = []
+    for heading, body in sections:
+        current = ""
+        for sentence in _sentence_end.split(body.strip()):
+            if current and len(current) + len(sentence) + 1 > size:
+                out.append((heading, current))
+                current = ""
+            current = f"{current} {sentence}" if current else sentence
+        if current:
+            out.append((heading, current))
+    return [
+        f"{heading}: {truncate(body, size)[0]}" if heading else truncate(body, size)[0]
+        for heading, body in out
+    ]
+
+
+def bm25(query, documents):
+    """A BM25 score per document for the query's terms."""
+    wanted = set(terms(query))
+    tokenized = [Counter(terms(document)) for document in documents]
+    if not wanted or not tokenized:
+        return [0.0] * len(documents)
+    average = sum(sum(counts.values()) for counts in tokenized) / len(tokenized) or 1.0
+    idf = {}
+    for term in wanted:
+        df = sum(1 for counts in tokenized if term in counts)
+        idf[term] = math.log(1 + (len(tokenized) - df + 0.5) / (df + 0.5))
+    scores = []
+    for counts in tokenized:
+        length = sum(counts.values())
+        scores.append(sum(
+            idf[term] * counts[term] * (K1 + 1) / (counts[term] + K1 * (1 - B + B * length / average))
+            for term in wanted if counts[term]
+        ))
+    return scores
+
+
+def enrich_results(query, results):
+    """
+    Tavily results ranked, trimmed and, for the top pages, given the passages that
+    best match the query, all within BYTE_BUDGET bytes of JSON.
+    """
+    budget = enrichment_setting('BYTE_BUDGET', DEFAULT_BYTE_BUDGET)
+    snippet_chars = enrichment_setting('SNIPPET_CHARS', DEFAULT_SNIPPET_CHARS)
+    ranked = rank_results(query, results, enrichment_setting('MAX_RESULTS', DEFAULT_MAX_RESULTS))
+    enriched = [
+        {
+            "title": result.get("title") or "",
+            "url": result.get("url") or "",
+            "content": truncate(result.get("content") or "", snippet_chars)[0],
+        }
+        for result in ranked
+    ]
+    while len(enriched) > 1 and json_size(enriched) > budget:
+        enriched.pop()
+
+    top = [result for result in enriched[:enrichment_setting('FETCH_TOP', DEFAULT_FETCH_TOP)] if result["url"]]
+    fetched = fetch_all(
+        [result["url"] for result in top],
+        timeout=enrichment_setting('FETCH_DEADLINE', DEFAULT_FETCH_DEADLINE),
+        max_chars=enrichment_setting('PAGE_CHARS', DEFAULT_PAGE_CHARS),
+    )
+    size = enrichment_setting('PASSAGE_CHARS', DEFAULT_PASSAGE_CHARS)
+    candidates = [
+        (result, passage)
+        for result, page in zip(top, fetched) if page.get("content")
+        for passage in passages(page["content"], size)
+    ]
+    scores = bm25(query, [passage for _, passage in candidates])
+
+    used = json_size(enriched)
+    per_page = enrichment_setting('PASSAGES_PER_PAGE', DEFAULT_PASSAGES_PER_PAGE)
+    for score, _, (result, passage) in sorted(
+        ((score, position, candidate) for position, (score, candidate) in enumerate(zip(scores, candidates))),
+        key=lambda item: (-item[0], item[1]),
+    ):
+        if score <= 0:
+            break
+        chosen = result.get("passages", [])
+        if len(chosen) >= per_page:
+            continue
+        # ', "passages": []' is paid once per result, ', ' between passages.
+        cost = json_size(passage) + (2 if chosen else len(', "passages": []'))
+        if used + cost > budget:
+            continue
+        result["passages"] = [*chosen, passage]
+        used += cost
+    return enriched
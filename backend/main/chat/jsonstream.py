@@ -0,0 +1,86 @@
+# jsonstream.py
+#
+# Streamed JSON bodies for the endpoints that return whole conversations
+# (conversation_by_name, interface_fetch). Rows come from the database in batches
+# of ITERATOR_CHUNK_SIZE through QuerySet.iterator() and are encoded one at a time.
+# Output goes out in pieces of about FLUSH_BYTES, so memory stays at a batch of
+# rows and the first bytes leave before the last row is read.
+#
+# The body is the same JSON document the endpoints always returned, just written
+# compactly. With ?format=ndjson (or "Accept: application/x-ndjson") it is one
+# message per line instead.
+#
+# Rows are encoded with orjson when it is installed, and the standard library's
+# json otherwise.
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+try:
+    import orjson
+except ImportError:  # json it is
+    orjson = None
+
+ITERATOR_CHUNK_SIZE = 100
+FLUSH_BYTES = 64 * 1024
+NDJSON = "application/x-ndjson"
+
+_fallback = DjangoJSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def encoder_name():
+    return "orjson" if orjson is not None else "json"
+
+
+def dumps(value):
+    """value as compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        # Dates and the like go through Django's encoder either way, so both write them alike.
+        return orjson.dumps(value, default=_fallback.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return _fallback.encode(value).encode()
+
+
+def wants_ndjson(request):
+    return request.GET.get('format') == 'ndjson' or NDJSON in request.headers.get('Accept', '')
+
+
+def batched(pieces, size=None):
+    """Joins byte pieces into chunks of at least `size` bytes (the last may be shorter)."""
+    size = size or FLUSH_BYTES
+    buffer, buffered = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield b"".join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def object_pieces(head, key, items, tail=None):
+    """
+    The bytes of {**head, key: [*items], **tail()}, a piece at a time. tail is
+    called once the items have run out, for values that depend on them.
+    """
+    opening = dumps(head)[:-1]
+    yield opening + (b"," if head else b"") + dumps(key) + b":["
+    for index, item in enumerate(items):
+        yield (b"," if index else b"") + dumps(item)
+    closing = dumps(tail() if tail else {})
+    yield b"]" + (b"," + closing[1:] if closing != b"{}" else b"}")
+
+
+def json_stream_response(head, key, items, tail=None, status=200):
+    return StreamingHttpResponse(
+        batched(object_pieces(head, key, items, tail)), content_type="application/json", status=status
+    )
+
+
+def ndjson_response(items, status=200):
+    return StreamingHttpResponse(batched(dumps(item) + b"\n" for item in items), content_type=NDJSON, status=status)
+
+
+def streamed_rows(queryset):
+    return queryset.iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+
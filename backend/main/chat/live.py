@@ -0,0 +1,355 @@
+# live.py
+#
+# Live turns that outlive the connection that started them. The stream views'
+# event generator is driven by a producer (a pooled thread for interface_stream, a
+# task on live_loop for interface_stream_async) that publishes every SSE event to a
+# LiveStream; the HTTP response only follows it. A dropped connection doesn't stop
+# the answer, and a client reconnecting through /resume/<stream_id>/ on the same
+# worker within LIVE_STREAMS['RETENTION'] seconds replays the events it missed
+# (SSE ids, so Last-Event-ID works) and then follows the live ones. Other workers
+# answer /resume/ from the turn's checkpointed Chat row instead.
+#
+# Sync turns are produced on a pool of at most MAX_DETACHED threads. When all of
+# them are busy, a new turn runs inside its response instead (as with DETACH off),
+# so a burst can't grow the thread count without bound. The pool's threads are
+# joined at interpreter exit, so a worker shutting down finishes the turns it holds.
+# Async turns are produced on one long-lived event loop in its own thread, not the
+# loop serving the request. Under WSGI that loop belongs to async_to_sync and ends
+# with the view call, taking any task started on it along.
+#
+# Followers send a heartbeat comment whenever the turn has been quiet for
+# KEEPALIVE_INTERVAL seconds (a long tool call, a slow first token), so proxies
+# don't close the connection, and merge the deltas that piled up while the client
+# was still reading earlier ones (see chat/sse.py).
+#
+# Configure with settings.LIVE_STREAMS, e.g.
+#   LIVE_STREAMS = {
+#       "DETACH": True,     # False runs the turn inside the response, as before
+#       "RETENTION": 60,
+#       "MAX_DETACHED": 64, # sync turns producing in the background at once
+#   }
+
+import asyncio
+import contextvars
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from .sse import KEEPALIVE_INTERVAL, coalesce, sse_comment, sse_setting
+
+DEFAULT_RETENTION = 60
+DEFAULT_MAX_DETACHED = 64
+
+
+def live_setting(name, default):
+    value = getattr(settings, 'LIVE_STREAMS', {}).get(name)
+    return default if value is None else value
+
+
+class ResponseBuffer:
+    """Append-only text buffer: chunks are kept as a list and only joined when the text is read."""
+
+    def __init__(self):
+        self._parts = []
+        self._length = 0
+
+    def append(self, text):
+        self._parts.append(text)
+        self._length += len(text)
+
+    def text(self):
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def __len__(self):
+        return self._length
+
+    def __bool__(self):
+        return self._length > 0
+
+
+def with_event_id(index, event):
+    # Comments (keepalives) carry no id; data events get their position in the stream.
+    if event.startswith("data:"):
+        return f"id: {index}\n{event}"
+    return event
+
+
+class LiveStream:
+    def __init__(self, stream_id=None):
+        self.stream_id = stream_id or uuid.uuid4().hex
+        self.events = []
+        self.done = False
+        self.finished_at = None
+        self.task = None
+        # True when the turn runs inside its response, which then has no follower
+        # to send heartbeats for it (see sse.with_heartbeats).
+        self.inline = False
+        self._condition = threading.Condition()
+        self._waiters = []
+
+    def publish(self, event):
+        with self._condition:
+            self.events.append(event)
+            index = len(self.events) - 1
+            self._wake()
+        return index
+
+    def finish(self):
+        with self._condition:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._wake()
+
+    def _wake(self):
+        self._condition.notify_all()
+        for loop, waiter in self._waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, waiter)
+            except RuntimeError:
+                pass  # that follower's loop has closed; it isn't listening any more
+        self._waiters = []
+
+    def follow(self, offset=0):
+        """Every event from `offset` on, blocking for new ones until the turn is done."""
+        keepalive = sse_setting('KEEPALIVE_INTERVAL', KEEPALIVE_INTERVAL)
+        window = sse_setting('COALESCE_WINDOW', 0)
+        while True:
+            with self._condition:
+                if offset >= len(self.events) and not self.done:
+                    self._condition.wait(keepalive)
+                if offset >= len(self.events) and not self.done:
+                    events = None
+                else:
+                    if window and not self.done:
+                        self._condition.wait_for(lambda: self.done, timeout=window)
+                    events, done = self.events[offset:], self.done
+            if events is None:
+                yield sse_comment()
+                continue
+            for index, event in coalesce(events, offset):
+                yield with_event_id(index, event)
+            offset += len(events)
+            if done:
+                return
+
+    async def follow_async(self, offset=0):
+        keepalive = sse_setting('KEEPALIVE_INTERVAL', KEEPALIVE_INTERVAL)
+        window = sse_setting('COALESCE_WINDOW', 0)
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                waiter = None
+                if offset >= len(self.events) and not self.done:
+                    waiter = loop.create_future()
+                    self._waiters.append((loop, waiter))
+            if waiter is not None:
+                try:
+                    await asyncio.wait_for(waiter, keepalive)
+                except asyncio.TimeoutError:
+                    yield sse_comment()
+                    continue
+            if window and not self.done:
+                await asyncio.sleep(window)
+            with self._condition:
+                events, done = self.events[offset:], self.done
+            for index, event in coalesce(events, offset):
+                yield with_event_id(index, event)
+            offset += len(events)
+            if done:
+                return
+
+
+def _resolve(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class LiveStreamRegistry:
+    def __init__(self):
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def create(self):
+        stream = LiveStream()
+        with self._lock:
+            self._prune()
+            self._streams[stream.stream_id] = stream
+        return stream
+
+    def get(self, stream_id):
+        with self._lock:
+            self._prune()
+            return self._streams.get(stream_id)
+
+    def _prune(self):
+        cutoff = time.monotonic() - live_setting('RETENTION', DEFAULT_RETENTION)
+        expired = [
+            stream_id for stream_id, stream in self._streams.items()
+            if stream.finished_at is not None and stream.finished_at < cutoff
+        ]
+        for stream_id in expired:
+            del self._streams[stream_id]
+
+    def __len__(self):
+        return len(self._streams)
+
+
+live_streams = LiveStreamRegistry()
+
+
+class ProducerPool:
+    """Threads for detached sync turns, at most `size` (MAX_DETACHED) busy at once."""
+
+    def __init__(self, size=None):
+        self._size = size
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """Runs fn(*args) on the pool; False, without running it, when every thread is busy."""
+        with self._lock:
+            if self._executor is None:
+                size = self._size or live_setting('MAX_DETACHED', DEFAULT_MAX_DETACHED)
+                self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="turn")
+                self._slots = threading.BoundedSemaphore(size)
+        if not self._slots.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                fn(*args)
+            finally:
+                self._slots.release()
+
+        self._executor.submit(run)
+        return True
+
+
+class LiveLoop:
+    """One event loop, on a thread of its own, for detached async turns."""
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def submit(self, coroutine):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="live-turns", daemon=True).start()
+        # In a fresh context: the request's would tie the turn's sync_to_async calls to
+        # the thread of the async_to_sync call that is serving it, which ends first.
+        return contextvars.Context().run(asyncio.run_coroutine_threadsafe, coroutine, self._loop)
+
+
+producers = ProducerPool()
+live_loop = LiveLoop()
+
+
+def _produce(stream, events):
+    try:
+        for event in events:
+            stream.publish(event)
+    finally:
+        stream.finish()
+        connection.close()
+
+
+def _drive(stream, events):
+    try:
+        for event in events:
+            yield with_event_id(stream.publish(event), event)
+    finally:
+        events.close()
+        stream.finish()
+
+
+class _Closing:
+    """
+    An inline turn's iterator whose close() (called when the response closes) also
+    calls on_close. A response closed before it was iterated never starts `events`,
+    so their own `finally` never runs; on_close is what's left to clean up with.
+    """
+
+    def __init__(self, iterator, on_close):
+        self._iterator = iterator
+        self._on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        try:
+            self._iterator.close()
+        finally:
+            self._on_close()
+
+
+class _AsyncClosing:
+    """_Closing for an async iterator. The response only calls a synchronous close();
+    a started generator is closed by the cancelled request task instead."""
+
+    def __init__(self, iterator, on_close):
+        self._iterator = iterator
+        self._on_close = on_close
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._iterator.__anext__()
+
+    def close(self):
+        self._on_close()
+
+
+def start_live(stream, events, on_close=None):
+    """
+    Runs the `events` generator for `stream` and returns the iterator to send to the
+    client. When the turn runs inside the response, on_close() is called as the
+    response closes, whether or not it was iterated.
+    """
+    if not live_setting('DETACH', True) or not producers.submit(_produce, stream, events):
+        stream.inline = True
+        driven = _drive(stream, events)
+        return _Closing(driven, on_close) if on_close else driven
+    return stream.follow()
+
+
+async def _produce_async(stream, events):
+    try:
+        async for event in events:
+            stream.publish(event)
+    finally:
+        stream.finish()
+        await sync_to_async(connection.close)()
+
+
+async def _drive_async(stream, events):
+    try:
+        async for event in events:
+            yield with_event_id(stream.publish(event), event)
+    finally:
+        await events.aclose()
+        stream.finish()
+
+
+def start_live_async(stream, events, on_close=None):
+    """start_live() for an async `events` generator, which runs on live_loop when detached."""
+    if not live_setting('DETACH', True):
+        stream.inline = True
+        driven = _drive_async(stream, events)
+        return _AsyncClosing(driven, on_close) if on_close else driven
+    stream.task = live_loop.submit(_produce_async(stream, events))
+    return stream.follow_async()
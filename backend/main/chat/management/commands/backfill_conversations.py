@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from chat.models import Conversation
+
+
+class Command(BaseCommand):
+    help = "Builds (or rebuilds) the conversation summary table from existing chat rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        batch = []
+        written = 0
+        for summary in Conversation.recount().iterator(chunk_size=batch_size):
+            batch.append(summary)
+            if len(batch) >= batch_size:
+                written += self._write(batch)
+                batch = []
+        if batch:
+            written += self._write(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {written} conversations."))
+
+    def _write(self, batch):
+        # Re-runnable: existing summaries are overwritten with the recomputed values.
+        Conversation.save_recounted(batch)
+        self.stdout.write(f"  ...{len(batch)} conversations")
+        return len(batch)
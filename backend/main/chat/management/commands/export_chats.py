@@ -0,0 +1,47 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat import transfer
+
+
+class Command(BaseCommand):
+    help = "Writes chat rows as compressed NDJSON for import_chats - see chat/transfer.py."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="File to write, or - for stdout.")
+        parser.add_argument('--conversation', action='append', dest='conversations', metavar='NAME',
+                            help="Only this conversation (repeatable).")
+        parser.add_argument('--compression', choices=transfer.COMPRESSIONS,
+                            help="Default: from the file name (.gz, .zst, .ndjson), else gzip.")
+        parser.add_argument('--chunk-size', type=int, help="Rows fetched from the database at a time.")
+
+    def handle(self, *args, **options):
+        path = options['output']
+        compression = options['compression'] or ('gzip' if path == '-' else transfer.compression_for(path))
+        # With the export on stdout, progress goes to stderr.
+        log = self.stderr if path == '-' else self.stdout
+        started = time.monotonic()
+
+        def progress(rows):
+            log.write(f"  ...{rows} rows ({rows / (time.monotonic() - started):.0f}/s)")
+
+        try:
+            if path == '-':
+                rows, written = transfer.write_export(
+                    sys.stdout.buffer, options['conversations'], compression, options['chunk_size'], progress
+                )
+                sys.stdout.buffer.flush()
+            else:
+                with open(path, 'wb') as out:
+                    rows, written = transfer.write_export(
+                        out, options['conversations'], compression, options['chunk_size'], progress
+                    )
+        except transfer.TransferError as e:
+            raise CommandError(str(e))
+
+        seconds = time.monotonic() - started
+        log.write(self.style.SUCCESS(
+            f"Exported {rows} rows ({written / 2 ** 20:.1f} MB {compression}) in {seconds:.1f} s."
+        ))
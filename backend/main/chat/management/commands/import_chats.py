@@ -0,0 +1,51 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat import transfer
+
+
+class Command(BaseCommand):
+    help = "Loads an export_chats file; rows already present are skipped, conflicting ids reported - see chat/transfer.py."
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="File to read (gzip, zstd or plain NDJSON), or - for stdin.")
+        parser.add_argument('--batch-size', type=int, help="Rows written per bulk_create.")
+        parser.add_argument('--skip-summaries', action='store_true',
+                            help="Don't recompute the imported conversations' summaries (run backfill_conversations later).")
+
+    def handle(self, *args, **options):
+        reported = {'at': 0.0}
+
+        def progress(stats):
+            # At most one line a second, however small the batches.
+            if stats.seconds - reported['at'] >= 1:
+                reported['at'] = stats.seconds
+                self.stdout.write(
+                    f"  ...{stats.read} rows read, {stats.created} created, {stats.skipped} already there "
+                    f"({stats.read / stats.seconds:.0f}/s)"
+                )
+
+        try:
+            if options['input'] == '-':
+                stats = transfer.import_rows(sys.stdin.buffer.read, options['batch_size'], progress)
+            else:
+                with open(options['input'], 'rb') as source:
+                    stats = transfer.import_rows(source.read, options['batch_size'], progress)
+        except transfer.TransferError as e:
+            raise CommandError(str(e))
+        except OSError as e:
+            raise CommandError(f"Can't read {options['input']}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats.created} of {stats.read} rows in {stats.seconds:.1f} s "
+            f"({stats.skipped} already there, {stats.images_dropped} images without a blob dropped)."
+        ))
+        if stats.conflicts:
+            self.stderr.write(self.style.WARNING(
+                f"{stats.conflicts} rows not imported: their ids belong to different turns here "
+                f"(ids {', '.join(map(str, stats.conflict_ids))}{', ...' if stats.conflicts > len(stats.conflict_ids) else ''})."
+            ))
+        if stats.conversations and not options['skip_summaries']:
+            transfer.rebuild_conversations(stats.conversations)
+            self.stdout.write(f"Recomputed {len(stats.conversations)} conversation summaries.")
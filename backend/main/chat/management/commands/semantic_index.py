@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chat import semantic
+from chat.models import STATUS_COMPLETE, Chat
+
+
+class Command(BaseCommand):
+    help = "Adds saved turns that aren't in the semantic index yet (or rebuilds it) - see chat/semantic.py."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--rebuild', action='store_true', help="Start from an empty index.")
+        parser.add_argument('--api-key', help="Gemini API key, for embedders that call the API.")
+
+    def handle(self, *args, **options):
+        embedder = semantic.get_embedder()
+        if getattr(embedder, 'needs_api_key', False) and not options['api_key']:
+            raise CommandError(f"{type(embedder).__name__} needs --api-key")
+        index = semantic.get_index()
+        if options['rebuild']:
+            index.reset()
+
+        indexed = set(index.ids().tolist())
+        turns = (
+            Chat.objects.filter(status=STATUS_COMPLETE)
+            .exclude(prompt='')
+            .order_by('id')
+            .values_list('id', 'prompt')
+        )
+        batch = []
+        added = 0
+        for chat_id, prompt in turns.iterator(chunk_size=options['batch_size']):
+            if chat_id in indexed:
+                continue
+            batch.append((chat_id, prompt))
+            if len(batch) >= options['batch_size']:
+                added += self._add(index, embedder, batch, options['api_key'])
+                batch = []
+        if batch:
+            added += self._add(index, embedder, batch, options['api_key'])
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {added} turns; the index holds {len(index)}."))
+
+    def _add(self, index, embedder, batch, api_key):
+        ids = [chat_id for chat_id, _ in batch]
+        index.add(ids, embedder.embed([prompt for _, prompt in batch], api_key=api_key))
+        self.stdout.write(f"  ...{len(batch)} turns")
+        return len(batch)
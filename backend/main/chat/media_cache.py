@@ -0,0 +1,109 @@
+# media_cache.py
+#
+# Images are uploaded once through /upload/ (stored in the blob store) and then
+# referenced from the history by their handle, the blob's SHA-256:
+#   {"type": "image_ref", "handle": "<digest>"}
+# instead of being resent as a data: URL every turn. Two bounded caches sit in
+# front of the blob store, both keyed by handle:
+#   - decoded bytes, capped by total size, so hot images skip the disk read;
+#   - Gemini Files API references, per API key, so a large image is uploaded to
+#     Gemini once and afterwards sent as a file_uri instead of inline bytes.
+
+import io
+import threading
+import time
+from collections import OrderedDict
+
+from .blobstore import DIGEST_PATTERN, get_blob_store
+from .clients import gemini_client, key_fingerprint
+
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+GEMINI_FILE_CACHE_SIZE = 4096
+# Images at least this big go through the Files API instead of inline_data.
+GEMINI_FILE_THRESHOLD = 1024 * 1024
+# Gemini deletes uploaded files after 48 hours; stop reusing them a bit before.
+GEMINI_FILE_TTL = 47 * 60 * 60
+
+
+class UnknownHandle(LookupError):
+    pass
+
+
+class ImageBytesCache:
+    """LRU of handle -> (mime_type, bytes), bounded by the total number of bytes held."""
+
+    def __init__(self, max_bytes=IMAGE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, handle):
+        with self._lock:
+            entry = self._data.get(handle)
+            if entry is not None:
+                self._data.move_to_end(handle)
+                self.hits += 1
+                return entry
+        self.misses += 1
+        entry = self._load(handle)
+        with self._lock:
+            if handle not in self._data:
+                self._data[handle] = entry
+                self.total_bytes += len(entry[1])
+                while self.total_bytes > self.max_bytes and len(self._data) > 1:
+                    _, (_, evicted) = self._data.popitem(last=False)
+                    self.total_bytes -= len(evicted)
+        return entry
+
+    def _load(self, handle):
+        from .models import Blob
+
+        if not DIGEST_PATTERN.match(handle or ""):
+            raise UnknownHandle(f"Invalid image handle: {handle!r}")
+        blob = Blob.objects.filter(digest=handle).first()
+        if blob is None:
+            raise UnknownHandle(f"Unknown image handle: {handle}")
+        with get_blob_store().open(handle) as blob_file:
+            return blob.content_type, blob_file.read()
+
+
+class GeminiFileCache:
+    """(API key, handle) -> uploaded Gemini file, so each image is uploaded once per key."""
+
+    def __init__(self, max_entries=GEMINI_FILE_CACHE_SIZE, ttl=GEMINI_FILE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_upload(self, gemini_api_key, handle, mime_type, data):
+        key = (key_fingerprint(gemini_api_key), handle)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                return entry[1]
+
+        file_client = gemini_client(gemini_api_key, "file")
+        uploaded = file_client.create_file(io.BytesIO(data), mime_type=mime_type, display_name=handle)
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, uploaded.uri)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return uploaded.uri
+
+
+image_bytes_cache = ImageBytesCache()
+gemini_file_cache = GeminiFileCache()
+
+
+def image_ref_part(handle, gemini_api_key=None):
+    """The Gemini part for an uploaded image: a file_uri when worth it, else inline bytes."""
+    mime_type, data = image_bytes_cache.get(handle)
+    if gemini_api_key and len(data) >= GEMINI_FILE_THRESHOLD:
+        file_uri = gemini_file_cache.get_or_upload(gemini_api_key, handle, mime_type, data)
+        return {'file_data': {'mime_type': mime_type, 'file_uri': file_uri}}
+    return {'inline_data': {'mime_type': mime_type, 'data': data}}
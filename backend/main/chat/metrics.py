@@ -0,0 +1,243 @@
+# metrics.py
+#
+# Where a turn's time goes. Pipeline stages, tool calls, upstream requests and
+# whole HTTP requests are timed into histograms and served at /metrics in
+# Prometheus' text format:
+#
+#   juno_stage_duration_seconds{stage}
+#       parse, semantic_lookup, context (stored history plus
+#       convert_to_gemini_history), model_first_chunk and model_stream (per model
+#       call), tools (one round of tool calls), save (persist or enqueue the turn),
+#       db_write (one batch of saved turns), search_enrichment and, for spoken
+#       prompts, transcribe_wait (ending the audio to having its transcript).
+#   juno_time_to_first_delta_seconds       request start to the first text sent
+#   juno_stream_duration_seconds{outcome}  request start to the end of the stream
+#   juno_tool_duration_seconds{tool,outcome}             each tool run (cache misses)
+#   juno_upstream_request_duration_seconds{service,outcome}  Tavily searches, page fetches
+#   juno_admission_wait_seconds{outcome}   time queued for a slot: admitted, queue_timeout,
+#       or 0 for turns turned away at once (rate_limited, queue_full); see chat/admission.py
+#   juno_http_request_duration_seconds{route,method,status}
+#       RequestMetricsMiddleware. For event streams this is the time until the
+#       response starts; the stream itself is in juno_stream_duration_seconds.
+#
+# Histograms live in the process that observed them; with several workers, scrape
+# each one or run the app with one worker per scrape target.
+#
+# A request's Trace keeps its own stage timings too. Clients that send
+# "timings": true get them as a "timing" event just before "done", and every client
+# does when METRICS["SSE_TIMINGS"] is on.
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Prometheus' default latency buckets, stretched to cover a long tool turn.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REGISTRY = []
+
+
+def metrics_setting(name, default=None):
+    value = getattr(settings, 'METRICS', {}).get(name)
+    return default if value is None else value
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value):
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class Histogram:
+    """A Prometheus histogram: per label set, a count per bucket plus the sum and count."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def observe(self, seconds, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # One slot per bucket, one for +Inf, then sum and count.
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[-1] if series else 0
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), values):
+                cumulative += count
+                bucket_labels = ",".join([*labels, 'le="%s"' % _format(bound)])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = f"{{{','.join(labels)}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {_format(values[-2])}")
+            lines.append(f"{self.name}_count{suffix} {values[-1]}")
+        return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram(
+    "juno_stage_duration_seconds", "Time spent in each stage of the chat pipeline.", ["stage"]
+)
+FIRST_DELTA_SECONDS = Histogram(
+    "juno_time_to_first_delta_seconds", "Time from request start to the first text delta."
+)
+STREAM_SECONDS = Histogram(
+    "juno_stream_duration_seconds", "Time from request start to the end of the event stream.", ["outcome"]
+)
+TOOL_SECONDS = Histogram(
+    "juno_tool_duration_seconds", "Time each tool call took to run.", ["tool", "outcome"]
+)
+UPSTREAM_SECONDS = Histogram(
+    "juno_upstream_request_duration_seconds", "Time for requests to Tavily and fetched web pages.",
+    ["service", "outcome"],
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "juno_admission_wait_seconds", "Time turns waited to be admitted, by outcome.", ["outcome"]
+)
+HTTP_SECONDS = Histogram(
+    "juno_http_request_duration_seconds", "Time to respond to each HTTP request (to the start of streams).",
+    ["route", "method", "status"],
+)
+
+
+def render():
+    return "\n".join(histogram.render() for histogram in REGISTRY) + "\n"
+
+
+class Trace:
+    """One turn's stage timings, kept for its "timing" event and fed to the histograms."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}  # stage -> seconds, summed over model rounds
+        self.marks = {}   # event -> seconds since the request started
+
+    def observe(self, stage, seconds):
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def span(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def chunks(self, stream, started):
+        """Yields a model stream's chunks, timing the first one and the whole stream."""
+        first = True
+        try:
+            for chunk in stream:
+                if first:
+                    self.observe("model_first_chunk", time.perf_counter() - started)
+                    first = False
+                yield chunk
+        finally:
+            self.observe("model_stream", time.perf_counter() - started)
+
+    async def achunks(self, stream, started):
+        first = True
+        try:
+            async for chunk in stream:
+                if first:
+                    self.observe("model_first_chunk", time.perf_counter() - started)
+                    first = False
+                yield chunk
+        finally:
+            self.observe("model_stream", time.perf_counter() - started)
+
+    def mark(self, name):
+        """Records when `name` first happened."""
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.started
+
+    def finish(self, outcome):
+        total = time.perf_counter() - self.started
+        STREAM_SECONDS.observe(total, outcome=outcome)
+        if "first_delta" in self.marks:
+            FIRST_DELTA_SECONDS.observe(self.marks["first_delta"])
+        self.marks["total"] = total
+
+    def event(self):
+        return {
+            "type": "timing",
+            "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+            **{f"{name}_ms": round(seconds * 1000, 1) for name, seconds in self.marks.items()},
+        }
+
+
+class RequestMetricsMiddleware:
+    """Times every request into juno_http_request_duration_seconds, labelled by URL route."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, started)
+        return response
+
+    def _observe(self, request, response, started):
+        # The route pattern, not the path, so /message/<id>/ is one series.
+        match = getattr(request, "resolver_match", None)
+        HTTP_SECONDS.observe(
+            time.perf_counter() - started,
+            route=getattr(match, "route", None) or "unmatched",
+            method=request.method,
+            status=response.status_code,
+        )
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_rename_conversation_id_chat_conversation_name'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['-date_time', '-id'], name='chat_date_time_id_idx'),
+        ),
+    ]
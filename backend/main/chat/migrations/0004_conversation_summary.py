@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_chat_date_time_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=360, unique=True)),
+                ('title', models.CharField(blank=True, max_length=120)),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('last_message_time', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'conversation',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['conversation_name', 'date_time'], name='chat_conv_date_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['-last_message_time', '-id'], name='conv_last_message_idx'),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Moves inline base64 images out of chat.generated_image_b64 into the blob store,
+# a batch at a time. Not atomic, so each batch commits on its own and a large
+# table can be migrated without one giant transaction; re-running picks up
+# wherever it stopped, since moved rows have generated_image_b64 cleared. A value
+# that isn't valid base64 is logged and left inline on its row.
+
+import base64
+import binascii
+import logging
+
+from django.db import migrations
+
+from chat.blobstore import get_blob_store, sniff_content_type
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+
+
+def decode_inline_image(value):
+    content_type = None
+    if value.startswith('data:'):
+        header, value = value.split(',', 1)
+        content_type = header[len('data:'):].split(';')[0] or None
+    data = base64.b64decode(value)
+    return data, content_type or sniff_content_type(data)
+
+
+def move_images(apps, schema_editor):
+    Chat = apps.get_model('chat', 'Chat')
+    Blob = apps.get_model('chat', 'Blob')
+    store = get_blob_store()
+
+    last_id = 0
+    while True:
+        batch = list(
+            Chat.objects.filter(generated_image_b64__isnull=False, id__gt=last_id)
+            .order_by('id')
+            .values('id', 'generated_image_b64')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last_id = batch[-1]['id']
+
+        blobs = {}
+        chats = []
+        for row in batch:
+            digest = None
+            if row['generated_image_b64']:
+                try:
+                    data, content_type = decode_inline_image(row['generated_image_b64'])
+                except (binascii.Error, ValueError) as e:
+                    logger.warning("Chat %s: generated_image_b64 is not a base64 image (%s); left inline.", row['id'], e)
+                    continue
+                digest = store.put(data)
+                blobs[digest] = Blob(digest=digest, content_type=content_type, size=len(data))
+            chats.append(Chat(id=row['id'], generated_image_id=digest, generated_image_b64=None))
+
+        Blob.objects.bulk_create(blobs.values(), ignore_conflicts=True)
+        Chat.objects.bulk_update(chats, ['generated_image', 'generated_image_b64'])
+
+
+def restore_images(apps, schema_editor):
+    Chat = apps.get_model('chat', 'Chat')
+    store = get_blob_store()
+
+    last_id = 0
+    while True:
+        batch = list(
+            Chat.objects.filter(generated_image__isnull=False, id__gt=last_id)
+            .order_by('id')
+            .values('id', 'generated_image_id')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        chats = []
+        for row in batch:
+            with store.open(row['generated_image_id']) as blob:
+                inline = base64.b64encode(blob.read()).decode()
+            chats.append(Chat(id=row['id'], generated_image_b64=inline))
+        Chat.objects.bulk_update(chats, ['generated_image_b64'])
+        last_id = batch[-1]['id']
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('chat', '0005_blob_chat_generated_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_images, restore_images),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_move_generated_images_to_blobs'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='chat',
+            name='generated_image_b64',
+        ),
+    ]
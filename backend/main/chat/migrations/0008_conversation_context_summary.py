@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_remove_chat_generated_image_b64'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='summary_through_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_conversation_context_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='status',
+            field=models.CharField(choices=[('partial', 'Partial'), ('complete', 'Complete')], default='complete', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='stream_id',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['stream_id'], name='chat_stream_id_idx'),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Full-text index over chat prompts and results: a generated tsvector column with a
+# GIN index on Postgres, an FTS5 table kept in sync by triggers on SQLite. Existing
+# rows are indexed here; see chat/search.py.
+#
+# The SQL is copied from chat/search.py as it stood when this migration was written,
+# so later changes there don't change what this migration does.
+
+from django.db import migrations
+
+POSTGRES_INSTALL = [
+    """
+    ALTER TABLE chat ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(prompt, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(result, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS chat_search_vector_idx ON chat USING GIN (search_vector)",
+]
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS chat_search_vector_idx",
+    "ALTER TABLE chat DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS chat_fts USING fts5(
+        prompt, result, content='chat', content_rowid='id', tokenize='porter unicode61'
+    )
+"""
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_fts_insert AFTER INSERT ON chat BEGIN
+        INSERT INTO chat_fts(rowid, prompt, result) VALUES (new.id, new.prompt, new.result);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_fts_delete AFTER DELETE ON chat BEGIN
+        INSERT INTO chat_fts(chat_fts, rowid, prompt, result) VALUES ('delete', old.id, old.prompt, old.result);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_fts_update AFTER UPDATE OF prompt, result ON chat BEGIN
+        INSERT INTO chat_fts(chat_fts, rowid, prompt, result) VALUES ('delete', old.id, old.prompt, old.result);
+        INSERT INTO chat_fts(rowid, prompt, result) VALUES (new.id, new.prompt, new.result);
+    END
+    """,
+]
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS chat_fts_insert",
+    "DROP TRIGGER IF EXISTS chat_fts_delete",
+    "DROP TRIGGER IF EXISTS chat_fts_update",
+    "DROP TABLE IF EXISTS chat_fts",
+]
+
+
+def install(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'postgresql':
+            for statement in POSTGRES_INSTALL:
+                cursor.execute(statement)
+        elif vendor == 'sqlite':
+            try:
+                cursor.execute(SQLITE_TABLE)
+            except Exception:
+                # SQLite built without FTS5: search falls back to scanning.
+                return
+            for statement in SQLITE_TRIGGERS:
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO chat_fts(chat_fts) VALUES ('rebuild')")
+
+
+def uninstall(apps, schema_editor):
+    statements = {'postgresql': POSTGRES_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}.get(schema_editor.connection.vendor, [])
+    with schema_editor.connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_chat_status_stream_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
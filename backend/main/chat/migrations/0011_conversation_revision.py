@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_chat_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='revision',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
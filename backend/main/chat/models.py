@@ -1,18 +1,164 @@
 # chat/models.py
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Greatest
 from django.utils import timezone
 
+CONVERSATION_TITLE_LENGTH = 120
+
+# A turn is saved as partial while it is still streaming (see chat/live.py) or when
+# the stream ended early, and as complete once the model finished its answer.
+STATUS_PARTIAL = 'partial'
+STATUS_COMPLETE = 'complete'
+
+class Blob(models.Model):
+    """A stored binary payload, addressed by the SHA-256 of its bytes (see chat/blobstore.py)."""
+    digest = models.CharField(max_length=64, primary_key=True)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'blob'
+
+    def __str__(self):
+        return f"Blob {self.digest[:12]} ({self.content_type}, {self.size} bytes)"
+
+
 class Chat(models.Model):
     prompt = models.TextField()
     result = models.TextField(blank=True, null=True)
     date_time = models.DateTimeField(default=timezone.now)
     conversation_name = models.CharField(max_length=360)
     message_type = models.CharField(max_length=50, default='Text')
-    generated_image_b64 = models.TextField(null=True, blank=True)
+    generated_image = models.ForeignKey(
+        Blob, null=True, blank=True, on_delete=models.PROTECT, related_name='+'
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=[(STATUS_PARTIAL, 'Partial'), (STATUS_COMPLETE, 'Complete')],
+        default=STATUS_COMPLETE,
+    )
+    # The live stream that produced this turn, for /resume/ after a disconnect.
+    stream_id = models.CharField(max_length=32, null=True, blank=True)
 
     
     class Meta:
         db_table = 'chat'
+        indexes = [
+            # Keyset pagination for /history/ (see chat/pagination.py).
+            models.Index(fields=['-date_time', '-id'], name='chat_date_time_id_idx'),
+            # Loading one conversation in order.
+            models.Index(fields=['conversation_name', 'date_time'], name='chat_conv_date_time_idx'),
+            models.Index(fields=['stream_id'], name='chat_stream_id_idx'),
+        ]
 
     def __str__(self):
         return f"Chat {self.id} - {self.conversation_name}"
+
+
+class Conversation(models.Model):
+    """
+    One row per conversation_name, kept current as turns are saved, so the latest
+    conversation and the conversation list are index lookups instead of scans of chat.
+    """
+    name = models.CharField(max_length=360, unique=True)
+    title = models.CharField(max_length=CONVERSATION_TITLE_LENGTH, blank=True)
+    message_count = models.PositiveIntegerField(default=0)
+    last_message_time = models.DateTimeField(default=timezone.now)
+    # Running summary of the turns up to and including chat id summary_through_id,
+    # used in place of them once the conversation outgrows its context budget.
+    summary = models.TextField(blank=True, default='')
+    summary_through_id = models.BigIntegerField(null=True, blank=True)
+    # Bumped when existing turns are rewritten (a checkpointed turn finalized, say),
+    # which leaves message_count alone; cached histories compare against it.
+    revision = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'conversation'
+        indexes = [
+            models.Index(fields=['-last_message_time', '-id'], name='conv_last_message_idx'),
+        ]
+
+    def __str__(self):
+        return f"Conversation {self.name} ({self.message_count})"
+
+    @classmethod
+    def record_turn(cls, chat):
+        """Folds a newly saved Chat row into its conversation's summary."""
+        cls.record_turns([chat])
+
+    @classmethod
+    def record_turns(cls, chats):
+        """Same for a batch of rows: one update (or insert) per conversation."""
+        by_name = {}
+        for chat in chats:
+            if chat.conversation_name:
+                by_name.setdefault(chat.conversation_name, []).append(chat)
+
+        for name, turns in by_name.items():
+            first = min(turns, key=lambda chat: chat.date_time)
+            last_time = max(chat.date_time for chat in turns)
+            counted = dict(
+                message_count=F('message_count') + len(turns),
+                last_message_time=Greatest('last_message_time', models.Value(last_time)),
+            )
+            with transaction.atomic():
+                if cls.objects.filter(name=name).update(**counted):
+                    continue
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(
+                            name=name,
+                            title=first.prompt[:CONVERSATION_TITLE_LENGTH],
+                            message_count=len(turns),
+                            last_message_time=last_time,
+                        )
+                except IntegrityError:
+                    # Another worker created it first; count these turns against theirs.
+                    cls.objects.filter(name=name).update(**counted)
+
+    @classmethod
+    def touch(cls, names):
+        """Marks the conversations' saved turns as changed."""
+        names = {name for name in names if name}
+        if names:
+            cls.objects.filter(name__in=names).update(revision=F('revision') + 1)
+
+    @classmethod
+    def recount(cls, names=None):
+        """
+        Summaries recomputed from the chat table, one dict per conversation (all of
+        them, or just `names`): conversation_name, message_count, last_message_time, title.
+        """
+        first_prompt = Chat.objects.filter(
+            conversation_name=OuterRef('conversation_name')
+        ).order_by('date_time', 'id').values('prompt')[:1]
+        chats = Chat.objects.all() if names is None else Chat.objects.filter(conversation_name__in=names)
+        return (
+            chats.values('conversation_name')
+            .annotate(
+                message_count=Count('id'),
+                last_message_time=Max('date_time'),
+                title=Subquery(first_prompt),
+            )
+            .order_by('conversation_name')
+        )
+
+    @classmethod
+    def save_recounted(cls, summaries):
+        """Writes recount() results, overwriting the existing summaries."""
+        cls.objects.bulk_create(
+            [
+                cls(
+                    name=summary['conversation_name'],
+                    title=(summary['title'] or '')[:CONVERSATION_TITLE_LENGTH],
+                    message_count=summary['message_count'],
+                    last_message_time=summary['last_message_time'],
+                )
+                for summary in summaries
+            ],
+            update_conflicts=True,
+            unique_fields=['name'],
+            update_fields=['title', 'message_count', 'last_message_time'],
+        )
@@ -0,0 +1,632 @@
+# pages.py
+#
+# fetch_pages: the tool the model reads web pages with (registered in tools.py), and
+# fetch_page, which internet.get_page_content and just_wiki use. A tool call's URLs
+# are fetched together on a shared thread pool through one keep-alive
+# requests.Session, and each page is parsed while it downloads. Only the headings and
+# paragraphs of the main content area (div#content or <main>, else the whole page)
+# are kept, and reading stops once EXTRACT_CHARS of text or MAX_BYTES of HTML is in
+# hand. The tool returns the first MAX_CHARS of that per page.
+#
+#   - Parsing uses lxml's C parser when lxml is installed, and the standard library's
+#     html.parser otherwise. Both are fed the page chunk by chunk, so a huge page
+#     never sits in memory whole.
+#   - Extracted pages are kept on disk with their ETag/Last-Modified. A page still
+#     fresh under its Cache-Control max-age is answered from disk. An older one is
+#     revalidated with If-None-Match/If-Modified-Since, and a 304 reuses the stored
+#     text without downloading or parsing it again. Requests carry no cookies or
+#     credentials, so responses marked "private" are cached too: this cache is the
+#     only user that ever sees them.
+#   - Only http(s) URLs on public addresses are fetched, after redirects too. The
+#     connection goes to the very address that was checked (the host name travels in
+#     the Host header and TLS SNI), so a DNS answer that changes between the check
+#     and the connect can't point a fetch at a private address.
+#     ALLOW_PRIVATE_HOSTS lifts all of that for local testing.
+#
+# Configure with settings.PAGE_FETCH, e.g.
+#   PAGE_FETCH = {
+#       "LOCATION": MEDIA_ROOT / "pages",  # None to turn the disk cache off
+#       "MAX_ENTRIES": 2000,               # pages kept on disk
+#       "MAX_AGE": 3600,                   # cap on how long a page counts as fresh
+#       "MAX_URLS": 5,                     # per tool call
+#       "MAX_CHARS": 8000,                 # text the tool returns per page
+#       "EXTRACT_CHARS": 32000,            # text extracted and cached per page
+#       "MAX_BYTES": 4 * 2**20,            # HTML read per page
+#       "TIMEOUT": 15,                     # seconds per page, redirects included
+#       "PARSER": None,                    # "lxml" or "html.parser"; None picks
+#       "ALLOW_PRIVATE_HOSTS": False,
+#   }
+
+import codecs
+import hashlib
+import ipaddress
+import json
+import logging
+import os
+import re
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from html.parser import HTMLParser
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .metrics import UPSTREAM_SECONDS
+
+try:
+    from lxml import etree
+except ImportError:  # html.parser it is
+    etree = None
+
+logger = logging.getLogger(__name__)
+
+# URLs of one tool call go out together through this shared pool, like the Tavily
+# fan-out in tools.py; it also bounds the connections kept per host.
+FETCH_POOL_SIZE = 8
+CHUNK_SIZE = 64 * 1024
+MAX_REDIRECTS = 5
+# The cache directory is trimmed back to MAX_ENTRIES every this many writes.
+PRUNE_EVERY = 100
+
+DEFAULT_MAX_ENTRIES = 2000
+DEFAULT_MAX_AGE = 3600
+DEFAULT_MAX_URLS = 5
+DEFAULT_MAX_CHARS = 8000
+DEFAULT_EXTRACT_CHARS = 32000
+DEFAULT_MAX_BYTES = 4 * 2**20
+DEFAULT_TIMEOUT = 15
+
+USER_AGENT = "JunoPageFetcher/1.0 (+https://juno-4m9x.onrender.com)"
+
+_fetch_pool = ThreadPoolExecutor(max_workers=FETCH_POOL_SIZE, thread_name_prefix="pages")
+
+
+def page_setting(name, default=None):
+    # fetch_page also backs the command-line scrapers, which run without Django settings.
+    if not settings.configured:
+        return default
+    value = getattr(settings, 'PAGE_FETCH', {}).get(name)
+    return default if value is None else value
+
+
+class FetchError(Exception):
+    pass
+
+
+# --- Extraction ------------------------------------------------------------
+
+HEADINGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+SKIPPED = {"script", "style", "noscript", "template", "svg"}
+# Elements that end an open <p>, whether they start inside it or end around it.
+CLOSES_P = {
+    "address", "article", "aside", "blockquote", "dd", "details", "div", "dl", "dt", "fieldset",
+    "figcaption", "figure", "footer", "form", "header", "hr", "li", "main", "nav", "ol", "p",
+    "pre", "section", "table", "td", "th", "ul", *HEADINGS,
+}
+_whitespace = re.compile(r"\s+")
+
+
+class TextExtractor:
+    """
+    Collects headings and paragraphs from parser events (the lxml parser-target
+    interface: start/end/data/close). Headings come out as "--- H2: text ---" and
+    blocks are joined with spaces, as get_page_content always returned them.
+
+    Only the few elements that matter are tracked, each with a count of same-named
+    tags opened inside it, so an end tag closes the right one. html.parser, unlike
+    lxml, reports void and unclosed tags as they are written, so the implied ends of
+    <p> are applied here too.
+    """
+
+    def __init__(self, max_chars=DEFAULT_MAX_CHARS):
+        self.max_chars = max_chars
+        self.title = ""
+        self.root_seen = False
+        self._open = []  # [tag, kind, nested same-named tags]
+        self._inside = {"block": 0, "skip": 0, "root": 0, "title": 0}
+        self._text = []
+        self._blocks = {True: [], False: []}  # in a content root or not
+        self._chars = {True: 0, False: 0}
+
+    @property
+    def done(self):
+        return self._chars[True] >= self.max_chars
+
+    def _kind(self, tag, attrs):
+        if tag in HEADINGS or tag == "p":
+            return "block"
+        if tag in SKIPPED or (tag == "sup" and "reference" in (attrs.get("class") or "")):
+            # Footnote markers like [12] are noise in the middle of a sentence.
+            return "skip"
+        if tag == "main" or (tag == "div" and attrs.get("id") == "content"):
+            return "root"
+        if tag == "title":
+            return "title"
+        return None
+
+    def start(self, tag, attrs):
+        tag = tag.lower()
+        if tag in CLOSES_P and self._open and self._open[-1][0] == "p":
+            self.end("p")
+        kind = self._kind(tag, attrs)
+        if kind == "block" and self._inside["block"]:
+            kind = None  # nested blocks read as part of the outer one
+        if kind is not None:
+            if kind == "root":
+                self.root_seen = True
+            self._open.append([tag, kind, 0])
+            self._inside[kind] += 1
+            return
+        for entry in reversed(self._open):
+            if entry[0] == tag:
+                entry[2] += 1
+                break
+        if tag == "br" and self._inside["block"]:
+            self._text.append(" ")
+
+    def end(self, tag):
+        tag = tag.lower()
+        if tag != "p" and tag in CLOSES_P and self._open and self._open[-1][0] == "p" and not self._open[-1][2]:
+            self.end("p")
+        for position in range(len(self._open) - 1, -1, -1):
+            entry = self._open[position]
+            if entry[0] != tag:
+                continue
+            if entry[2]:
+                entry[2] -= 1
+                return
+            # Anything opened after it and never closed ends with it.
+            while len(self._open) > position:
+                self._close(*self._open.pop()[:2])
+            return
+
+    def data(self, text):
+        if (self._inside["block"] or self._inside["title"]) and not self._inside["skip"]:
+            self._text.append(text)
+
+    def _close(self, tag, kind):
+        self._inside[kind] -= 1
+        if kind == "title":
+            self.title = self.title or _whitespace.sub(" ", "".join(self._text)).strip()
+            self._text = []
+        elif kind == "block":
+            text = _whitespace.sub(" ", "".join(self._text)).strip()
+            self._text = []
+            in_root = self._inside["root"] > 0
+            if text and self._chars[in_root] < self.max_chars:
+                block = f"\n\n--- {tag.upper()}: {text} ---" if tag in HEADINGS else text
+                self._blocks[in_root].append(block)
+                self._chars[in_root] += len(block) + 1
+
+    def close(self):
+        while self._open:
+            self.end(self._open[-1][0])
+        return self.text()
+
+    def text(self):
+        return " ".join(self._blocks[self.root_seen])
+
+
+class _StdlibParser(HTMLParser):
+    """html.parser feeding a TextExtractor, with the same feed/close as lxml's."""
+
+    def __init__(self, target):
+        super().__init__(convert_charrefs=True)
+        self.target = target
+
+    def handle_starttag(self, tag, attrs):
+        self.target.start(tag, {name: value or "" for name, value in attrs})
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self.target.end(tag)
+
+    def handle_endtag(self, tag):
+        self.target.end(tag)
+
+    def handle_data(self, data):
+        self.target.data(data)
+
+    def close(self):
+        super().close()
+        return self.target.close()
+
+
+def parser_name():
+    name = page_setting('PARSER')
+    if name:
+        return name
+    return "lxml" if etree is not None else "html.parser"
+
+
+def make_parser(target, name=None):
+    if (name or parser_name()) == "lxml":
+        return etree.HTMLParser(target=target, no_network=True, recover=True)
+    return _StdlibParser(target)
+
+
+def extract_text(html, max_chars=DEFAULT_MAX_CHARS, parser=None):
+    """(title, text) for a whole HTML string; fetch_page does the same while downloading."""
+    extractor = TextExtractor(max_chars)
+    feed = make_parser(extractor, parser)
+    for start in range(0, len(html), CHUNK_SIZE):
+        feed.feed(html[start:start + CHUNK_SIZE])
+        if extractor.done:
+            break
+    feed.close()
+    return extractor.title, extractor.text()
+
+
+def truncate(text, max_chars):
+    """text cut to max_chars at a word boundary, and whether it was cut."""
+    if len(text) <= max_chars:
+        return text, False
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip(), True
+
+
+# --- Disk cache ------------------------------------------------------------
+
+class PageCache:
+    """Extracted pages on disk, one JSON file per URL, trimmed oldest-first to max_entries."""
+
+    def __init__(self, location, max_entries=DEFAULT_MAX_ENTRIES):
+        self.location = Path(location)
+        self.max_entries = max_entries
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.location.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, url):
+        return self.location / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+    def get(self, url):
+        path = self._path(url)
+        try:
+            with open(path, encoding="utf-8") as handle:
+                entry = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        if entry.get("url") != url:
+            return None
+        return entry
+
+    def touch(self, url):
+        try:
+            os.utime(self._path(url))
+        except OSError:
+            pass
+
+    def set(self, url, entry):
+        path = self._path(url)
+        fd, temp = tempfile.mkstemp(dir=self.location, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                json.dump({**entry, "url": url}, handle)
+            os.replace(temp, path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        entries = []
+        for path in self.location.glob("*.json"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except OSError:
+                pass
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def clear(self):
+        for path in self.location.glob("*.json"):
+            path.unlink(missing_ok=True)
+
+
+_cache = None
+_session = None
+_lock = threading.Lock()
+_counts = {"network": 0, "cache": 0, "revalidated": 0, "error": 0}
+
+
+def get_page_cache():
+    """The shared PageCache, or None when PAGE_FETCH["LOCATION"] is unset."""
+    global _cache
+    if _cache is None:
+        location = page_setting('LOCATION')
+        if location is None:
+            return None
+        with _lock:
+            if _cache is None:
+                _cache = PageCache(location, page_setting('MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+    return _cache
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = PinnedAddressAdapter(pool_connections=32, pool_maxsize=FETCH_POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({"User-Agent": USER_AGENT, "Accept": "text/html,text/plain;q=0.9,*/*;q=0.1"})
+                _session = session
+    return _session
+
+
+def _count(source):
+    with _lock:
+        _counts[source] += 1
+
+
+def stats():
+    cache = get_page_cache()
+    with _lock:
+        counts = dict(_counts)
+    return {**counts, "parser": parser_name(), "location": str(cache.location) if cache else None}
+
+
+# --- Fetching --------------------------------------------------------------
+
+_max_age = re.compile(r"max-age\s*=\s*(\d+)")
+_charset = re.compile(rb"""charset\s*=\s*["']?([\w.:-]+)""", re.IGNORECASE)
+
+
+def freshness(headers):
+    """Seconds the response may be reused without revalidating; None if it mustn't be stored."""
+    cache_control = headers.get("Cache-Control", "").lower()
+    if "no-store" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        return 0
+    match = _max_age.search(cache_control)
+    if not match:
+        return 0
+    try:
+        age = int(headers.get("Age", 0))
+    except ValueError:
+        age = 0
+    return max(0, min(int(match.group(1)) - age, page_setting('MAX_AGE', DEFAULT_MAX_AGE)))
+
+
+def _encoding(response, head):
+    # requests falls back to ISO-8859-1 for any text/* without a charset; pages nearly
+    # always declare theirs in a <meta> instead, and default to UTF-8 when they don't.
+    for source in (response.headers.get("Content-Type", "").encode("latin-1", "replace"), head[:4096]):
+        match = _charset.search(source)
+        if match:
+            try:
+                return codecs.lookup(match.group(1).decode("ascii")).name
+            except LookupError:
+                pass
+    return "utf-8"
+
+
+class PinnedAddressAdapter(HTTPAdapter):
+    """
+    For requests sent to an IP address with the real host name in the Host header
+    (see pinned), verifies TLS against that name and sends it as SNI, so connection
+    pools are keyed by address and name together.
+    """
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+        hostname = urlsplit("//" + request.headers.get("Host", "")).hostname
+        if host_params["scheme"] == "https" and hostname and hostname != host_params["host"]:
+            pool_kwargs["server_hostname"] = hostname
+            pool_kwargs["assert_hostname"] = hostname
+        return host_params, pool_kwargs
+
+
+def is_public_address(address):
+    return ipaddress.ip_address(address.split("%")[0]).is_global
+
+
+def check_url(url):
+    """
+    Raises FetchError unless url may be fetched; returns the checked address to
+    connect to, or None when ALLOW_PRIVATE_HOSTS leaves resolving to requests.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise FetchError("Only http and https URLs can be fetched.")
+    if page_setting('ALLOW_PRIVATE_HOSTS', False):
+        return None
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise FetchError(f"Could not resolve {parts.hostname}: {e}")
+    for *_, sockaddr in addresses:
+        if not is_public_address(sockaddr[0]):
+            raise FetchError(f"{parts.hostname} is not a public address.")
+    return addresses[0][4][0].split("%")[0]
+
+
+def pinned(url, address):
+    """url rewritten to connect to `address`, and the Host header that keeps its name."""
+    parts = urlsplit(url)
+    host = parts.netloc.rpartition("@")[2]
+    netloc = f"[{address}]" if ":" in address else address
+    if parts.port:
+        netloc += f":{parts.port}"
+    return urlunsplit(parts._replace(netloc=netloc)), host
+
+
+def _get(url, entry, deadline):
+    """The final response for url, following redirects by hand so every hop is checked."""
+    session = get_session()
+    for _ in range(MAX_REDIRECTS + 1):
+        address = check_url(url)
+        target = url
+        headers = {}
+        if address:
+            target, headers["Host"] = pinned(url, address)
+        if entry and entry.get("final_url") == url:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        timeout = max(0.1, deadline - time.monotonic())
+        response = session.get(target, headers=headers, stream=True, timeout=timeout, allow_redirects=False)
+        if not response.is_redirect:
+            return url, response
+        response.close()
+        url = urljoin(url, response.headers["Location"])
+    raise FetchError(f"More than {MAX_REDIRECTS} redirects.")
+
+
+def _read(response, max_chars, max_bytes, deadline, parser=None):
+    """Streams the body through the extractor; returns (title, text, stopped early)."""
+    content_type = response.headers.get("Content-Type", "text/html").split(";")[0].strip().lower()
+    if content_type not in ("text/html", "application/xhtml+xml", "text/plain"):
+        raise FetchError(f"Unsupported content type {content_type}.")
+    extractor = TextExtractor(max_chars)
+    feed = None
+    decoder = None
+    plain = []
+    read = 0
+    stopped = False
+    for chunk in response.iter_content(CHUNK_SIZE):
+        if decoder is None:
+            decoder = codecs.getincrementaldecoder(_encoding(response, chunk))(errors="replace")
+            feed = None if content_type == "text/plain" else make_parser(extractor, parser)
+        text = decoder.decode(chunk)
+        if feed is None:
+            plain.append(text)
+        else:
+            feed.feed(text)
+        read += len(chunk)
+        if (extractor.done if feed is not None else read >= max_chars * 4) or read >= max_bytes or time.monotonic() > deadline:
+            stopped = True
+            break
+    if feed is None:
+        if decoder is not None:
+            plain.append(decoder.decode(b"", final=True))
+        return "", _whitespace.sub(" ", "".join(plain)).strip(), stopped
+    feed.feed(decoder.decode(b"", final=True))
+    feed.close()
+    return extractor.title, extractor.text(), stopped
+
+
+def _page(url, entry, source, max_chars):
+    content, truncated = truncate(entry["content"], max_chars)
+    return {
+        "url": url,
+        "final_url": entry.get("final_url", url),
+        "title": entry.get("title", ""),
+        "content": content,
+        "truncated": truncated or entry.get("truncated", False),
+        "source": source,
+    }
+
+
+def fetch_page(url, max_chars=None, parser=None, timeout=None):
+    """
+    One page as {"url", "final_url", "title", "content", "truncated", "source"},
+    source being "network", "cache" (still fresh) or "revalidated" (a 304). Failures
+    come back as {"url", "error"}. timeout defaults to PAGE_FETCH["TIMEOUT"].
+    """
+    started = time.perf_counter()
+    page = _fetch_page(url, max_chars, parser, timeout)
+    UPSTREAM_SECONDS.observe(time.perf_counter() - started, service="page", outcome=page.get("source", "error"))
+    return page
+
+
+def _fetch_page(url, max_chars, parser, timeout):
+    extract_chars = max(page_setting('EXTRACT_CHARS', DEFAULT_EXTRACT_CHARS), page_setting('MAX_CHARS', DEFAULT_MAX_CHARS))
+    max_chars = min(max_chars or page_setting('MAX_CHARS', DEFAULT_MAX_CHARS), extract_chars)
+    deadline = time.monotonic() + (timeout or page_setting('TIMEOUT', DEFAULT_TIMEOUT))
+    cache = get_page_cache()
+    entry = cache.get(url) if cache else None
+    try:
+        if entry and entry.get("expires", 0) > time.time():
+            cache.touch(url)
+            _count("cache")
+            return _page(url, entry, "cache", max_chars)
+
+        final_url, response = _get(url, entry, deadline)
+        try:
+            if response.status_code == 304 and entry:
+                max_age = freshness(response.headers)
+                entry = {**entry, "expires": time.time() + (max_age or 0)}
+                if cache:
+                    cache.set(url, entry)
+                _count("revalidated")
+                return _page(url, entry, "revalidated", max_chars)
+            response.raise_for_status()
+            # The cached copy is always extracted to the full EXTRACT_CHARS so any
+            # smaller max_chars can be answered from it later.
+            title, content, stopped = _read(
+                response, extract_chars,
+                page_setting('MAX_BYTES', DEFAULT_MAX_BYTES), deadline, parser,
+            )
+        finally:
+            response.close()
+
+        entry = {
+            "final_url": final_url,
+            "title": title,
+            "content": content,
+            "truncated": stopped,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        max_age = freshness(response.headers)
+        if cache and max_age is not None and (max_age or entry["etag"] or entry["last_modified"]):
+            cache.set(url, {**entry, "expires": time.time() + max_age})
+        _count("network")
+        return _page(url, entry, "network", max_chars)
+    except (FetchError, requests.exceptions.RequestException) as e:
+        _count("error")
+        return {"url": url, "error": str(e)}
+
+
+def fetch_all(urls, timeout=None, max_chars=None):
+    """
+    fetch_page for every URL at once on the shared pool, in order. Pages still
+    unfinished after timeout (plus a margin for waiting on a free worker) come back
+    as errors; their fetches stop at their own deadline.
+    """
+    timeout = timeout or page_setting('TIMEOUT', DEFAULT_TIMEOUT)
+    futures = [_fetch_pool.submit(fetch_page, url, max_chars=max_chars, timeout=timeout) for url in urls]
+    done, _ = wait(futures, timeout=timeout + 1)
+    pages = []
+    for url, future in zip(urls, futures):
+        if future in done:
+            pages.append(future.result())
+        else:
+            future.cancel()
+            pages.append({"url": url, "error": "Timed out."})
+    return pages
+
+
+def fetch_pages(urls: list):
+    """Reads web pages and returns the main text (headings and paragraphs) of each. Use it to read pages found with internet_search, or any link the user gives."""
+    if isinstance(urls, str):
+        urls = [urls]
+    urls = list(dict.fromkeys(str(url).strip() for url in urls if str(url).strip()))
+    if not urls:
+        return {"error": "No URLs to fetch."}
+    max_urls = page_setting('MAX_URLS', DEFAULT_MAX_URLS)
+    wanted, skipped = urls[:max_urls], urls[max_urls:]
+    pages = fetch_all(wanted)
+    pages.extend({"url": url, "error": f"Skipped: at most {max_urls} pages per call."} for url in skipped)
+    return {"pages": pages}
@@ -0,0 +1,94 @@
+# pagination.py
+#
+# Keyset ("cursor") pagination for the history endpoints. A page is fetched with
+#   WHERE (date_time, id) < (cursor.date_time, cursor.id) ORDER BY date_time DESC, id DESC
+# which the chat_date_time_id_idx index answers without a COUNT(*) or an OFFSET scan,
+# so page 10,000 costs the same as page 1. The conversation list pages the same
+# way on (last_message_time, id).
+
+import base64
+import json
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+APPROX_TOTAL_TTL = 60
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def page_size(raw, default=DEFAULT_PAGE_SIZE):
+    try:
+        size = int(raw)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(row, field='date_time'):
+    # Rows are model instances or, for projected querysets, .values() dicts.
+    if isinstance(row, dict):
+        value, row_id = row[field], row["id"]
+    else:
+        value, row_id = getattr(row, field), row.id
+    payload = json.dumps({"d": value.isoformat(), "i": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["d"]), int(payload["i"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+
+
+def keyset_page(queryset, cursor, limit, field='date_time'):
+    """
+    Returns (rows, next_cursor) for the page after `cursor` (the first page when
+    cursor is empty), newest `field` first. next_cursor is None on the last page.
+    """
+    queryset = queryset.order_by(f'-{field}', '-id')
+    if cursor:
+        value, row_id = decode_cursor(cursor)
+        queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': row_id}))
+
+    # One extra row tells us whether there is a next page without counting.
+    rows = list(queryset[:limit + 1])
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1], field)
+    return rows, None
+
+
+def approximate_total(model):
+    """
+    Row count for `model`'s table, cached for APPROX_TOTAL_TTL seconds. On Postgres
+    this reads the planner's estimate from pg_class instead of running COUNT(*).
+    """
+    table = model._meta.db_table
+    key = f"approx_total:{table}"
+    total = cache.get(key)
+    if total is not None:
+        return total
+
+    total = None
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as db_cursor:
+            db_cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+            row = db_cursor.fetchone()
+        # reltuples is -1 until the table has been analyzed at least once.
+        if row and row[0] is not None and row[0] >= 0:
+            total = row[0]
+    if total is None:
+        total = model.objects.count()
+
+    cache.set(key, total, APPROX_TOTAL_TTL)
+    return total
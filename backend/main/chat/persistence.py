@@ -0,0 +1,305 @@
+# persistence.py
+#
+# Write-behind persistence for finished chat turns. The stream views hand the turn
+# to turn_queue and send `done` straight away; a background thread writes queued
+# turns with one bulk_create per batch, a batch closing at BATCH_SIZE turns or
+# BATCH_WAIT seconds after its first turn, whichever comes first. Failed batches are
+# retried with exponential backoff, then row by row so one bad turn can't sink the
+# others. Pending turns are drained at interpreter exit.
+#
+# Long answers are also checkpointed while they stream: Checkpointer creates the
+# turn's Chat row as partial after the first CHECKPOINT_CHUNKS chunks or
+# CHECKPOINT_INTERVAL seconds, keeps its text current, and the final write marks
+# it complete.
+#
+# Configure with settings.PERSISTENCE, e.g.
+#   PERSISTENCE = {
+#       "WRITE_BEHIND": True,   # False writes each turn inside the request again
+#       "BATCH_SIZE": 100,
+#       "BATCH_WAIT": 0.05,
+#       "QUEUE_SIZE": 10000,    # past this, turns are written inline (backpressure)
+#       "MAX_RETRIES": 5,
+#       "CHECKPOINT_CHUNKS": 20,
+#       "CHECKPOINT_INTERVAL": 2.0,
+#   }
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .context import context_cache
+from .metrics import STAGE_SECONDS
+from .models import STATUS_COMPLETE, STATUS_PARTIAL, Chat, Conversation
+from .semantic import index_chats
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_BATCH_WAIT = 0.05
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE = 0.1
+BACKOFF_MAX = 5.0
+DRAIN_TIMEOUT = 30
+DEFAULT_CHECKPOINT_CHUNKS = 20
+DEFAULT_CHECKPOINT_INTERVAL = 2.0
+
+_STOP = object()
+
+
+def persistence_setting(name, default):
+    value = getattr(settings, 'PERSISTENCE', {}).get(name)
+    return default if value is None else value
+
+
+# chat_id is set when a checkpoint already created the row; the turn then updates it.
+# embedding is the prompt's vector when the request already computed one (see semantic.py).
+Turn = namedtuple(
+    'Turn', 'prompt result conversation_name date_time status chat_id stream_id embedding',
+    defaults=(STATUS_COMPLETE, None, None, None),
+)
+
+
+def write_turns(turns):
+    """Saves Turns in one transaction and returns their Chat rows."""
+    with STAGE_SECONDS.time(stage="db_write"):
+        return _write_turns([Turn(*turn) for turn in turns])
+
+
+def _write_turns(turns):
+    chats = [
+        Chat(
+            id=turn.chat_id, prompt=turn.prompt, result=turn.result,
+            conversation_name=turn.conversation_name, date_time=turn.date_time, status=turn.status,
+            stream_id=turn.stream_id,
+        )
+        for turn in turns
+    ]
+    new = [chat for chat in chats if chat.id is None]
+    existing = [chat for chat in chats if chat.id is not None]
+    with transaction.atomic():
+        Chat.objects.bulk_create(new)
+        # Checkpointed rows were counted in their conversation when they were created.
+        Conversation.record_turns(new)
+        if existing:
+            Chat.objects.bulk_update(existing, ['result', 'status'])
+            Conversation.touch(chat.conversation_name for chat in existing)
+    for conversation_name in {chat.conversation_name for chat in chats}:
+        context_cache.invalidate(conversation_name)
+    index_chats(chats, [turn.embedding for turn in turns])
+    return chats
+
+
+class Checkpointer:
+    """
+    Saves a streaming turn's text to its Chat row every CHECKPOINT_CHUNKS chunks or
+    CHECKPOINT_INTERVAL seconds. A failed checkpoint is logged and retried at the
+    next one; it never interrupts the stream.
+    """
+
+    def __init__(self, prompt, conversation_name, stream_id=None):
+        self.prompt = prompt
+        self.conversation_name = conversation_name
+        self.stream_id = stream_id
+        self.chat_id = None
+        self.every_chunks = persistence_setting('CHECKPOINT_CHUNKS', DEFAULT_CHECKPOINT_CHUNKS)
+        self.every_seconds = persistence_setting('CHECKPOINT_INTERVAL', DEFAULT_CHECKPOINT_INTERVAL)
+        self._chunks = 0
+        self._last = time.monotonic()
+
+    def chunk_added(self):
+        """Counts a chunk and says whether a checkpoint is due."""
+        self._chunks += 1
+        return self._chunks >= self.every_chunks or time.monotonic() - self._last >= self.every_seconds
+
+    def save(self, text):
+        self._chunks = 0
+        self._last = time.monotonic()
+        try:
+            if self.chat_id is None:
+                with transaction.atomic():
+                    chat = Chat.objects.create(
+                        prompt=self.prompt, result=text, conversation_name=self.conversation_name,
+                        status=STATUS_PARTIAL, stream_id=self.stream_id,
+                    )
+                    Conversation.record_turn(chat)
+                self.chat_id = chat.id
+                context_cache.invalidate(self.conversation_name)
+            else:
+                Chat.objects.filter(pk=self.chat_id).update(result=text)
+        except Exception:
+            logger.warning("Checkpointing turn for conversation %r failed", self.conversation_name, exc_info=True)
+
+
+class WriteBehindQueue:
+    def __init__(self, writer=write_turns, batch_size=None, batch_wait=None, queue_size=None, max_retries=None):
+        self.writer = writer
+        self.batch_size = batch_size or persistence_setting('BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.batch_wait = batch_wait if batch_wait is not None else persistence_setting('BATCH_WAIT', DEFAULT_BATCH_WAIT)
+        self.max_retries = max_retries if max_retries is not None else persistence_setting('MAX_RETRIES', DEFAULT_MAX_RETRIES)
+        self._queue = queue.Queue(maxsize=queue_size or persistence_setting('QUEUE_SIZE', DEFAULT_QUEUE_SIZE))
+        self._worker = None
+        self._lock = threading.Lock()
+        # Turns accepted but not yet written, per conversation, so readers of one
+        # conversation can wait for its own writes.
+        self._pending = Counter()
+        self._written = threading.Condition()
+
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+        self.inline_writes = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self._total_flush_seconds = 0.0
+
+    def submit(self, prompt, result, conversation_name, status=STATUS_COMPLETE, chat_id=None, stream_id=None,
+               embedding=None):
+        turn = Turn(prompt, result, conversation_name, timezone.now(), status, chat_id, stream_id, embedding)
+        self._ensure_worker()
+        with self._written:
+            self._pending[conversation_name] += 1
+        try:
+            self._queue.put_nowait(turn)
+        except queue.Full:
+            # The writer can't keep up; make this request pay for its own row.
+            self.inline_writes += 1
+            self._flush([turn])
+            return
+        self.submitted += 1
+
+    def wait_for(self, conversation_name, timeout=DRAIN_TIMEOUT):
+        """Blocks until every turn submitted for `conversation_name` has been written (or given up on)."""
+        deadline = time.monotonic() + timeout
+        with self._written:
+            while self._pending[conversation_name]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._written.wait(remaining)
+        return True
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="chat-write-behind", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        try:
+            while True:
+                first = self._queue.get()
+                if first is _STOP:
+                    break
+                batch = [first]
+                stop = False
+                closes_at = time.monotonic() + self.batch_wait
+                while len(batch) < self.batch_size:
+                    remaining = closes_at - time.monotonic()
+                    try:
+                        turn = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if turn is _STOP:
+                        stop = True
+                        break
+                    batch.append(turn)
+                self._flush(batch)
+                if stop:
+                    break
+        finally:
+            connection.close()
+
+    def _flush(self, batch):
+        close_old_connections()
+        started = time.perf_counter()
+        try:
+            self._write_with_retries(batch)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.batches += 1
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            self._total_flush_seconds += elapsed
+            with self._written:
+                for turn in batch:
+                    self._pending[turn.conversation_name] -= 1
+                    if self._pending[turn.conversation_name] <= 0:
+                        del self._pending[turn.conversation_name]
+                self._written.notify_all()
+
+    def _write_with_retries(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.writer(batch)
+                self.written += len(batch)
+                return
+            except Exception:
+                if attempt == self.max_retries:
+                    break
+                self.retries += 1
+                logger.warning("Saving %d chat turns failed, retrying", len(batch), exc_info=True)
+                close_old_connections()
+                time.sleep(min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+        # Still failing: find the turns that can be saved on their own.
+        for turn in batch:
+            try:
+                self.writer([turn])
+                self.written += 1
+            except Exception:
+                self.failed += 1
+                logger.error("Dropping chat turn for conversation %r", turn.conversation_name, exc_info=True)
+
+    def drain(self, timeout=DRAIN_TIMEOUT):
+        """Writes everything queued so far and stops the worker; the next submit starts a new one."""
+        with self._lock:
+            worker = self._worker
+            if worker is not None and worker.is_alive():
+                self._queue.put(_STOP)
+                worker.join(timeout)
+            self._worker = None
+        # Anything left (no worker was running, or it timed out) is written here.
+        leftover = []
+        while True:
+            try:
+                turn = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if turn is not _STOP:
+                leftover.append(turn)
+        if leftover:
+            self._flush(leftover)
+
+    def stats(self):
+        return {
+            "depth": self._queue.qsize(),
+            "submitted": self.submitted,
+            "written": self.written,
+            "failed": self.failed,
+            "retries": self.retries,
+            "batches": self.batches,
+            "inline_writes": self.inline_writes,
+            "last_flush_ms": round(self.last_flush_seconds * 1000, 2),
+            "max_flush_ms": round(self.max_flush_seconds * 1000, 2),
+            "mean_flush_ms": round(self._total_flush_seconds * 1000 / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+turn_queue = WriteBehindQueue()
+atexit.register(turn_queue.drain)
+
+
+def write_behind_enabled():
+    return bool(persistence_setting('WRITE_BEHIND', True))
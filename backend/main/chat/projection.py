@@ -0,0 +1,71 @@
+# projection.py
+#
+# Column projection for the history endpoints. `?view=summary` returns the prompt
+# and a short preview of the answer, truncated in the database so the full `result`
+# never leaves it; `?fields=id,prompt,...` picks columns explicitly. Without either
+# the endpoints keep returning the full result. The generated image is only ever
+# linked from the per-message endpoint.
+
+from django.db.models.functions import Substr
+from django.urls import reverse
+
+PREVIEW_LENGTH = 200
+
+# What a client may ask for; `preview` is computed from `result` in SQL.
+LIST_FIELDS = {"id", "prompt", "result", "preview", "date_time", "conversation_name", "message_type"}
+MESSAGE_FIELDS = LIST_FIELDS | {"generated_image"}
+
+VIEWS = {
+    "summary": ["id", "prompt", "preview", "date_time", "conversation_name"],
+    "full": ["id", "prompt", "result", "date_time", "conversation_name"],
+    "message": ["id", "prompt", "result", "date_time", "conversation_name", "message_type", "generated_image"],
+}
+
+# Always selected: ordering, cursors and last_message_time need them.
+KEY_COLUMNS = ("id", "date_time")
+
+
+class InvalidProjection(ValueError):
+    pass
+
+
+def requested_fields(request, allowed=LIST_FIELDS, default_view="full"):
+    fields = request.GET.get('fields')
+    if fields:
+        names = [name.strip() for name in fields.split(',') if name.strip()]
+        unknown = [name for name in names if name not in allowed]
+        if unknown:
+            raise InvalidProjection(f"Unknown fields: {', '.join(unknown)}")
+        return names
+
+    view = request.GET.get('view', default_view)
+    if view not in VIEWS or not set(VIEWS[view]) <= allowed:
+        choices = [name for name, view_fields in VIEWS.items() if set(view_fields) <= allowed]
+        raise InvalidProjection(f"Unknown view '{view}', expected one of: {', '.join(choices)}")
+    return VIEWS[view]
+
+
+def project(queryset, fields):
+    """Narrows a Chat queryset to dict rows holding just what `fields` needs."""
+    columns = set(KEY_COLUMNS)
+    annotations = {}
+    for name in fields:
+        if name == "preview":
+            annotations["preview"] = Substr("result", 1, PREVIEW_LENGTH)
+        else:
+            columns.add(name)
+    if annotations:
+        queryset = queryset.annotate(**annotations)
+    return queryset.values(*columns, *annotations)
+
+
+def serialize(row, fields):
+    formatted = {}
+    for name in fields:
+        value = row[name]
+        if name == "date_time":
+            value = value.isoformat()
+        elif name == "generated_image" and value:
+            value = reverse('blob', args=[value])
+        formatted[name] = value
+    return formatted
@@ -0,0 +1,296 @@
+# search.py
+#
+# Full-text search over saved turns, using the database's own inverted index:
+#   - Postgres: a generated tsvector column on chat (prompt weighted above result)
+#     with a GIN index, queried with websearch_to_tsquery, ranked by ts_rank_cd and
+#     highlighted with ts_headline;
+#   - SQLite: an external-content FTS5 table, chat_fts, kept in sync by triggers on
+#     chat, ranked by bm25 and highlighted with snippet().
+# Either way the index follows every insert and update of a chat row (checkpoints,
+# bulk_create from the write-behind queue...) without any application code.
+# Anything else falls back to an unranked icontains scan.
+#
+# SQLite rebuilds a table to alter it, which drops its triggers; install_index is
+# idempotent, and repair_index runs it after every migrate (see ChatConfig.ready) so
+# a later migration of chat can't silently stop the index from updating.
+#
+# Snippets are HTML: the database marks matches with private-use characters, and
+# the text is escaped before those become <mark> tags, so chat text can't inject
+# markup into the page that shows it.
+
+import re
+from html import escape
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+SNIPPET_START = "<mark>"
+SNIPPET_STOP = "</mark>"
+# What the database wraps matches in; swapped for the tags once the text is escaped.
+MATCH_START = "\ue000"
+MATCH_STOP = "\ue001"
+SNIPPET_WORDS = 24
+MAX_SEARCH_OFFSET = 1000
+# Only the most recent matches are ranked, so a word that appears in half the
+# table costs no more than a rare one.
+RANK_WINDOW = 2000
+
+POSTGRES_INSTALL = [
+    """
+    ALTER TABLE chat ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(prompt, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(result, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS chat_search_vector_idx ON chat USING GIN (search_vector)",
+]
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS chat_search_vector_idx",
+    "ALTER TABLE chat DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS chat_fts USING fts5(
+        prompt, result, content='chat', content_rowid='id', tokenize='porter unicode61'
+    )
+"""
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_fts_insert AFTER INSERT ON chat BEGIN
+        INSERT INTO chat_fts(rowid, prompt, result) VALUES (new.id, new.prompt, new.result);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_fts_delete AFTER DELETE ON chat BEGIN
+        INSERT INTO chat_fts(chat_fts, rowid, prompt, result) VALUES ('delete', old.id, old.prompt, old.result);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_fts_update AFTER UPDATE OF prompt, result ON chat BEGIN
+        INSERT INTO chat_fts(chat_fts, rowid, prompt, result) VALUES ('delete', old.id, old.prompt, old.result);
+        INSERT INTO chat_fts(rowid, prompt, result) VALUES (new.id, new.prompt, new.result);
+    END
+    """,
+]
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS chat_fts_insert",
+    "DROP TRIGGER IF EXISTS chat_fts_delete",
+    "DROP TRIGGER IF EXISTS chat_fts_update",
+    "DROP TABLE IF EXISTS chat_fts",
+]
+
+
+def _sqlite_names(cursor, kind):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = %s AND name LIKE 'chat_fts%%'", [kind])
+    return {row[0] for row in cursor.fetchall()}
+
+
+def install_index(db=connection):
+    """Creates whatever part of the search index is missing on `db`."""
+    with db.cursor() as cursor:
+        if db.vendor == 'postgresql':
+            for statement in POSTGRES_INSTALL:
+                cursor.execute(statement)
+        elif db.vendor == 'sqlite':
+            had_triggers = len(_sqlite_names(cursor, 'trigger')) == len(SQLITE_TRIGGERS)
+            try:
+                cursor.execute(SQLITE_TABLE)
+            except Exception:
+                # SQLite built without FTS5: search falls back to scanning.
+                return
+            for statement in SQLITE_TRIGGERS:
+                cursor.execute(statement)
+            if not had_triggers:
+                # New table, or rows written while the triggers were gone.
+                cursor.execute("INSERT INTO chat_fts(chat_fts) VALUES ('rebuild')")
+
+
+def repair_index(db=connection):
+    """Puts back the SQLite triggers a rebuild of chat dropped, if the index is installed."""
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        installed = 'chat_fts' in _sqlite_names(cursor, 'table')
+    if installed:
+        install_index(db)
+
+
+def uninstall_index(db=connection):
+    with db.cursor() as cursor:
+        statements = {'postgresql': POSTGRES_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}.get(db.vendor, [])
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def search_backend():
+    if connection.vendor == 'postgresql':
+        return 'postgres'
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            if 'chat_fts' in _sqlite_names(cursor, 'table'):
+                return 'sqlite_fts5'
+    return 'scan'
+
+
+_terms = re.compile(r'"([^"]*)"|(\S+)')
+_words = re.compile(r"\w+")
+
+
+def fts5_query(query):
+    """
+    User input as an FTS5 MATCH expression: every word must appear, "quoted words"
+    as a phrase. Each word is quoted so FTS5 operators in the input are just text.
+    """
+    clauses = []
+    for phrase, word in _terms.findall(query):
+        words = _words.findall(phrase or word)
+        if words:
+            clauses.append('"' + " ".join(words) + '"')
+    return " ".join(clauses)
+
+
+def _rank_window(limit, offset):
+    return max(RANK_WINDOW, offset + limit)
+
+
+def _rows(cursor):
+    columns = [column[0] for column in cursor.description]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    for row in rows:
+        # Raw SQLite queries return the timestamp as text (UTC when USE_TZ).
+        if isinstance(row['date_time'], str):
+            row['date_time'] = parse_datetime(row['date_time'])
+            if settings.USE_TZ and row['date_time'].tzinfo is None:
+                row['date_time'] = row['date_time'].replace(tzinfo=dt_timezone.utc)
+    return rows
+
+
+def _search_postgres(query, limit, offset, conversation_name):
+    conversation_filter = "AND c.conversation_name = %s" if conversation_name else ""
+    sql = f"""
+        WITH q AS (SELECT websearch_to_tsquery('english', %s) AS query),
+        candidates AS (
+            SELECT c.id FROM chat c, q
+            WHERE c.search_vector @@ q.query {conversation_filter}
+            ORDER BY c.id DESC
+            LIMIT %s
+        ),
+        top AS (
+            SELECT c.id, c.conversation_name, c.date_time, c.prompt, c.result,
+                   ts_rank_cd(c.search_vector, q.query) AS rank
+            FROM chat c JOIN candidates USING (id), q
+            ORDER BY rank DESC, c.id DESC
+            LIMIT %s OFFSET %s
+        )
+        SELECT top.id, top.conversation_name, top.date_time, top.prompt, top.rank,
+               ts_headline('english', top.prompt || E'\\n' || coalesce(top.result, ''), q.query,
+                           %s) AS snippet
+        FROM top, q
+        ORDER BY top.rank DESC, top.id DESC
+    """
+    options = (
+        f"StartSel={MATCH_START}, StopSel={MATCH_STOP}, "
+        f"MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}, MaxFragments=2"
+    )
+    params = [
+        query, *([conversation_name] if conversation_name else []),
+        _rank_window(limit, offset), limit, offset, options,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return _rows(cursor)
+
+
+def _rank_cutoff(cursor, match, conversation_name, window):
+    # FTS5 walks a term's matches in rowid order, so finding the window-th most
+    # recent one is cheap; ranking is then limited to rowids from there up.
+    if conversation_name:
+        cursor.execute("""
+            SELECT chat_fts.rowid FROM chat_fts JOIN chat c ON c.id = chat_fts.rowid
+            WHERE chat_fts MATCH %s AND c.conversation_name = %s
+            ORDER BY chat_fts.rowid DESC LIMIT 1 OFFSET %s
+        """, [match, conversation_name, window - 1])
+    else:
+        cursor.execute(
+            "SELECT rowid FROM chat_fts WHERE chat_fts MATCH %s ORDER BY rowid DESC LIMIT 1 OFFSET %s",
+            [match, window - 1],
+        )
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def _search_sqlite(query, limit, offset, conversation_name):
+    match = fts5_query(query)
+    if not match:
+        return []
+    conversation_filter = "AND c.conversation_name = %s" if conversation_name else ""
+    # bm25 is lower for better matches; prompt hits count double.
+    sql = f"""
+        SELECT c.id, c.conversation_name, c.date_time, c.prompt,
+               -bm25(chat_fts, 2.0, 1.0) AS rank,
+               snippet(chat_fts, -1, %s, %s, '…', %s) AS snippet
+        FROM chat_fts JOIN chat c ON c.id = chat_fts.rowid
+        WHERE chat_fts MATCH %s AND chat_fts.rowid >= %s {conversation_filter}
+        ORDER BY bm25(chat_fts, 2.0, 1.0), c.id DESC
+        LIMIT %s OFFSET %s
+    """
+    with connection.cursor() as cursor:
+        cutoff = _rank_cutoff(cursor, match, conversation_name, _rank_window(limit, offset))
+        params = [MATCH_START, MATCH_STOP, SNIPPET_WORDS, match, cutoff,
+                  *([conversation_name] if conversation_name else []), limit, offset]
+        cursor.execute(sql, params)
+        return _rows(cursor)
+
+
+def _scan_snippet(text, query):
+    position = text.lower().find(query.lower())
+    if position < 0:
+        return text[:200]
+    start = max(0, position - 80)
+    end = position + len(query)
+    return (
+        ("…" if start else "") + text[start:position]
+        + MATCH_START + text[position:end] + MATCH_STOP + text[end:end + 80]
+    )
+
+
+def _search_scan(query, limit, offset, conversation_name):
+    from .models import Chat
+
+    queryset = Chat.objects.filter(Q(prompt__icontains=query) | Q(result__icontains=query))
+    if conversation_name:
+        queryset = queryset.filter(conversation_name=conversation_name)
+    rows = queryset.order_by('-date_time', '-id').values(
+        'id', 'conversation_name', 'date_time', 'prompt', 'result'
+    )[offset:offset + limit]
+    results = []
+    for row in rows:
+        result = row.pop('result') or ''
+        row['rank'] = None
+        row['snippet'] = _scan_snippet(f"{row['prompt']}\n{result}", query)
+        results.append(row)
+    return results
+
+
+def highlight(snippet):
+    """A marked snippet as HTML: the text escaped, its matches in <mark>."""
+    return escape(snippet).replace(MATCH_START, SNIPPET_START).replace(MATCH_STOP, SNIPPET_STOP)
+
+
+_backends = {
+    'postgres': _search_postgres,
+    'sqlite_fts5': _search_sqlite,
+    'scan': _search_scan,
+}
+
+
+def search_turns(query, limit, offset=0, conversation_name=None, backend=None):
+    """Best-ranked turns matching `query` as dicts: id, conversation_name, date_time, prompt, rank, snippet."""
+    backend = backend or search_backend()
+    rows = _backends[backend](query, limit, min(offset, MAX_SEARCH_OFFSET), conversation_name)
+    for row in rows:
+        row['snippet'] = highlight(row['snippet'] or '')
+    return rows
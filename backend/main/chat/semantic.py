@@ -0,0 +1,163 @@
+# semantic.py
+#
+# "Have we answered this before?" Every finished turn's prompt is embedded and added
+# to a vector index (chat/vector_index.py) next to its Chat id. Before a new turn
+# calls Gemini, its prompt is looked up there; when an earlier turn is close enough:
+#   - "serve" mode sends that earlier answer back instead of calling Gemini (at or
+#     above SERVE_THRESHOLD),
+#   - otherwise, at or above CONTEXT_THRESHOLD, the earlier answer is attached to the
+#     prompt as context for the model to reuse or correct.
+# Only text prompts of MIN_PROMPT_WORDS or more are looked up: "yes" or "and then?"
+# mean something different in every conversation.
+#
+# Configure with settings.SEMANTIC, e.g.
+#   SEMANTIC = {
+#       "MODE": "context",          # "off", "context" or "serve"
+#       "EMBEDDER": "chat.embeddings.HashingEmbedder",
+#       "DIMENSIONS": 256,
+#       "LOCATION": MEDIA_ROOT / "semantic",
+#       "SERVE_THRESHOLD": 0.95,
+#       "CONTEXT_THRESHOLD": 0.8,
+#       "MIN_PROMPT_WORDS": 4,
+#       "NPROBE": 8,
+#   }
+# Turns saved while MODE was "off", or before the index existed, are added with
+#   python manage.py semantic_index
+
+import logging
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .embeddings import DEFAULT_DIMENSIONS
+from .models import STATUS_COMPLETE, Chat
+from .vector_index import DEFAULT_NPROBE, VectorIndex
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SERVE_THRESHOLD = 0.95
+DEFAULT_CONTEXT_THRESHOLD = 0.8
+DEFAULT_MIN_PROMPT_WORDS = 4
+CANDIDATES = 5
+
+# served: the answer is sent as-is rather than given to the model as context.
+Match = namedtuple('Match', 'chat_id score prompt result served')
+
+
+def semantic_setting(name, default=None):
+    value = getattr(settings, 'SEMANTIC', {}).get(name)
+    return default if value is None else value
+
+
+def semantic_enabled():
+    return semantic_setting('MODE', 'off') != 'off'
+
+
+_embedder = None
+_index = None
+_lock = threading.Lock()
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        with _lock:
+            if _embedder is None:
+                embedder_class = import_string(semantic_setting('EMBEDDER', 'chat.embeddings.HashingEmbedder'))
+                _embedder = embedder_class(dimensions=semantic_setting('DIMENSIONS', DEFAULT_DIMENSIONS))
+    return _embedder
+
+
+def get_index():
+    global _index
+    if _index is None:
+        embedder = get_embedder()
+        with _lock:
+            if _index is None:
+                _index = VectorIndex(
+                    semantic_setting('LOCATION', settings.MEDIA_ROOT / 'semantic'),
+                    embedder.dimensions,
+                    embedder=embedder.name,
+                    nprobe=semantic_setting('NPROBE', DEFAULT_NPROBE),
+                )
+    return _index
+
+
+def embed_prompt(prompt, api_key=None):
+    return get_embedder().embed([prompt], api_key=api_key)[0]
+
+
+def lookup(prompt, api_key=None):
+    """
+    Returns (match, prompt vector) for a new prompt. match is None when nothing is
+    close enough; the vector is kept to index the turn once it is saved. Never
+    raises: retrieval failing must not fail the turn.
+    """
+    if not semantic_enabled() or not prompt or len(prompt.split()) < semantic_setting('MIN_PROMPT_WORDS', DEFAULT_MIN_PROMPT_WORDS):
+        return None, None
+    try:
+        vector = embed_prompt(prompt, api_key)
+        hits = get_index().search(vector, k=CANDIDATES)
+    except Exception:
+        logger.warning("Semantic lookup failed", exc_info=True)
+        return None, None
+
+    context_threshold = semantic_setting('CONTEXT_THRESHOLD', DEFAULT_CONTEXT_THRESHOLD)
+    scores = {chat_id: score for chat_id, score in hits if score >= context_threshold}
+    if not scores:
+        return None, vector
+    # Deleted turns can still be in the index; skip them.
+    rows = Chat.objects.filter(id__in=scores, status=STATUS_COMPLETE).exclude(result='').values('id', 'prompt', 'result')
+    best = max(rows, key=lambda row: (scores[row['id']], row['id']), default=None)
+    if best is None:
+        return None, vector
+    score = scores[best['id']]
+    served = (
+        semantic_setting('MODE') == 'serve'
+        and score >= semantic_setting('SERVE_THRESHOLD', DEFAULT_SERVE_THRESHOLD)
+    )
+    return Match(best['id'], score, best['prompt'], best['result'], served), vector
+
+
+def with_previous_answer(contents, match):
+    """contents with the earlier answer attached to the newest user message."""
+    note = {
+        "text": (
+            "An earlier conversation asked a very similar question:\n"
+            f"{match.prompt}\n\nThe answer given then was:\n{match.result}\n\n"
+            "Reuse it if it still answers the question above; correct or update it if not."
+        )
+    }
+    for position in range(len(contents) - 1, -1, -1):
+        if contents[position]['role'] == 'user':
+            latest = {**contents[position], 'parts': [*contents[position]['parts'], note]}
+            return [*contents[:position], latest, *contents[position + 1:]]
+    return [*contents, {'role': 'user', 'parts': [note]}]
+
+
+def index_chats(chats, vectors=None):
+    """
+    Adds complete turns to the index. vectors[i] is chats[i]'s prompt embedding when
+    the request already computed it; the rest are embedded here, except with an
+    embedder that needs an API key (those wait for `manage.py semantic_index`).
+    """
+    if not semantic_enabled():
+        return
+    vectors = vectors or [None] * len(chats)
+    ready = [(chat, vector) for chat, vector in zip(chats, vectors) if chat.status == STATUS_COMPLETE and chat.prompt]
+    if not ready:
+        return
+    try:
+        embedder = get_embedder()
+        missing = [chat.prompt for chat, vector in ready if vector is None]
+        if missing and getattr(embedder, 'needs_api_key', False):
+            ready = [(chat, vector) for chat, vector in ready if vector is not None]
+        elif missing:
+            computed = iter(embedder.embed(missing))
+            ready = [(chat, next(computed) if vector is None else vector) for chat, vector in ready]
+        if ready:
+            get_index().add([chat.id for chat, _ in ready], [vector for _, vector in ready])
+    except Exception:
+        logger.warning("Adding %d turns to the semantic index failed", len(ready), exc_info=True)
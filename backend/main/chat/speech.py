@@ -0,0 +1,449 @@
+# speech.py
+#
+# Speech to text for chat turns, rebuilt from the stt.py prototype so the server can
+# use it. A client opens a session, uploads audio in chunks while it records, then
+# ends the session. Ending returns the transcript, or sends it straight into
+# interface_stream as the turn's prompt (see the stt views).
+#
+#   - Segmenter cuts 16-bit mono PCM into utterances as it arrives, using
+#     energy-based voice activity detection. FRAME_MS frames louder than
+#     ENERGY_RATIO times the running noise floor start a segment, and SILENCE_MS
+#     of quiet ends it.
+#   - Each finished segment goes to the recognizer on a shared pool straight away,
+#     so earlier sentences are transcribed while the user is still talking, and
+#     ending the session only waits for the last one.
+#   - Recognizers are pluggable (settings.STT["RECOGNIZER"]). GoogleRecognizer
+#     uses the SpeechRecognition package, as the prototype did. StubRecognizer is
+#     offline and deterministic, for tests and benchmarks.
+#   - TextToSpeech keeps one pyttsx3 engine on its own thread for the life of the
+#     process; the prototype built a new engine for every utterance.
+#
+# Sessions live in the worker that opened them (like live turns, see chat/live.py),
+# so all the uploads of one session must reach the same worker.
+#
+# Configure with settings.STT, e.g.
+#   STT = {
+#       "RECOGNIZER": "chat.speech.GoogleRecognizer",
+#       "LANGUAGE": "en-US",
+#       "SAMPLE_RATE": 16000,          # for raw PCM uploads; WAV headers say their own
+#       "SILENCE_MS": 500,
+#       "MAX_SEGMENT_SECONDS": 15,
+#       "MAX_SESSION_SECONDS": 300,    # audio accepted per session
+#       "SESSION_TTL": 300,            # idle seconds before a session is dropped
+#       "TIMEOUT": 30,                 # seconds ending a session waits for transcripts
+#   }
+
+import logging
+import os
+import queue
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+FRAME_MS = 30
+# Audio kept from before speech is detected, so quiet first syllables aren't cut.
+PREROLL_MS = 300
+# Loud frames in a row needed to start a segment; a click or a cough is shorter.
+START_FRAMES = 3
+# Segments with less speech than this are dropped as noise.
+MIN_SPEECH_MS = 200
+# A frame is speech when its RMS energy is this many times the noise floor's...
+ENERGY_RATIO = 3.0
+# ...and at least this loud (int16 scale, about -50 dBFS), so digital silence and
+# hiss never count.
+MIN_ENERGY = 100.0
+# How quickly the noise floor follows quiet frames.
+NOISE_ADAPT = 0.05
+
+STT_POOL_SIZE = 8
+
+DEFAULT_LANGUAGE = "en-US"
+DEFAULT_SAMPLE_RATE = 16000
+DEFAULT_SILENCE_MS = 500
+DEFAULT_MAX_SEGMENT_SECONDS = 15
+DEFAULT_MAX_SESSION_SECONDS = 300
+DEFAULT_SESSION_TTL = 300
+DEFAULT_TIMEOUT = 30
+
+_stt_pool = ThreadPoolExecutor(max_workers=STT_POOL_SIZE, thread_name_prefix="stt")
+
+
+def stt_setting(name, default=None):
+    # The command-line loop in stt.py runs without Django settings.
+    if not settings.configured:
+        return default
+    value = getattr(settings, 'STT', {}).get(name)
+    return default if value is None else value
+
+
+class AudioError(ValueError):
+    pass
+
+
+class Segment(namedtuple('Segment', 'index start end pcm sample_rate')):
+    """One utterance: 16-bit mono PCM, with start/end in seconds from the start of the audio."""
+
+    @property
+    def duration(self):
+        return len(self.pcm) / 2 / self.sample_rate
+
+
+class Segmenter:
+    """Energy-based voice activity detection over PCM fed in pieces of any size."""
+
+    def __init__(self, sample_rate=DEFAULT_SAMPLE_RATE, silence_ms=None, max_segment_seconds=None):
+        self.sample_rate = sample_rate
+        self.frame_bytes = sample_rate * FRAME_MS // 1000 * 2
+        self.silence_frames = max(1, (silence_ms or stt_setting('SILENCE_MS', DEFAULT_SILENCE_MS)) // FRAME_MS)
+        max_seconds = max_segment_seconds or stt_setting('MAX_SEGMENT_SECONDS', DEFAULT_MAX_SEGMENT_SECONDS)
+        self.max_frames = int(max_seconds * 1000 // FRAME_MS)
+        self.noise = MIN_ENERGY / ENERGY_RATIO
+        self.frames = 0       # frames seen so far
+        self.segments = 0     # segments emitted so far
+        self._pending = b""
+        self._preroll = deque(maxlen=PREROLL_MS // FRAME_MS)
+        self._voiced = None   # frames of the open segment, or None between segments
+        self._start = 0
+        self._loud_run = 0
+        self._quiet_run = 0
+
+    @property
+    def in_speech(self):
+        return self._voiced is not None
+
+    def feed(self, pcm):
+        """Adds audio; returns the segments it finished."""
+        data = self._pending + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self._pending = data[usable:]
+        if not usable:
+            return []
+        samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32).reshape(-1, self.frame_bytes // 2)
+        energies = np.sqrt(np.mean(samples * samples, axis=1))
+        finished = []
+        for number, energy in enumerate(energies):
+            frame = data[number * self.frame_bytes:(number + 1) * self.frame_bytes]
+            segment = self._frame(frame, float(energy))
+            if segment is not None:
+                finished.append(segment)
+        return finished
+
+    def flush(self):
+        """Ends the audio: returns the open segment, if it holds enough speech."""
+        if self._voiced is None:
+            return []
+        segment = self._close(self._quiet_run)
+        return [segment] if segment is not None else []
+
+    def _frame(self, frame, energy):
+        self.frames += 1
+        loud = energy > max(MIN_ENERGY, self.noise * ENERGY_RATIO)
+        if self._voiced is None:
+            self._preroll.append(frame)
+            if not loud:
+                self._loud_run = 0
+                self.noise += NOISE_ADAPT * (energy - self.noise)
+                return None
+            self._loud_run += 1
+            if self._loud_run < START_FRAMES:
+                return None
+            self._voiced = list(self._preroll)
+            self._preroll.clear()
+            self._start = self.frames - len(self._voiced)
+            self._quiet_run = 0
+            return None
+
+        self._voiced.append(frame)
+        self._quiet_run = 0 if loud else self._quiet_run + 1
+        if self._quiet_run >= self.silence_frames or len(self._voiced) >= self.max_frames:
+            return self._close(self._quiet_run)
+        return None
+
+    def _close(self, trailing_quiet):
+        voiced = self._voiced
+        self._voiced = None
+        self._loud_run = 0
+        # Keep a little of the trailing silence; recognizers like a soft ending.
+        keep = len(voiced) - max(0, trailing_quiet - 100 // FRAME_MS)
+        speech_frames = len(voiced) - trailing_quiet
+        if speech_frames * FRAME_MS < MIN_SPEECH_MS:
+            return None
+        segment = Segment(
+            self.segments,
+            self._start * FRAME_MS / 1000,
+            (self._start + speech_frames) * FRAME_MS / 1000,
+            b"".join(voiced[:keep]),
+            self.sample_rate,
+        )
+        self.segments += 1
+        return segment
+
+
+def parse_wav_header(data):
+    """(sample_rate, offset of the PCM) for a WAV file's first bytes; only 16-bit mono PCM."""
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise AudioError("Not a WAV file.")
+    offset = 12
+    sample_rate = None
+    while offset + 8 <= len(data):
+        chunk_id, size = data[offset:offset + 4], struct.unpack("<I", data[offset + 4:offset + 8])[0]
+        if chunk_id == b"fmt ":
+            audio_format, channels, sample_rate = struct.unpack("<HHI", data[offset + 8:offset + 16])
+            bits = struct.unpack("<H", data[offset + 22:offset + 24])[0]
+            if audio_format != 1 or channels != 1 or bits != 16:
+                raise AudioError("Only 16-bit mono PCM WAV audio is supported.")
+        elif chunk_id == b"data":
+            if sample_rate is None:
+                raise AudioError("WAV data before its format chunk.")
+            return sample_rate, offset + 8
+        offset += 8 + size + size % 2
+    raise AudioError("The first upload must hold the whole WAV header.")
+
+
+# --- Recognizers -----------------------------------------------------------
+
+class StubRecognizer:
+    """
+    Offline stand-in. "Hears" transcripts[i] in segment i (or "segment <n>"), after
+    taking delay + real_time_factor * the segment's length, like a remote API would.
+    """
+
+    def __init__(self, transcripts=None, delay=0.0, real_time_factor=0.0, **options):
+        self.transcripts = list(transcripts or [])
+        self.delay = delay
+        self.real_time_factor = real_time_factor
+        self.calls = 0
+
+    def transcribe(self, segment, language=DEFAULT_LANGUAGE):
+        self.calls += 1
+        time.sleep(self.delay + self.real_time_factor * segment.duration)
+        if self.transcripts:
+            return self.transcripts[segment.index % len(self.transcripts)]
+        return f"segment {segment.index + 1}"
+
+
+class GoogleRecognizer:
+    """Google's free web speech API through the SpeechRecognition package."""
+
+    def __init__(self, key=None, **options):
+        import speech_recognition as sr
+
+        self.sr = sr
+        self.key = key
+        self.recognizer = sr.Recognizer()
+
+    def transcribe(self, segment, language=DEFAULT_LANGUAGE):
+        audio = self.sr.AudioData(segment.pcm, segment.sample_rate, 2)
+        try:
+            return self.recognizer.recognize_google(audio, key=self.key, language=language)
+        except self.sr.UnknownValueError:
+            return ""
+
+
+_recognizer = None
+_lock = threading.Lock()
+
+
+def get_recognizer():
+    global _recognizer
+    if _recognizer is None:
+        with _lock:
+            if _recognizer is None:
+                _recognizer = import_string(stt_setting('RECOGNIZER', 'chat.speech.GoogleRecognizer'))()
+    return _recognizer
+
+
+# --- Text to speech --------------------------------------------------------
+
+class TextToSpeech:
+    """
+    One pyttsx3 engine for the whole process. Engines are slow to build and not
+    thread-safe, so this one lives on its own thread and takes work from a queue.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _run(self):
+        try:
+            import pyttsx3
+
+            engine = pyttsx3.init()
+        except Exception as e:
+            error = e
+            engine = None
+        while True:
+            text, path, done = self._queue.get()
+            if engine is None:
+                done.set_exception(error)
+                continue
+            try:
+                if path:
+                    engine.save_to_file(text, path)
+                else:
+                    engine.say(text)
+                engine.runAndWait()
+                done.set_result(path)
+            except Exception as e:
+                done.set_exception(e)
+
+    def _submit(self, text, path=None):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="tts", daemon=True)
+                self._thread.start()
+        done = Future()
+        self._queue.put((text, path, done))
+        return done
+
+    def speak(self, text):
+        """Says text on this machine's speakers; returns once it has been said."""
+        self._submit(text).result()
+
+    def synthesize(self, text):
+        """text as WAV bytes."""
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            self._submit(text, path).result()
+            with open(path, "rb") as handle:
+                return handle.read()
+        finally:
+            os.unlink(path)
+
+
+_tts = None
+
+
+def get_stt_pool():
+    """The thread pool utterances are transcribed on, shared by every session."""
+    return _stt_pool
+
+
+def get_tts():
+    global _tts
+    if _tts is None:
+        with _lock:
+            if _tts is None:
+                _tts = TextToSpeech()
+    return _tts
+
+
+# --- Sessions --------------------------------------------------------------
+
+class SpeechSession:
+    """One recording: audio in, segments transcribed in the background as they close."""
+
+    def __init__(self, data=None, sample_rate=None, language=None):
+        self.session_id = uuid.uuid4().hex
+        self.data = data or {}  # chat parameters for interface_stream, if any
+        self.sample_rate = sample_rate
+        self.language = language or stt_setting('LANGUAGE', DEFAULT_LANGUAGE)
+        self.segmenter = None
+        self.transcriptions = []  # (segment, future) in order
+        self.audio_bytes = 0
+        self.ended = False
+        self.touched = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def audio_seconds(self):
+        return self.audio_bytes / 2 / (self.sample_rate or DEFAULT_SAMPLE_RATE)
+
+    def feed(self, data):
+        with self._lock:
+            if self.ended:
+                raise AudioError("The session has ended.")
+            self.touched = time.monotonic()
+            if self.segmenter is None:
+                if data[:4] == b"RIFF":
+                    self.sample_rate, offset = parse_wav_header(data)
+                    data = data[offset:]
+                self.sample_rate = self.sample_rate or stt_setting('SAMPLE_RATE', DEFAULT_SAMPLE_RATE)
+                self.segmenter = Segmenter(self.sample_rate)
+            self.audio_bytes += len(data)
+            if self.audio_seconds > stt_setting('MAX_SESSION_SECONDS', DEFAULT_MAX_SESSION_SECONDS):
+                raise AudioError("Too much audio for one session.")
+            self._transcribe(self.segmenter.feed(data))
+
+    def _transcribe(self, segments):
+        recognizer = get_recognizer()
+        for segment in segments:
+            future = _stt_pool.submit(recognizer.transcribe, segment, self.language)
+            self.transcriptions.append((segment, future))
+
+    def transcript(self):
+        """The text of the segments transcribed so far, in order, stopping at the first still running."""
+        texts = []
+        for _, future in list(self.transcriptions):
+            if not future.done():
+                break
+            if not future.exception() and future.result():
+                texts.append(future.result())
+        return " ".join(texts)
+
+    def end(self, timeout=None):
+        """
+        Closes the audio and waits for every transcription. Returns the transcript
+        and a list of {"start", "end", "text"} per segment.
+        """
+        with self._lock:
+            if not self.ended:
+                self.ended = True
+                if self.segmenter is not None:
+                    self._transcribe(self.segmenter.flush())
+        wait([future for _, future in self.transcriptions], timeout=timeout or stt_setting('TIMEOUT', DEFAULT_TIMEOUT))
+        segments = []
+        for segment, future in self.transcriptions:
+            text = ""
+            if future.done() and not future.exception():
+                text = (future.result() or "").strip()
+            elif future.done():
+                logger.warning("Transcribing a speech segment failed", exc_info=future.exception())
+            segments.append({"start": segment.start, "end": segment.end, "text": text})
+        return " ".join(item["text"] for item in segments if item["text"]), segments
+
+
+class SpeechSessionRegistry:
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        session = SpeechSession(**kwargs)
+        with self._lock:
+            self._prune()
+            self._sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            self._prune()
+            return self._sessions.get(session_id)
+
+    def pop(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+
+    def _prune(self):
+        cutoff = time.monotonic() - stt_setting('SESSION_TTL', DEFAULT_SESSION_TTL)
+        for session_id in [key for key, session in self._sessions.items() if session.touched < cutoff]:
+            del self._sessions[session_id]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+speech_sessions = SpeechSessionRegistry()
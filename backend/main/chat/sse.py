@@ -0,0 +1,146 @@
+# sse.py
+#
+# Server-sent event framing for the stream views.
+#
+# Deltas are most of what a turn sends, so their envelope is precomputed and only
+# the text is escaped, with the same escaper json.dumps uses for strings: the bytes
+# are identical to sse_event({"type": "delta", "text": ...}) without building and
+# walking a dict per chunk. A DeltaEvent keeps its text, so when a client falls
+# behind, the deltas waiting for it are merged into fewer, larger writes (see
+# coalesce and LiveStream.follow).
+#
+# Detached turns get heartbeats from their followers (LiveStream.follow). A turn
+# that runs inside its response pulls its model chunks through with_heartbeats /
+# awith_heartbeats instead, which hand back None whenever KEEPALIVE_INTERVAL
+# passes without a chunk, so the view can send a comment during a slow first token.
+#
+# Configure with settings.SSE, e.g.
+#   SSE = {
+#       "KEEPALIVE_INTERVAL": 15,    # heartbeat comment after this many idle seconds
+#       "COALESCE": True,            # merge deltas that are waiting for the client
+#       "COALESCE_WINDOW": 0.0,      # also hold deltas up to this many seconds to merge more
+#       "COALESCE_MAX_CHARS": 4096,  # cap on the text merged into one event
+#   }
+
+import asyncio
+import json
+from concurrent.futures import TimeoutError as FuturesTimeout
+from json.encoder import encode_basestring_ascii
+
+from django.conf import settings
+
+KEEPALIVE_INTERVAL = 15
+DEFAULT_COALESCE_MAX_CHARS = 4096
+
+_END = object()
+
+DELTA_PREFIX = 'data: {"type": "delta", "text": '
+DELTA_SUFFIX = '}\n\n'
+
+
+def sse_setting(name, default):
+    value = getattr(settings, 'SSE', {}).get(name)
+    return default if value is None else value
+
+
+def sse_event(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def sse_comment() -> str:
+    return ":\n\n"
+
+
+class DeltaEvent(str):
+    """The framed delta event for `text`, which stays available as .text for merging."""
+
+    def __new__(cls, text):
+        event = super().__new__(cls, DELTA_PREFIX + encode_basestring_ascii(text) + DELTA_SUFFIX)
+        event.text = text
+        return event
+
+
+def sse_delta(text) -> str:
+    return DeltaEvent(text)
+
+
+def coalesce(events, first_index):
+    """
+    Yields (index, event) for events numbered from first_index, with every run of
+    consecutive deltas merged into one event (up to COALESCE_MAX_CHARS of text)
+    whose index is that of the run's last delta.
+    """
+    if not sse_setting('COALESCE', True):
+        yield from enumerate(events, first_index)
+        return
+
+    max_chars = sse_setting('COALESCE_MAX_CHARS', DEFAULT_COALESCE_MAX_CHARS)
+    run, run_chars = [], 0
+    for index, event in enumerate(events, first_index):
+        if isinstance(event, DeltaEvent):
+            if run and run_chars + len(event.text) > max_chars:
+                yield index - 1, _merged(run)
+                run, run_chars = [], 0
+            run.append(event)
+            run_chars += len(event.text)
+            continue
+        if run:
+            yield index - 1, _merged(run)
+            run, run_chars = [], 0
+        yield index, event
+    if run:
+        yield first_index + len(events) - 1, _merged(run)
+
+
+def _merged(run):
+    if len(run) == 1:
+        return run[0]
+    return DeltaEvent("".join(event.text for event in run))
+
+
+def with_heartbeats(iterator, executor, interval):
+    """
+    The items of `iterator`, each pulled on `executor`, with None in between
+    whenever `interval` seconds pass without one. Only for iterators that wait on
+    the network: next() runs on another thread, away from this one's DB connection.
+    """
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = executor.submit(next, iterator, _END)
+            try:
+                item = pending.result(timeout=interval)
+            except FuturesTimeout:
+                yield None
+                continue
+            pending = None
+            if item is _END:
+                return
+            yield item
+    finally:
+        # A next() already running finishes on its own; its item is dropped.
+        if pending is not None:
+            pending.cancel()
+
+
+async def awith_heartbeats(iterator, interval):
+    """with_heartbeats() for an async iterator; each __anext__() runs as a task."""
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            done, _ = await asyncio.wait({pending}, timeout=interval)
+            if not done:
+                yield None
+                continue
+            finished, pending = pending, None
+            try:
+                item = finished.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        if pending is not None:
+            pending.cancel()
@@ -1,33 +1,45 @@
+# stt.py
+#
+# Talk to the speech pipeline from this machine's microphone:
+#   python -m chat.stt
+# Audio is cut into utterances as it is read (see speech.py), each utterance is
+# printed once it's transcribed, and then read back through the one shared TTS
+# engine. Needs the SpeechRecognition package with PyAudio, and pyttsx3.
+
 import speech_recognition as sr
-import pyttsx3 
-
-r = sr.Recognizer() 
-
-def SpeakText(command):
-    
-    engine = pyttsx3.init()
-    engine.say(command) 
-    engine.runAndWait()
-
-while(1):    
-    try:
-        with sr.Microphone() as source2:
-            print("Adjusting for noise...")
-            r.adjust_for_ambient_noise(source2, duration=1)
-            
-            print("Listening...")
-            audio2 = r.listen(source2)
-            
-            print("Processing...")
-            
-            MyText = r.recognize_google(audio2)
-            MyText = MyText.lower()
-
-            print("Did you say ", MyText)
-            SpeakText(MyText)
-            
-    except sr.RequestError as e:
-        print("Could not request results; {0}".format(e))
-        
-    except sr.UnknownValueError:
-        print("Unknown error: Could not understand audio")
\ No newline at end of file
+
+from .speech import DEFAULT_SAMPLE_RATE, Segmenter, get_recognizer, get_stt_pool, get_tts
+
+
+def main():
+    recognizer = get_recognizer()
+    pool = get_stt_pool()
+    tts = get_tts()
+
+    def heard(future):
+        try:
+            text = future.result().lower()
+        except sr.RequestError as e:
+            print("Could not request results; {0}".format(e))
+            return
+        if not text:
+            print("Could not understand audio")
+            return
+        print("Did you say ", text)
+        tts.speak(text)
+
+    with sr.Microphone(sample_rate=DEFAULT_SAMPLE_RATE) as source:
+        segmenter = Segmenter(source.SAMPLE_RATE)
+        print("Listening...")
+        try:
+            while True:
+                # Keep reading while earlier utterances are transcribed and spoken.
+                for segment in segmenter.feed(source.stream.read(source.CHUNK)):
+                    pool.submit(recognizer.transcribe, segment).add_done_callback(heard)
+        except KeyboardInterrupt:
+            for segment in segmenter.flush():
+                heard(pool.submit(recognizer.transcribe, segment))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,1942 @@
-from django.test import TestCase
+import asyncio
+import base64
+import importlib
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+from urllib.parse import urlsplit
 
-# Create your tests here.
+import requests
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from benchmarks.common import FakeGenerativeModel, PassThroughToolCache
+from benchmarks.compare import compare
+from benchmarks.page_fetch import FixtureServer, write_fixtures
+from benchmarks.search_enrichment import CorpusTavilyClient, build_corpus
+from benchmarks.stt_latency import make_recording, write_wav
+from . import (
+    admission, blobstore, clients, context, embeddings, enrichment, live, media_cache, metrics, pages, persistence, search,
+    semantic, speech,
+    sse, tool_cache, tools, transfer, vector_index, views,
+)
+from .models import Blob, Chat, Conversation
+from .pagination import MAX_PAGE_SIZE, page_size
+from .projection import PREVIEW_LENGTH
+
+
+def stream_body(**extra):
+    body = {
+        "geminiApiKey": "test",
+        "tavilyApiKey": "test",
+        "conversation_name": "tests",
+        "history": [{"role": "user", "content": "hello"}],
+    }
+    body.update(extra)
+    return json.dumps(body)
+
+
+def sse_payloads(parts):
+    events = []
+    for part in parts:
+        text = part.decode() if isinstance(part, bytes) else part
+        for line in text.splitlines():
+            if line.startswith("data: "):
+                events.append(json.loads(line[len("data: "):]))
+    return events
+
+
+def response_body(response):
+    return b"".join(response.streaming_content) if response.streaming else response.content
+
+
+# Every test turn goes through admission (off by default) with the same API keys;
+# keep their rate limit out of the way. AdmissionTests sets up controllers of its own.
+_admission_settings = override_settings(ADMISSION={"ENABLED": True, "KEY_RATE": 0})
+
+
+def setUpModule():
+    _admission_settings.enable()
+
+
+def tearDownModule():
+    _admission_settings.disable()
+
+
+# Background threads can't see rows inside the test's transaction, so these save
+# turns inline and run them inside the response.
+SAVE_INLINE = override_settings(PERSISTENCE={"WRITE_BEHIND": False}, LIVE_STREAMS={"DETACH": False})
+
+
+@SAVE_INLINE
+class InterfaceStreamUpstreamCallsTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def run_turn(self, model, tool=None):
+        tools = {"internet_search": tool or mock.Mock(return_value={"results": ["r"]})}
+        with mock.patch.object(views, "gemini_model", return_value=model), \
+                mock.patch.dict(views.AVAILABLE_TOOLS, tools), \
+                mock.patch.object(views, "get_tool_cache", PassThroughToolCache):
+            request = self.factory.post("/interface_stream/", stream_body(), content_type="application/json")
+            response = views.interface_stream(request)
+            return sse_payloads(list(response.streaming_content))
+
+    def test_plain_turn_makes_a_single_upstream_call(self):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=3, chunk_text="hi ")
+
+        events = self.run_turn(model)
+
+        self.assertEqual(model.calls, 1)
+        self.assertEqual([e["text"] for e in events if e["type"] == "delta"], ["hi "] * 3)
+        self.assertEqual(events[-1], {"type": "done"})
+        self.assertEqual(Chat.objects.get().result, "hi hi hi ")
+
+    def test_list_arguments_from_real_sdk_parts_reach_the_tool(self):
+        from google.generativeai import protos
+
+        def response(part):
+            return protos.GenerateContentResponse(candidates=[
+                protos.Candidate(content=protos.Content(role="model", parts=[part]))
+            ])
+
+        urls = ["https://example.com/a", "https://example.com/b"]
+        model = mock.Mock()
+        model.generate_content.side_effect = [
+            iter([response(protos.Part(function_call=protos.FunctionCall(name="fetch_pages", args={"urls": urls})))]),
+            iter([response(protos.Part(text="read them"))]),
+        ]
+        tool = mock.Mock(return_value={"pages": []})
+        with mock.patch.object(views, "gemini_model", return_value=model), \
+                mock.patch.dict(views.AVAILABLE_TOOLS, {"fetch_pages": tool}), \
+                mock.patch.object(views, "get_tool_cache", PassThroughToolCache):
+            request = self.factory.post("/interface_stream/", stream_body(), content_type="application/json")
+            events = sse_payloads(list(views.interface_stream(request).streaming_content))
+
+        tool.assert_called_once_with(tavily_api_key="test", urls=urls)
+        self.assertIs(type(tool.call_args.kwargs["urls"]), list)
+        [call] = [e for e in events if e["type"] == "tool_call"]
+        self.assertEqual(call["args"], {"urls": urls})
+        self.assertEqual([e["text"] for e in events if e["type"] == "delta"], ["read them"])
+        self.assertEqual(events[-1], {"type": "done"})
+
+    def test_tool_turn_calls_the_model_again_with_the_tool_output(self):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=2, tool_call=True)
+        tool = mock.Mock(return_value={"results": ["r"]})
+
+        events = self.run_turn(model, tool)
+
+        self.assertEqual(model.calls, 2)
+        tool.assert_called_once_with(tavily_api_key="test", query="benchmark query")
+        self.assertEqual(
+            [e["type"] for e in events],
+            ["turn", "tool_call", "tool_start", "tool_end", "delta", "delta", "done"]
+        )
+
+    def test_parallel_calls_run_together_and_return_in_one_turn(self):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=1,
+                                    tool_call=True, parallel_calls=3)
+        tool = mock.Mock(side_effect=lambda query, tavily_api_key: {"results": [query]})
+
+        events = self.run_turn(model, tool)
+
+        self.assertEqual(model.calls, 2)
+        self.assertEqual(tool.call_count, 3)
+        tool_turn = model.requests[-1][0][-1]
+        self.assertEqual(tool_turn["role"], "tool")
+        self.assertEqual(
+            sorted(part["function_response"]["response"]["results"][0] for part in tool_turn["parts"]),
+            ["benchmark query", "benchmark query 2", "benchmark query 3"]
+        )
+        ends = [e for e in events if e["type"] == "tool_end"]
+        self.assertEqual(sorted(e["id"] for e in ends), [0, 1, 2])
+        self.assertTrue(all(e["ok"] and "duration_ms" in e for e in ends))
+
+    def test_tool_loop_stops_after_max_rounds(self):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=1,
+                                    tool_call=True, tool_rounds=50)
+
+        events = self.run_turn(model)
+
+        self.assertEqual(model.calls, views.MAX_TOOL_ROUNDS + 1)
+        self.assertEqual(model.requests[-1][1], {"tool_config": views.NO_MORE_TOOLS})
+        self.assertEqual(events[-2]["type"], "delta")
+
+    def test_tool_rounds_stop_once_the_time_budget_is_spent(self):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=1, tool_call=True)
+
+        with mock.patch.object(views, "TOOL_TIME_BUDGET", 0):
+            events = self.run_turn(model)
+
+        self.assertEqual(model.calls, 1)
+        self.assertEqual(model.requests[0][1], {"tool_config": views.NO_MORE_TOOLS})
+        self.assertNotIn("tool_call", [e["type"] for e in events])
+
+    def test_tools_still_running_at_the_deadline_are_abandoned(self):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=1, tool_call=True)
+        release = threading.Event()
+        tool = mock.Mock(side_effect=lambda **kwargs: release.wait(5) and {"results": ["late"]})
+
+        try:
+            with mock.patch.object(views, "TOOL_TIME_BUDGET", 0.1):
+                events = self.run_turn(model, tool)
+        finally:
+            release.set()
+
+        end = next(e for e in events if e["type"] == "tool_end")
+        self.assertFalse(end["ok"])
+        self.assertEqual(model.calls, 2)
+        self.assertEqual(model.requests[-1][1], {"tool_config": views.NO_MORE_TOOLS})
+        response = model.requests[-1][0][-1]["parts"][0]["function_response"]["response"]
+        self.assertEqual(response, {"error": "Tool call timed out."})
+
+    def test_tool_errors_go_back_to_the_model(self):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=1, tool_call=True)
+        tool = mock.Mock(side_effect=RuntimeError("boom"))
+
+        events = self.run_turn(model, tool)
+
+        end = next(e for e in events if e["type"] == "tool_end")
+        self.assertFalse(end["ok"])
+        response = model.requests[-1][0][-1]["parts"][0]["function_response"]["response"]
+        self.assertIn("boom", response["error"])
+        self.assertEqual(events[-1], {"type": "done"})
+
+    async def test_async_tool_turn_runs_parallel_calls(self):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=1,
+                                    tool_call=True, parallel_calls=2)
+        tool = mock.Mock(return_value={"results": ["r"]})
+        with mock.patch.object(views, "gemini_model", return_value=model), \
+                mock.patch.dict(views.AVAILABLE_TOOLS, {"internet_search": tool}), \
+                mock.patch.object(views, "get_tool_cache", PassThroughToolCache):
+            request = self.factory.post("/interface_stream_async/", stream_body(), content_type="application/json")
+            response = await views.interface_stream_async(request)
+            events = sse_payloads([part async for part in response.streaming_content])
+
+        self.assertEqual(model.calls, 2)
+        self.assertEqual(tool.call_count, 2)
+        self.assertEqual(len([e for e in events if e["type"] == "tool_end"]), 2)
+
+    async def test_async_plain_turn_makes_a_single_upstream_call(self):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=2)
+        with mock.patch.object(views, "gemini_model", return_value=model):
+            request = self.factory.post("/interface_stream_async/", stream_body(), content_type="application/json")
+            response = await views.interface_stream_async(request)
+            events = sse_payloads([part async for part in response.streaming_content])
+
+        self.assertEqual(model.calls, 1)
+        self.assertEqual([e["type"] for e in events], ["turn", "delta", "delta", "done"])
+
+
+    async def test_async_turn_is_framed_as_server_sent_events(self):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=2, chunk_text='say "hi"\n')
+        with mock.patch.object(views, "gemini_model", return_value=model):
+            request = self.factory.post("/interface_stream_async/", stream_body(), content_type="application/json")
+            response = await views.interface_stream_async(request)
+            parts = [part.decode() async for part in response.streaming_content]
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(parts[0], ":\n\n")
+        self.assertEqual(parts[-1], ":\n\n")
+        events = parts[1:-1]
+        for number, event in enumerate(events, 1):
+            self.assertTrue(event.endswith("\n\n"))
+            event_id, data = event[:-2].split("\n")
+            self.assertEqual(event_id, f"id: {number}")
+            self.assertTrue(data.startswith("data: "))
+        self.assertEqual(events[1], "id: 2\n" + sse.sse_delta('say "hi"\n'))
+        self.assertEqual(sse_payloads(events[1:3]), [{"type": "delta", "text": 'say "hi"\n'}] * 2)
+        self.assertEqual(sse_payloads(events[-1:]), [{"type": "done"}])
+
+    async def test_async_tool_loop_stops_after_max_rounds(self):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=1,
+                                    tool_call=True, tool_rounds=50)
+        with mock.patch.object(views, "gemini_model", return_value=model), \
+                mock.patch.object(views, "MAX_TOOL_ROUNDS", 2), \
+                mock.patch.object(views, "get_tool_cache", PassThroughToolCache):
+            request = self.factory.post("/interface_stream_async/", stream_body(), content_type="application/json")
+            response = await views.interface_stream_async(request)
+            events = sse_payloads([part async for part in response.streaming_content])
+
+        self.assertEqual(model.calls, 3)
+        self.assertEqual(model.requests[-1][1], {"tool_config": views.NO_MORE_TOOLS})
+        self.assertEqual([e["round"] for e in events if e["type"] == "tool_end"], [1, 2])
+
+class ToolCacheTests(TestCase):
+    def test_entries_expire_after_their_ttl(self):
+        fresh = tool_cache.LocMemBackend(ttl=60)
+        fresh.set("k", "v")
+        self.assertEqual(fresh.get("k"), "v")
+
+        expired = tool_cache.LocMemBackend(ttl=0)
+        expired.set("k", "v")
+        self.assertIs(expired.get("k"), tool_cache.MISSING)
+        self.assertEqual(len(expired), 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        backend = tool_cache.LocMemBackend(ttl=60, max_entries=2)
+        backend.set("a", 1)
+        backend.set("b", 2)
+        backend.get("a")
+        backend.set("c", 3)
+
+        self.assertIs(backend.get("b"), tool_cache.MISSING)
+        self.assertEqual((backend.get("a"), backend.get("c")), (1, 3))
+        self.assertEqual(backend.evictions, 1)
+
+    def test_keys_ignore_case_and_whitespace_in_string_arguments(self):
+        key = tool_cache.make_key("internet_search", {"query": "Weather  in\tParis "})
+        self.assertEqual(key, tool_cache.make_key("internet_search", {"query": "weather in paris"}))
+        self.assertNotEqual(key, tool_cache.make_key("fetch_pages", {"query": "weather in paris"}))
+        self.assertNotEqual(
+            tool_cache.make_key("t", {"n": 1}), tool_cache.make_key("t", {"n": "1"}),
+        )
+        self.assertNotIn(" ", key)
+
+    def test_concurrent_misses_share_one_call(self):
+        cache = tool_cache.ToolResultCache(tool_cache.LocMemBackend(ttl=60))
+        release = threading.Event()
+        calls = []
+
+        def search():
+            calls.append(1)
+            release.wait(5)
+            return {"results": ["r"]}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.call("internet_search", {"query": "q"}, search)))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while cache.coalesced < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"results": ["r"]}] * 4)
+        self.assertEqual((cache.misses, cache.hits, cache.coalesced), (1, 3, 3))
+
+    def test_errors_are_not_cached(self):
+        cache = tool_cache.ToolResultCache(tool_cache.LocMemBackend(ttl=60))
+        failing = mock.Mock(return_value={"error": "rate limited"})
+        cache.call("internet_search", {"query": "q"}, failing)
+        cache.call("internet_search", {"query": "q"}, failing)
+        self.assertEqual(failing.call_count, 2)
+
+    @override_settings(CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "default"},
+        "tools": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tool-cache-tests"},
+    })
+    def test_django_cache_backend_shares_entries_and_locks(self):
+        cache = tool_cache.build_tool_cache({"BACKEND": "chat.tool_cache.DjangoCacheBackend", "ALIAS": "tools", "TTL": 60})
+        other_worker = tool_cache.build_tool_cache({"BACKEND": "chat.tool_cache.DjangoCacheBackend", "ALIAS": "tools"})
+        search = mock.Mock(return_value={"results": ["r"]})
+
+        self.assertEqual(cache.call("internet_search", {"query": "q"}, search), {"results": ["r"]})
+        self.assertEqual(other_worker.call("internet_search", {"query": " Q"}, search), {"results": ["r"]})
+        self.assertEqual(search.call_count, 1)
+
+        backend = cache.backend
+        self.assertIs(backend.get("absent"), tool_cache.MISSING)
+        self.assertTrue(backend.acquire("k", 10))
+        self.assertFalse(other_worker.backend.acquire("k", 10))
+        backend.release("k")
+        self.assertTrue(other_worker.backend.acquire("k", 10))
+
+    def test_stats_count_hits_misses_and_evictions(self):
+        cache = tool_cache.ToolResultCache(tool_cache.LocMemBackend(ttl=60, max_entries=1))
+        cache.call("t", {"q": "a"}, lambda: "A")
+        cache.call("t", {"q": "a"}, lambda: "A")
+        cache.call("t", {"q": "b"}, lambda: "B")
+
+        self.assertEqual(cache.stats(), {
+            "backend": "LocMemBackend", "hits": 1, "misses": 2, "evictions": 1, "coalesced": 0, "size": 1,
+        })
+
+
+@override_settings(SEARCH_ENRICHMENT={"ENABLED": False})
+class InternetSearchTests(TestCase):
+    def search(self, results_for):
+        client = mock.Mock()
+        client.search.side_effect = lambda query, search_depth: results_for(query)
+        with mock.patch.object(tools, "tavily_client", return_value=client):
+            return tools.internet_search("rivers", tavily_api_key="test"), client
+
+    def test_results_from_the_sub_queries_are_merged_without_duplicate_urls(self):
+        output, client = self.search(lambda query: {"results": [{"url": "https://a"}, {"url": "https://b"}]})
+
+        self.assertEqual(client.search.call_count, 4)
+        self.assertEqual(sorted(result["url"] for result in output["results"]), ["https://a", "https://b"])
+
+    def test_collection_stops_once_there_are_more_than_enough_results(self):
+        output, _ = self.search(lambda query: {"results": [{"url": f"https://{query}/{i}"} for i in range(3)]})
+
+        # Two sub-queries' worth: more than SEARCH_MIN_RESULTS, so the rest are ignored.
+        self.assertEqual(len(output["results"]), 6)
+
+    def test_slow_sub_queries_are_abandoned_after_the_timeout(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def results_for(query):
+            if query != "rivers":
+                release.wait(5)
+            return {"results": [{"url": f"https://{query}"}]}
+
+        with mock.patch.object(tools, "SEARCH_TIMEOUT", 0.2):
+            started = time.perf_counter()
+            output, _ = self.search(results_for)
+
+        self.assertLess(time.perf_counter() - started, 2)
+        self.assertEqual(output, {"results": [{"url": "https://rivers"}]})
+
+    def test_one_failing_sub_query_does_not_sink_the_search(self):
+        def results_for(query):
+            if query == "rivers overview":
+                raise ConnectionError("reset")
+            return {"results": [{"url": f"https://{query}"}]}
+
+        output, _ = self.search(results_for)
+
+        self.assertEqual(len(output["results"]), 3)
+
+    def test_search_fails_only_when_every_sub_query_does(self):
+        def results_for(query):
+            raise ConnectionError("reset")
+
+        output, _ = self.search(results_for)
+
+        self.assertIn("reset", output["error"])
+
+
+class HistoryPaginationTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        now = timezone.now()
+        # Rows share timestamps in pairs so the id tie-break is exercised.
+        for index in range(7):
+            Chat.objects.create(
+                prompt=f"p{index}", result="r", conversation_name="c",
+                date_time=now - timedelta(minutes=index // 2)
+            )
+
+    def get(self, **params):
+        response = views.paginated_history(self.factory.get("/history/", params))
+        return response.status_code, json.loads(response.content)
+
+    def test_cursor_pages_cover_every_row_once_in_order(self):
+        seen = []
+        cursor = ""
+        while True:
+            status, body = self.get(cursor=cursor, limit=3)
+            self.assertEqual(status, 200)
+            seen.extend(row["id"] for row in body["results"])
+            if not body["has_next"]:
+                break
+            cursor = body["next_cursor"]
+
+        expected = list(Chat.objects.order_by('-date_time', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_limit_is_capped_and_total_is_optional(self):
+        status, body = self.get(cursor="", limit=10_000, include_total=1)
+        self.assertEqual(status, 200)
+        self.assertEqual(len(body["results"]), 7)
+        self.assertEqual(body["approx_total"], 7)
+        self.assertLessEqual(page_size(10_000), MAX_PAGE_SIZE)
+
+    def test_bad_cursor_is_rejected(self):
+        status, _ = self.get(cursor="not-a-cursor")
+        self.assertEqual(status, 400)
+
+    def test_page_number_api_still_works(self):
+        status, body = self.get(page=2, limit=5)
+        self.assertEqual(status, 200)
+        self.assertEqual((body["total_items"], body["current_page"], len(body["results"])), (7, 2, 2))
+
+
+class ConversationSummaryTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_saved_turns_update_the_summary(self):
+        views.save_turn("first question", "a", "conv-1")
+        views.save_turn("second question", "b", "conv-1")
+        views.save_turn("other", "c", "conv-2")
+
+        conversation = Conversation.objects.get(name="conv-1")
+        self.assertEqual((conversation.title, conversation.message_count), ("first question", 2))
+        self.assertEqual(
+            conversation.last_message_time,
+            Chat.objects.filter(conversation_name="conv-1").latest('date_time').date_time
+        )
+
+        response = views.interface_fetch(self.factory.get("/interface_fetch/"))
+        self.assertEqual([row["prompt"] for row in json.loads(response_body(response))["result"]], ["other"])
+
+    def test_backfill_matches_incremental_summary(self):
+        now = timezone.now()
+        for index in range(5):
+            Chat.objects.create(prompt=f"q{index}", result="r", conversation_name=f"c{index % 2}",
+                                date_time=now + timedelta(seconds=index))
+
+        call_command("backfill_conversations", batch_size=1, stdout=StringIO())
+        call_command("backfill_conversations", stdout=StringIO())
+
+        summaries = {c.name: (c.title, c.message_count) for c in Conversation.objects.all()}
+        self.assertEqual(summaries, {"c0": ("q0", 3), "c1": ("q1", 2)})
+
+        response = views.conversation_list(self.factory.get("/conversations/", {"cursor": "", "limit": 1}))
+        body = json.loads(response.content)
+        self.assertEqual([row["id"] for row in body["results"]], ["c0"])
+        self.assertTrue(body["has_next"])
+
+    def test_unknown_conversation_is_404(self):
+        response = views.conversation_by_name(self.factory.get("/conversation/nope/"), "nope")
+        self.assertEqual(response.status_code, 404)
+
+
+class ProjectionTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        image = Blob.objects.create(digest="ab" * 32, content_type="image/png", size=3)
+        self.chat = Chat.objects.create(prompt="q", result="x" * 5000, conversation_name="c",
+                                        generated_image=image)
+
+    def get_json(self, view_function, path, *args, **params):
+        response = view_function(self.factory.get(path, params), *args)
+        return response.status_code, json.loads(response_body(response))
+
+    def test_summary_view_returns_truncated_preview_only(self):
+        status, body = self.get_json(views.paginated_history, "/history/", view="summary")
+        self.assertEqual(status, 200)
+        row = body["results"][0]
+        self.assertNotIn("result", row)
+        self.assertEqual(row["preview"], "x" * PREVIEW_LENGTH)
+
+        _, body = self.get_json(views.conversation_by_name, "/conversation/c/", "c", fields="id,preview")
+        self.assertEqual(set(body["messages"][0]), {"id", "preview"})
+
+    def test_default_view_is_unchanged_and_never_includes_images(self):
+        _, body = self.get_json(views.interface_fetch, "/interface_fetch/")
+        row = body["result"][0]
+        self.assertEqual(row["result"], "x" * 5000)
+        self.assertNotIn("generated_image", row)
+
+        status, _ = self.get_json(views.paginated_history, "/history/", fields="generated_image")
+        self.assertEqual(status, 400)
+
+    def test_message_endpoint_serves_full_payload(self):
+        status, body = self.get_json(views.chat_message, "/message/", self.chat.id)
+        self.assertEqual(status, 200)
+        self.assertEqual(body["result"], "x" * 5000)
+        self.assertEqual(body["generated_image"], f"/blob/{'ab' * 32}/")
+
+
+class BlobStoreTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        patcher = mock.patch.object(blobstore, "_blob_store", blobstore.FileSystemBlobStore(self.tempdir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.data = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+    def test_identical_bytes_are_stored_once(self):
+        first = blobstore.save_blob(self.data, "image/png")
+        second = blobstore.save_blob(self.data, "image/png")
+        self.assertEqual(first.digest, second.digest)
+        self.assertEqual(Blob.objects.count(), 1)
+        files = [name for _, _, names in os.walk(self.tempdir.name) for name in names]
+        self.assertEqual(files, [first.digest])
+
+    def test_blob_view_supports_etag_and_ranges(self):
+        digest = blobstore.save_blob(self.data, "image/png").digest
+
+        response = views.blob(self.factory.get("/blob/"), digest)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.data)
+        self.assertEqual(response["ETag"], f'"{digest}"')
+        response.close()
+
+        response = views.blob(self.factory.get("/blob/", HTTP_IF_NONE_MATCH=f'"{digest}"'), digest)
+        self.assertEqual(response.status_code, 304)
+
+        response = views.blob(self.factory.get("/blob/", HTTP_RANGE="bytes=8-15"), digest)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, self.data[8:16])
+        self.assertEqual(response["Content-Range"], f"bytes 8-15/{len(self.data)}")
+
+        response = views.blob(self.factory.get("/blob/", HTTP_RANGE="bytes=-4"), digest)
+        self.assertEqual(response.content, self.data[-4:])
+
+        response = views.blob(self.factory.get("/blob/", HTTP_RANGE=f"bytes={len(self.data)}-"), digest)
+        self.assertEqual(response.status_code, 416)
+
+    def test_only_raster_images_are_served_inline(self):
+        png = blobstore.save_blob(self.data, "image/png").digest
+        svg = blobstore.save_blob(b'<svg xmlns="http://www.w3.org/2000/svg"><script/></svg>', "image/svg+xml").digest
+
+        response = views.blob(self.factory.get("/blob/"), png)
+        self.assertEqual(response["X-Content-Type-Options"], "nosniff")
+        self.assertFalse(response.get("Content-Disposition", "").startswith("attachment"))
+        response.close()
+
+        for request in (self.factory.get("/blob/"), self.factory.get("/blob/", HTTP_RANGE="bytes=0-3")):
+            response = views.blob(request, svg)
+            self.assertEqual(response["X-Content-Type-Options"], "nosniff")
+            self.assertEqual(response["Content-Disposition"], f'attachment; filename="{svg}"')
+            response.close()
+
+    def test_inline_images_decode_with_their_content_type(self):
+        migration = importlib.import_module("chat.migrations.0006_move_generated_images_to_blobs")
+        inline = base64.b64encode(self.data).decode()
+
+        self.assertEqual(migration.decode_inline_image(f"data:image/webp;base64,{inline}"), (self.data, "image/webp"))
+        self.assertEqual(migration.decode_inline_image(inline), (self.data, "image/png"))
+
+
+
+class InlineImageMigrationTests(TransactionTestCase):
+    before = [("chat", "0005_blob_chat_generated_image")]
+    after = [("chat", "0006_move_generated_images_to_blobs")]
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        patcher = mock.patch.object(blobstore, "_blob_store", blobstore.FileSystemBlobStore(self.tempdir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_rows_that_do_not_decode_are_left_inline(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        OldChat = executor.loader.project_state(self.before).apps.get_model("chat", "Chat")
+        png = b"\x89PNG\r\n\x1a\n" + b"pixels"
+        good = OldChat.objects.create(prompt="a", conversation_name="c",
+                                      generated_image_b64=base64.b64encode(png).decode())
+        bad = OldChat.objects.create(prompt="b", conversation_name="c", generated_image_b64="not base64!")
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        with self.assertLogs("chat.migrations.0006_move_generated_images_to_blobs", "WARNING"):
+            executor.migrate(self.after)
+
+        OldChat = executor.loader.project_state(self.after).apps.get_model("chat", "Chat")
+        good, bad = OldChat.objects.get(pk=good.pk), OldChat.objects.get(pk=bad.pk)
+        self.assertEqual((good.generated_image_id, good.generated_image_b64), (blobstore.blob_digest(png), None))
+        self.assertEqual((bad.generated_image_id, bad.generated_image_b64), (None, "not base64!"))
+
+class ImageHandleTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        for patcher in (
+            mock.patch.object(blobstore, "_blob_store", blobstore.FileSystemBlobStore(self.tempdir.name)),
+            mock.patch.object(media_cache, "image_bytes_cache", media_cache.ImageBytesCache()),
+            mock.patch.object(media_cache, "gemini_file_cache", media_cache.GeminiFileCache()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def upload(self, data, content_type="image/png"):
+        request = self.factory.post("/upload/", data, content_type=content_type)
+        response = views.upload_image(request)
+        self.assertEqual(response.status_code, 201)
+        return json.loads(response.content)["handle"]
+
+    def history_with(self, handle):
+        return [{"role": "user", "content": [
+            {"type": "text", "text": "what is this?"},
+            {"type": "image_ref", "handle": handle},
+        ]}]
+
+    def test_uploaded_image_is_sent_inline_and_cached(self):
+        data = b"\x89PNG\r\n\x1a\n" + b"pixels" * 10
+        handle = self.upload(data)
+
+        for _ in range(3):
+            parts = views.convert_to_gemini_history(self.history_with(handle), "key")[0]["parts"]
+        self.assertEqual(parts[1], {"inline_data": {"mime_type": "image/png", "data": data}})
+        self.assertEqual((media_cache.image_bytes_cache.misses, media_cache.image_bytes_cache.hits), (1, 2))
+        self.assertEqual(views.extract_prompt_summary(self.history_with(handle)), "what is this? [Includes: image]")
+
+    def test_large_images_are_uploaded_to_gemini_once_per_key(self):
+        data = b"\xff\xd8\xff" + b"\0" * media_cache.GEMINI_FILE_THRESHOLD
+        handle = self.upload(data, "application/octet-stream")
+        uploaded = mock.Mock(uri="https://files.example/abc")
+
+        file_client = mock.Mock()
+        file_client.create_file.return_value = uploaded
+        with mock.patch.object(media_cache, "gemini_client", return_value=file_client) as gemini_client:
+            for _ in range(2):
+                parts = views.convert_to_gemini_history(self.history_with(handle), "key")[0]["parts"]
+            views.convert_to_gemini_history(self.history_with(handle), "other key")
+
+        self.assertEqual(parts[1], {"file_data": {"mime_type": "image/jpeg", "file_uri": uploaded.uri}})
+        self.assertEqual(file_client.create_file.call_count, 2)
+        self.assertEqual([call.args for call in gemini_client.call_args_list], [("key", "file"), ("other key", "file")])
+
+    def test_unknown_handles_and_non_images_are_rejected(self):
+        with self.assertRaises(media_cache.UnknownHandle):
+            views.convert_to_gemini_history(self.history_with("0" * 64))
+
+        response = views.upload_image(self.factory.post("/upload/", b"hello", content_type="text/plain"))
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_whitelisted_raster_types_can_be_uploaded(self):
+        heic = b"\0\0\0\x18ftypheic" + b"\0" * 32
+        self.assertEqual(blobstore.sniff_content_type(heic), "image/heic")
+        self.assertEqual(blobstore.sniff_content_type(b"\0\0\0\x18ftypmif1" + b"\0" * 32), "image/heif")
+        self.upload(heic, "image/heic")
+
+        svg = b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>'
+        for data, content_type in ((svg, "image/svg+xml"), (svg, "image/png"), (b"GIF89a" + b"\0" * 16, "image/gif")):
+            response = views.upload_image(self.factory.post("/upload/", data, content_type=content_type))
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Blob.objects.count(), 1)
+
+
+@SAVE_INLINE
+class ServerContextTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        context.context_cache.invalidate("ctx")
+        views.save_turn("first", "one", "ctx")
+        views.save_turn("second", "two", "ctx")
+
+    def run_prompt(self, prompt):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=1, chunk_text="three")
+        body = json.dumps({"geminiApiKey": "k", "tavilyApiKey": "k", "conversation_name": "ctx", "prompt": prompt})
+        with mock.patch.object(views, "gemini_model", return_value=model):
+            response = views.interface_stream(self.factory.post("/interface_stream/", body, content_type="application/json"))
+            list(response.streaming_content)
+        return model.requests[0][0]
+
+    def texts(self, contents):
+        return [(content["role"], content["parts"][0]["text"]) for content in contents]
+
+    def test_history_is_rebuilt_from_saved_turns(self):
+        contents = self.run_prompt("third")
+
+        self.assertEqual(self.texts(contents), [
+            ("user", "first"), ("model", "one"), ("user", "second"), ("model", "two"), ("user", "third"),
+        ])
+        self.assertEqual(Chat.objects.filter(conversation_name="ctx").count(), 3)
+
+    def test_cached_history_is_reused_until_a_turn_is_saved(self):
+        context.load_history("ctx")
+        hits = context.context_cache.hits
+        context.load_history("ctx")
+        self.assertEqual(context.context_cache.hits, hits + 1)
+
+        views.save_turn("third", "three", "ctx")
+        self.assertEqual(len(context.load_history("ctx")), 6)
+
+    def test_finalizing_a_checkpointed_turn_makes_cached_history_stale(self):
+        checkpoint = persistence.Checkpointer("third", "ctx")
+        checkpoint.save("thr")
+        self.assertEqual(self.texts(context.load_history("ctx"))[-1], ("model", "thr"))
+
+        # Another worker's cache isn't dropped by this one's write; the revision has to do it.
+        with mock.patch.object(context.context_cache, "invalidate"):
+            persistence.write_turns([persistence.Turn("third", "three", "ctx", timezone.now(),
+                                                      chat_id=checkpoint.chat_id)])
+        self.assertEqual(self.texts(context.load_history("ctx"))[-1], ("model", "three"))
+
+    def test_old_turns_are_summarized_past_the_budget(self):
+        views.save_turn("x" * 400, "y" * 400, "ctx")
+        with self.settings(CONTEXT={"TOKEN_BUDGET": 150}), \
+                mock.patch.object(context, "summarize", return_value="they said first and second") as summarize, \
+                mock.patch.object(context.summarizer, "schedule", side_effect=context.summarizer.run) as schedule:
+            # The turn that crosses the budget goes out whole; the summary is for the next one.
+            crossing = context.load_history("ctx", "key")
+            contents = context.load_history("ctx", "key")
+            context.load_history("ctx", "key")
+
+        schedule.assert_called_once()
+        summarize.assert_called_once()
+        self.assertEqual(len(crossing), 6)
+        self.assertEqual([turn[1] for turn in summarize.call_args.args[1]], ["first", "second"])
+        self.assertIn("they said first and second", contents[0]["parts"][0]["text"])
+        self.assertEqual(self.texts(contents)[2:], [("user", "x" * 400), ("model", "y" * 400)])
+        self.assertEqual(Conversation.objects.get(name="ctx").summary, "they said first and second")
+
+    def test_old_turns_are_dropped_without_a_key_to_summarize_with(self):
+        views.save_turn("x" * 400, "y" * 400, "ctx")
+        with self.settings(CONTEXT={"TOKEN_BUDGET": 150}), \
+                mock.patch.object(context.summarizer, "schedule") as schedule:
+            contents = context.load_history("ctx")
+
+        schedule.assert_not_called()
+        self.assertEqual(self.texts(contents), [("user", "x" * 400), ("model", "y" * 400)])
+
+    def test_summaries_time_out(self):
+        model = mock.Mock()
+        model.generate_content.return_value.text = "short"
+        with self.settings(CONTEXT={"SUMMARY_TIMEOUT": 7}), \
+                mock.patch.object(context, "gemini_model", return_value=model):
+            self.assertEqual(context.summarize("", [(1, "a", "b")], "key"), "short")
+        self.assertEqual(model.generate_content.call_args.kwargs["request_options"], {"timeout": 7})
+
+
+class ClientPoolTests(TestCase):
+    def test_pool_reuses_entries_and_evicts_least_recently_used(self):
+        pool = clients.KeyedPool(max_size=2, idle_timeout=60)
+        first = pool.get("a", object)
+        self.assertIs(pool.get("a", object), first)
+        pool.get("b", object)
+        pool.get("a", object)
+        pool.get("c", object)
+
+        self.assertIsNot(pool.get("b", object), first)
+        self.assertIs(pool.get("c", object), pool.get("c", object))
+        self.assertEqual(pool.stats()["evictions"], 2)
+
+    def test_idle_entries_are_rebuilt(self):
+        pool = clients.KeyedPool(max_size=10, idle_timeout=60)
+        with mock.patch.object(clients.time, "monotonic", return_value=1000):
+            first = pool.get("a", object)
+        with mock.patch.object(clients.time, "monotonic", return_value=1030):
+            self.assertIs(pool.get("a", object), first)
+        with mock.patch.object(clients.time, "monotonic", return_value=1100):
+            self.assertIsNot(pool.get("a", object), first)
+
+    def test_models_are_pooled_per_key_without_global_configuration(self):
+        with mock.patch.object(clients.genai, "configure") as configure:
+            model = clients.gemini_model("key one", "gemini-test")
+            same = clients.gemini_model("key one", "gemini-test")
+            other = clients.gemini_model("key two", "gemini-test")
+
+        configure.assert_not_called()
+        self.assertIs(model, same)
+        self.assertIsNot(model._client, other._client)
+        self.assertEqual(model._client._client_options.api_key, "key one")
+
+    def test_tavily_clients_share_a_session_per_key(self):
+        client = clients.tavily_client("tavily key")
+        self.assertIs(clients.tavily_client("tavily key"), client)
+        self.assertIsNot(clients.tavily_client("another key").session, client.session)
+
+
+    def test_async_models_are_pooled_per_event_loop(self):
+        async def fetch():
+            model = clients.gemini_model("key one", "gemini-test", asynchronous=True)
+            self.assertIs(clients.gemini_model("key one", "gemini-test", asynchronous=True), model)
+            return model
+
+        first, second = asyncio.run(fetch()), asyncio.run(fetch())
+
+        self.assertIsNot(first, second)
+        self.assertIsNot(first._async_client, second._async_client)
+
+
+class ClientInternalsTests(TestCase):
+    """
+    clients.py reaches into google.generativeai and tavily internals (versions are
+    pinned in requirements.txt); these fail when an upgrade moves them.
+    """
+
+    def test_gemini_client_manager_is_still_there(self):
+        from google.generativeai import client as genai_client
+
+        for name in ("configure", "make_client", "get_default_client"):
+            self.assertTrue(callable(getattr(genai_client._ClientManager, name, None)), name)
+
+    def test_models_call_their_own_client(self):
+        model = clients.genai.GenerativeModel("gemini-test")
+        model._client = mock.Mock()
+        model._client.generate_content.return_value = clients.genai.protos.GenerateContentResponse()
+
+        model.generate_content("hi")
+
+        model._client.generate_content.assert_called_once()
+
+    def test_async_models_call_their_own_client(self):
+        model = clients.genai.GenerativeModel("gemini-test")
+        model._async_client = mock.Mock()
+        model._async_client.generate_content = mock.AsyncMock(
+            return_value=clients.genai.protos.GenerateContentResponse()
+        )
+
+        asyncio.run(model.generate_content_async("hi"))
+
+        model._async_client.generate_content.assert_awaited_once()
+
+    def test_tavily_searches_go_through_the_pooled_session(self):
+        client = clients.tavily_client("tavily key")
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {"results": [{"url": "https://a"}]}
+        with mock.patch.object(client.session, "post", return_value=response) as post:
+            results = client.search(query="q", search_depth="basic")
+
+        self.assertEqual(results["results"], [{"url": "https://a"}])
+        self.assertEqual(post.call_args.args[0], client.base_url + "/search")
+        self.assertEqual(post.call_args.kwargs["json"]["query"], "q")
+
+class WriteBehindTests(TestCase):
+    def make_queue(self, writer, **kwargs):
+        turn_queue = persistence.WriteBehindQueue(writer=writer, **kwargs)
+        self.addCleanup(turn_queue.drain)
+        return turn_queue
+
+    def test_stream_queues_the_turn_instead_of_writing_it(self):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=1, chunk_text="hi")
+        with mock.patch.object(views, "gemini_model", return_value=model), \
+                mock.patch.object(views.turn_queue, "submit") as submit:
+            request = RequestFactory().post("/interface_stream/", stream_body(), content_type="application/json")
+            events = sse_payloads(list(views.interface_stream(request).streaming_content))
+
+        self.assertEqual(events[-1], {"type": "done"})
+        submit.assert_called_once_with("hello", "hi", "tests", "complete", None, events[0]["stream_id"], None)
+        self.assertFalse(Chat.objects.exists())
+
+    def test_turns_are_written_in_batches(self):
+        batches = []
+        turn_queue = self.make_queue(batches.append, batch_size=3, batch_wait=0.5)
+        for index in range(7):
+            turn_queue.submit(f"q{index}", "a", "conv")
+
+        self.assertTrue(turn_queue.wait_for("conv", timeout=5))
+        self.assertEqual([len(batch) for batch in batches], [3, 3, 1])
+        self.assertEqual([turn[0] for batch in batches for turn in batch], [f"q{index}" for index in range(7)])
+        self.assertEqual(turn_queue.stats()["written"], 7)
+
+    def test_failed_batches_are_retried_then_split(self):
+        attempts = []
+
+        def writer(batch):
+            attempts.append([turn[0] for turn in batch])
+            if any(turn[0] == "bad" for turn in batch):
+                raise RuntimeError("database is down")
+
+        turn_queue = self.make_queue(writer, batch_size=10, batch_wait=0.5, max_retries=2)
+        with mock.patch.object(persistence.time, "sleep"), self.assertLogs(persistence.logger, "WARNING"):
+            turn_queue.submit("good", "a", "conv")
+            turn_queue.submit("bad", "a", "conv")
+            turn_queue.drain()
+
+        self.assertEqual(attempts, [["good", "bad"]] * 3 + [["good"], ["bad"]])
+        self.assertEqual({key: turn_queue.stats()[key] for key in ("written", "failed", "retries")},
+                         {"written": 1, "failed": 1, "retries": 2})
+
+    def test_write_turns_bulk_inserts_and_updates_conversations(self):
+        now = timezone.now()
+        persistence.write_turns([
+            ("first", "a", "conv-a", now),
+            ("second", "b", "conv-a", now + timedelta(seconds=1)),
+            ("other", "c", "conv-b", now),
+        ])
+
+        self.assertEqual(Chat.objects.count(), 3)
+        conversation = Conversation.objects.get(name="conv-a")
+        self.assertEqual((conversation.title, conversation.message_count), ("first", 2))
+        self.assertEqual(conversation.last_message_time, now + timedelta(seconds=1))
+
+
+class FailingModel(FakeGenerativeModel):
+    """Streams `fail_after` chunks and then drops the connection."""
+
+    fail_after = 3
+
+    def _stream(self, contents, kwargs):
+        for index, chunk in enumerate(super()._stream(contents, kwargs)):
+            if index == self.fail_after:
+                raise RuntimeError("upstream reset")
+            yield chunk
+
+
+@SAVE_INLINE
+class PartialTurnTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def run_turn(self, model):
+        with mock.patch.object(views, "gemini_model", return_value=model), \
+                self.settings(PERSISTENCE={"WRITE_BEHIND": False, "CHECKPOINT_CHUNKS": 2}):
+            request = self.factory.post("/interface_stream/", stream_body(), content_type="application/json")
+            return sse_payloads(list(views.interface_stream(request).streaming_content))
+
+    def test_long_turns_are_checkpointed_then_completed(self):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=5, chunk_text="ab")
+        saves = []
+        real_save = persistence.Checkpointer.save
+
+        def save(checkpoint, text):
+            saves.append((text, Chat.objects.filter(status="partial").count()))
+            real_save(checkpoint, text)
+
+        with mock.patch.object(persistence.Checkpointer, "save", save):
+            events = self.run_turn(model)
+
+        self.assertEqual([text for text, _ in saves], ["abab", "abababab"])
+        chat = Chat.objects.get()
+        self.assertEqual((chat.result, chat.status, chat.stream_id), ("ab" * 5, "complete", events[0]["stream_id"]))
+        self.assertEqual(Conversation.objects.get(name="tests").message_count, 1)
+
+    def test_interrupted_turns_stay_partial(self):
+        events = self.run_turn(FailingModel(first_latency=0, chunk_interval=0, chunk_count=5, chunk_text="ab"))
+
+        self.assertEqual([e["type"] for e in events][-2:], ["error", "done"])
+        chat = Chat.objects.get()
+        self.assertEqual((chat.result, chat.status), ("ababab", "partial"))
+
+    def test_response_buffer_joins_lazily(self):
+        buffer = views.ResponseBuffer()
+        self.assertFalse(buffer)
+        for text in ("a", "bc", "d"):
+            buffer.append(text)
+        self.assertEqual((buffer.text(), len(buffer)), ("abcd", 4))
+        buffer.append("e")
+        self.assertEqual(buffer.text(), "abcde")
+
+
+class ResumeTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_resume_replays_the_live_stream_after_the_last_event(self):
+        live = views.live_streams.create()
+        for text in ("one", "two", "three"):
+            live.publish(views.sse_event({"type": "delta", "text": text}))
+        live.finish()
+
+        request = self.factory.get(f"/resume/{live.stream_id}/", HTTP_LAST_EVENT_ID="0")
+        parts = list(views.resume_stream(request, live.stream_id).streaming_content)
+
+        self.assertEqual([e["text"] for e in sse_payloads(parts)], ["two", "three"])
+        self.assertTrue(parts[0].decode().startswith("id: 1\n"))
+
+    def test_follower_waits_for_events_published_later(self):
+        live = views.live_streams.create()
+        followed = live.follow()
+        live.publish(views.sse_event({"type": "delta", "text": "first"}))
+        self.assertIn("first", next(followed))
+
+        threading.Timer(0.05, lambda: (live.publish(views.sse_event({"type": "done"})), live.finish())).start()
+        self.assertEqual([e["type"] for e in sse_payloads(list(followed))], ["done"])
+
+    def test_other_workers_resume_from_the_checkpointed_row(self):
+        Chat.objects.create(prompt="q", result="so far", conversation_name="c", status="complete", stream_id="f" * 32)
+
+        response = views.resume_stream(self.factory.get("/resume/x/"), "f" * 32)
+        events = sse_payloads(list(response.streaming_content))
+
+        self.assertEqual(events[0]["text"], "so far")
+        self.assertEqual([e["type"] for e in events], ["snapshot", "done"])
+        self.assertEqual(views.resume_stream(self.factory.get("/resume/x/"), "0" * 32).status_code, 404)
+
+    def test_stalled_partial_turns_end_with_an_error(self):
+        Chat.objects.create(prompt="q", result="so far", conversation_name="c", status="partial", stream_id="e" * 32)
+
+        with mock.patch.object(views, "RESUME_STALE_AFTER", 0), mock.patch.object(views.time, "sleep"):
+            response = views.resume_stream(self.factory.get("/resume/x/"), "e" * 32)
+            events = sse_payloads(list(response.streaming_content))
+
+        self.assertEqual([e["type"] for e in events], ["snapshot", "error", "done"])
+
+
+# The default: turns run on the producer pool (sync) or live_loop (async) and the
+# response follows them, so their rows are written from other threads.
+@override_settings(PERSISTENCE={"WRITE_BEHIND": False})
+class DetachedStreamTests(TransactionTestCase):
+    def model(self):
+        return FakeGenerativeModel(first_latency=0, chunk_interval=0.01, chunk_count=3, chunk_text="hi ")
+
+    def test_sync_turn_runs_on_the_pool_and_can_be_resumed(self):
+        with mock.patch.object(views, "gemini_model", return_value=self.model()):
+            request = RequestFactory().post("/interface_stream/", stream_body(), content_type="application/json")
+            parts = list(views.interface_stream(request).streaming_content)
+        events = sse_payloads(parts)
+        self.assertEqual([e["type"] for e in events], ["turn", "delta", "delta", "delta", "done"])
+        self.assertEqual(Chat.objects.get().result, "hi hi hi ")
+
+        stream_id = events[0]["stream_id"]
+        resumed = self.client.get(f"/resume/{stream_id}/", HTTP_LAST_EVENT_ID="2")
+        self.assertEqual([e["type"] for e in sse_payloads(list(resumed.streaming_content))], ["delta", "done"])
+
+    def test_async_turn_completes_under_wsgi(self):
+        # The test client is a WSGI handler: the view's own loop is gone once it returns.
+        with mock.patch.object(views, "gemini_model", return_value=self.model()):
+            response = self.client.post("/interface_stream_async/", stream_body(), content_type="application/json")
+            events = sse_payloads(list(response))
+        self.assertEqual([e["text"] for e in events if e["type"] == "delta"], ["hi "] * 3)
+        self.assertEqual(events[-1], {"type": "done"})
+        self.assertEqual(Chat.objects.get().result, "hi hi hi ")
+
+    def test_full_pool_runs_the_turn_inside_the_response(self):
+        pool = live.ProducerPool(size=1)
+        release = threading.Event()
+        self.assertTrue(pool.submit(release.wait))
+        with mock.patch.object(live, "producers", pool), \
+                mock.patch.object(views, "gemini_model", return_value=self.model()):
+            request = RequestFactory().post("/interface_stream/", stream_body(), content_type="application/json")
+            iterator = views.interface_stream(request).streaming_content
+            self.assertEqual(sse_payloads(list(iterator))[-1], {"type": "done"})
+        release.set()
+
+
+class SSEFramingTests(TestCase):
+    def test_delta_envelope_matches_json_dumps(self):
+        for text in ("hi", 'quote " and \\ slash', "line\nbreak", "naïve → 漢字 😀", ""):
+            self.assertEqual(sse.sse_delta(text), sse.sse_event({"type": "delta", "text": text}))
+
+    def test_consecutive_deltas_are_merged_under_the_cap(self):
+        events = [sse.sse_delta("a"), sse.sse_delta("b"), sse.sse_event({"type": "tool_start"}),
+                  sse.sse_delta("cc"), sse.sse_delta("dd"), sse.sse_delta("e")]
+
+        with self.settings(SSE={"COALESCE_MAX_CHARS": 4}):
+            merged = list(sse.coalesce(events, 10))
+        self.assertEqual([(index, getattr(event, "text", event)) for index, event in merged], [
+            (11, "ab"), (12, events[2]), (14, "ccdd"), (15, "e"),
+        ])
+
+        with self.settings(SSE={"COALESCE": False}):
+            self.assertEqual(len(list(sse.coalesce(events, 0))), 6)
+
+    def test_backlogged_deltas_reach_the_client_as_one_write(self):
+        live = views.live_streams.create()
+        for text in ("a", "b", "c"):
+            live.publish(sse.sse_delta(text))
+        live.publish(sse.sse_event({"type": "done"}))
+        live.finish()
+
+        parts = list(live.follow())
+        self.assertEqual(parts, ["id: 2\n" + sse.sse_delta("abc"), "id: 3\n" + sse.sse_event({"type": "done"})])
+
+    def test_idle_followers_get_heartbeats(self):
+        live = views.live_streams.create()
+        with self.settings(SSE={"KEEPALIVE_INTERVAL": 0.01}):
+            followed = live.follow()
+            self.assertEqual(next(followed), sse.sse_comment())
+            live.publish(sse.sse_delta("late"))
+            live.finish()
+            self.assertEqual([e["text"] for e in sse_payloads(list(followed))], ["late"])
+
+    async def test_idle_async_followers_get_heartbeats(self):
+        live = views.live_streams.create()
+        with self.settings(SSE={"KEEPALIVE_INTERVAL": 0.01}):
+            followed = live.follow_async()
+            self.assertEqual(await followed.__anext__(), sse.sse_comment())
+            live.publish(sse.sse_delta("late"))
+            live.finish()
+            self.assertEqual([e["text"] for e in sse_payloads([part async for part in followed])], ["late"])
+
+
+    def heartbeats_between(self, parts, first, last):
+        """Comments sent after the `first` event type and before the `last` one."""
+        kinds = ["comment" if part == sse.sse_comment() else sse_payloads([part])[0]["type"] for part in parts]
+        start = kinds.index(first)
+        return kinds[start:kinds.index(last, start)].count("comment")
+
+    @SAVE_INLINE
+    def test_inline_turns_send_heartbeats_while_the_model_and_tools_are_slow(self):
+        model = FakeGenerativeModel(first_latency=0.2, chunk_interval=0, chunk_count=1, tool_call=True)
+        tool = mock.Mock(side_effect=lambda **kwargs: time.sleep(0.2) or {"results": ["r"]})
+        with self.settings(SSE={"KEEPALIVE_INTERVAL": 0.02}), \
+                mock.patch.object(views, "gemini_model", return_value=model), \
+                mock.patch.dict(views.AVAILABLE_TOOLS, {"internet_search": tool}), \
+                mock.patch.object(views, "get_tool_cache", PassThroughToolCache):
+            request = RequestFactory().post("/interface_stream/", stream_body(), content_type="application/json")
+            parts = [part.decode() for part in views.interface_stream(request).streaming_content]
+
+        self.assertGreaterEqual(self.heartbeats_between(parts, "turn", "tool_call"), 3)
+        self.assertGreaterEqual(self.heartbeats_between(parts, "tool_start", "tool_end"), 3)
+        self.assertGreaterEqual(self.heartbeats_between(parts, "tool_end", "delta"), 3)
+        self.assertEqual(sse_payloads(parts)[-1], {"type": "done"})
+
+    @SAVE_INLINE
+    async def test_inline_async_turns_send_heartbeats_while_the_model_is_slow(self):
+        model = FakeGenerativeModel(first_latency=0.2, chunk_interval=0, chunk_count=2, chunk_text="hi")
+        with self.settings(SSE={"KEEPALIVE_INTERVAL": 0.02}), \
+                mock.patch.object(views, "gemini_model", return_value=model):
+            request = RequestFactory().post("/interface_stream_async/", stream_body(), content_type="application/json")
+            response = await views.interface_stream_async(request)
+            parts = [part.decode() async for part in response.streaming_content]
+
+        self.assertGreaterEqual(self.heartbeats_between(parts, "turn", "delta"), 3)
+        self.assertEqual([e["text"] for e in sse_payloads(parts) if e["type"] == "delta"], ["hi", "hi"])
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        views.save_turn("How do I bake sourdough bread?", "Feed the starter, then proof the dough overnight.", "baking")
+        views.save_turn("Any tips for pizza dough?", "Use a long cold ferment for the dough.", "baking")
+        views.save_turn("Explain database indexes", "An index trades write cost for faster reads.", "databases")
+
+    def get(self, **params):
+        response = views.search(self.factory.get("/search/", params))
+        return response.status_code, json.loads(response.content)
+
+    def test_results_are_ranked_with_snippets(self):
+        status, body = self.get(q="dough")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["backend"], "sqlite_fts5")
+        self.assertEqual([r["conversation_name"] for r in body["results"]], ["baking", "baking"])
+        # The prompt is weighted above the answer.
+        self.assertEqual(body["results"][0]["prompt"], "Any tips for pizza dough?")
+        self.assertGreater(body["results"][0]["rank"], body["results"][1]["rank"])
+        self.assertIn("<mark>dough</mark>", body["results"][0]["snippet"])
+
+    def test_words_are_stemmed_and_phrases_respected(self):
+        _, body = self.get(q="indexing")
+        self.assertEqual([r["conversation_name"] for r in body["results"]], ["databases"])
+        _, body = self.get(q='"cold ferment"')
+        self.assertEqual(len(body["results"]), 1)
+        _, body = self.get(q='"ferment cold"')
+        self.assertEqual(body["results"], [])
+
+    def test_index_follows_checkpoints_and_final_writes(self):
+        checkpointer = persistence.Checkpointer("Tell me about kombucha", "drinks")
+        checkpointer.save("A fermented tea")
+        self.assertEqual(len(search.search_turns("fermented tea", 10)), 1)
+
+        views.save_turn("Tell me about kombucha", "A fermented tea with a SCOBY culture", "drinks",
+                        chat_id=checkpointer.chat_id)
+        self.assertEqual([r["id"] for r in search.search_turns("scoby", 10)], [checkpointer.chat_id])
+
+        Chat.objects.filter(pk=checkpointer.chat_id).delete()
+        self.assertEqual(search.search_turns("kombucha", 10), [])
+
+    def test_conversation_filter_and_operator_input(self):
+        _, body = self.get(q="dough", conversation="databases")
+        self.assertEqual(body["results"], [])
+        # FTS5 syntax in the query is treated as text, not as an error.
+        status, body = self.get(q='dough OR "unclosed NEAR(')
+        self.assertEqual(status, 200)
+
+    def test_scan_fallback_matches_substrings(self):
+        rows = search.search_turns("Write cost", 10, backend="scan")
+        self.assertEqual([row["conversation_name"] for row in rows], ["databases"])
+        self.assertIn("<mark>write cost</mark>", rows[0]["snippet"])
+
+    def test_snippets_escape_chat_text(self):
+        views.save_turn("<script>alert(1)</script> payload & more", "<img src=x onerror=alert(1)>", "xss")
+        for backend in ("sqlite_fts5", "scan"):
+            [row] = search.search_turns("payload", 10, backend=backend)
+            self.assertNotIn("<script>", row["snippet"])
+            self.assertNotIn("<img", row["snippet"])
+            self.assertIn("&lt;script&gt;", row["snippet"])
+            self.assertIn("<mark>payload</mark> &amp;", row["snippet"])
+
+    def test_empty_query_is_rejected(self):
+        status, _ = self.get(q="  ")
+        self.assertEqual(status, 400)
+
+
+class VectorIndexTests(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.embedder = embeddings.HashingEmbedder(dimensions=64)
+
+    def make_index(self, **kwargs):
+        return vector_index.VectorIndex(self.tempdir.name, 64, embedder=self.embedder.name, **kwargs)
+
+    def test_hashing_embedder_is_deterministic_and_keeps_rewordings_close(self):
+        first, again, reworded, other = embeddings.HashingEmbedder(dimensions=64).embed([
+            "how do I reverse a list in python",
+            "how do I reverse a list in python",
+            "How do I reverse a Python list?",
+            "best hiking trails near the alps",
+        ])
+        self.assertEqual(first.tolist(), again.tolist())
+        self.assertAlmostEqual(float(first @ first), 1.0, places=5)
+        self.assertGreater(first @ reworded, 0.6)
+        self.assertGreater(first @ reworded, first @ other + 0.4)
+
+    def test_rows_persist_and_other_instances_see_new_ones(self):
+        index = self.make_index()
+        vectors = self.embedder.embed(["alpha beta", "gamma delta", "epsilon zeta"])
+        index.add([10, 11], vectors[:2])
+        reopened = self.make_index()
+        self.assertEqual(reopened.search(vectors[1], k=1), [(11, mock.ANY)])
+
+        index.add([12], vectors[2:])
+        self.assertEqual(len(reopened), 3)
+        self.assertEqual(reopened.search(vectors[2], k=1)[0][0], 12)
+
+    def test_approximate_search_after_training_finds_near_duplicates(self):
+        index = self.make_index(train_min=256, nprobe=4)
+        rng = random.Random(7)
+        words = [f"w{n}" for n in range(400)]
+        prompts = [" ".join(rng.choices(words, k=8)) for _ in range(600)]
+        for start in range(0, 600, 100):
+            index.add(range(start, start + 100), self.embedder.embed(prompts[start:start + 100]))
+        self.assertGreater(index.stats()["lists"], 1)
+
+        queries = self.embedder.embed([prompt + " please" for prompt in prompts[:50]])
+        found = sum(index.search(query, k=1)[0][0] == row for row, query in enumerate(queries))
+        self.assertGreaterEqual(found, 45)
+        self.assertEqual(self.make_index().search(queries[0], k=3), index.search(queries[0], k=3))
+
+    def test_vectors_from_another_embedder_are_refused(self):
+        self.make_index().add([1], self.embedder.embed(["hello there"]))
+        with self.assertRaises(vector_index.IncompatibleIndex):
+            vector_index.VectorIndex(self.tempdir.name, 64, embedder="something-else")
+
+
+@SAVE_INLINE
+class SemanticRetrievalTests(TestCase):
+    PROMPT = "how do I reverse a list in python"
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        embedder = embeddings.HashingEmbedder(dimensions=64)
+        for name, value in (("_embedder", embedder),
+                            ("_index", vector_index.VectorIndex(tempdir.name, 64, embedder=embedder.name))):
+            patcher = mock.patch.object(semantic, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_prompt(self, prompt, mode):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=1, chunk_text="fresh answer")
+        body = stream_body(history=[{"role": "user", "content": prompt}])
+        with self.settings(SEMANTIC={"MODE": mode}), mock.patch.object(views, "gemini_model", return_value=model):
+            response = views.interface_stream(self.factory.post("/interface_stream/", body, content_type="application/json"))
+            return model, sse_payloads(list(response.streaming_content))
+
+    def test_a_repeated_question_is_served_without_calling_gemini(self):
+        with self.settings(SEMANTIC={"MODE": "serve"}):
+            earlier = views.save_turn(self.PROMPT, "Use reversed() or list.reverse().", "older")
+
+        model, events = self.run_prompt("How do I reverse a list in Python?", "serve")
+
+        self.assertEqual(model.calls, 0)
+        match = next(e for e in events if e["type"] == "semantic_match")
+        self.assertEqual((match["chat_id"], match["served"]), (earlier.id, True))
+        self.assertEqual([e["text"] for e in events if e["type"] == "delta"], ["Use reversed() or list.reverse()."])
+        self.assertEqual(Chat.objects.filter(conversation_name="tests").get().result, "Use reversed() or list.reverse().")
+
+    def test_a_similar_question_gets_the_earlier_answer_as_context(self):
+        with self.settings(SEMANTIC={"MODE": "context"}):
+            views.save_turn(self.PROMPT, "Use reversed() or list.reverse().", "older")
+
+        model, events = self.run_prompt("how can I reverse a list in python quickly", "context")
+
+        self.assertEqual(model.calls, 1)
+        self.assertFalse(next(e for e in events if e["type"] == "semantic_match")["served"])
+        prompt_parts = model.requests[0][0][-1]["parts"]
+        self.assertIn("Use reversed() or list.reverse().", prompt_parts[-1]["text"])
+        # The new turn is indexed too, with the vector computed for the lookup.
+        self.assertEqual(len(semantic.get_index()), 2)
+
+    def test_unrelated_short_or_disabled_lookups_leave_the_turn_alone(self):
+        with self.settings(SEMANTIC={"MODE": "serve"}):
+            views.save_turn(self.PROMPT, "Use reversed().", "older")
+
+        for prompt, mode in (("what is the capital of peru", "serve"), ("reverse a list", "serve"),
+                             (self.PROMPT, "off")):
+            model, events = self.run_prompt(prompt, mode)
+            self.assertEqual(model.calls, 1)
+            self.assertFalse([e for e in events if e["type"] == "semantic_match"])
+
+    def test_backfill_command_indexes_existing_turns_once(self):
+        views.save_turn(self.PROMPT, "Use reversed().", "older")
+        views.save_turn("what is the capital of peru", "Lima.", "older")
+        with self.settings(SEMANTIC={"MODE": "context"}):
+            call_command("semantic_index", stdout=StringIO())
+            call_command("semantic_index", stdout=StringIO())
+        self.assertEqual(len(semantic.get_index()), 2)
+
+
+class PageFetchTests(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        fixtures = Path(tempdir.name) / "fixtures"
+        fixtures.mkdir()
+        write_fixtures(fixtures, 3)
+        self.server = FixtureServer(fixtures, latency=0.2)
+        self.addCleanup(self.server.httpd.shutdown)
+        self.urls = [self.server.url + path for path in self.server.pages]
+        self.page_fetch = {"LOCATION": Path(tempdir.name) / "cache", "ALLOW_PRIVATE_HOSTS": True}
+        patcher = mock.patch.object(pages, "_cache", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_both_parsers_keep_only_the_article_text(self):
+        body, _ = next(iter(self.server.pages.values()))
+        html = body.decode()
+        title, text = pages.extract_text(html, parser="lxml")
+        self.assertEqual(pages.extract_text(html, parser="html.parser"), (title, text))
+        self.assertTrue(title.endswith(" - Wikipedia"))
+        self.assertTrue(text.startswith(f"\n\n--- H1: {title[:-len(' - Wikipedia')]} ---"))
+        self.assertIn("--- H2:", text)
+        for noise in ("RLCONF", "last edited", "[1", ".x{"):
+            self.assertNotIn(noise, text)
+        self.assertLess(len(text), pages.DEFAULT_MAX_CHARS + 2000)
+
+    def test_pages_are_fetched_together_and_revalidated_from_the_disk_cache(self):
+        with self.settings(PAGE_FETCH=self.page_fetch):
+            started = time.perf_counter()
+            first = tools.call_tool("fetch_pages", {"urls": self.urls})["pages"]
+            self.assertLess(time.perf_counter() - started, 0.5)
+            second = pages.fetch_pages(self.urls)["pages"]
+
+        self.assertEqual([page["source"] for page in first], ["network"] * 3)
+        self.assertEqual([page["source"] for page in second], ["revalidated"] * 3)
+        self.assertEqual(self.server.not_modified, 3)
+        self.assertEqual([page["content"] for page in first], [page["content"] for page in second])
+        self.assertTrue(all(len(page["content"]) <= pages.DEFAULT_MAX_CHARS for page in first))
+
+    def test_limits_and_urls_that_are_not_fetched(self):
+        with self.settings(PAGE_FETCH={**self.page_fetch, "MAX_URLS": 2}):
+            short = pages.fetch_page(self.urls[0], max_chars=200)
+            self.assertLessEqual(len(short["content"]), 200)
+            self.assertTrue(short["truncated"])
+            result = pages.fetch_pages(self.urls + ["file:///etc/passwd"])["pages"]
+            self.assertIn("at most 2", result[2]["error"])
+            self.assertIn("http and https", pages.fetch_page("file:///etc/passwd")["error"])
+        with self.settings(PAGE_FETCH={**self.page_fetch, "ALLOW_PRIVATE_HOSTS": False}):
+            self.assertIn("not a public address", pages.fetch_page(self.urls[0])["error"])
+        self.assertEqual(self.server.requests, 3)
+
+        declaration = next(
+            d for d in tools.available_tools().function_declarations if d.name == "fetch_pages"
+        )
+        self.assertEqual(list(declaration.parameters.required), ["urls"])
+
+
+    def test_connections_go_to_the_address_that_was_checked(self):
+        port = urlsplit(self.server.url).port
+        path = next(iter(self.server.pages))
+        resolve = socket.getaddrinfo
+        lookups = []
+
+        def rebinding(host, *args, **kwargs):
+            if host != "rebind.test":
+                return resolve(host, *args, **kwargs)
+            lookups.append(host)
+            # Public (as far as the check knows) the first time, gone afterwards.
+            if len(lookups) > 1:
+                raise socket.gaierror("rebound")
+            return resolve("127.0.0.1", *args, **kwargs)
+
+        with self.settings(PAGE_FETCH={**self.page_fetch, "ALLOW_PRIVATE_HOSTS": False}), \
+                mock.patch.object(socket, "getaddrinfo", rebinding), \
+                mock.patch.object(pages, "is_public_address", return_value=True):
+            page = pages.fetch_page(f"http://rebind.test:{port}{path}")
+
+        self.assertEqual(page["source"], "network")
+        self.assertEqual(page["final_url"], f"http://rebind.test:{port}{path}")
+        self.assertEqual(lookups, ["rebind.test"])
+
+    def test_pinned_https_requests_verify_the_host_name(self):
+        url, host = pages.pinned("https://user@example.com:8443/a?b=1", "2001:db8::1")
+        self.assertEqual((url, host), ("https://[2001:db8::1]:8443/a?b=1", "example.com:8443"))
+
+        request = requests.Request("GET", "https://93.184.216.34/wiki/x", headers={"Host": "example.com"}).prepare()
+        host_params, pool_kwargs = pages.PinnedAddressAdapter().build_connection_pool_key_attributes(request, True)
+        self.assertEqual(host_params["host"], "93.184.216.34")
+        self.assertEqual((pool_kwargs["server_hostname"], pool_kwargs["assert_hostname"]), ("example.com", "example.com"))
+
+class SearchEnrichmentTests(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        fixtures = Path(tempdir.name) / "fixtures"
+        fixtures.mkdir()
+        rng = random.Random(5)
+        self.cases, others = build_corpus(fixtures, 2, 8, rng)
+        self.server = FixtureServer(fixtures, latency=0)
+        self.addCleanup(self.server.httpd.shutdown)
+        client = CorpusTavilyClient(self.server.url, self.cases, others, rng, latency=0, results_per_call=5)
+        patcher = mock.patch.object(tools, "tavily_client", lambda api_key: client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(pages, "_cache", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.settings_patch = self.settings(
+            PAGE_FETCH={"LOCATION": Path(tempdir.name) / "cache", "ALLOW_PRIVATE_HOSTS": True},
+            SEARCH_ENRICHMENT={"ENABLED": True, "BYTE_BUDGET": 3000},
+        )
+        self.settings_patch.enable()
+        self.addCleanup(self.settings_patch.disable)
+
+    def test_passages_are_cut_by_section_and_ranked_by_the_query(self):
+        text = ("\n\n--- H1: Rivers --- The Nile is long. It flows north. "
+                "\n\n--- H2: Dams --- The Aswan dam on the Nile was finished in 1970. Dams store water.")
+        chunks = enrichment.passages(text, 60)
+        self.assertEqual(chunks[0], "Rivers: The Nile is long. It flows north.")
+        self.assertEqual(len(chunks), 3)
+        scores = enrichment.bm25("when was the aswan dam finished", chunks)
+        self.assertIn("1970", chunks[scores.index(max(scores))])
+
+    def test_search_results_are_trimmed_and_carry_the_answering_passage(self):
+        query, year, relevant = self.cases[0]
+        results = tools.internet_search(query, tavily_api_key="test")["results"]
+
+        self.assertEqual([result["url"] for result in results], [self.server.url + path for path, _ in relevant])
+        self.assertTrue(any(year in passage for passage in results[0]["passages"]))
+        self.assertLessEqual(enrichment.json_size(results), 3000)
+        self.assertEqual(set(results[0]), {"title", "url", "content", "passages"})
+
+    def test_pages_that_miss_the_deadline_keep_their_snippets(self):
+        self.server.latency = 1.0
+        with self.settings(SEARCH_ENRICHMENT={"ENABLED": True, "FETCH_DEADLINE": 0.2}):
+            started = time.perf_counter()
+            results = tools.internet_search(self.cases[1][0], tavily_api_key="test")["results"]
+        self.assertLess(time.perf_counter() - started, 1.5)
+        self.assertTrue(results)
+        self.assertFalse(any("passages" in result for result in results))
+
+
+@SAVE_INLINE
+class MetricsTests(TestCase):
+    def test_histograms_render_cumulative_buckets_with_escaped_labels(self):
+        histogram = metrics.Histogram("test_seconds", "Test.", ["stage"], buckets=(0.1, 1.0))
+        self.addCleanup(metrics.REGISTRY.remove, histogram)
+        for seconds in (0.05, 0.5, 0.5, 5):
+            histogram.observe(seconds, stage='say "hi"')
+
+        lines = histogram.render().splitlines()
+        self.assertEqual(lines[2:], [
+            'test_seconds_bucket{stage="say \\"hi\\"",le="0.1"} 1',
+            'test_seconds_bucket{stage="say \\"hi\\"",le="1.0"} 3',
+            'test_seconds_bucket{stage="say \\"hi\\"",le="+Inf"} 4',
+            'test_seconds_sum{stage="say \\"hi\\""} 6.05',
+            'test_seconds_count{stage="say \\"hi\\""} 4',
+        ])
+
+    def test_a_tool_turn_reports_its_stages(self):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=2, tool_call=True)
+        tool = mock.Mock(return_value={"results": ["r"]})
+        tools_before = metrics.TOOL_SECONDS.count(tool="internet_search", outcome="ok")
+        streams_before = metrics.STREAM_SECONDS.count(outcome="complete")
+        with mock.patch.object(views, "gemini_model", return_value=model), \
+                mock.patch.dict(views.AVAILABLE_TOOLS, {"internet_search": tool}), \
+                mock.patch.object(views, "get_tool_cache", PassThroughToolCache):
+            request = RequestFactory().post("/interface_stream/", stream_body(timings=True), content_type="application/json")
+            events = sse_payloads(list(views.interface_stream(request).streaming_content))
+
+        timing = events[-2]
+        self.assertEqual(timing["type"], "timing")
+        self.assertEqual(events[-1], {"type": "done"})
+        for stage in ("parse", "semantic_lookup", "context", "model_first_chunk", "model_stream", "tools", "save"):
+            self.assertIn(stage, timing["stages_ms"])
+        self.assertLessEqual(timing["first_delta_ms"], timing["total_ms"])
+        self.assertEqual(metrics.TOOL_SECONDS.count(tool="internet_search", outcome="ok"), tools_before + 1)
+        self.assertEqual(metrics.STREAM_SECONDS.count(outcome="complete"), streams_before + 1)
+
+        request = RequestFactory().post("/interface_stream/", stream_body(), content_type="application/json")
+        with mock.patch.object(views, "gemini_model", return_value=FakeGenerativeModel(first_latency=0, chunk_interval=0)):
+            events = sse_payloads(list(views.interface_stream(request).streaming_content))
+        self.assertNotIn("timing", [event["type"] for event in events])
+
+    def test_middleware_times_requests_by_route_and_metrics_are_served(self):
+        before = metrics.HTTP_SECONDS.count(route="history/", method="GET", status="200")
+        self.client.get("/history/")
+        self.assertEqual(metrics.HTTP_SECONDS.count(route="history/", method="GET", status="200"), before + 1)
+
+        with self.settings(METRICS={"TOKEN": "secret"}):
+            response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn('juno_http_request_duration_seconds_count{route="history/",method="GET",status="200"}',
+                      response.content.decode())
+
+
+    def test_metrics_and_stats_need_the_token_or_staff(self):
+        from django.contrib.auth.models import User
+
+        paths = ["/metrics", "/tool_cache/stats/", "/persistence/stats/", "/admission/stats/", "/semantic/stats/"]
+        for path in paths:
+            self.assertEqual(self.client.get(path).status_code, 403, path)
+            with self.settings(METRICS={"TOKEN": "secret"}):
+                self.assertEqual(self.client.get(path).status_code, 401, path)
+                self.assertEqual(self.client.get(path, HTTP_AUTHORIZATION="Bearer wrong").status_code, 401, path)
+                self.assertEqual(self.client.get(path, HTTP_AUTHORIZATION="Bearer secret").status_code, 200, path)
+
+        user = User.objects.create_user("viewer", password="pw")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get("/admission/stats/").status_code, 403)
+        user.is_staff = True
+        user.save()
+        for path in paths:
+            self.assertEqual(self.client.get(path).status_code, 200, path)
+
+
+class SpeechTests(TestCase):
+    def setUp(self):
+        self.recognizer = speech.StubRecognizer(["what is the tallest", "mountain in europe"])
+        patcher = mock.patch.object(speech, "_recognizer", self.recognizer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        import numpy as np
+        self.pcm, self.speech_end = make_recording(np.random.default_rng(3), sentences=2)
+
+    def test_segmenter_finds_each_utterance_however_the_audio_is_split(self):
+        whole = speech.Segmenter(16000)
+        segments = whole.feed(self.pcm) + whole.flush()
+        self.assertEqual(len(segments), 2)
+        self.assertAlmostEqual(segments[-1].end, self.speech_end, delta=0.1)
+
+        pieces = speech.Segmenter(16000)
+        split = []
+        for offset in range(0, len(self.pcm), 1001):
+            split += pieces.feed(self.pcm[offset:offset + 1001])
+        split += pieces.flush()
+        self.assertEqual([(s.start, s.end, s.pcm) for s in split], [(s.start, s.end, s.pcm) for s in segments])
+
+        quiet = speech.Segmenter(16000)
+        click = b"\x00\x40" * 800 + b"\x00\x00" * 16000
+        self.assertEqual(quiet.feed(b"\x00\x00" * 16000 + click) + quiet.flush(), [])
+
+    def test_session_transcribes_while_audio_arrives(self):
+        path = Path(tempfile.mkdtemp()) / "prompt.wav"
+        write_wav(path, self.pcm)
+        data = path.read_bytes()
+
+        response = self.client.post("/stt/", json.dumps({"language": "en-GB"}), content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        started = response.json()
+        # The first chunk carries the WAV header.
+        for offset in range(0, len(data), 6400):
+            response = self.client.post(started["audio_url"], data[offset:offset + 6400],
+                                        content_type="application/octet-stream")
+            self.assertEqual(response.status_code, 200)
+        # The pause after the first sentence closed its segment while audio was still arriving.
+        self.assertGreaterEqual(response.json()["segments"], 1)
+        self.assertEqual(response.json()["transcript"].split()[:3], ["what", "is", "the"])
+
+        response = self.client.post(started["end_url"], content_type="application/json")
+        self.assertEqual(response.json()["transcript"], "what is the tallest mountain in europe")
+        self.assertEqual(len(response.json()["segments"]), 2)
+        self.assertEqual(self.recognizer.calls, 2)
+        self.assertEqual(self.client.post(started["end_url"], content_type="application/json").status_code, 404)
+
+    def test_session_is_refused_when_the_recognizer_cannot_load(self):
+        with mock.patch.object(speech, "_recognizer", None), \
+                self.settings(STT={"RECOGNIZER": "chat.speech.MissingRecognizer"}):
+            response = self.client.post("/stt/", content_type="application/json")
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Speech recognition is unavailable", response.json()["error"])
+
+    def test_bad_audio_is_rejected(self):
+        started = self.client.post("/stt/", content_type="application/json").json()
+        response = self.client.post(started["audio_url"], b"RIFF\x00\x00\x00\x00WAVEjunk",
+                                    content_type="application/octet-stream")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post("/stt/missing/audio/", b"\x00\x00",
+                                          content_type="application/octet-stream").status_code, 404)
+
+    @SAVE_INLINE
+    def test_transcript_starts_a_turn(self):
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=1, chunk_text="Mont Blanc")
+        started = self.client.post("/stt/", json.dumps({
+            "geminiApiKey": "test", "tavilyApiKey": "test", "conversation_name": "spoken", "sample_rate": 16000,
+        }), content_type="application/json").json()
+        self.client.post(started["audio_url"], self.pcm, content_type="application/octet-stream")
+
+        with mock.patch.object(views, "gemini_model", return_value=model):
+            response = self.client.post(started["end_url"], content_type="application/json")
+            events = sse_payloads(list(response.streaming_content))
+
+        self.assertEqual([event["type"] for event in events[:3]], ["turn", "transcript", "delta"])
+        self.assertEqual(events[1]["text"], "what is the tallest mountain in europe")
+        self.assertEqual(model.requests[0][0][-1]["parts"], [{"text": "what is the tallest mountain in europe"}])
+        self.assertEqual(Chat.objects.get(conversation_name="spoken").result, "Mont Blanc")
+
+    def test_text_to_speech_reuses_one_engine(self):
+        pyttsx3 = mock.Mock()
+        with mock.patch.dict(sys.modules, {"pyttsx3": pyttsx3}):
+            tts = speech.TextToSpeech()
+            tts.speak("one")
+            tts.speak("two")
+        pyttsx3.init.assert_called_once_with()
+        engine = pyttsx3.init.return_value
+        self.assertEqual([call.args for call in engine.say.call_args_list], [("one",), ("two",)])
+
+
+class AdmissionTests(TestCase):
+    def controller(self, **limits):
+        return admission.AdmissionController(admission.LocalStore(), **{"key_rate": 0, **limits})
+
+    def test_key_buckets_allow_a_burst_then_the_sustained_rate(self):
+        store = admission.LocalStore()
+        self.assertEqual([store.take("k", 10, 3) for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(store.take("k", 10, 3), 0.1, delta=0.01)
+        self.assertEqual(store.take("other", 10, 3), 0.0)
+
+    def test_turns_queue_in_order_and_are_turned_away_when_the_queue_is_full(self):
+        controller = self.controller(max_active=1, queue_size=2, queue_timeout=5)
+        running = controller.admit("a")
+        first, second = controller.admit("b"), controller.admit("c")
+        with self.assertRaises(admission.Rejected) as rejected:
+            controller.admit("d")
+        self.assertEqual(rejected.exception.reason, "queue_full")
+        self.assertGreaterEqual(rejected.exception.retry_after, 1)
+
+        positions = controller.positions(second)
+        self.assertEqual(next(positions), 2)
+        controller.release(running)
+        self.assertEqual(list(controller.positions(first)), [])
+        self.assertEqual(next(positions), 1)
+        controller.release(first)
+        self.assertEqual(list(positions), [])
+        self.assertEqual(controller.stats()["admitted"], 3)
+
+    def test_a_turn_queued_past_its_deadline_is_rejected(self):
+        controller = self.controller(max_active=1, queue_timeout=0.05)
+        controller.admit("a")
+        waiting = controller.admit("b")
+        with self.assertRaises(admission.Rejected) as rejected:
+            list(controller.positions(waiting))
+        self.assertEqual(rejected.exception.reason, "queue_timeout")
+        self.assertEqual(controller.stats()["queued"], 0)
+
+    def test_cache_store_shares_slots_and_buckets_between_workers(self):
+        with self.settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                               "LOCATION": "admission-tests"}}):
+            one, two = admission.CacheStore(), admission.CacheStore()
+            one.cache.clear()
+            slot = one.acquire(1)
+            self.assertIsNotNone(slot)
+            self.assertIsNone(two.acquire(1))
+            one.release(slot)
+            self.assertIsNotNone(two.acquire(1))
+            self.assertEqual(one.take("k", 1, 1), 0.0)
+            self.assertGreater(two.take("k", 1, 1), 0.5)
+
+    @SAVE_INLINE
+    def test_rate_limited_key_gets_a_429_with_retry_after(self):
+        controller = self.controller(key_rate=0.1, key_burst=1)
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=1)
+        with mock.patch.object(views, "admission", controller), \
+                mock.patch.object(views, "gemini_model", return_value=model):
+            first = self.client.post("/interface_stream/", stream_body(), content_type="application/json")
+            list(first.streaming_content)
+            response = self.client.post("/interface_stream/", stream_body(), content_type="application/json")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()["reason"], "rate_limited")
+        self.assertEqual(response["Retry-After"], "10")
+
+    @SAVE_INLINE
+    def test_queued_turn_reports_its_position_then_runs(self):
+        controller = self.controller(max_active=1)
+        running = controller.admit("other")
+        threading.Timer(0.1, controller.release, [running]).start()
+        model = FakeGenerativeModel(first_latency=0, chunk_interval=0, chunk_count=1, chunk_text="hi")
+        with mock.patch.object(views, "admission", controller), \
+                mock.patch.object(views, "gemini_model", return_value=model):
+            request = RequestFactory().post("/interface_stream/", stream_body(), content_type="application/json")
+            events = sse_payloads(list(views.interface_stream(request).streaming_content))
+
+        self.assertEqual(events[1], {"type": "queued", "position": 1})
+        self.assertEqual(events[2], {"type": "delta", "text": "hi"})
+        self.assertEqual(controller.stats()["active"], 0)
+
+    @SAVE_INLINE
+    def test_a_response_closed_unread_gives_its_slot_back(self):
+        controller = self.controller(max_active=1)
+        with mock.patch.object(views, "admission", controller):
+            request = RequestFactory().post("/interface_stream/", stream_body(), content_type="application/json")
+            response = views.interface_stream(request)
+            self.assertEqual(controller.stats()["active"], 1)
+            response.close()
+
+        self.assertEqual(controller.stats()["active"], 0)
+
+    @SAVE_INLINE
+    async def test_an_async_response_closed_unread_gives_its_slot_back(self):
+        controller = self.controller(max_active=1)
+        with mock.patch.object(views, "admission", controller):
+            request = RequestFactory().post("/interface_stream_async/", stream_body(), content_type="application/json")
+            response = await views.interface_stream_async(request)
+            self.assertEqual(controller.stats()["active"], 1)
+            response.close()
+
+        self.assertEqual(controller.stats()["active"], 0)
+
+    def test_admission_is_off_by_default(self):
+        with self.settings(ADMISSION={}):
+            self.assertFalse(admission.admission_enabled())
+            self.assertEqual(self.controller(max_active=1).admit("k").slot, admission.UNLIMITED)
+
+
+class StreamedJsonTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        now = timezone.now()
+        Chat.objects.bulk_create([
+            Chat(prompt=f"q{index}", result="\u00e9\"\n" * index, conversation_name="long",
+                 date_time=now + timedelta(seconds=index))
+            for index in range(250)
+        ])
+
+    def test_conversation_streams_the_same_document_in_pieces(self):
+        with mock.patch("chat.jsonstream.FLUSH_BYTES", 1024):
+            response = views.conversation_by_name(self.factory.get("/conversation/long/"), "long")
+            self.assertTrue(response.streaming)
+            pieces = list(response.streaming_content)
+        self.assertGreater(len(pieces), 10)
+
+        body = json.loads(b"".join(pieces))
+        rows = list(Chat.objects.filter(conversation_name="long").order_by("date_time"))
+        self.assertEqual(body["id"], "long")
+        self.assertEqual([message["result"] for message in body["messages"]], [row.result for row in rows])
+        self.assertEqual(body["last_message_time"], rows[-1].date_time.isoformat())
+
+    def test_ndjson_is_one_message_per_line(self):
+        response = views.conversation_by_name(self.factory.get("/conversation/long/", {"format": "ndjson"}), "long")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = response_body(response).decode().splitlines()
+        self.assertEqual([json.loads(line)["prompt"] for line in lines], [f"q{index}" for index in range(250)])
+
+        request = self.factory.get("/interface_fetch/", HTTP_ACCEPT="application/x-ndjson")
+        self.assertEqual(len(response_body(views.interface_fetch(request)).splitlines()), 250)
+
+    def test_both_encoders_write_the_same_json(self):
+        from . import jsonstream
+        value = {"text": "\u00e9 \"quoted\"\n", "when": timezone.now(), "count": 3, "items": [None, True]}
+        with mock.patch.object(jsonstream, "orjson", None):
+            fallback = jsonstream.dumps(value)
+        self.assertEqual(json.loads(jsonstream.dumps(value)), json.loads(fallback))
+        self.assertEqual(json.loads(b"".join(jsonstream.object_pieces({}, "result", iter([])))), {"result": []})
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        Blob.objects.create(digest="a" * 64, content_type="image/png", size=3)
+        Chat.objects.bulk_create([
+            Chat(prompt=f"q{index}", result=f"\u00e9 answer {index}\n", conversation_name=f"conv-{index % 3}",
+                 date_time=now + timedelta(seconds=index, microseconds=index),
+                 generated_image_id="a" * 64 if index == 4 else None)
+            for index in range(25)
+        ])
+        call_command("backfill_conversations", stdout=StringIO())
+
+    def rows(self):
+        return list(Chat.objects.order_by("id").values(*transfer.FIELDS))
+
+    def test_round_trip_through_gzip_then_rerun_is_a_no_op(self):
+        before = self.rows()
+        path = os.path.join(tempfile.mkdtemp(), "chats.ndjson.gz")
+        call_command("export_chats", path, "--chunk-size", "7", stdout=StringIO())
+        with open(path, "rb") as exported:
+            self.assertEqual(exported.read(2), transfer.GZIP_MAGIC)
+
+        Chat.objects.filter(id__in=[row["id"] for row in before[10:]]).delete()
+        Conversation.objects.all().delete()
+        call_command("import_chats", path, "--batch-size", "4", stdout=StringIO())
+        self.assertEqual(self.rows(), before)
+        self.assertEqual(Conversation.objects.get(name="conv-1").message_count, 8)
+
+        output = StringIO()
+        call_command("import_chats", path, stdout=output)
+        self.assertIn("Imported 0 of 25 rows", output.getvalue())
+        self.assertEqual(self.rows(), before)
+
+    def test_import_drops_images_whose_blob_is_missing_and_rejects_garbage(self):
+        body = b"".join(transfer.export_stream(compression="none"))
+        Chat.objects.all().delete()
+        Blob.objects.all().delete()
+        stats = transfer.import_rows(BytesIO(body).read)
+        self.assertEqual((stats.created, stats.images_dropped), (25, 1))
+        self.assertFalse(Chat.objects.exclude(generated_image=None).exists())
+
+        with self.assertRaises(transfer.TransferError):
+            transfer.import_rows(BytesIO(b"\x1f\x8bnot gzip").read)
+        with self.assertRaises(transfer.TransferError):
+            transfer.import_rows(BytesIO(b'{"id": 1}\n').read)
+
+    def test_ids_taken_by_other_turns_are_reported_not_skipped(self):
+        body = b"".join(transfer.export_stream(conversations=["conv-0"], compression="none"))
+        moved = Chat.objects.filter(conversation_name="conv-0").order_by("id")[:2]
+        Chat.objects.filter(id__in=[chat.id for chat in moved]).update(prompt="something else")
+
+        stats = transfer.import_rows(BytesIO(body).read)
+
+        self.assertEqual((stats.created, stats.skipped, stats.conflicts), (0, 7, 2))
+        self.assertEqual(stats.conflict_ids, [chat.id for chat in moved])
+        self.assertEqual(Chat.objects.filter(prompt="something else").count(), 2)
+
+    def test_only_the_imported_conversations_are_recounted(self):
+        body = b"".join(transfer.export_stream(conversations=["conv-1"], compression="none"))
+        Chat.objects.filter(conversation_name="conv-1").delete()
+        Conversation.objects.filter(name="conv-1").update(message_count=0)
+        Conversation.objects.filter(name="conv-2").update(message_count=99)
+
+        output = StringIO()
+        with open(os.path.join(tempfile.mkdtemp(), "conv-1.ndjson"), "wb") as exported:
+            exported.write(body)
+        call_command("import_chats", exported.name, stdout=output)
+
+        self.assertIn("Recomputed 1 conversation summaries", output.getvalue())
+        self.assertEqual(Conversation.objects.get(name="conv-1").message_count, 8)
+        self.assertEqual(Conversation.objects.get(name="conv-2").message_count, 99)
+
+    def test_endpoints_need_the_token_and_filter_conversations(self):
+        self.assertEqual(self.client.get("/export/").status_code, 403)
+        with self.settings(TRANSFER={"TOKEN": "secret"}):
+            self.assertEqual(self.client.get("/export/").status_code, 401)
+            auth = {"HTTP_AUTHORIZATION": "Bearer secret"}
+            response = self.client.get("/export/", {"conversation": ["conv-0", "conv-2"]}, **auth)
+            self.assertEqual(response["Content-Type"], "application/gzip")
+            body = response_body(response)
+            names = {json.loads(line)["conversation_name"]
+                     for line in b"".join(transfer.decompressed(BytesIO(body).read)).splitlines()}
+            self.assertEqual(names, {"conv-0", "conv-2"})
+            self.assertEqual(self.client.get("/export/", {"compression": "lz4"}, **auth).status_code, 400)
+
+            Chat.objects.filter(conversation_name="conv-2").delete()
+            response = self.client.post("/import/", body, content_type="application/gzip", **auth)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["created"], 8)
+            self.assertEqual(Chat.objects.count(), 25)
+
+
+class BenchmarkCompareTests(TestCase):
+    def report(self, p99, throughput, queries, errors=0):
+        return {"meta": {}, "results": [{
+            "endpoint": "history", "concurrency": 8, "requests": 100, "errors": errors, "throughput": throughput,
+            "latency_ms": {"p50": 20.0, "p95": 30.0, "p99": p99, "mean": 21.0},
+            "first_byte_ms": {"p50": 19.0, "p95": 29.0, "p99": 39.0, "mean": 20.0},
+            "queries_per_request": queries,
+        }]}
+
+    def regressed(self, baseline, current, **kwargs):
+        return {row[0] for row in compare(baseline, current, **kwargs) if row[-1]}
+
+    def test_flags_slower_fewer_and_chattier_runs(self):
+        baseline = self.report(p99=40.0, throughput=200.0, queries=2.0)
+        self.assertEqual(self.regressed(baseline, self.report(p99=41.0, throughput=195.0, queries=2.2)), set())
+        self.assertEqual(
+            self.regressed(baseline, self.report(p99=60.0, throughput=150.0, queries=3.0, errors=1)),
+            {"latency p99 ms", "throughput", "queries/request", "errors"},
+        )
+
+    def test_small_absolute_changes_are_noise(self):
+        baseline = self.report(p99=2.0, throughput=200.0, queries=2.0)
+        self.assertEqual(self.regressed(baseline, self.report(p99=4.0, throughput=200.0, queries=2.0)), set())
+        self.assertEqual(self.regressed(baseline, self.report(p99=4.0, throughput=200.0, queries=2.0),
+                                        min_delta_ms=1.0), {"latency p99 ms"})
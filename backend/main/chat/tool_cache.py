@@ -0,0 +1,239 @@
+# tool_cache.py
+#
+# Caches tool results (internet_search and anything else in AVAILABLE_TOOLS) so the
+# same question asked a few minutes apart doesn't go back out to Tavily.
+#
+# Configure with settings.TOOL_CACHE, e.g.
+#   TOOL_CACHE = {
+#       "BACKEND": "chat.tool_cache.DjangoCacheBackend",  # share between workers
+#       "ALIAS": "default",
+#       "TTL": 300,
+#       "MAX_ENTRIES": 1024,
+#   }
+# The default is an in-process LRU (LocMemBackend).
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+MISSING = object()
+
+DEFAULT_TTL = 300
+DEFAULT_MAX_ENTRIES = 1024
+# How long a request waits on someone else's in-flight call for the same key
+# before giving up and calling the tool itself.
+DEFAULT_LOCK_TIMEOUT = 30
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_query(value):
+    return _whitespace.sub(" ", value).strip().casefold()
+
+
+def make_key(tool_name, tool_args):
+    normalized = {
+        name: normalize_query(value) if isinstance(value, str) else value
+        for name, value in tool_args.items()
+    }
+    # Hashed so the key is safe for memcached (no spaces, bounded length).
+    digest = hashlib.sha256(json.dumps(normalized, sort_keys=True, default=str).encode()).hexdigest()
+    return f"tool:{tool_name}:{digest}"
+
+
+def is_cacheable(tool_output):
+    return not (isinstance(tool_output, dict) and "error" in tool_output)
+
+
+class LocMemBackend:
+    """In-process TTL + LRU store. Not shared between workers."""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, **options):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def acquire(self, key, timeout):
+        return True
+
+    def release(self, key):
+        pass
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCacheBackend:
+    """
+    Stores entries in a Django cache (Redis, Memcached, database...) so every worker
+    shares them. Size capping and eviction are left to that cache's own settings
+    (e.g. OPTIONS["MAX_ENTRIES"]), so evictions aren't visible here.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, alias="default", **options):
+        from django.core.cache import caches
+
+        self.ttl = ttl
+        self.evictions = 0
+        self.cache = caches[alias]
+
+    def get(self, key):
+        return self.cache.get(key, MISSING)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.ttl)
+
+    # cache.add is atomic on the shared backends, which makes it a usable
+    # cross-worker lock for "one worker fills this key, the rest wait".
+    def acquire(self, key, timeout):
+        return self.cache.add(f"{key}:lock", 1, timeout)
+
+    def release(self, key):
+        self.cache.delete(f"{key}:lock")
+
+    def clear(self):
+        self.cache.clear()
+
+    def __len__(self):
+        return 0
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = MISSING
+
+
+class ToolResultCache:
+    def __init__(self, backend, lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        self.backend = backend
+        self.lock_timeout = lock_timeout
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def call(self, tool_name, tool_args, tool_call):
+        """Returns the cached result for (tool_name, tool_args), running tool_call() on a miss."""
+        key = make_key(tool_name, tool_args)
+        value = self.backend.get(key)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+
+        # Single flight within this process: the first caller for a key runs the
+        # tool, everyone arriving while it runs waits for its result.
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            self.coalesced += 1
+            flight.done.wait(self.lock_timeout)
+            if flight.value is not MISSING:
+                self.hits += 1
+                return flight.value
+            self.misses += 1
+            return tool_call()
+
+        try:
+            value = self._fill(key, tool_call)
+            flight.value = value
+            return value
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _fill(self, key, tool_call):
+        # Across workers: only the one holding the backend lock calls the tool,
+        # the others poll the backend until the value lands or the lock times out.
+        locked = self.backend.acquire(key, self.lock_timeout)
+        if not locked:
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                value = self.backend.get(key)
+                if value is not MISSING:
+                    self.hits += 1
+                    return value
+
+        self.misses += 1
+        try:
+            value = tool_call()
+            if is_cacheable(value):
+                self.backend.set(key, value)
+            return value
+        finally:
+            if locked:
+                self.backend.release(key)
+
+    def stats(self):
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.backend.evictions,
+            "coalesced": self.coalesced,
+            "size": len(self.backend),
+        }
+
+
+def build_tool_cache(config=None):
+    if config is None:
+        config = getattr(settings, "TOOL_CACHE", {})
+    backend_class = import_string(config.get("BACKEND", "chat.tool_cache.LocMemBackend"))
+    backend = backend_class(
+        ttl=config.get("TTL", DEFAULT_TTL),
+        max_entries=config.get("MAX_ENTRIES", DEFAULT_MAX_ENTRIES),
+        alias=config.get("ALIAS", "default"),
+    )
+    return ToolResultCache(backend, lock_timeout=config.get("LOCK_TIMEOUT", DEFAULT_LOCK_TIMEOUT))
+
+
+_tool_cache = None
+_tool_cache_lock = threading.Lock()
+
+
+def get_tool_cache():
+    global _tool_cache
+    if _tool_cache is None:
+        with _tool_cache_lock:
+            if _tool_cache is None:
+                _tool_cache = build_tool_cache()
+    return _tool_cache
@@ -1,36 +1,90 @@
 # tools.py
 
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeout
+
 import google.generativeai as genai
-# REMOVE: import os
-from tavily import TavilyClient
+
+from .clients import tavily_client
+from .enrichment import enrich_results, enrichment_enabled
+from .metrics import STAGE_SECONDS, TOOL_SECONDS, UPSTREAM_SECONDS
+from .pages import fetch_pages
+
+# Sub-queries for one search go out together through this shared pool; the cap
+# keeps a burst of tool calls from opening an unbounded number of connections.
+SEARCH_POOL_SIZE = 8
+SEARCH_MIN_RESULTS = 5
+SEARCH_TIMEOUT = 20
+
+_search_pool = ThreadPoolExecutor(max_workers=SEARCH_POOL_SIZE, thread_name_prefix="tavily")
+
+
+def timed_search(client, query):
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        response = client.search(query=query, search_depth="basic")
+        outcome = "ok"
+        return response
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, service="tavily", outcome=outcome)
+
 
 # The function now takes the key as an argument
 def internet_search(query: str, tavily_api_key: str):
     """Searches the internet for information on a given query."""
     try:
         # Use the key passed as an argument, NOT from the environment
-        tavily_client = TavilyClient(api_key=tavily_api_key)
+        client = tavily_client(tavily_api_key)
 
-        # ... the rest of your function remains the same ...
         search_queries = [
             query,
             f"what is {query}",
             f"{query} company information",
             f"{query} overview",
         ]
-        # ... etc.
+
+        futures = [
+            _search_pool.submit(timed_search, client, q)
+            for q in search_queries
+        ]
 
         all_results = []
-        for q in search_queries:
-            response = tavily_client.search(query=q, search_depth="basic")
-            if response.get('results'):
-                all_results.extend(response['results'])
-            if len(all_results) > 5:
-                break
-        
+        seen_urls = set()
+        errors = []
+        try:
+            for future in as_completed(futures, timeout=SEARCH_TIMEOUT):
+                try:
+                    response = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                for result in response.get('results') or []:
+                    url = result.get('url')
+                    if url and url in seen_urls:
+                        continue
+                    seen_urls.add(url)
+                    all_results.append(result)
+                if len(all_results) > SEARCH_MIN_RESULTS:
+                    break
+        except FuturesTimeout:
+            pass
+        finally:
+            # Calls that have not started yet are dropped; ones already in flight
+            # finish in the background and their results are ignored.
+            for future in futures:
+                future.cancel()
+
         if not all_results:
+            if errors:
+                raise errors[0]
             return {"results": "No relevant information found."}
 
+        if enrichment_enabled():
+            with STAGE_SECONDS.time(stage="search_enrichment"):
+                return {"results": enrich_results(query, all_results)}
         return {"results": all_results}
     
     except Exception as e:
@@ -39,6 +93,7 @@ def internet_search(query: str, tavily_api_key: str):
 
 AVAILABLE_TOOLS = {
     "internet_search": internet_search,
+    "fetch_pages": fetch_pages,
 }
 internet_search_tool = genai.protos.Tool(
     function_declarations=[
@@ -57,4 +112,77 @@ internet_search_tool = genai.protos.Tool(
             )
         )
     ]
-)
\ No newline at end of file
+)
+
+# Hand-written declarations win; anything else registered in AVAILABLE_TOOLS gets
+# one generated from its signature and docstring.
+TOOL_DECLARATIONS = {
+    declaration.name: declaration for declaration in internet_search_tool.function_declarations
+}
+
+# Filled in by the server from the request, never exposed to the model.
+SERVER_ARGS = {"tavily_api_key"}
+
+_schema_types = {
+    str: genai.protos.Type.STRING,
+    int: genai.protos.Type.INTEGER,
+    float: genai.protos.Type.NUMBER,
+    bool: genai.protos.Type.BOOLEAN,
+    list: genai.protos.Type.ARRAY,
+    dict: genai.protos.Type.OBJECT,
+}
+
+
+def declaration_from_function(name, function):
+    properties = {}
+    required = []
+    for param in inspect.signature(function).parameters.values():
+        if param.name in SERVER_ARGS or param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+            continue
+        schema_type = _schema_types.get(param.annotation, genai.protos.Type.STRING)
+        if schema_type == genai.protos.Type.ARRAY:
+            properties[param.name] = genai.protos.Schema(
+                type=schema_type, items=genai.protos.Schema(type=genai.protos.Type.STRING)
+            )
+        else:
+            properties[param.name] = genai.protos.Schema(type=schema_type)
+        if param.default is param.empty:
+            required.append(param.name)
+    return genai.protos.FunctionDeclaration(
+        name=name,
+        description=inspect.getdoc(function) or name,
+        parameters=genai.protos.Schema(
+            type=genai.protos.Type.OBJECT,
+            properties=properties,
+            required=required,
+        ),
+    )
+
+
+def available_tools():
+    """A single genai Tool declaring everything in AVAILABLE_TOOLS."""
+    return genai.protos.Tool(
+        function_declarations=[
+            TOOL_DECLARATIONS.get(name) or declaration_from_function(name, function)
+            for name, function in AVAILABLE_TOOLS.items()
+        ]
+    )
+
+
+def call_tool(name, args, **server_args):
+    """Calls a registered tool with the model's args plus whichever server args it accepts."""
+    function = AVAILABLE_TOOLS[name]
+    accepted = inspect.signature(function).parameters
+    if any(param.kind == param.VAR_KEYWORD for param in accepted.values()):
+        extra = server_args
+    else:
+        extra = {key: value for key, value in server_args.items() if key in accepted}
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        output = function(**args, **extra)
+        # Tools report most failures as {"error": ...} rather than raising.
+        outcome = "error" if isinstance(output, dict) and "error" in output else "ok"
+        return output
+    finally:
+        TOOL_SECONDS.observe(time.perf_counter() - started, tool=name, outcome=outcome)
@@ -0,0 +1,366 @@
+# transfer.py
+#
+# Bulk export and import of chat turns, for moving a whole database (or some
+# conversations of it) between deployments. The format is NDJSON, one Chat row per
+# line, compressed with gzip or zstd:
+#   {"id": 7, "prompt": "...", "result": "...", "date_time": "2025-01-02T03:04:05.123456+00:00",
+#    "conversation_name": "...", "message_type": "Text", "status": "complete",
+#    "stream_id": null, "generated_image": "<blob digest>" | null}
+#
+# Export reads rows in id order through QuerySet.iterator(chunk_size=...), which is
+# a server-side cursor on PostgreSQL and batched fetchmany() elsewhere, and
+# compresses them incrementally, so memory stays at one chunk however many rows
+# go out. `manage.py export_chats` writes a file (or stdout); GET /export/
+# streams the same bytes.
+#
+# Import decompresses and parses the same way and writes with bulk_create in
+# batches of BATCH_SIZE, one transaction each. Rows keep their ids. A row whose id
+# is taken by the same turn (same conversation_name, date_time and prompt) is
+# skipped, so an interrupted import can simply be run again; one whose id is taken
+# by a different turn is a conflict: it is not written, and counted and reported
+# with its id. Afterwards the id sequence is moved past the imported ids and the
+# summaries of the conversations that got rows are recomputed (rebuild_conversations).
+# Image bytes are not part of the export: copy the blob store alongside it. A
+# generated_image whose Blob row is missing is dropped (and counted) rather than
+# failing the batch.
+# `manage.py import_chats` reads a file (or stdin) and prints progress; POST /import/
+# takes the compressed body. The compression is recognized from its magic bytes.
+#
+# zstd needs the zstandard package; gzip works everywhere.
+#
+# Configure with settings.TRANSFER, e.g.
+#   TRANSFER = {
+#       "TOKEN": "...",          # required for /export/ and /import/ ("Authorization: Bearer <token>")
+#       "CHUNK_SIZE": 2000,      # rows fetched at a time on export
+#       "BATCH_SIZE": 2000,      # rows written per bulk_create on import
+#       "GZIP_LEVEL": 3,
+#       "ZSTD_LEVEL": 3,
+#   }
+
+import time
+import zlib
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from .jsonstream import batched, dumps
+from .models import Blob, Chat, Conversation
+
+try:
+    import orjson
+except ImportError:  # json it is
+    orjson = None
+    import json
+
+try:
+    import zstandard
+except ImportError:  # gzip only
+    zstandard = None
+
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_BATCH_SIZE = 2000
+DEFAULT_GZIP_LEVEL = 3
+DEFAULT_ZSTD_LEVEL = 3
+READ_BYTES = 1024 * 1024
+# Conversations recounted per query after an import.
+REBUILD_BATCH = 500
+# Conflicting ids listed in the import report; the count covers all of them.
+REPORTED_CONFLICTS = 100
+
+FIELDS = ['id', 'prompt', 'result', 'date_time', 'conversation_name', 'message_type', 'status', 'stream_id',
+          'generated_image']
+COMPRESSIONS = ['gzip', 'zstd', 'none']
+CONTENT_TYPES = {'gzip': 'application/gzip', 'zstd': 'application/zstd', 'none': 'application/x-ndjson'}
+SUFFIXES = {'gzip': '.ndjson.gz', 'zstd': '.ndjson.zst', 'none': '.ndjson'}
+
+CORRUPT = (zlib.error, zstandard.ZstdError) if zstandard is not None else (zlib.error,)
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def transfer_setting(name, default=None):
+    value = getattr(settings, 'TRANSFER', {}).get(name)
+    return default if value is None else value
+
+
+class TransferError(ValueError):
+    pass
+
+
+def compression_for(path):
+    """The compression a file name asks for: .gz, .zst or plain."""
+    if path.endswith('.zst'):
+        return 'zstd'
+    if path.endswith('.gz'):
+        return 'gzip'
+    return 'none' if path.endswith('.ndjson') else 'gzip'
+
+
+def _require_zstd():
+    if zstandard is None:
+        raise TransferError("zstd compression needs the zstandard package (pip install zstandard).")
+
+
+# Export
+
+def encode_row(row):
+    """One values_list() row (in FIELDS order) as an NDJSON line."""
+    pk, prompt, result, date_time, name, message_type, status, stream_id, image = row
+    return dumps({
+        'id': pk, 'prompt': prompt, 'result': result,
+        # isoformat() keeps the microseconds that Django's JSON encoder would cut.
+        'date_time': date_time.isoformat(),
+        'conversation_name': name, 'message_type': message_type, 'status': status,
+        'stream_id': stream_id, 'generated_image': image,
+    }) + b"\n"
+
+
+def export_lines(conversations=None, chunk_size=None):
+    """Every Chat row (or those of `conversations`) in id order, as NDJSON lines."""
+    rows = Chat.objects.order_by('id')
+    if conversations:
+        rows = rows.filter(conversation_name__in=conversations)
+    rows = rows.values_list(*FIELDS)
+    for row in rows.iterator(chunk_size=chunk_size or transfer_setting('CHUNK_SIZE', DEFAULT_CHUNK_SIZE)):
+        yield encode_row(row)
+
+
+def compressed(chunks, compression='gzip', level=None):
+    """The bytes of `chunks` compressed as one gzip member or zstd frame, a piece at a time."""
+    if compression == 'none':
+        yield from chunks
+        return
+    if compression == 'gzip':
+        compressor = zlib.compressobj(
+            level if level is not None else transfer_setting('GZIP_LEVEL', DEFAULT_GZIP_LEVEL), zlib.DEFLATED, 31
+        )
+    elif compression == 'zstd':
+        _require_zstd()
+        compressor = zstandard.ZstdCompressor(
+            level=level if level is not None else transfer_setting('ZSTD_LEVEL', DEFAULT_ZSTD_LEVEL)
+        ).compressobj()
+    else:
+        raise TransferError(f"Unknown compression {compression!r}; use one of {', '.join(COMPRESSIONS)}.")
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def export_stream(conversations=None, compression='gzip', chunk_size=None):
+    """Compressed export bytes, in pieces of at least jsonstream.FLUSH_BYTES before compression."""
+    return compressed(batched(export_lines(conversations, chunk_size)), compression)
+
+
+def write_export(out, conversations=None, compression='gzip', chunk_size=None, progress=None):
+    """Writes the export to the binary file `out`. Returns (rows, bytes written)."""
+    counted = {'rows': 0}
+
+    def counting(lines):
+        for line in lines:
+            counted['rows'] += 1
+            if progress and counted['rows'] % 100000 == 0:
+                progress(counted['rows'])
+            yield line
+
+    written = 0
+    for piece in compressed(batched(counting(export_lines(conversations, chunk_size))), compression):
+        out.write(piece)
+        written += len(piece)
+    return counted['rows'], written
+
+
+# Import
+
+def _decompressor(head):
+    if head.startswith(GZIP_MAGIC):
+        return lambda: zlib.decompressobj(31)
+    if head.startswith(ZSTD_MAGIC):
+        _require_zstd()
+        return lambda: zstandard.ZstdDecompressor().decompressobj()
+    return None
+
+
+def decompressed(read):
+    """
+    The uncompressed bytes behind `read(size)`, whose stream may be gzip (one or
+    more members), zstd or plain NDJSON.
+    """
+    data = read(READ_BYTES)
+    make = _decompressor(data)
+    if make is None:
+        while data:
+            yield data
+            data = read(READ_BYTES)
+        return
+    decompressor = make()
+    while data:
+        try:
+            out = decompressor.decompress(data)
+        except CORRUPT as e:
+            raise TransferError(f"Corrupt compressed stream: {e}") from e
+        if out:
+            yield out
+        # Concatenated gzip members (or zstd frames) carry on with a fresh decompressor.
+        data = getattr(decompressor, 'unused_data', b"") if getattr(decompressor, 'eof', False) else b""
+        if data:
+            decompressor = make()
+        else:
+            data = read(READ_BYTES)
+    if not getattr(decompressor, 'eof', True):
+        raise TransferError("The compressed stream ended early.")
+
+
+def lines(chunks):
+    """Splits byte chunks into lines, dropping blank ones."""
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        *complete, pending = pending.split(b"\n")
+        for line in complete:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+
+def _loads(line):
+    return orjson.loads(line) if orjson is not None else json.loads(line)
+
+
+def decode_row(line, number):
+    try:
+        data = _loads(line)
+        if not isinstance(data, dict):
+            raise ValueError("not an object")
+        return Chat(
+            id=data.get('id'),
+            prompt=data['prompt'],
+            result=data.get('result'),
+            date_time=datetime.fromisoformat(data['date_time']),
+            conversation_name=data['conversation_name'],
+            message_type=data.get('message_type') or 'Text',
+            status=data.get('status') or Chat._meta.get_field('status').default,
+            stream_id=data.get('stream_id'),
+            generated_image_id=data.get('generated_image'),
+        )
+    except (ValueError, KeyError, TypeError) as e:
+        raise TransferError(f"Line {number}: not a chat row ({e}).") from e
+
+
+class ImportStats:
+    def __init__(self):
+        self.read = 0
+        self.created = 0
+        self.skipped = 0
+        self.conflicts = 0
+        self.conflict_ids = []
+        self.images_dropped = 0
+        self.conversations = set()
+        self.started = time.monotonic()
+
+    @property
+    def seconds(self):
+        return time.monotonic() - self.started
+
+    def conflict(self, chat):
+        self.conflicts += 1
+        if len(self.conflict_ids) < REPORTED_CONFLICTS:
+            self.conflict_ids.append(chat.id)
+
+    def as_dict(self):
+        return {
+            "read": self.read, "created": self.created, "skipped": self.skipped,
+            "conflicts": self.conflicts, "conflict_ids": self.conflict_ids,
+            "images_dropped": self.images_dropped, "seconds": round(self.seconds, 2),
+        }
+
+
+def natural_key(chat):
+    return chat.conversation_name, chat.date_time, chat.prompt
+
+
+def _write_batch(batch, stats):
+    ids = [chat.id for chat in batch if chat.id is not None]
+    unnumbered = [chat for chat in batch if chat.id is None]
+    digests = {chat.generated_image_id for chat in batch if chat.generated_image_id}
+    with transaction.atomic():
+        taken = {
+            pk: (name, date_time, prompt)
+            for pk, name, date_time, prompt in Chat.objects.filter(id__in=ids).values_list(
+                'id', 'conversation_name', 'date_time', 'prompt'
+            )
+        } if ids else {}
+        # Rows without an id can only be recognized by their natural key.
+        present = set(Chat.objects.filter(
+            conversation_name__in={chat.conversation_name for chat in unnumbered},
+            date_time__in={chat.date_time for chat in unnumbered},
+        ).values_list('conversation_name', 'date_time', 'prompt')) if unnumbered else set()
+        blobs = set(Blob.objects.filter(digest__in=digests).values_list('digest', flat=True)) if digests else set()
+        fresh = []
+        for chat in batch:
+            if chat.id in taken:
+                if taken[chat.id] == natural_key(chat):
+                    stats.skipped += 1
+                else:
+                    stats.conflict(chat)
+                continue
+            if chat.id is None and natural_key(chat) in present:
+                stats.skipped += 1
+                continue
+            if chat.generated_image_id and chat.generated_image_id not in blobs:
+                chat.generated_image_id = None
+                stats.images_dropped += 1
+            fresh.append(chat)
+        # ignore_conflicts covers rows another import wrote since the check above.
+        Chat.objects.bulk_create(fresh, ignore_conflicts=True)
+    stats.created += len(fresh)
+    stats.conversations.update(chat.conversation_name for chat in fresh)
+
+
+def rebuild_conversations(names, batch_size=REBUILD_BATCH):
+    """Recomputes the summaries of the conversations in `names` (and no others)."""
+    names = sorted(names)
+    for start in range(0, len(names), batch_size):
+        Conversation.save_recounted(list(Conversation.recount(names[start:start + batch_size])))
+
+
+def reset_sequence():
+    """Moves Chat's id sequence past the imported ids (a no-op on SQLite)."""
+    statements = connection.ops.sequence_reset_sql(no_style(), [Chat])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def import_rows(read, batch_size=None, progress=None):
+    """
+    Imports the export behind `read(size)`. Calls progress(stats) after every batch.
+    Returns the ImportStats; rebuilding the summaries of stats.conversations is up
+    to the caller (rebuild_conversations).
+    """
+    batch_size = batch_size or transfer_setting('BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    stats = ImportStats()
+    batch = []
+    try:
+        for number, line in enumerate(lines(decompressed(read)), 1):
+            batch.append(decode_row(line, number))
+            stats.read += 1
+            if len(batch) >= batch_size:
+                _write_batch(batch, stats)
+                batch = []
+                if progress:
+                    progress(stats)
+        if batch:
+            _write_batch(batch, stats)
+            if progress:
+                progress(stats)
+    finally:
+        if stats.created:
+            reset_sequence()
+    return stats
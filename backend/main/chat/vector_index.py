@@ -0,0 +1,354 @@
+# vector_index.py
+#
+# A compact on-disk vector index with approximate nearest-neighbour search, for
+# semantic retrieval over past turns (see chat/semantic.py). Everything lives in one
+# directory:
+#   meta.json       dimensions, embedder name, row count, capacity, training state;
+#                   replaced atomically, last, so it only ever describes flushed rows
+#   vectors.f32     capacity x dimensions float32 unit vectors, memory-mapped
+#   ids.i64         the chat id of each row
+#   lists-N.i32     the SPILL IVF lists each row belongs to (-1 until trained)
+#   centroids-N.f32 one unit centroid per list
+# where N is the row count the centroids were trained on, so a retrain writes new
+# files and switches to them with meta.json: a crash never pairs rows with
+# centroids from another training.
+# The files grow by doubling, so appends are amortized O(1) and only the pages a
+# query touches are read into memory.
+#
+# Search is IVF ("inverted file"): rows are clustered by spherical k-means into
+# about √n lists, and a query scores the centroids first and then only the rows of
+# the NPROBE closest lists. Each row is filed under its SPILL closest lists, so a
+# query that lands near a list boundary still finds it: with the hashing embedder
+# one list per row found the reworded prompt ~90% of the time, two lists ~98%.
+# Until the index reaches TRAIN_MIN rows every row is scored (exact search). New
+# rows join their closest lists; the centroids are retrained once the index has
+# grown RETRAIN_GROWTH times since they were computed. Retraining runs k-means
+# outside the lock searches take, so lookups carry on meanwhile.
+#
+# Any number of processes can share a directory: writers take an flock on
+# location/lock (where fcntl exists), and every call first checks whether meta.json
+# changed and, if so, maps in the rows another process added.
+
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: one process per index directory.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NPROBE = 8
+SPILL = 2
+TRAIN_MIN = 2048
+RETRAIN_GROWTH = 4
+INITIAL_CAPACITY = 1024
+KMEANS_ITERATIONS = 8
+KMEANS_SAMPLE_PER_LIST = 32
+SCORE_CHUNK_ROWS = 65536
+
+
+class IncompatibleIndex(ValueError):
+    """The directory holds vectors from another embedder or dimensionality."""
+
+
+def assign_lists(vectors, centroids, spill=SPILL):
+    """The `spill` closest lists of each row, closest first; -1 pads when there are fewer lists."""
+    assigned = np.full((len(vectors), spill), -1, dtype=np.int32)
+    width = min(spill, len(centroids))
+    for start in range(0, len(vectors), SCORE_CHUNK_ROWS // 8):
+        scores = vectors[start:start + SCORE_CHUNK_ROWS // 8] @ centroids.T
+        if width == 1:
+            closest = np.argmax(scores, axis=1)[:, None]
+        else:
+            closest = np.argpartition(-scores, width - 1, axis=1)[:, :width]
+            order = np.argsort(-np.take_along_axis(scores, closest, axis=1), axis=1)
+            closest = np.take_along_axis(closest, order, axis=1)
+        assigned[start:start + len(scores), :width] = closest
+    return assigned
+
+
+class VectorIndex:
+    def __init__(self, location, dimensions, embedder="", nprobe=DEFAULT_NPROBE, train_min=TRAIN_MIN):
+        self.location = str(location)
+        self.dimensions = dimensions
+        self.embedder = embedder
+        self.nprobe = nprobe
+        self.train_min = train_min
+        self._lock = threading.RLock()
+        self._write_mutex = threading.Lock()
+        os.makedirs(self.location, exist_ok=True)
+        self._close()
+        self._meta_mtime = None
+        self._refresh()
+
+    # --- files -------------------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.location, name)
+
+    def _lists_name(self, trained_count=None):
+        return f"lists-{self.trained_count if trained_count is None else trained_count}.i32"
+
+    def _centroids_name(self, trained_count=None):
+        return f"centroids-{self.trained_count if trained_count is None else trained_count}.f32"
+
+    def _close(self):
+        self.count = 0
+        self.capacity = 0
+        self.trained_count = 0
+        self._vectors = self._ids = self._lists = None
+        self._centroids = None
+        self._members = []
+
+    def _map(self, name, dtype, shape):
+        return np.memmap(self._path(name), dtype=dtype, mode="r+", shape=shape)
+
+    def _map_all(self):
+        if self.capacity:
+            self._vectors = self._map("vectors.f32", np.float32, (self.capacity, self.dimensions))
+            self._ids = self._map("ids.i64", np.int64, (self.capacity,))
+            self._lists = self._map(self._lists_name(), np.int32, (self.capacity, SPILL))
+
+    def _read_meta(self):
+        try:
+            with open(self._path("meta.json")) as meta_file:
+                return json.load(meta_file)
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self):
+        meta = {
+            "dimensions": self.dimensions,
+            "embedder": self.embedder,
+            "count": self.count,
+            "capacity": self.capacity,
+            "lists": 0 if self._centroids is None else len(self._centroids),
+            "trained_count": self.trained_count,
+        }
+        fd, temp_path = tempfile.mkstemp(dir=self.location, prefix=".tmp-meta-")
+        with os.fdopen(fd, "w") as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(temp_path, self._path("meta.json"))
+        self._meta_mtime = os.stat(self._path("meta.json")).st_mtime_ns
+
+    def _refresh(self):
+        """Catches up with meta.json: maps new rows, or reloads everything after a retrain."""
+        try:
+            mtime = os.stat(self._path("meta.json")).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._meta_mtime:
+            return
+        meta = self._read_meta()
+        if (meta["dimensions"], meta["embedder"]) != (self.dimensions, self.embedder):
+            raise IncompatibleIndex(
+                f"{self.location} holds {meta['embedder']} vectors of {meta['dimensions']} dimensions, "
+                f"not {self.embedder} of {self.dimensions}"
+            )
+        previous_count = self.count
+        if meta["trained_count"] != self.trained_count or meta["count"] < self.count:
+            self._close()
+            previous_count = 0
+            self.trained_count = meta["trained_count"]
+            if meta["lists"]:
+                self._centroids = np.fromfile(self._path(self._centroids_name()), dtype=np.float32).reshape(
+                    meta["lists"], self.dimensions
+                )
+                self._members = [np.empty(0, dtype=np.int64) for _ in range(meta["lists"])]
+        if meta["capacity"] != self.capacity:
+            self.capacity = meta["capacity"]
+            self._map_all()
+        self.count = meta["count"]
+        if self._centroids is not None and self.count > previous_count:
+            self._add_members(np.arange(previous_count, self.count), self._lists[previous_count:self.count])
+        self._meta_mtime = mtime
+
+    @contextmanager
+    def _write_lock(self):
+        # Writers exclude each other (threads, then processes); readers only wait
+        # on self._lock, which writers hold just while they change the mapping.
+        with self._write_mutex:
+            if fcntl is None:
+                yield
+                return
+            with open(self._path("lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _grow(self, needed):
+        capacity = max(self.capacity, INITIAL_CAPACITY)
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self.capacity:
+            return
+        for array in (self._vectors, self._ids, self._lists):
+            if array is not None:
+                array.flush()
+        self._vectors = self._ids = self._lists = None
+        for name, row_bytes in (("vectors.f32", 4 * self.dimensions), ("ids.i64", 8), (self._lists_name(), 4 * SPILL)):
+            with open(self._path(name), "ab") as data_file:
+                data_file.truncate(capacity * row_bytes)
+        self.capacity = capacity
+        self._map_all()
+
+    # --- writing -----------------------------------------------------------
+
+    def add(self, ids, vectors):
+        """Appends rows: chat ids and their unit vectors (n x dimensions)."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimensions)
+        if not len(vectors):
+            return
+        with self._write_lock():
+            with self._lock:
+                self._refresh()
+                start, end = self.count, self.count + len(vectors)
+                self._grow(end)
+                self._vectors[start:end] = vectors
+                self._ids[start:end] = ids
+                if self._centroids is not None:
+                    assigned = assign_lists(vectors, self._centroids)
+                    self._lists[start:end] = assigned
+                    self._add_members(np.arange(start, end), assigned)
+                else:
+                    self._lists[start:end] = -1
+                for array in (self._vectors, self._ids, self._lists):
+                    array.flush()
+                self.count = end
+                self._write_meta()
+                train = self.count >= self.train_min and (
+                    self._centroids is None or self.count >= self.trained_count * RETRAIN_GROWTH
+                )
+            if train:
+                self._train(end)
+
+    def reset(self):
+        with self._write_lock(), self._lock:
+            for name in os.listdir(self.location):
+                if name.endswith((".f32", ".i32", ".i64", ".json")):
+                    os.remove(self._path(name))
+            self._close()
+            self._meta_mtime = None
+
+    # --- IVF ---------------------------------------------------------------
+
+    def _add_members(self, positions, assigned):
+        assigned = assigned.reshape(len(positions), -1)
+        positions = np.repeat(positions, assigned.shape[1])
+        assigned = assigned.ravel()
+        keep = assigned >= 0
+        positions, assigned = positions[keep], assigned[keep]
+        order = np.argsort(assigned, kind="stable")
+        lists, starts = np.unique(assigned[order], return_index=True)
+        for list_id, group in zip(lists, np.split(positions[order], starts[1:])):
+            self._members[list_id] = np.concatenate([self._members[list_id], group])
+
+    def _train(self, n):
+        """Clusters rows [0, n) and files every row under the new lists. Called holding only the write lock."""
+        vectors = self._vectors
+        list_count = max(1, int(math.sqrt(n)))
+        rng = np.random.default_rng(n)
+        sample_size = min(n, list_count * KMEANS_SAMPLE_PER_LIST)
+        sample = np.asarray(vectors[np.sort(rng.choice(n, sample_size, replace=False))])
+        centroids = sample[rng.choice(sample_size, list_count, replace=False)].copy()
+
+        # Spherical k-means: assign by dot product, centroid = normalized mean.
+        for _ in range(KMEANS_ITERATIONS):
+            assigned = assign_lists(sample, centroids, spill=1)[:, 0]
+            order = np.argsort(assigned, kind="stable")
+            lists, starts = np.unique(assigned[order], return_index=True)
+            sums = np.zeros_like(centroids)
+            sums[lists] = np.add.reduceat(sample[order], starts)
+            empty = np.flatnonzero(~sums.any(axis=1))
+            sums[empty] = sample[rng.choice(sample_size, len(empty))]
+            centroids = sums / np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = centroids.astype(np.float32)
+
+        with open(self._path(self._lists_name(n)), "wb") as lists_file:
+            lists_file.truncate(self.capacity * 4 * SPILL)
+        lists = np.memmap(self._path(self._lists_name(n)), dtype=np.int32, mode="r+", shape=(self.capacity, SPILL))
+        for start in range(0, n, SCORE_CHUNK_ROWS):
+            end = min(n, start + SCORE_CHUNK_ROWS)
+            lists[start:end] = assign_lists(np.asarray(vectors[start:end]), centroids)
+        lists.flush()
+        centroids.tofile(self._path(self._centroids_name(n)))
+        members = [np.empty(0, dtype=np.int64) for _ in range(list_count)]
+
+        with self._lock:
+            old_files = [self._lists_name(), self._centroids_name()]
+            self._lists, self._centroids, self._members = lists, centroids, members
+            self._add_members(np.arange(n), np.asarray(lists[:n]))
+            self.trained_count = n
+            self._write_meta()
+        for name in old_files:
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+        logger.info("Trained vector index %s: %d rows in %d lists", self.location, n, list_count)
+
+    # --- reading -----------------------------------------------------------
+
+    def _top(self, positions, scores, k):
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            positions, scores = positions[best], scores[best]
+        order = np.argsort(-scores, kind="stable")
+        return [(int(self._ids[position]), float(score)) for position, score in zip(positions[order], scores[order])]
+
+    def search(self, vector, k=10, nprobe=None, exact=False):
+        """The k rows closest to `vector` as (chat id, cosine similarity), best first."""
+        vector = np.asarray(vector, dtype=np.float32).reshape(self.dimensions)
+        with self._lock:
+            self._refresh()
+            if not self.count:
+                return []
+            if exact or self._centroids is None:
+                results = []
+                for start in range(0, self.count, SCORE_CHUNK_ROWS):
+                    end = min(self.count, start + SCORE_CHUNK_ROWS)
+                    scores = self._vectors[start:end] @ vector
+                    results.extend(self._top(np.arange(start, end), scores, k))
+                return sorted(results, key=lambda hit: -hit[1])[:k]
+
+            nprobe = min(nprobe or self.nprobe, len(self._centroids))
+            closest = np.argpartition(-(self._centroids @ vector), nprobe - 1)[:nprobe]
+            # np.unique also sorts, so the rows are read in file order.
+            positions = np.unique(np.concatenate([self._members[list_id] for list_id in closest]))
+            if not len(positions):
+                return []
+            return self._top(positions, self._vectors[positions] @ vector, k)
+
+    def ids(self):
+        with self._lock:
+            self._refresh()
+            return np.array(self._ids[:self.count]) if self.count else np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return self.count
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            return {
+                "rows": self.count,
+                "dimensions": self.dimensions,
+                "embedder": self.embedder,
+                "lists": 0 if self._centroids is None else len(self._centroids),
+                "trained_rows": self.trained_count,
+                "nprobe": self.nprobe,
+                "bytes": self.capacity * (4 * self.dimensions + 12),
+            }
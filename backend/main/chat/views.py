@@ -1,45 +1,77 @@
 from django.views.decorators.csrf import csrf_exempt
-from django.http import StreamingHttpResponse, JsonResponse
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse,
+)
 from django.core.paginator import Paginator
-from .models import Chat
-import google.generativeai as genai
-import base64
+from django.urls import reverse
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from .models import STATUS_COMPLETE, STATUS_PARTIAL, Blob, Chat, Conversation
+import asyncio
+import itertools
 import json
-import os
+import re
 import time
+from collections.abc import Mapping, Sequence
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-from .tools import internet_search_tool, AVAILABLE_TOOLS
+from .tools import AVAILABLE_TOOLS, available_tools, call_tool
+from .tool_cache import get_tool_cache
+from .clients import gemini_model
+from .blobstore import INLINE_IMAGE_TYPES, get_blob_store, save_blob, sniff_content_type
+from .media_cache import image_ref_part
+from .context import load_history
+from .persistence import Checkpointer, Turn, turn_queue, write_behind_enabled, write_turns
+from .live import ResponseBuffer, live_streams, start_live, start_live_async
+from .sse import KEEPALIVE_INTERVAL, awith_heartbeats, sse_comment, sse_delta, sse_event, sse_setting
+from .sse import with_heartbeats
+from .pagination import InvalidCursor, approximate_total, keyset_page, page_size
+from .search import search_backend, search_turns
+from .semantic import get_index as get_semantic_index, lookup as semantic_lookup
+from .semantic import semantic_enabled, semantic_setting, with_previous_answer
+from .projection import MESSAGE_FIELDS, InvalidProjection, project, requested_fields, serialize
+from .jsonstream import json_stream_response, ndjson_response, streamed_rows, wants_ndjson
+from .metrics import Trace, metrics_setting, render as render_metrics
+from .speech import AudioError, get_recognizer, speech_sessions
+from .admission import Rejected, admission
+from .transfer import COMPRESSIONS, CONTENT_TYPES, SUFFIXES, TransferError, export_stream, import_rows
+from .transfer import rebuild_conversations, transfer_setting
 
 Aiselected_Model = "Gemini-Flash"
-KEEPALIVE_INTERVAL = 15
 
-def sse_event(payload: dict) -> str:
-    return f"data: {json.dumps(payload)}\n\n"
+# Tool loop limits for one turn: how many rounds of tool calls the model gets, and
+# how long all of them together may take, before it must answer with what it has.
+MAX_TOOL_ROUNDS = 4
+TOOL_TIME_BUDGET = 45
+NO_MORE_TOOLS = {"function_calling_config": {"mode": "NONE"}}
 
-def sse_comment() -> str:
-    return ":\n\n"
+TOOL_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="tool")
+# Model streams of turns running inside their response are read here, so the
+# response can send heartbeats while it waits (see sse.with_heartbeats).
+MODEL_READ_POOL = ThreadPoolExecutor(max_workers=64, thread_name_prefix="model-read")
 
 def interface_fetch(request):
-    latest_entry = Chat.objects.order_by('-date_time').first()
+    try:
+        fields = requested_fields(request)
+    except InvalidProjection as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    latest = Conversation.objects.order_by('-last_message_time', '-id').values_list('name', flat=True).first()
+    if latest is None:
+        # Chats saved before the conversation table was backfilled.
+        latest = Chat.objects.order_by('-date_time').values_list('conversation_name', flat=True).first()
 
-    if not latest_entry:
+    if latest is None:
         return JsonResponse({"result": [], "message": "No conversations found."}, status=200)
 
-    latest_conversation_name = latest_entry.conversation_name
-    conversation_chats = Chat.objects.filter(
-        conversation_name=latest_conversation_name
-    ).order_by('date_time')
+    conversation_chats = streamed_rows(project(Chat.objects.filter(
+        conversation_name=latest
+    ).order_by('date_time'), fields))
 
-    formatted_conversation = [
-        {
-            "id": chat.id,
-            "prompt": chat.prompt,
-            "result": chat.result,
-            "date_time": chat.date_time.isoformat(),
-            "conversation_name": chat.conversation_name
-        } for chat in conversation_chats
-    ]
-    return JsonResponse({"result": formatted_conversation}, status=200)
+    formatted_conversation = (serialize(chat, fields) for chat in conversation_chats)
+    if wants_ndjson(request):
+        return ndjson_response(formatted_conversation)
+    return json_stream_response({}, "result", formatted_conversation)
 
 def extract_prompt_summary(messages_history):
     latest_user_prompt_summary = ""
@@ -55,7 +87,7 @@ def extract_prompt_summary(messages_history):
                     text_content = part.get('text', '')
                     if text_content:
                         text_parts.append(text_content)
-                elif part.get('type') == 'image_url':
+                elif part.get('type') in ('image_url', 'image_ref'):
                     media_types_present.add("image")
                 elif part.get('type') == 'file_url':
                     media_types_present.add("file")
@@ -68,7 +100,7 @@ def extract_prompt_summary(messages_history):
                 latest_user_prompt_summary = f"[Only media: {', '.join(sorted(list(media_types_present)))}]"
     return latest_user_prompt_summary
 
-def convert_to_gemini_history(messages_history):
+def convert_to_gemini_history(messages_history, gemini_api_key=None):
     gemini_formatted_history = []
     for msg in messages_history:
         role = 'model' if msg.get('role') == 'assistant' else 'user'
@@ -96,6 +128,9 @@ def convert_to_gemini_history(messages_history):
                         })
                     else:
                         content_for_gemini.append({"text": f"[Image URL: {full_image_data_url}]"})
+                elif part.get('type') == 'image_ref':
+                    # Uploaded through /upload/; resolved from the image caches.
+                    content_for_gemini.append(image_ref_part(part.get('handle'), gemini_api_key))
                 elif part.get('type') == 'file_url':
                     file_url_data = part.get('file_url', {}).get('url', '')
                     content_for_gemini.append({"text": f"[File URL: {file_url_data}]"})
@@ -107,126 +142,601 @@ def convert_to_gemini_history(messages_history):
     return gemini_formatted_history
 
 
-@csrf_exempt
-def interface_stream(request):
-
+def parse_stream_request(body):
+    """Returns (params, None) for a valid interface_stream body, or (None, error_response)."""
     try:
-        data = json.loads(request.body)
+        data = json.loads(body)
     except json.JSONDecodeError:
-        return JsonResponse({"error": "Invalid JSON in request body"}, status=400)
+        return None, JsonResponse({"error": "Invalid JSON in request body"}, status=400)
 
     gemini_api_key = data.get('geminiApiKey')
     tavily_api_key = data.get('tavilyApiKey')
-    
-    messages_history = data.get('history', []) 
+
+    conversation_name = data.get('conversation_name')
+    # Without a history the server rebuilds the context from the saved turns
+    # (see chat/context.py), so the client only sends the new prompt.
+    server_context = data.get('context') == 'server' or ('history' not in data and bool(conversation_name))
+
+    messages_history = [] if server_context else data.get('history', [])
     if data.get('prompt'):
         messages_history.append({'role': 'user', 'content': data.get('prompt')})
 
-    conversation_name = data.get('conversation_name')
     if not gemini_api_key or not tavily_api_key:
-        return JsonResponse(
+        return None, JsonResponse(
             {"error": "Both geminiApiKey and tavilyApiKey must be provided in the request body."},
             status=401
         )
 
     if not messages_history:
-        return JsonResponse({"error": "No messages provided"}, status=400)
+        return None, JsonResponse({"error": "No messages provided"}, status=400)
+
+    if server_context and not conversation_name:
+        return None, JsonResponse({"error": "conversation_name is required for server-side context"}, status=400)
+
+    return {
+        "gemini_api_key": gemini_api_key,
+        "tavily_api_key": tavily_api_key,
+        "messages_history": messages_history,
+        "conversation_name": conversation_name,
+        "server_context": server_context,
+        "prompt_summary": extract_prompt_summary(messages_history),
+        "timings": bool(data.get('timings')) or metrics_setting('SSE_TIMINGS', False),
+    }, None
+
+def request_contents(params):
+    """Gemini contents for this turn: stored context (server mode) plus what the client sent."""
+    contents = []
+    if params["server_context"]:
+        # The previous turn may still be in the write-behind queue.
+        turn_queue.wait_for(params["conversation_name"])
+        contents = load_history(params["conversation_name"], params["gemini_api_key"])
+    return contents + convert_to_gemini_history(params["messages_history"], params["gemini_api_key"])
+
+def build_model(gemini_api_key, asynchronous=False):
+    return gemini_model(gemini_api_key, 'gemini-2.5-flash', tools=[available_tools()], asynchronous=asynchronous)
+
+def chunk_parts(chunk):
+    if not chunk.candidates:
+        return []
+    return chunk.candidates[0].content.parts
 
-    prompt_summary_for_db = extract_prompt_summary(messages_history)
+# Reads the text off the parts directly: chunk.text raises on chunks that carry
+# a function_call instead of text.
+def chunk_text(chunk):
+    return "".join(part.text for part in chunk_parts(chunk) if part.text)
+
+def split_chunk(chunk, model_parts):
+    """
+    Returns the text to forward for this chunk. Once a function_call part shows up,
+    that chunk and everything after it is collected into model_parts instead, so
+    every call the model asked for in this candidate is run together.
+    """
+    parts = chunk_parts(chunk)
+    if model_parts or any(part.function_call for part in parts):
+        model_parts.extend(parts)
+        return ""
+    return chunk_text(chunk)
+
+def plain_args(value):
+    """
+    Function call arguments as plain dicts and lists. The SDK hands them over as
+    proto MapComposite/RepeatedComposite values, which json can't serialize.
+    """
+    if isinstance(value, Mapping):
+        return {key: plain_args(item) for key, item in value.items()}
+    if isinstance(value, Sequence) and not isinstance(value, (str, bytes)):
+        return [plain_args(item) for item in value]
+    return value
+
+def tool_calls_in(model_parts):
+    return [
+        {
+            "name": part.function_call.name,
+            "args": plain_args(part.function_call.args),
+        }
+        for part in model_parts if part.function_call
+    ]
+
+def run_tool(tool_name, tool_args, tavily_api_key):
+    """Runs one tool call through the result cache. Failures come back as {"error": ...} for the model."""
+    if tool_name not in AVAILABLE_TOOLS:
+        return {"error": f"Unknown function '{tool_name}'."}
+    try:
+        return get_tool_cache().call(
+            tool_name, tool_args,
+            lambda: call_tool(tool_name, tool_args, tavily_api_key=tavily_api_key)
+        )
+    except Exception as tool_e:
+        return {"error": f"An error occurred while using the {tool_name} tool: {str(tool_e)}"}
+
+def timed_tool_call(index, tool_call, tavily_api_key):
+    started = time.perf_counter()
+    output = run_tool(tool_call["name"], tool_call["args"], tavily_api_key)
+    return index, output, time.perf_counter() - started
+
+def tool_end_event(round_number, index, tool_call, output, duration):
+    event = {
+        "type": "tool_end",
+        "round": round_number,
+        "id": index,
+        "name": tool_call["name"],
+        "duration_ms": round(duration * 1000),
+        "ok": not (isinstance(output, dict) and "error" in output),
+    }
+    if not event["ok"]:
+        event["error"] = output["error"]
+    return event
+
+def tool_round_contents(model_parts, tool_calls, outputs):
+    """The model's function-call turn plus one tool turn carrying every result."""
+    return [
+        {"role": "model", "parts": model_parts},
+        {
+            "role": "tool",
+            "parts": [
+                {"function_response": {"name": tool_call["name"], "response": output}}
+                for tool_call, output in zip(tool_calls, outputs)
+            ]
+        }
+    ]
+
+def save_turn(prompt, result, conversation_name, status=STATUS_COMPLETE, chat_id=None, stream_id=None, embedding=None):
+    return write_turns([Turn(prompt, result, conversation_name, timezone.now(), status, chat_id, stream_id, embedding)])[0]
+
+def persist_turn(prompt, result, conversation_name, status=STATUS_COMPLETE, chat_id=None, stream_id=None, embedding=None):
+    # Queued for the background writer so `done` doesn't wait on the database.
+    if write_behind_enabled():
+        turn_queue.submit(prompt, result, conversation_name, status, chat_id, stream_id, embedding)
+    else:
+        save_turn(prompt, result, conversation_name, status, chat_id, stream_id, embedding)
+
+def semantic_prompt(params):
+    # Only text prompts: an answer about one image is no answer about another.
+    content = params["messages_history"][-1].get('content')
+    if isinstance(content, list) and any(part.get('type') != 'text' for part in content):
+        return None
+    return params["prompt_summary"]
+
+def semantic_match_event(match):
+    return {"type": "semantic_match", "chat_id": match.chat_id, "score": round(match.score, 4), "served": match.served}
+
+def generation_kwargs(round_number, deadline):
+    # Out of rounds or out of time: ask for a plain answer from what we have.
+    if round_number > MAX_TOOL_ROUNDS or time.monotonic() >= deadline:
+        return {"tool_config": NO_MORE_TOOLS}
+    return {}
+
+
+def heartbeat_interval(live):
+    """Seconds between heartbeats this turn must send itself: None unless it runs inside its response."""
+    return sse_setting('KEEPALIVE_INTERVAL', KEEPALIVE_INTERVAL) if live.inline else None
+
+def tool_wait(deadline, interval):
+    # How long to wait for the next tool result before checking in again.
+    remaining = max(0, deadline - time.monotonic())
+    return remaining if interval is None else min(remaining, interval)
+
+
+def rejected_response(rejected):
+    response = JsonResponse(
+        {"error": str(rejected), "reason": rejected.reason, "retry_after": rejected.retry_after}, status=429
+    )
+    response['Retry-After'] = str(rejected.retry_after)
+    return response
+
+def rejected_event(rejected):
+    return {"type": "error", "message": str(rejected), "reason": rejected.reason, "retry_after": rejected.retry_after}
+
+
+@csrf_exempt
+def interface_stream(request):
+    trace = Trace()
+    with trace.span("parse"):
+        params, error_response = parse_stream_request(request.body)
+    if error_response:
+        return error_response
+    return stream_turn(params, trace)
+
+def stream_turn(params, trace, prelude=()):
+    """The event stream for one parsed turn; `prelude` events go out right after "turn"."""
+    gemini_api_key = params["gemini_api_key"]
+    tavily_api_key = params["tavily_api_key"]
+    conversation_name = params["conversation_name"]
+    prompt_summary_for_db = params["prompt_summary"]
+
+    try:
+        ticket = admission.admit(gemini_api_key)
+    except Rejected as rejected:
+        return rejected_response(rejected)
+
+    live = live_streams.create()
 
     def event_stream():
-        full_response_text = ""
+        response_text = ResponseBuffer()
+        checkpoint = Checkpointer(prompt_summary_for_db, conversation_name, live.stream_id)
+        completed = disconnected = False
+        prompt_vector = None
         yield sse_comment()
+        yield sse_event({"type": "turn", "stream_id": live.stream_id})
+        for event in prelude:
+            yield sse_event(event)
 
         try:
-            genai.configure(api_key=gemini_api_key)
-            
-            model = genai.GenerativeModel(
-                'gemini-2.5-flash',
-                tools=[internet_search_tool]
-            )
-            
-            gemini_history = convert_to_gemini_history(messages_history)
-            response = model.generate_content(gemini_history, stream=False)
-            candidate = response.candidates[0]
-            
-            if candidate.content.parts and candidate.content.parts[0].function_call:
-                function_call = candidate.content.parts[0].function_call
-                tool_name = function_call.name
-                tool_args = {key: value for key, value in function_call.args.items()}
-                
-                yield sse_event({"type": "tool_call", "name": tool_name, "args": tool_args})
-
-                if tool_name in AVAILABLE_TOOLS:
-                    try:
-                        tool_function = AVAILABLE_TOOLS[tool_name]                        
-                        tool_output = tool_function(tavily_api_key=tavily_api_key, **tool_args)
-                        
-                        if isinstance(tool_output, dict) and "error" in tool_output:
-                            raise Exception(tool_output["error"])
-
-                    except Exception as tool_e:
-                        error_text = f"An error occurred while using the search tool: {str(tool_e)}"
-                        yield sse_event({"type": "error", "message": error_text})
-                        return
-                    
-                    final_response_stream = model.generate_content(
-                        [
-                            *gemini_history,
-                            candidate.content,
-                            {
-                                "role": "tool",
-                                "parts": [{
-                                    "function_response": {
-                                        "name": tool_name,
-                                        "response": tool_output
-                                    }
-                                }]
-                            }
-                        ],
-                        stream=True
+            with trace.span("admission"):
+                for position in admission.positions(ticket):
+                    yield sse_event({"type": "queued", "position": position})
+
+            with trace.span("semantic_lookup"):
+                match, prompt_vector = semantic_lookup(semantic_prompt(params), gemini_api_key)
+            if match:
+                yield sse_event(semantic_match_event(match))
+            if match and match.served:
+                # The earlier answer is this turn's answer; `finally` saves it as usual.
+                response_text.append(match.result)
+                trace.mark("first_delta")
+                yield sse_delta(match.result)
+                completed = True
+                return
+
+            model = build_model(gemini_api_key)
+
+            with trace.span("context"):
+                contents = request_contents(params)
+            if match:
+                contents = with_previous_answer(contents, match)
+            deadline = time.monotonic() + TOOL_TIME_BUDGET
+            heartbeat = heartbeat_interval(live)
+            # Each round is one streaming call. Text deltas go straight out; if the
+            # model asks for tools instead, they all run at once and their results
+            # go back for another round, until it answers in text.
+            for round_number in range(1, MAX_TOOL_ROUNDS + 2):
+                extra = generation_kwargs(round_number, deadline)
+                model_started = time.perf_counter()
+
+                def model_chunks():
+                    yield from trace.chunks(model.generate_content(contents, stream=True, **extra), model_started)
+
+                chunks = model_chunks() if heartbeat is None else with_heartbeats(model_chunks(), MODEL_READ_POOL, heartbeat)
+                model_parts = []
+                for chunk in chunks:
+                    if chunk is None:
+                        yield sse_comment()
+                        continue
+                    text = split_chunk(chunk, model_parts)
+                    if text:
+                        response_text.append(text)
+                        trace.mark("first_delta")
+                        yield sse_delta(text)
+                        if prompt_summary_for_db and checkpoint.chunk_added():
+                            checkpoint.save(response_text.text())
+
+                tool_calls = tool_calls_in(model_parts)
+                if not tool_calls or extra:
+                    break
+
+                for index, tool_call in enumerate(tool_calls):
+                    yield sse_event({"type": "tool_call", "round": round_number, "id": index, **tool_call})
+                    yield sse_event({"type": "tool_start", "round": round_number, "id": index, "name": tool_call["name"]})
+
+                outputs = [None] * len(tool_calls)
+                tools_started = time.perf_counter()
+                futures = [
+                    TOOL_POOL.submit(timed_tool_call, index, tool_call, tavily_api_key)
+                    for index, tool_call in enumerate(tool_calls)
+                ]
+                running = set(futures)
+                while running and time.monotonic() < deadline:
+                    done, running = wait(running, timeout=tool_wait(deadline, heartbeat), return_when=FIRST_COMPLETED)
+                    if not done and heartbeat is not None:
+                        yield sse_comment()
+                    for future in done:
+                        index, output, duration = future.result()
+                        outputs[index] = output
+                        yield sse_event(tool_end_event(round_number, index, tool_calls[index], output, duration))
+
+                for index, output in enumerate(outputs):
+                    if output is None:
+                        futures[index].cancel()
+                        outputs[index] = {"error": "Tool call timed out."}
+                        yield sse_event(tool_end_event(round_number, index, tool_calls[index], outputs[index], time.perf_counter() - tools_started))
+                trace.observe("tools", time.perf_counter() - tools_started)
+
+                contents = [*contents, *tool_round_contents(model_parts, tool_calls, outputs)]
+            completed = True
+
+        except GeneratorExit:
+            # The client went away mid-turn (only when turns aren't detached).
+            disconnected = True
+            raise
+        except Rejected as rejected:
+            yield sse_event(rejected_event(rejected))
+        except Exception as e:
+            yield sse_event({"type": "error", "message": str(e)})
+        finally:
+            admission.release(ticket)
+            db_error = None
+            try:
+                if prompt_summary_for_db and response_text:
+                    with trace.span("save"):
+                        persist_turn(
+                            prompt_summary_for_db, response_text.text(), conversation_name,
+                            STATUS_COMPLETE if completed else STATUS_PARTIAL, checkpoint.chat_id, live.stream_id,
+                            prompt_vector,
+                        )
+            except Exception as db_e:
+                db_error = db_e
+
+            trace.finish("complete" if completed else "disconnected" if disconnected else "error")
+            if not disconnected:
+                if db_error:
+                    yield sse_event({"type": "error", "message": f"DB save failed: {str(db_error)}"})
+                if params["timings"]:
+                    yield sse_event(trace.event())
+                yield sse_event({"type": "done"})
+                yield sse_comment()
+
+    # A response closed before it was iterated never runs event_stream's `finally`.
+    events = start_live(live, event_stream(), on_close=lambda: admission.release(ticket))
+    return StreamingHttpResponse(events, content_type="text/event-stream")
+
+# Same contract as interface_stream, but the whole turn runs on the event loop so
+# an ASGI worker is not pinned to one thread per open stream. Blocking tools are
+# pushed to the default executor only for as long as they run.
+@csrf_exempt
+async def interface_stream_async(request):
+    trace = Trace()
+    with trace.span("parse"):
+        params, error_response = parse_stream_request(request.body)
+    if error_response:
+        return error_response
+
+    gemini_api_key = params["gemini_api_key"]
+    tavily_api_key = params["tavily_api_key"]
+    conversation_name = params["conversation_name"]
+    prompt_summary_for_db = params["prompt_summary"]
+
+    try:
+        ticket = await sync_to_async(admission.admit, thread_sensitive=False)(gemini_api_key)
+    except Rejected as rejected:
+        return rejected_response(rejected)
+
+    live = live_streams.create()
+
+    async def event_stream():
+        response_text = ResponseBuffer()
+        checkpoint = Checkpointer(prompt_summary_for_db, conversation_name, live.stream_id)
+        completed = disconnected = False
+        prompt_vector = None
+        yield sse_comment()
+        yield sse_event({"type": "turn", "stream_id": live.stream_id})
+
+        try:
+            with trace.span("admission"):
+                async for position in admission.apositions(ticket):
+                    yield sse_event({"type": "queued", "position": position})
+
+            with trace.span("semantic_lookup"):
+                match, prompt_vector = await sync_to_async(semantic_lookup, thread_sensitive=False)(
+                    semantic_prompt(params), gemini_api_key
+                )
+            if match:
+                yield sse_event(semantic_match_event(match))
+            if match and match.served:
+                # The earlier answer is this turn's answer; `finally` saves it as usual.
+                response_text.append(match.result)
+                trace.mark("first_delta")
+                yield sse_delta(match.result)
+                completed = True
+                return
+
+            model = build_model(gemini_api_key, asynchronous=True)
+
+            # Stored context, image handles and summaries all need DB or network I/O.
+            with trace.span("context"):
+                contents = await sync_to_async(request_contents, thread_sensitive=False)(params)
+            if match:
+                contents = with_previous_answer(contents, match)
+            deadline = time.monotonic() + TOOL_TIME_BUDGET
+            heartbeat = heartbeat_interval(live)
+            for round_number in range(1, MAX_TOOL_ROUNDS + 2):
+                extra = generation_kwargs(round_number, deadline)
+                model_started = time.perf_counter()
+
+                async def model_chunks():
+                    response_stream = await model.generate_content_async(contents, stream=True, **extra)
+                    async for chunk in trace.achunks(response_stream, model_started):
+                        yield chunk
+
+                chunks = model_chunks() if heartbeat is None else awith_heartbeats(model_chunks(), heartbeat)
+                model_parts = []
+                async for chunk in chunks:
+                    if chunk is None:
+                        yield sse_comment()
+                        continue
+                    text = split_chunk(chunk, model_parts)
+                    if text:
+                        response_text.append(text)
+                        trace.mark("first_delta")
+                        yield sse_delta(text)
+                        if prompt_summary_for_db and checkpoint.chunk_added():
+                            await sync_to_async(checkpoint.save)(response_text.text())
+
+                tool_calls = tool_calls_in(model_parts)
+                if not tool_calls or extra:
+                    break
+
+                for index, tool_call in enumerate(tool_calls):
+                    yield sse_event({"type": "tool_call", "round": round_number, "id": index, **tool_call})
+                    yield sse_event({"type": "tool_start", "round": round_number, "id": index, "name": tool_call["name"]})
+
+                outputs = [None] * len(tool_calls)
+                tools_started = time.perf_counter()
+                tasks = [
+                    asyncio.ensure_future(
+                        sync_to_async(timed_tool_call, thread_sensitive=False)(index, tool_call, tavily_api_key)
                     )
-                    
-                    for chunk in final_response_stream:
-                        if chunk.text:
-                            full_response_text += chunk.text
-                            yield sse_event({"type": "delta", "text": chunk.text})
-
-                else: 
-                    error_text = f"Error: Model tried to call an unknown function '{tool_name}'."
-                    full_response_text += error_text
-                    yield sse_event({"type": "delta", "text": error_text})
-
-            else:
-                response_stream = model.generate_content(gemini_history, stream=True)
-                for chunk in response_stream:
-                    if chunk.text:
-                        full_response_text += chunk.text
-                        yield sse_event({"type": "delta", "text": chunk.text})
+                    for index, tool_call in enumerate(tool_calls)
+                ]
+                running = set(tasks)
+                while running and time.monotonic() < deadline:
+                    done, running = await asyncio.wait(
+                        running, timeout=tool_wait(deadline, heartbeat), return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if not done and heartbeat is not None:
+                        yield sse_comment()
+                    for task in done:
+                        index, output, duration = task.result()
+                        outputs[index] = output
+                        yield sse_event(tool_end_event(round_number, index, tool_calls[index], output, duration))
+
+                for index, output in enumerate(outputs):
+                    if output is None:
+                        tasks[index].cancel()
+                        outputs[index] = {"error": "Tool call timed out."}
+                        yield sse_event(tool_end_event(round_number, index, tool_calls[index], outputs[index], time.perf_counter() - tools_started))
+                trace.observe("tools", time.perf_counter() - tools_started)
 
+                contents = [*contents, *tool_round_contents(model_parts, tool_calls, outputs)]
+            completed = True
+
+        except (GeneratorExit, asyncio.CancelledError):
+            disconnected = True
+            raise
+        except Rejected as rejected:
+            yield sse_event(rejected_event(rejected))
         except Exception as e:
             yield sse_event({"type": "error", "message": str(e)})
         finally:
+            admission.release(ticket)
+            db_error = None
             try:
-                if prompt_summary_for_db and full_response_text:
-                    Chat.objects.create(
-                        prompt=prompt_summary_for_db,
-                        result=full_response_text,
-                        conversation_name=conversation_name
+                if prompt_summary_for_db and response_text:
+                    turn = (
+                        prompt_summary_for_db, response_text.text(), conversation_name,
+                        STATUS_COMPLETE if completed else STATUS_PARTIAL, checkpoint.chat_id, live.stream_id,
+                        prompt_vector,
                     )
+                    with trace.span("save"):
+                        if write_behind_enabled():
+                            turn_queue.submit(*turn)
+                        else:
+                            await sync_to_async(save_turn)(*turn)
             except Exception as db_e:
-                yield sse_event({"type": "error", "message": f"DB save failed: {str(db_e)}"})
-            
-            yield sse_event({"type": "done"})
-            yield sse_comment()
+                db_error = db_e
+
+            trace.finish("complete" if completed else "disconnected" if disconnected else "error")
+            if not disconnected:
+                if db_error:
+                    yield sse_event({"type": "error", "message": f"DB save failed: {str(db_error)}"})
+                if params["timings"]:
+                    yield sse_event(trace.event())
+                yield sse_event({"type": "done"})
+                yield sse_comment()
+
+    # A response closed before it was iterated never runs event_stream's `finally`.
+    events = start_live_async(live, event_stream(), on_close=lambda: admission.release(ticket))
+    return StreamingHttpResponse(events, content_type="text/event-stream")
+
+# /resume/<stream_id>/: what a turn has produced so far, then the rest of it. On the
+# worker running the turn this replays the live stream after Last-Event-ID (or
+# ?after=); anywhere else it sends the checkpointed text as a snapshot and polls the
+# row for growth until the turn is complete or has stopped moving.
+RESUME_POLL_INTERVAL = 1.0
+RESUME_STALE_AFTER = 30
+
+def resume_offset(request):
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('after')
+    try:
+        return int(last_event_id) + 1
+    except (TypeError, ValueError):
+        return 0
+
+def stored_turn(stream_id):
+    return Chat.objects.filter(stream_id=stream_id).values('id', 'result', 'status').first()
+
+def snapshot_event(row):
+    return sse_event({"type": "snapshot", "id": row["id"], "text": row["result"] or "", "status": row["status"]})
+
+def stalled_event():
+    return sse_event({"type": "error", "message": "The turn stopped before it was complete."})
+
+def resume_stream(request, stream_id):
+    live = live_streams.get(stream_id)
+    if live is not None:
+        return StreamingHttpResponse(live.follow(resume_offset(request)), content_type="text/event-stream")
+    row = stored_turn(stream_id)
+    if row is None:
+        return JsonResponse({"error": "Stream not found"}, status=404)
+
+    def event_stream():
+        current = row
+        sent = len(row["result"] or "")
+        last_growth = last_sent = time.monotonic()
+        yield snapshot_event(row)
+        while current["status"] == STATUS_PARTIAL:
+            if time.monotonic() - last_growth > RESUME_STALE_AFTER:
+                yield stalled_event()
+                break
+            time.sleep(RESUME_POLL_INTERVAL)
+            current = stored_turn(stream_id)
+            text = current["result"] or ""
+            if len(text) > sent:
+                yield sse_delta(text[sent:])
+                sent = len(text)
+                last_growth = last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= KEEPALIVE_INTERVAL:
+                yield sse_comment()
+                last_sent = time.monotonic()
+        yield sse_event({"type": "done"})
+
+    return StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+
+async def resume_stream_async(request, stream_id):
+    live = live_streams.get(stream_id)
+    if live is not None:
+        return StreamingHttpResponse(live.follow_async(resume_offset(request)), content_type="text/event-stream")
+    row = await sync_to_async(stored_turn)(stream_id)
+    if row is None:
+        return JsonResponse({"error": "Stream not found"}, status=404)
+
+    async def event_stream():
+        current = row
+        sent = len(row["result"] or "")
+        last_growth = last_sent = time.monotonic()
+        yield snapshot_event(row)
+        while current["status"] == STATUS_PARTIAL:
+            if time.monotonic() - last_growth > RESUME_STALE_AFTER:
+                yield stalled_event()
+                break
+            await asyncio.sleep(RESUME_POLL_INTERVAL)
+            current = await sync_to_async(stored_turn)(stream_id)
+            text = current["result"] or ""
+            if len(text) > sent:
+                yield sse_delta(text[sent:])
+                sent = len(text)
+                last_growth = last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= KEEPALIVE_INTERVAL:
+                yield sse_comment()
+                last_sent = time.monotonic()
+        yield sse_event({"type": "done"})
 
     return StreamingHttpResponse(event_stream(), content_type="text/event-stream")
 
 def paginated_history(request):
-    chat_list = Chat.objects.order_by('-date_time').all()
+    # ?cursor= (empty for the first page) switches to keyset pagination; the
+    # page-number API below stays for older clients.
+    if 'cursor' in request.GET:
+        return cursor_history(request)
+
+    try:
+        fields = requested_fields(request)
+    except InvalidProjection as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    chat_list = project(Chat.objects.order_by('-date_time', '-id'), fields)
 
     page_number = request.GET.get('page', 1)
-    items_per_page = request.GET.get('limit', 20) 
+    items_per_page = page_size(request.GET.get('limit'))
 
     paginator = Paginator(chat_list, items_per_page)
 
@@ -235,15 +745,7 @@ def paginated_history(request):
     except Exception:
         return JsonResponse({"error": "Page not found"}, status=404)
 
-    formatted_history = [
-        {
-            "id": chat.id,
-            "prompt": chat.prompt,
-            "result": chat.result,
-            "date_time": chat.date_time.isoformat(),
-            "conversation_name": chat.conversation_name,
-        } for chat in page_obj
-    ]
+    formatted_history = [serialize(chat, fields) for chat in page_obj]
 
     return JsonResponse({
         "total_items": paginator.count,
@@ -254,25 +756,394 @@ def paginated_history(request):
         "results": formatted_history
     }, status=200)
 
+def cursor_history(request):
+    try:
+        fields = requested_fields(request)
+        chats, next_cursor = keyset_page(
+            project(Chat.objects.all(), fields),
+            request.GET.get('cursor', ''),
+            page_size(request.GET.get('limit'))
+        )
+    except (InvalidCursor, InvalidProjection) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    response = {
+        "results": [serialize(chat, fields) for chat in chats],
+        "next_cursor": next_cursor,
+        "has_next": next_cursor is not None,
+    }
+    if request.GET.get('include_total') in ('1', 'true'):
+        response["approx_total"] = approximate_total(Chat)
+    return JsonResponse(response, status=200)
+
 def conversation_by_name(request,conversation_name):
-    if not Chat.objects.filter(conversation_name=conversation_name).exists():
-        return JsonResponse({"error": "Conversation not found"}, status=404)
+    try:
+        fields = requested_fields(request)
+    except InvalidProjection as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
-    conversation_chats = Chat.objects.filter(
+    conversation_chats = streamed_rows(project(Chat.objects.filter(
         conversation_name=conversation_name
-    ).order_by('date_time')
+    ).order_by('date_time'), fields))
 
-    formatted_messages = [
-        {
-            "id": chat.id,
-            "prompt": chat.prompt,
-            "result": chat.result,
-            "date_time": chat.date_time.isoformat(),
-            "conversation_name": chat.conversation_name,
-        } for chat in conversation_chats
-    ]
+    first = next(conversation_chats, None)
+    if first is None:
+        return JsonResponse({"error": "Conversation not found"}, status=404)
+
+    # Rows are encoded as they are read; the last one read has last_message_time.
+    last = [first]
+
+    def messages():
+        for chat in itertools.chain([first], conversation_chats):
+            last[0] = chat
+            yield serialize(chat, fields)
+
+    if wants_ndjson(request):
+        return ndjson_response(messages())
+    return json_stream_response(
+        {"id": conversation_name}, "messages", messages(),
+        lambda: {"last_message_time": last[0]["date_time"].isoformat()},
+    )
+
+def chat_message(request, chat_id):
+    """One message in full, including the generated image the list endpoints leave out."""
+    try:
+        fields = requested_fields(request, allowed=MESSAGE_FIELDS, default_view="message")
+    except InvalidProjection as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    chat = project(Chat.objects.filter(id=chat_id), fields).first()
+    if chat is None:
+        return JsonResponse({"error": "Message not found"}, status=404)
+    return JsonResponse(serialize(chat, fields), status=200)
+
+def conversation_list(request):
+    try:
+        conversations, next_cursor = keyset_page(
+            Conversation.objects.all(),
+            request.GET.get('cursor', ''),
+            page_size(request.GET.get('limit')),
+            field='last_message_time'
+        )
+    except InvalidCursor as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    return JsonResponse({
+        "results": [
+            {
+                "id": conversation.name,
+                "title": conversation.title,
+                "message_count": conversation.message_count,
+                "last_message_time": conversation.last_message_time.isoformat(),
+            } for conversation in conversations
+        ],
+        "next_cursor": next_cursor,
+        "has_next": next_cursor is not None,
+    }, status=200)
+
+def search(request):
+    """
+    Turns matching ?q= (words must all appear, "quoted words" as a phrase), best
+    match first, with a highlighted snippet. ?conversation= limits it to one
+    conversation; ?limit= and ?offset= page through the results.
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({"error": "Provide a search query as ?q="}, status=400)
+    try:
+        offset = max(0, int(request.GET.get('offset', 0)))
+    except ValueError:
+        return JsonResponse({"error": "offset must be an integer"}, status=400)
+
+    backend = search_backend()
+    rows = search_turns(
+        query,
+        page_size(request.GET.get('limit')),
+        offset,
+        conversation_name=request.GET.get('conversation') or None,
+        backend=backend,
+    )
     return JsonResponse({
-        "id": conversation_name,
-        "messages": formatted_messages,
-        "last_message_time": formatted_messages[-1]["date_time"] if formatted_messages else ""
-    }, status=200)
\ No newline at end of file
+        "query": query,
+        "backend": backend,
+        "results": [
+            {
+                "id": row["id"],
+                "conversation_name": row["conversation_name"],
+                "date_time": row["date_time"].isoformat(),
+                "prompt": row["prompt"],
+                "snippet": row["snippet"],
+                "rank": row["rank"],
+            } for row in rows
+        ],
+    }, status=200)
+
+@csrf_exempt
+def upload_image(request):
+    """
+    Stores an image (multipart field "file", or the raw body) and returns the handle
+    to reference it by in history as {"type": "image_ref", "handle": ...}. The type
+    comes from the bytes, not the client, and must be PNG, JPEG, WebP or HEIC/HEIF.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "POST an image to upload it."}, status=405)
+
+    upload = request.FILES.get('file')
+    data = upload.read() if upload is not None else request.body
+
+    if not data:
+        return JsonResponse({"error": "No image provided"}, status=400)
+    content_type = sniff_content_type(data)
+    if content_type not in INLINE_IMAGE_TYPES:
+        return JsonResponse({"error": "Only PNG, JPEG, WebP and HEIC/HEIF images can be uploaded"}, status=400)
+
+    stored = save_blob(data, content_type)
+    return JsonResponse({
+        "handle": stored.digest,
+        "content_type": stored.content_type,
+        "size": stored.size,
+        "url": reverse('blob', args=[stored.digest]),
+    }, status=201)
+
+def json_object(body):
+    """The JSON object in an optional request body, or None if it isn't one."""
+    try:
+        data = json.loads(body or b"{}")
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+@csrf_exempt
+def stt_start(request):
+    """
+    Opens a speech session. The optional JSON body may give the audio's
+    "sample_rate" (for raw PCM) and "language", plus any interface_stream fields
+    (keys, conversation_name, ...) for the turn the transcript will start.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "POST to start a speech session."}, status=405)
+    data = json_object(request.body)
+    if data is None:
+        return JsonResponse({"error": "Invalid JSON in request body"}, status=400)
+    try:
+        sample_rate = int(data.pop('sample_rate', 0) or 0) or None
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "sample_rate must be an integer"}, status=400)
+
+    try:
+        # Loaded here so a missing speech backend fails the request that opens the
+        # session, not an upload halfway through it.
+        get_recognizer()
+    except ImportError as e:
+        return JsonResponse({"error": f"Speech recognition is unavailable: {e}"}, status=503)
+    language = data.pop('language', None)
+    session = speech_sessions.create(data=data, sample_rate=sample_rate, language=language)
+    return JsonResponse({
+        "session_id": session.session_id,
+        "audio_url": reverse('stt_audio', args=[session.session_id]),
+        "end_url": reverse('stt_end', args=[session.session_id]),
+    }, status=201)
+
+@csrf_exempt
+def stt_audio(request, session_id):
+    """
+    Adds the next chunk of a session's audio: 16-bit mono PCM, where the first
+    chunk may start with a WAV header. Finished utterances are transcribed in the
+    background; the reply carries the transcript so far.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "POST audio to add it to the session."}, status=405)
+    session = speech_sessions.get(session_id)
+    if session is None:
+        return JsonResponse({"error": "Speech session not found"}, status=404)
+    if not request.body:
+        return JsonResponse({"error": "No audio provided"}, status=400)
+    try:
+        session.feed(request.body)
+    except AudioError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse({
+        "audio_seconds": round(session.audio_seconds, 2),
+        "segments": len(session.transcriptions),
+        "transcript": session.transcript(),
+    }, status=200)
+
+@csrf_exempt
+def stt_end(request, session_id):
+    """
+    Ends a session's audio and waits for the last transcriptions. With chat keys
+    (sent here or to stt_start) the transcript is the prompt of a new turn, and
+    the response is interface_stream's event stream opening with a "transcript"
+    event. Without them, it is the transcript as JSON.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "POST to end the speech session."}, status=405)
+    data = json_object(request.body)
+    if data is None:
+        return JsonResponse({"error": "Invalid JSON in request body"}, status=400)
+    session = speech_sessions.pop(session_id)
+    if session is None:
+        return JsonResponse({"error": "Speech session not found"}, status=404)
+
+    trace = Trace()
+    with trace.span("transcribe_wait"):
+        transcript, segments = session.end()
+    data = {**session.data, **data}
+    if not data.get('geminiApiKey') and not data.get('tavilyApiKey'):
+        return JsonResponse({"transcript": transcript, "segments": segments}, status=200)
+    if not transcript:
+        return JsonResponse({"error": "No speech was recognized", "segments": segments}, status=422)
+
+    with trace.span("parse"):
+        params, error_response = parse_stream_request(json.dumps({**data, "prompt": transcript}))
+    if error_response:
+        return error_response
+    return stream_turn(params, trace, prelude=[{"type": "transcript", "text": transcript, "segments": segments}])
+
+BLOB_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def blob(request, digest):
+    """
+    Serves a stored blob. Blobs never change, so the digest is a strong ETag and
+    responses can be cached forever; single byte ranges are honoured.
+    """
+    blob_row = Blob.objects.filter(digest=digest).first()
+    store = get_blob_store()
+    if blob_row is None or not store.exists(digest):
+        raise Http404("Blob not found")
+
+    etag = f'"{digest}"'
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    size = store.size(digest)
+    match = BLOB_RANGE.match(request.headers.get('Range', ''))
+    if_range = request.headers.get('If-Range')
+    if match and (not if_range or if_range == etag):
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        elif last:
+            start, end = max(0, size - int(last)), size - 1
+        else:
+            start, end = 0, -1
+        if start > end or start >= size:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        with store.open(digest) as blob_file:
+            blob_file.seek(start)
+            response = HttpResponse(blob_file.read(end - start + 1), status=206, content_type=blob_row.content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        response = FileResponse(store.open(digest), content_type=blob_row.content_type)
+        response['Content-Length'] = size
+
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response['X-Content-Type-Options'] = 'nosniff'
+    if blob_row.content_type not in INLINE_IMAGE_TYPES:
+        # Anything that isn't a plain raster image (SVG, HTML...) could carry script.
+        response['Content-Disposition'] = f'attachment; filename="{digest}"'
+    return response
+
+def metrics_denied(request):
+    """
+    The response refusing /metrics or a stats endpoint, or None for staff users and
+    requests that carry the metrics token.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_active and user.is_staff:
+        return None
+    token = metrics_setting('TOKEN')
+    if not token:
+        return JsonResponse({"error": "Metrics are staff-only; set METRICS_TOKEN to let scrapers in."}, status=403)
+    if request.headers.get('Authorization') != f"Bearer {token}":
+        return JsonResponse({"error": "Unauthorized"}, status=401)
+    return None
+
+def tool_cache_stats(request):
+    denied = metrics_denied(request)
+    if denied:
+        return denied
+    return JsonResponse(get_tool_cache().stats(), status=200)
+
+def persistence_stats(request):
+    denied = metrics_denied(request)
+    if denied:
+        return denied
+    return JsonResponse(turn_queue.stats(), status=200)
+
+def admission_stats(request):
+    denied = metrics_denied(request)
+    if denied:
+        return denied
+    return JsonResponse(admission.stats(), status=200)
+
+def metrics(request):
+    denied = metrics_denied(request)
+    if denied:
+        return denied
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+def transfer_denied(request):
+    """The response refusing a bulk transfer, or None when the request may go ahead."""
+    token = transfer_setting('TOKEN')
+    if not token:
+        return JsonResponse({"error": "Bulk transfer is disabled; set TRANSFER_TOKEN to enable it."}, status=403)
+    if request.headers.get('Authorization') != f"Bearer {token}":
+        return JsonResponse({"error": "Unauthorized"}, status=401)
+    return None
+
+def export_chats(request):
+    """
+    Every chat row as compressed NDJSON (see chat/transfer.py), streamed as it is
+    read. ?conversation=<name> (repeatable) narrows it down, ?compression= picks
+    gzip (the default), zstd or none.
+    """
+    denied = transfer_denied(request)
+    if denied:
+        return denied
+    compression = request.GET.get('compression', 'gzip')
+    if compression not in COMPRESSIONS:
+        return JsonResponse({"error": f"compression must be one of {', '.join(COMPRESSIONS)}"}, status=400)
+    try:
+        pieces = export_stream(request.GET.getlist('conversation'), compression)
+        # Starts the generator, so a missing zstandard package is a 400 here rather than a broken stream.
+        first = next(pieces)
+    except TransferError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    response = StreamingHttpResponse(itertools.chain([first], pieces), content_type=CONTENT_TYPES[compression])
+    response['Content-Disposition'] = f'attachment; filename="chats{SUFFIXES[compression]}"'
+    return response
+
+@csrf_exempt
+def import_chats(request):
+    """
+    Loads a body written by /export/ or export_chats (gzip, zstd or plain NDJSON),
+    read from the request stream a megabyte at a time. Rows already present are
+    skipped, so a failed upload can be sent again; rows whose ids belong to other
+    turns here are reported as conflicts.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "POST an export to import it."}, status=405)
+    denied = transfer_denied(request)
+    if denied:
+        return denied
+    try:
+        stats = import_rows(request.read)
+    except TransferError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    rebuild_conversations(stats.conversations)
+    return JsonResponse(stats.as_dict(), status=200)
+
+def semantic_stats(request):
+    denied = metrics_denied(request)
+    if denied:
+        return denied
+    if not semantic_enabled():
+        return JsonResponse({"mode": "off"}, status=200)
+    return JsonResponse({"mode": semantic_setting('MODE'), **get_semantic_index().stats()}, status=200)
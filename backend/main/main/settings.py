@@ -23,6 +23,8 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
 
+# Still large for clients that inline images as data: URLs in history; clients
+# using /upload/ and image_ref parts send kilobyte-sized bodies.
 DATA_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50 MB
 FILE_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50 MB
 
@@ -41,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'chat.metrics.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,6 +58,138 @@ ROOT_URLCONF = 'main.urls'
 
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Search/tool results cache (see chat/tool_cache.py). Switch BACKEND to
+# 'chat.tool_cache.DjangoCacheBackend' to share entries through CACHES between workers.
+TOOL_CACHE = {
+    'BACKEND': os.environ.get('TOOL_CACHE_BACKEND', 'chat.tool_cache.LocMemBackend'),
+    'TTL': int(os.environ.get('TOOL_CACHE_TTL', 300)),
+    'MAX_ENTRIES': int(os.environ.get('TOOL_CACHE_MAX_ENTRIES', 1024)),
+}
+
+# Content-addressed storage for generated images (see chat/blobstore.py).
+BLOB_STORE = {
+    'BACKEND': 'chat.blobstore.FileSystemBlobStore',
+    'LOCATION': os.environ.get('BLOB_STORE_LOCATION', MEDIA_ROOT / 'blobs'),
+}
+
+# Per-key Gemini and Tavily clients, reused across requests (see chat/clients.py).
+CLIENT_POOL = {
+    'MAX_SIZE': int(os.environ.get('CLIENT_POOL_MAX_SIZE', 256)),
+    'IDLE_TIMEOUT': int(os.environ.get('CLIENT_POOL_IDLE_TIMEOUT', 600)),
+    'GEMINI_TRANSPORT': os.environ.get('GEMINI_TRANSPORT'),
+    'GEMINI_API_ENDPOINT': os.environ.get('GEMINI_API_ENDPOINT'),
+    'TAVILY_API_BASE_URL': os.environ.get('TAVILY_API_BASE_URL'),
+}
+
+# Finished turns are saved by a background writer in batches (see chat/persistence.py).
+PERSISTENCE = {
+    'WRITE_BEHIND': os.environ.get('PERSISTENCE_WRITE_BEHIND', '1') == '1',
+    'BATCH_SIZE': int(os.environ.get('PERSISTENCE_BATCH_SIZE', 100)),
+    'BATCH_WAIT': float(os.environ.get('PERSISTENCE_BATCH_WAIT', 0.05)),
+    'QUEUE_SIZE': int(os.environ.get('PERSISTENCE_QUEUE_SIZE', 10000)),
+    'MAX_RETRIES': int(os.environ.get('PERSISTENCE_MAX_RETRIES', 5)),
+    'CHECKPOINT_CHUNKS': int(os.environ.get('PERSISTENCE_CHECKPOINT_CHUNKS', 20)),
+    'CHECKPOINT_INTERVAL': float(os.environ.get('PERSISTENCE_CHECKPOINT_INTERVAL', 2.0)),
+}
+
+# Heartbeats and delta coalescing for the event streams (see chat/sse.py).
+SSE = {
+    'KEEPALIVE_INTERVAL': int(os.environ.get('SSE_KEEPALIVE_INTERVAL', 15)),
+    'COALESCE': os.environ.get('SSE_COALESCE', '1') == '1',
+    'COALESCE_WINDOW': float(os.environ.get('SSE_COALESCE_WINDOW', 0)),
+    'COALESCE_MAX_CHARS': int(os.environ.get('SSE_COALESCE_MAX_CHARS', 4096)),
+}
+
+# Turns keep generating after their client disconnects, for /resume/ (see chat/live.py).
+LIVE_STREAMS = {
+    'DETACH': os.environ.get('LIVE_STREAMS_DETACH', '1') == '1',
+    'RETENTION': int(os.environ.get('LIVE_STREAMS_RETENTION', 60)),
+    'MAX_DETACHED': int(os.environ.get('LIVE_STREAMS_MAX_DETACHED', 64)),
+}
+
+# Server-side history and its running summary (see chat/context.py).
+CONTEXT = {
+    'TOKEN_BUDGET': int(os.environ.get('CONTEXT_TOKEN_BUDGET', 24000)),
+    'SUMMARY_TIMEOUT': float(os.environ.get('CONTEXT_SUMMARY_TIMEOUT', 30)),
+    'SUMMARY_WORKERS': int(os.environ.get('CONTEXT_SUMMARY_WORKERS', 2)),
+}
+
+# "Have we answered this before?" retrieval over past prompts (see chat/semantic.py).
+SEMANTIC = {
+    'MODE': os.environ.get('SEMANTIC_MODE', 'off'),
+    'EMBEDDER': os.environ.get('SEMANTIC_EMBEDDER', 'chat.embeddings.HashingEmbedder'),
+    'DIMENSIONS': int(os.environ.get('SEMANTIC_DIMENSIONS', 256)),
+    'LOCATION': os.environ.get('SEMANTIC_LOCATION', MEDIA_ROOT / 'semantic'),
+    'SERVE_THRESHOLD': float(os.environ.get('SEMANTIC_SERVE_THRESHOLD', 0.95)),
+    'CONTEXT_THRESHOLD': float(os.environ.get('SEMANTIC_CONTEXT_THRESHOLD', 0.8)),
+    'MIN_PROMPT_WORDS': int(os.environ.get('SEMANTIC_MIN_PROMPT_WORDS', 4)),
+    'NPROBE': int(os.environ.get('SEMANTIC_NPROBE', 8)),
+}
+
+# Web pages read by the fetch_pages tool, cached on disk by ETag/Last-Modified (see chat/pages.py).
+PAGE_FETCH = {
+    'LOCATION': os.environ.get('PAGE_FETCH_LOCATION', MEDIA_ROOT / 'pages'),
+    'MAX_ENTRIES': int(os.environ.get('PAGE_FETCH_MAX_ENTRIES', 2000)),
+    'MAX_URLS': int(os.environ.get('PAGE_FETCH_MAX_URLS', 5)),
+    'MAX_CHARS': int(os.environ.get('PAGE_FETCH_MAX_CHARS', 8000)),
+    'EXTRACT_CHARS': int(os.environ.get('PAGE_FETCH_EXTRACT_CHARS', 32000)),
+    'TIMEOUT': int(os.environ.get('PAGE_FETCH_TIMEOUT', 15)),
+    'ALLOW_PRIVATE_HOSTS': os.environ.get('PAGE_FETCH_ALLOW_PRIVATE_HOSTS', '0') == '1',
+}
+
+# Optional internet_search stage that reads the top hits and keeps the passages
+# matching the query (see chat/enrichment.py).
+SEARCH_ENRICHMENT = {
+    'ENABLED': os.environ.get('SEARCH_ENRICHMENT', '0') == '1',
+    'MAX_RESULTS': int(os.environ.get('SEARCH_ENRICHMENT_MAX_RESULTS', 5)),
+    'FETCH_TOP': int(os.environ.get('SEARCH_ENRICHMENT_FETCH_TOP', 3)),
+    'FETCH_DEADLINE': float(os.environ.get('SEARCH_ENRICHMENT_FETCH_DEADLINE', 4.0)),
+    'BYTE_BUDGET': int(os.environ.get('SEARCH_ENRICHMENT_BYTE_BUDGET', 6000)),
+}
+
+# Latency histograms served at /metrics (see chat/metrics.py). It and the */stats/
+# endpoints answer staff users, and, with TOKEN set, requests that send
+# "Authorization: Bearer <token>".
+METRICS = {
+    'SSE_TIMINGS': os.environ.get('METRICS_SSE_TIMINGS', '0') == '1',
+    'TOKEN': os.environ.get('METRICS_TOKEN'),
+}
+
+# Concurrency cap, wait queue and per-key rate limits for turns (see chat/admission.py),
+# off unless ADMISSION=1. Switch STORE to 'chat.admission.CacheStore' to share the
+# limits through CACHES between workers.
+ADMISSION = {
+    'ENABLED': os.environ.get('ADMISSION', '0') == '1',
+    'STORE': os.environ.get('ADMISSION_STORE', 'chat.admission.LocalStore'),
+    'MAX_ACTIVE': int(os.environ.get('ADMISSION_MAX_ACTIVE', 32)),
+    'QUEUE_SIZE': int(os.environ.get('ADMISSION_QUEUE_SIZE', 64)),
+    'QUEUE_TIMEOUT': float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 30)),
+    'KEY_RATE': float(os.environ.get('ADMISSION_KEY_RATE', 1.0)),
+    'KEY_BURST': int(os.environ.get('ADMISSION_KEY_BURST', 10)),
+}
+
+# Spoken prompts uploaded in chunks and transcribed while the user talks (see chat/speech.py).
+STT = {
+    'RECOGNIZER': os.environ.get('STT_RECOGNIZER', 'chat.speech.GoogleRecognizer'),
+    'LANGUAGE': os.environ.get('STT_LANGUAGE', 'en-US'),
+    'SAMPLE_RATE': int(os.environ.get('STT_SAMPLE_RATE', 16000)),
+    'SILENCE_MS': int(os.environ.get('STT_SILENCE_MS', 500)),
+    'MAX_SEGMENT_SECONDS': int(os.environ.get('STT_MAX_SEGMENT_SECONDS', 15)),
+    'MAX_SESSION_SECONDS': int(os.environ.get('STT_MAX_SESSION_SECONDS', 300)),
+    'SESSION_TTL': int(os.environ.get('STT_SESSION_TTL', 300)),
+    'TIMEOUT': int(os.environ.get('STT_TIMEOUT', 30)),
+}
+
+# Bulk export/import of chat rows as compressed NDJSON (see chat/transfer.py). The
+# /export/ and /import/ endpoints stay off until TOKEN is set.
+TRANSFER = {
+    'TOKEN': os.environ.get('TRANSFER_TOKEN'),
+    'CHUNK_SIZE': int(os.environ.get('TRANSFER_CHUNK_SIZE', 2000)),
+    'BATCH_SIZE': int(os.environ.get('TRANSFER_BATCH_SIZE', 2000)),
+    'GZIP_LEVEL': int(os.environ.get('TRANSFER_GZIP_LEVEL', 3)),
+    'ZSTD_LEVEL': int(os.environ.get('TRANSFER_ZSTD_LEVEL', 3)),
+}
+
 DATABASES = {
     'default': dj_database_url.parse(os.environ.get('DATABASE_URL'))
 }
@@ -7,7 +7,25 @@ from django.conf.urls.static import static
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('interface_stream/', views.interface_stream), 
+    path('interface_stream_async/', views.interface_stream_async),
+    path('resume/<str:stream_id>/', views.resume_stream),
+    path('resume_async/<str:stream_id>/', views.resume_stream_async),
     path('history/', views.paginated_history),
     path('conversation/<str:conversation_name>/',views.conversation_by_name,),
+    path('conversations/', views.conversation_list),
+    path('search/', views.search),
+    path('message/<int:chat_id>/', views.chat_message),
+    path('upload/', views.upload_image),
+    path('stt/', views.stt_start),
+    path('stt/<str:session_id>/audio/', views.stt_audio, name='stt_audio'),
+    path('stt/<str:session_id>/end/', views.stt_end, name='stt_end'),
+    path('blob/<str:digest>/', views.blob, name='blob'),
+    path('export/', views.export_chats),
+    path('import/', views.import_chats),
     path('interface_fetch/', views.interface_fetch),   
+    path('tool_cache/stats/', views.tool_cache_stats),
+    path('persistence/stats/', views.persistence_stats),
+    path('admission/stats/', views.admission_stats),
+    path('semantic/stats/', views.semantic_stats),
+    path('metrics', views.metrics),
 ]
\ No newline at end of file